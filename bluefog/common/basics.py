@@ -13,7 +13,7 @@
 # limitations under the License.
 # ==============================================================================
 
-from typing import List, Callable, Optional
+from typing import List, Callable, Dict, FrozenSet, Optional, Tuple
 import atexit
 import contextlib
 import ctypes
@@ -40,18 +40,25 @@ class BlueFogBasics(object):
     def __init__(self, pkg_path, *args):
         full_path = util.get_extension_full_path(pkg_path, *args)
         self._topology = None
+        self._nx_topology = None
         self._MPI_LIB_CTYPES = ctypes.CDLL(full_path, mode=ctypes.RTLD_GLOBAL)
         self._is_topo_weighted = False
+        # Local view of the topology and everything derived from it. They are computed
+        # once in set_topology so that the neighbor ops only need the lookups.
+        self._local_view = None
+        self._in_neighbor_set = frozenset()
+        self._out_neighbor_set = frozenset()
+        self._recv_weights = None
         self.warn_timeline = False
 
-    def init(self, topology_fn: Optional[Callable[[int], networkx.DiGraph]] = None,
+    def init(self, topology_fn: Optional[Callable[[int], topology_util.TopologyType]] = None,
              is_weighted: bool = False):
         """A function that initializes BlueFog.
 
         Args:
           topology_fn: A callable function that takes size as input and return
-            networkx.DiGraph object to decide the topology. If not provided
-            a default exponential graph (base 2) structure is called.
+            networkx.DiGraph or topology_util.SparseTopology object to decide the topology.
+            If not provided a default exponential graph (base 2) structure is called.
           is_weighted: If set to true, the neighbor ops like (win_update, neighbor_allreduce) will
             execute the weighted average instead, where the weight is the value used in
             topology matrix (including self).
@@ -60,14 +67,16 @@ class BlueFogBasics(object):
         if topology_fn:
             topo = topology_fn(self.size())
         else:
-            topo = topology_util.ExponentialGraph(self.size())
+            topo = topology_util.SparseExponentialGraph(self.size())
         self.set_topology(topo, is_weighted)
         atexit.register(self.shutdown)
 
     def shutdown(self) -> None:
         """A function that shuts BlueFog down."""
         self._MPI_LIB_CTYPES.bluefog_shutdown()
-        self.topology = None
+        self._topology = None
+        self._nx_topology = None
+        self._cache_local_topology(None, False)
 
     def size(self) -> int:
         """A function that returns the number of BlueFog processes.
@@ -152,46 +161,91 @@ class BlueFogBasics(object):
     def load_topology(self) -> networkx.DiGraph:
         """A funnction that returns the virtual topology MPI used.
 
+        If the topology was set through a topology_util.SparseTopology, it is converted
+        to networkx.DiGraph at the first call.
+
         Returns:
             topology: networkx.DiGraph.
         """
-        return self._topology
+        if self._nx_topology is None and self._topology is not None:
+            if isinstance(self._topology, topology_util.SparseTopology):
+                self._nx_topology = self._topology.to_networkx()
+            else:
+                self._nx_topology = self._topology
+        return self._nx_topology
 
     def in_neighbor_ranks(self) -> List[int]:
-        """Return the ranks of all in-neighbors.
+        """Return the ranks of all in-neighbors in ascending order.
         Notice: No matter self-loop is presented or not, self rank will not be included.
 
         Returns:
             in_neighbor_ranks
         """
-        if self._topology is None:
+        if self._local_view is None:
             return []
-        _rank = self.rank()
-        in_neighbor_ranks = [r for r in self._topology.predecessors(self.rank())
-                             if r != _rank]
-        return in_neighbor_ranks
+        return list(self._local_view.in_neighbor_ranks)
 
     def out_neighbor_ranks(self) -> List[int]:
-        """Return the ranks of all out-neighbors.
+        """Return the ranks of all out-neighbors in ascending order.
         Notice: No matter self-loop is presented or not, self rank will not be included.
 
         Returns:
             out_neighbor_ranks
         """
-        if self._topology is None:
+        if self._local_view is None:
             return []
-        _rank = self.rank()
-        out_neighbor_ranks = [r for r in self._topology.successors(self.rank())
-                              if r != _rank]
-        return out_neighbor_ranks
+        return list(self._local_view.out_neighbor_ranks)
+
+    def in_neighbor_set(self) -> FrozenSet[int]:
+        """Return the ranks of all in-neighbors as a frozenset, which is cached when
+        the topology is set. Self rank is not included."""
+        return self._in_neighbor_set
+
+    def out_neighbor_set(self) -> FrozenSet[int]:
+        """Return the ranks of all out-neighbors as a frozenset, which is cached when
+        the topology is set. Self rank is not included."""
+        return self._out_neighbor_set
+
+    def load_recv_weights(self) -> Tuple[float, Dict[int, float], bool]:
+        """Return the weights used by the neighbor ops (neighbor_allreduce, win_update, etc.)
+        when the weights are not provided explicitly. They are cached when the topology is set.
+
+        Returns:
+            self_weight, neighbor_weights, avg_computation: The weights of the topology if
+            it is weighted, otherwise the uniform weights 1/(indegree+1). avg_computation is
+            False for the uniform weights. The returned dictionary should not be modified.
+        """
+        if self._recv_weights is None:
+            return 1.0, {}, False
+        return self._recv_weights
+
+    def _cache_local_topology(self, local_view: Optional[topology_util.LocalView],
+                              is_weighted: bool) -> None:
+        self._local_view = local_view
+        if local_view is None:
+            self._in_neighbor_set = frozenset()
+            self._out_neighbor_set = frozenset()
+            self._recv_weights = None
+            return
+        self._in_neighbor_set = frozenset(local_view.in_neighbor_ranks)
+        self._out_neighbor_set = frozenset(local_view.out_neighbor_ranks)
+        if is_weighted:
+            self._recv_weights = (local_view.recv_self_weight,
+                                  dict(local_view.recv_neighbor_weights), True)
+        else:
+            weight = 1.0/(len(local_view.in_neighbor_ranks)+1)
+            self._recv_weights = (weight,
+                                  {r: weight for r in local_view.in_neighbor_ranks}, False)
 
-    def set_topology(self, topology: Optional[networkx.DiGraph] = None,
+    def set_topology(self, topology: Optional[topology_util.TopologyType] = None,
                      is_weighted: bool = False) -> bool:
         """A funnction that sets the virtual topology MPI used.
 
         Args:
-          Topo: A networkx.DiGraph object to decide the topology. If not provided
-            a default exponential graph (base 2) structure is used.
+          Topo: A networkx.DiGraph or topology_util.SparseTopology object to decide the
+            topology. If not provided a default exponential graph (base 2) structure is used.
+            SparseTopology only touches the neighbors of self rank, which is preferred
+            for the large world size.
           is_weighted: If set to true, the win_update and neighbor_allreduce will execute the
             weighted average instead, where the weights are the value used in topology matrix
             (including self weight). Note win_get/win_put/win_accumulate do not use this weight
@@ -207,24 +261,29 @@ class BlueFogBasics(object):
             >>> bf.set_topology(topology_util.RingGraph(bf.size()))
         """
         if topology is None:
-            topology = topology_util.ExponentialGraph(size=self.size())
+            topology = topology_util.SparseExponentialGraph(size=self.size())
             if self.local_rank() == 0:
                 logger.info(
                     "Topology is not specified. Default Exponential Two topology is used.")
 
-        if not isinstance(topology, networkx.DiGraph):
-            raise TypeError("topology must be a networkx.DiGraph obejct.")
-        if topology_util.IsTopologyEquivalent(topology, self._topology):
+        if not isinstance(topology, (networkx.DiGraph, topology_util.SparseTopology)):
+            raise TypeError("topology must be a networkx.DiGraph or "
+                            "topology_util.SparseTopology obejct.")
+        # The comparison costs O(edges) at most. It is free for the same topology object
+        # and the fingerprint of SparseTopology is cached after the first comparison.
+        # Changing is_weighted alone has to go through the setting as well.
+        if is_weighted == self._is_topo_weighted and \
+                topology_util.IsTopologyEquivalent(topology, self._topology):
             if self.local_rank() == 0:
                 logger.debug(
                     "Topology to set is the same as old one. Skip the setting.")
             return True
 
-        # We remove the self-rank for any cases because MPI graph_comm do not include it.
-        destinations = sorted([r for r in topology.successors(self.rank())
-                               if r != self.rank()])
-        sources = sorted([r for r in topology.predecessors(self.rank())
-                          if r != self.rank()])
+        # Only the neighbors of self rank are evaluated. The neighbor ranks in the view
+        # exclude the self-rank for any cases because MPI graph_comm do not include it.
+        local_view = topology_util.GetLocalView(topology, self.rank())
+        destinations = local_view.out_neighbor_ranks
+        sources = local_view.in_neighbor_ranks
         indegree = len(sources)
         outdegree = len(destinations)
         sources_type = ctypes.c_int * indegree
@@ -241,8 +300,8 @@ class BlueFogBasics(object):
         else:
             # Here the source_weights is a vector containing weights from source, i.e.,
             # (in-)neighbors, converted from the neighbor_weights dictionary.
-            self_weight, neighbor_weights = topology_util.GetRecvWeights(topology, self.rank())
-            source_weights = [neighbor_weights[r] for r in sorted(neighbor_weights.keys())]
+            self_weight = local_view.recv_self_weight
+            source_weights = [local_view.recv_neighbor_weights[r] for r in sources]
             source_weights_type = ctypes.c_float * indegree
             self._MPI_LIB_CTYPES.bluefog_set_topology_with_weights.argtypes = (
                 [ctypes.c_int, ctypes.POINTER(ctypes.c_int),
@@ -267,7 +326,9 @@ class BlueFogBasics(object):
                 )
             return False
         self._topology = topology
+        self._nx_topology = None
         self._is_topo_weighted = is_weighted
+        self._cache_local_topology(local_view, is_weighted)
         return True
 
     def is_homogeneous(self) -> bool:
@@ -284,6 +284,13 @@ struct TensorTableEntry {
   // Boolean value for hierarchical operation or not.
   bool is_hierarchical = false;
 
+  // Chunk size in bytes if the neighbor_allreduce is pipelined. Then the
+  // output has the shape of the tensor and the controller reduces it as
+  // self_weight * tensor + sum of src_weights[j] * (tensor of neighbor j).
+  // Zero means the output is filled with the tensors of the neighbors.
+  int64_t pipeline_chunk_size = 0;
+  double self_weight = 1.0;
+
   // The ops requires the mutex.
   bool require_mutex = false;
 
@@ -19,12 +19,15 @@
 
 #include <atomic>
 #include <chrono>
+#include <list>
 #include <memory>
 #include <queue>
 #include <thread>
 
 #include "tensor_queue.h"
 #include "mpi_controller.h"
+#include "parameter_manager.h"
+#include "response_cache.h"
 #include "timeline.h"
 
 #if HAVE_NCCL
@@ -66,6 +69,14 @@ struct BluefogGlobalState {
   // Time point when last cycle started.
   std::chrono::steady_clock::time_point last_cycle_start;
 
+  // Adaptive cycle time. When enabled, the background thread wakes up as soon as
+  // a tensor is enqueued, keeps the regular cycle time to batch tensors while
+  // the queue is busy, and doubles the cycle time (up to max_cycle_time_ms)
+  // while it is idle.
+  bool adaptive_cycle_time = false;
+  double max_cycle_time_ms = 5.0;
+  double current_cycle_time_ms = 0.5;
+
   // Time point when coordinator last checked for stalled tensors.
   std::chrono::steady_clock::time_point last_stall_check;
 
@@ -82,6 +93,27 @@ struct BluefogGlobalState {
   int64_t tensor_fusion_threshold = 8 * 1024 * 1024;
   FusionBufferManager fusion_buffer;
 
+  // Autotunes the fusion threshold and the cycle time. Only used on the
+  // coordinator node (rank zero).
+  ParameterManager parameter_manager;
+
+  // Responses of the tensors negotiated before. Disabled if capacity is zero.
+  ResponseCache response_cache;
+
+  // Requests hit in the response cache, which wait for the other ranks.
+  std::unordered_map<std::string, Request> cache_hit_requests;
+
+  // Negotiate neighbor_allreduce among the neighbors instead of through the
+  // coordinator.
+  bool neighbor_negotiation = false;
+
+  // Neighbor negotiated ops in flight. The list keeps the addresses of their
+  // MPI buffers stable.
+  std::list<NeighborNegotiatedOp> neighbor_negotiated_ops;
+
+  // Chunk size in bytes of the pipelined neighbor_allreduce. Zero disables it.
+  int64_t neighbor_allreduce_chunk_size = 0;
+
   // Because setting topology happens in the main thread instead of communication
   // thread. Following three variables are to sync between them.
   std::atomic_bool setting_topology{false};
@@ -103,6 +135,7 @@ struct BluefogGlobalState {
     // destructor cannot be called.
     if (background_thread.joinable()) {
       shut_down = true;
+      tensor_queue.WakeUp();
       background_thread.join();
     }
   }
@@ -100,6 +100,10 @@ bool Request::is_hierarchical() const { return is_hierarchical_; }
 
 void Request::set_is_hierarchical(bool value) { is_hierarchical_ = value; }
 
+int64_t Request::neighbor_pattern() const { return neighbor_pattern_; }
+
+void Request::set_neighbor_pattern(int64_t value) { neighbor_pattern_ = value; }
+
 const std::vector<int64_t>& Request::tensor_shape() const {
   return tensor_shape_;
 }
@@ -123,6 +127,7 @@ void Request_ParseFromWire(Request& request,
   request.set_root_rank(obj->root_rank());
   request.set_device(obj->device());
   request.set_is_hierarchical(obj->is_hierarchical());
+  request.set_neighbor_pattern(obj->neighbor_pattern());
   request.set_tensor_shape(std::vector<int64_t>(obj->tensor_shape()->begin(),
                                                 obj->tensor_shape()->end()));
 }
@@ -143,6 +148,7 @@ void Request_SerializeToWire(const Request& request,
   request_builder.add_root_rank(request.root_rank());
   request_builder.add_device(request.device());
   request_builder.add_is_hierarchical(request.is_hierarchical());
+  request_builder.add_neighbor_pattern(request.neighbor_pattern());
   request_builder.add_tensor_shape(tensor_shape_wire);
   obj = request_builder.Finish();
 }
@@ -309,6 +315,10 @@ void Response::set_devices(const std::vector<int32_t>& value) {
 
 void Response::add_device(int32_t value) { devices_.push_back(value); }
 
+int64_t Response::neighbor_pattern() const { return neighbor_pattern_; }
+
+void Response::set_neighbor_pattern(int64_t value) { neighbor_pattern_ = value; }
+
 void Response_ParseFromWire(Response& response,
                             const wire::Response* obj) {
   response.set_response_type((Response::ResponseType) obj->response_type());
@@ -372,6 +382,18 @@ bool ResponseList::change_topo() const { return change_topo_; }
 
 void ResponseList::set_change_topo(bool value) { change_topo_ = value; }
 
+int64_t ResponseList::tensor_fusion_threshold() const {
+  return tensor_fusion_threshold_;
+}
+
+void ResponseList::set_tensor_fusion_threshold(int64_t value) {
+  tensor_fusion_threshold_ = value;
+}
+
+double ResponseList::cycle_time_ms() const { return cycle_time_ms_; }
+
+void ResponseList::set_cycle_time_ms(double value) { cycle_time_ms_ = value; }
+
 void ResponseList::add_response(const Response& value) {
   responses_.push_back(value);
 }
@@ -390,6 +412,8 @@ void ResponseList::ParseFromBytes(ResponseList& response_list,
   }
   response_list.set_shutdown(obj->shutdown());
   response_list.set_change_topo(obj->change_topo());
+  response_list.set_tensor_fusion_threshold(obj->tensor_fusion_threshold());
+  response_list.set_cycle_time_ms(obj->cycle_time_ms());
 }
 
 void ResponseList::SerializeToString(const ResponseList& response_list,
@@ -409,6 +433,9 @@ void ResponseList::SerializeToString(const ResponseList& response_list,
   response_list_builder.add_responses(responses_wire);
   response_list_builder.add_shutdown(response_list.shutdown());
   response_list_builder.add_change_topo(response_list.change_topo());
+  response_list_builder.add_tensor_fusion_threshold(
+      response_list.tensor_fusion_threshold());
+  response_list_builder.add_cycle_time_ms(response_list.cycle_time_ms());
   auto obj = response_list_builder.Finish();
   builder.Finish(obj);
 
@@ -73,6 +73,10 @@ class Request {
   bool is_hierarchical() const;
   void set_is_hierarchical(bool value);
 
+  // Hash of the send and recv neighbors of dynamic neighbor_allreduce.
+  int64_t neighbor_pattern() const;
+  void set_neighbor_pattern(int64_t value);
+
   const std::vector<int64_t>& tensor_shape() const;
   void set_tensor_shape(const std::vector<int64_t>& value);
   void add_tensor_shape(int64_t value);
@@ -88,6 +92,7 @@ private:
   int32_t root_rank_ = 0;
   int32_t device_ = 0;
   bool is_hierarchical_ = false;
+  int64_t neighbor_pattern_ = 0;
   std::string tensor_name_;
   std::vector<int64_t> tensor_shape_;
 };
@@ -159,6 +164,11 @@ public:
  void set_devices(const std::vector<int32_t>& value);
  void add_device(int32_t value);
 
+ // Combined neighbor patterns of all ranks. It is only used by the coordinator
+ // to decide the fusion, hence not serialized.
+ int64_t neighbor_pattern() const;
+ void set_neighbor_pattern(int64_t value);
+
  static void ParseFromBytes(Response& response, const uint8_t* input);
 
  static void SerializeToString(const Response& response, std::string& output);
@@ -168,6 +178,7 @@ private:
   std::vector<std::string> tensor_names_;
   std::string error_message_;
   std::vector<int32_t> devices_;
+  int64_t neighbor_pattern_ = 0;
 };
 
 class ResponseList {
@@ -186,6 +197,13 @@ public:
   bool change_topo() const;
   void set_change_topo(bool value);
 
+  // Negative values mean the parameter is unchanged.
+  int64_t tensor_fusion_threshold() const;
+  void set_tensor_fusion_threshold(int64_t value);
+
+  double cycle_time_ms() const;
+  void set_cycle_time_ms(double value);
+
   static void ParseFromBytes(ResponseList& response_list,
                              const uint8_t* input);
 
@@ -196,6 +214,8 @@ private:
   std::vector<Response> responses_;
   bool shutdown_ = false;
   bool change_topo_ = false;
+  int64_t tensor_fusion_threshold_ = -1;
+  double cycle_time_ms_ = -1;
 };
 
 } // namespace common
@@ -40,11 +40,10 @@ void MPIContextManager::EnvFinalize() {
 }
 
 void WindowManager::FreeAllWins() {
-  for (auto& win_tensor : wins_tensor_vec_) {
-    MPI_Win_free(win_tensor.first.get());
-  }
+  MPI_Win_free(neighbor_win_.get());
   MPI_Win_free(global_win_.get());
-  wins_tensor_vec_.clear();
+  neighbor_tensors_.clear();
+  target_disps_.clear();
 }
 
 bool WindowManager::InitializeMutexWin(const MPI_Comm& mpi_comm) {
@@ -60,13 +59,13 @@ bool WindowManager::InitializeMutexWin(const MPI_Comm& mpi_comm) {
   if (!mutex_win_) {
     mutex_win_ = std::make_shared<MPI_Win>();
   }
-  // We only need one value for self mutex.
-  mutex_mem_.resize(global_size);
-  std::fill_n(mutex_mem_.data(), global_size, 0);
+  // The queue of each mutex is empty at the beginning.
+  mutex_mem_.resize(WIN_MUTEX_FIELDS * global_size);
+  std::fill_n(mutex_mem_.data(), mutex_mem_.size(), 0);
 
   int element_size = 0;
   MPI_Type_size(MPI_INT, &element_size);
-  int win_size = global_size * element_size;
+  int win_size = WIN_MUTEX_FIELDS * global_size * element_size;
   MPI_Win_create((void*)mutex_mem_.data(), win_size, element_size,
                  MPI_INFO_NULL, mpi_comm, mutex_win_.get());
   return true;
@@ -324,6 +323,7 @@ void MPIContext::Initialize(const std::vector<int>& ranks,
 
   // The real graph communicator creatation is late.
   graph_comm = MPI_COMM_NULL;
+  graph_negotiation_comm = MPI_COMM_NULL;
   DisableTopoWeights();
 
   // Create custom MPI float16 data type.
@@ -345,6 +345,10 @@ void MPIContext::Finalize(MPIContextManager& ctx_manager) {
     MPI_Comm_free(&graph_comm);
   }
 
+  if (graph_negotiation_comm != MPI_COMM_NULL) {
+    MPI_Comm_free(&graph_negotiation_comm);
+  }
+
   if (mpi_comm != MPI_COMM_NULL && mpi_comm != MPI_COMM_WORLD) {
     MPI_Comm_free(&mpi_comm);
   }
@@ -387,6 +391,17 @@ int MPIContext::BuildGraphComm(const int indegree, const int* sources,
         "details.");
     return -1;
   }
+
+  if (graph_negotiation_comm != MPI_COMM_NULL) {
+    MPI_Comm_free(&graph_negotiation_comm);
+  }
+  ret_code = MPI_Comm_dup(graph_comm, &graph_negotiation_comm);
+  if (ret_code != MPI_SUCCESS) {
+    throw std::runtime_error(
+        "Duplicate distributed graph communicator failed, see MPI output for "
+        "details.");
+    return -1;
+  }
   return 1;
 }
 
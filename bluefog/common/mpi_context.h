@@ -28,6 +28,11 @@
 namespace bluefog {
 namespace common {
 
+// Number of int fields per rank in the mutex window, i.e. the queue tail of
+// self mutex and the queue nodes of both the self and remote mutexes. See
+// MPIWinMutexAcquireImpl for the layout.
+constexpr int WIN_MUTEX_FIELDS = 5;
+
 // Base class for managing MPI environment.
 class MPIContextManager {
  public:
@@ -42,23 +47,32 @@ class WindowManager {
  public:
   WindowManager() = default;
 
-  inline std::shared_ptr<MPI_Win> GetWinByRank(int rank) { 
-    return wins_tensor_vec_[rank].first; 
-  }
-  inline std::shared_ptr<Tensor> GetAssociateTensorByRank(int rank) { 
-    return wins_tensor_vec_[rank].second; 
+  inline std::shared_ptr<MPI_Win> GetNeighborWin() { return neighbor_win_; }
+  inline void SetNeighborWin(std::shared_ptr<MPI_Win> win) {
+    neighbor_win_ = win;
   }
-  inline std::shared_ptr<MPI_Win> GetGlobalWin() { return global_win_; }
 
-  inline const void* GetWinMemoryByRank(int rank) { 
-    return wins_tensor_vec_[rank].second->data(); 
+  inline std::shared_ptr<Tensor> GetAssociateTensorByRank(int rank) {
+    auto it = neighbor_tensors_.find(rank);
+    return it == neighbor_tensors_.end() ? nullptr : it->second;
+  }
+  inline void SetAssociateTensorByRank(int rank, std::shared_ptr<Tensor> tensor) {
+    neighbor_tensors_[rank] = tensor;
   }
 
-  inline void PushBackWinAndTensor(std::shared_ptr<MPI_Win> win,
-                                   std::shared_ptr<Tensor> tensor) {
-    wins_tensor_vec_.push_back(std::make_pair(win, tensor));
+  // The displacement (in elements) of the slot that self rank writes to in
+  // the neighbor window of target_rank, or -1 if self rank is not an
+  // in-neighbor of target_rank.
+  inline int64_t GetTargetDisp(int target_rank) {
+    auto it = target_disps_.find(target_rank);
+    return it == target_disps_.end() ? -1 : it->second;
+  }
+  inline void SetTargetDisp(int target_rank, int64_t disp) {
+    target_disps_[target_rank] = disp;
   }
 
+  inline std::shared_ptr<MPI_Win> GetGlobalWin() { return global_win_; }
+
   inline void SetGlobalWin(std::shared_ptr<MPI_Win> win) {
     global_win_ = win;
   }
@@ -90,11 +104,15 @@ class WindowManager {
   void SetAssociatedP(int rank, double weight);
 
  private:
-  // Store all the pointers to the MPI WIN and underlying tensor.
-  // It should always keep the order from 0 to WORLD_SIZE-1.
-  // Used with win_put and win_accumulate.
-  std::vector<std::pair<std::shared_ptr<MPI_Win>, std::shared_ptr<Tensor>>>
-      wins_tensor_vec_;
+  // A window over one allocation holding the tensors of all in-neighbors,
+  // one slot per in-neighbor. Used with win_put and win_accumulate.
+  std::shared_ptr<MPI_Win> neighbor_win_;
+
+  // The tensor in the neighbor window for each in-neighbor rank.
+  std::unordered_map<int, std::shared_ptr<Tensor>> neighbor_tensors_;
+
+  // The displacement of self slot in the neighbor window of each out-neighbor.
+  std::unordered_map<int, int64_t> target_disps_;
 
   // A window associated with the self (all connected).
   // Used with win_get.
@@ -179,6 +197,10 @@ class MPIContext {
   // Graph-based communicator for neighbor collective operations.
   MPI_Comm graph_comm;
 
+  // Duplicate of graph_comm for the neighbor_allreduce negotiated among the
+  // neighbors only, so that its messages never match the ones of other ops.
+  MPI_Comm graph_negotiation_comm = MPI_COMM_NULL;
+
   // MPI Windows used for one-sided communication.
   std::unordered_map<std::string, std::shared_ptr<WindowManager>> named_win_map;
 
@@ -195,6 +217,8 @@ class MPIContext {
 
   int neighbor_indgree_ = -1;
   int neighbor_outdgree_ = -1;
+  // The largest in-degree over all ranks.
+  int max_neighbor_indgree_ = -1;
 
   bool is_homogeneous_ = true;
 
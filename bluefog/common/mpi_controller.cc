@@ -22,7 +22,11 @@
 
 #include <algorithm>
 #include <cassert>
+#include <chrono>
+#include <condition_variable>
 #include <cstring>
+#include <mutex>
+#include <set>
 #include <thread>
 
 #include "cuda_util.h"
@@ -45,6 +49,25 @@ static const int MAX_WIN_SENT =
         ? 1000
         : std::strtol(BLUEFOG_MAX_WIN_SENT, nullptr, 10);
 
+// Bytes of the receive buffers reused by the pipelined neighbor_allreduce. It
+// bounds the chunks in flight per in-neighbor, but at least one chunk per
+// in-neighbor is received at a time. Zero means two chunks per in-neighbor.
+static const char* BLUEFOG_RECV_POOL_SIZE =
+    std::getenv("BLUEFOG_NEIGHBOR_ALLREDUCE_RECV_POOL_SIZE");
+static const int64_t RECV_POOL_SIZE =
+    BLUEFOG_RECV_POOL_SIZE == nullptr
+        ? 0
+        : std::strtoll(BLUEFOG_RECV_POOL_SIZE, nullptr, 10);
+
+// The longest sleep in microseconds between two polls of a waiter of the win
+// mutex. The sleep starts from 1 microsecond and doubles until it.
+static const char* BLUEFOG_WIN_MUTEX_MAX_BACKOFF =
+    std::getenv("BLUEFOG_WIN_MUTEX_MAX_BACKOFF");
+static const int WIN_MUTEX_MAX_BACKOFF =
+    BLUEFOG_WIN_MUTEX_MAX_BACKOFF == nullptr
+        ? 100
+        : std::strtol(BLUEFOG_WIN_MUTEX_MAX_BACKOFF, nullptr, 10);
+
 // MPIController
 void MPIController::Initialize() {
   // Check if multi-thread is supported.
@@ -194,6 +217,8 @@ int MPIController::SetTopology(int indegree, const int* sources, int outdegree,
   MPI_Dist_graph_neighbors_count(mpi_ctx_.graph_comm, &mpi_ctx_.neighbor_indgree_,
                                  &mpi_ctx_.neighbor_outdgree_,
                                  &unused_neighbor_is_weighted_);
+  MPI_Allreduce(&mpi_ctx_.neighbor_indgree_, &mpi_ctx_.max_neighbor_indgree_,
+                1, MPI_INT, MPI_MAX, mpi_ctx_.mpi_comm);
 
   // Clear the previous neighbor_in_ranks_ is necessary because we might
   // change the topology.
@@ -396,12 +421,19 @@ void MPIController::NeighborAllreduce(TensorTableEntry& entry) {
     return;
   }
 
+  if (entry.pipeline_chunk_size > 0) {
+    PipelinedNeighborAllreduce(entry);
+    return;
+  }
+
   timeline_ptr->ActivityStart(entry.tensor_name, "COMMUNICATE");
   // Pitfall: Our neighbor_allreduce include itself, while
   // mpi_neighbor_allgather do not! Because for saving the communication there
   // is no need to transfer the local info again. However, for computation view,
   // including itself is more intuitive.
   std::string error_message = "";
+  // Number of point-to-point messages, recorded in the timeline.
+  int num_messages = 0;
 
   if (!entry.is_hierarchical) {
     if (!entry.dynamic_neighbors_enabled) {
@@ -409,6 +441,7 @@ void MPIController::NeighborAllreduce(TensorTableEntry& entry) {
           sendbuf, num_elements, mpi_ctx_.GetMPIDataType(entry.tensor),
           buffer_data, num_elements, mpi_ctx_.GetMPIDataType(entry.output),
           mpi_ctx_.GetMPICommunicator(Communicator::GRAPH));
+      num_messages = mpi_ctx_.neighbor_indgree_ + mpi_ctx_.neighbor_outdgree_;
       if (ret_code != MPI_SUCCESS) {
         throw std::runtime_error(
             "MPI_Neighbor_allreduce (through neighbor_allgather) failed, see "
@@ -449,6 +482,7 @@ void MPIController::NeighborAllreduce(TensorTableEntry& entry) {
         }
       }
       MPI_Waitall(nsend + nrecv, requests.data(), statuses.data());
+      num_messages = nsend + nrecv;
       error_message =
           GenerateNeighborAllreduceErrorMessage(statuses, nsend, nrecv);
     }
@@ -502,6 +536,7 @@ void MPIController::NeighborAllreduce(TensorTableEntry& entry) {
         }
       }
       MPI_Waitall(nsend + nrecv, requests.data(), statuses.data());
+      num_messages = nsend + nrecv;
       error_message =
           GenerateNeighborAllreduceErrorMessage(statuses, nsend, nrecv);
     } else {
@@ -513,6 +548,9 @@ void MPIController::NeighborAllreduce(TensorTableEntry& entry) {
               mpi_ctx_.GetMPIDataType(entry.output), 0,
               mpi_ctx_.GetMPICommunicator(Communicator::LOCAL));
   }
+  if (num_messages > 0) {
+    timeline_ptr->Counter("NEIGHBOR_ALLREDUCE_MESSAGES", num_messages);
+  }
   timeline_ptr->ActivityEnd(entry.tensor_name);
 
   timeline_ptr->ActivityStart(entry.tensor_name, "COMPUTE_AVERAGE");
@@ -524,6 +562,183 @@ void MPIController::NeighborAllreduce(TensorTableEntry& entry) {
   timeline_ptr->ActivityEnd(entry.tensor_name);
 }
 
+namespace {
+
+// Default number of chunks in flight for each in-neighbor in the pipelined
+// neighbor_allreduce, so that one chunk is reduced while the next one is
+// received.
+const int64_t PIPELINE_DEPTH = 2;
+
+template <typename T>
+void WeightedCopy(void* out, const void* in, double weight, int64_t n,
+                  bool accumulate) {
+  T* y = static_cast<T*>(out);
+  const T* x = static_cast<const T*>(in);
+  if (accumulate) {
+    for (int64_t i = 0; i < n; ++i) y[i] += static_cast<T>(weight * x[i]);
+  } else {
+    for (int64_t i = 0; i < n; ++i) y[i] = static_cast<T>(weight * x[i]);
+  }
+}
+
+// out = weight * in, or out += weight * in if accumulate is true.
+void WeightedCopy(DataType dtype, void* out, const void* in, double weight,
+                  int64_t n, bool accumulate) {
+  switch (dtype) {
+    case DataType::BLUEFOG_FLOAT32:
+      WeightedCopy<float>(out, in, weight, n, accumulate);
+      break;
+    case DataType::BLUEFOG_FLOAT64:
+      WeightedCopy<double>(out, in, weight, n, accumulate);
+      break;
+    default:
+      throw std::logic_error(
+          "Pipelined neighbor_allreduce only supports float and double "
+          "tensors.");
+  }
+}
+
+}  // namespace
+
+void MPIController::PipelinedNeighborAllreduce(TensorTableEntry& entry) {
+  Timeline* timeline_ptr;
+  Status timeline_status = GetBluefogTimeline(timeline_ptr);
+
+  // The order of in-neighbors doesn't matter since the weights are keyed by
+  // the rank.
+  const std::vector<int>& send_ranks = entry.dynamic_neighbors_enabled
+                                           ? *entry.send_neighbors
+                                           : mpi_ctx_.neighbor_out_ranks_;
+  const std::vector<int>& recv_ranks = entry.dynamic_neighbors_enabled
+                                           ? *entry.recv_neighbors
+                                           : mpi_ctx_.neighbor_in_ranks_;
+  int nsend = send_ranks.size();
+  int nrecv = recv_ranks.size();
+
+  const char* sendbuf = static_cast<const char*>(entry.tensor->data());
+  char* outbuf = (char*)entry.output->data();
+  DataType dtype = entry.tensor->dtype();
+  MPI_Datatype mpi_type = mpi_ctx_.GetMPIDataType(entry.tensor);
+  MPI_Comm comm = mpi_ctx_.GetMPICommunicator(Communicator::GRAPH);
+  int element_size = mpi_ctx_.GetMPITypeSize(dtype);
+  int64_t num_elements = entry.tensor->shape().num_elements();
+  int64_t chunk_elements =
+      std::max((int64_t)1, entry.pipeline_chunk_size / element_size);
+  int num_chunks = (num_elements + chunk_elements - 1) / chunk_elements;
+  int64_t chunk_bytes = chunk_elements * element_size;
+  auto ChunkCount = [&](int c) -> int {
+    return (int)std::min(chunk_elements, num_elements - c * chunk_elements);
+  };
+
+  timeline_ptr->ActivityStart(entry.tensor_name, "COMMUNICATE_AND_REDUCE");
+  // The chunks are sent in order. Since MPI doesn't overtake messages between
+  // the same pair of ranks with the same tag, the k-th receive posted for a
+  // neighbor gets its k-th chunk.
+  std::vector<MPI_Request> send_requests(nsend * num_chunks);
+  for (int c = 0; c < num_chunks; ++c) {
+    for (int i = 0; i < nsend; ++i) {
+      int ret_code = MPI_Isend(sendbuf + c * chunk_bytes, ChunkCount(c),
+                               mpi_type, send_ranks[i],
+                               mpi_ctx_.rank_ + send_ranks[i], comm,
+                               &send_requests[c * nsend + i]);
+      if (ret_code != MPI_SUCCESS) {
+        throw std::runtime_error(
+            "MPI_Isend (for pipelined neighbor_allreduce) failed, see MPI "
+            "output for details.");
+      }
+    }
+  }
+
+  // Every in-neighbor has depth slots and slot s receives the chunks c with
+  // c % depth == s. So at most depth chunks per neighbor are buffered instead
+  // of the whole tensor. The slots live in the receive pool, which is reused
+  // by the following ops.
+  int64_t depth = PIPELINE_DEPTH;
+  if (RECV_POOL_SIZE > 0 && nrecv > 0) {
+    depth = std::max((int64_t)1, RECV_POOL_SIZE / (nrecv * chunk_bytes));
+  }
+  depth = std::min(depth, (int64_t)num_chunks);
+  size_t pool_bytes = (size_t)(nrecv * depth * chunk_bytes);
+  if (recv_pool_.size() < pool_bytes) {
+    recv_pool_.resize(pool_bytes);
+    timeline_ptr->Counter("NEIGHBOR_ALLREDUCE_RECV_POOL_BYTES",
+                          (long)pool_bytes);
+  }
+  char* recv_buffer = recv_pool_.data();
+  std::vector<MPI_Request> recv_requests(nrecv * depth, MPI_REQUEST_NULL);
+  std::vector<int> slot_chunks(nrecv * depth);
+  auto PostRecv = [&](int slot, int c) {
+    int recv_rank = recv_ranks[slot / depth];
+    slot_chunks[slot] = c;
+    int ret_code = MPI_Irecv(recv_buffer + slot * chunk_bytes,
+                             ChunkCount(c), mpi_type, recv_rank,
+                             mpi_ctx_.rank_ + recv_rank, comm,
+                             &recv_requests[slot]);
+    if (ret_code != MPI_SUCCESS) {
+      throw std::runtime_error(
+          "MPI_Irecv (for pipelined neighbor_allreduce) failed, see MPI "
+          "output for details.");
+    }
+  };
+  for (int j = 0; j < nrecv; ++j) {
+    for (int s = 0; s < depth; ++s) {
+      PostRecv(j * depth + s, s);
+    }
+  }
+
+  // The self part is computed while the first chunks are in flight.
+  if (nrecv == 0) {
+    // Same as the non-pipelined one, which returns the tensor as it is.
+    std::memcpy(outbuf, sendbuf, num_elements * element_size);
+  } else {
+    WeightedCopy(dtype, outbuf, sendbuf, entry.self_weight, num_elements,
+                 /*accumulate=*/false);
+  }
+  std::vector<double> recv_weights(nrecv, 0.0);
+  for (int j = 0; j < nrecv; ++j) {
+    auto it = entry.src_weights.find(recv_ranks[j]);
+    if (it != entry.src_weights.end()) {
+      recv_weights[j] = it->second;
+    }
+  }
+
+  // Reduce whichever chunk arrives first and reuse its slot for the next chunk
+  // of the same neighbor.
+  for (int remaining = nrecv * num_chunks; remaining > 0; --remaining) {
+    int slot;
+    MPI_Status status;
+    int ret_code = MPI_Waitany(recv_requests.size(), recv_requests.data(),
+                               &slot, &status);
+    if (ret_code != MPI_SUCCESS || slot == MPI_UNDEFINED) {
+      throw std::runtime_error(
+          "MPI_Waitany (for pipelined neighbor_allreduce) failed, see MPI "
+          "output for details.");
+    }
+    int c = slot_chunks[slot];
+    WeightedCopy(dtype, outbuf + c * chunk_bytes,
+                 recv_buffer + slot * chunk_bytes,
+                 recv_weights[slot / depth], ChunkCount(c),
+                 /*accumulate=*/true);
+    if (c + depth < num_chunks) {
+      PostRecv(slot, c + depth);
+    }
+  }
+
+  std::vector<MPI_Status> statuses(send_requests.size());
+  MPI_Waitall(send_requests.size(), send_requests.data(), statuses.data());
+  std::string error_message =
+      GenerateNeighborAllreduceErrorMessage(statuses, statuses.size(), 0);
+  timeline_ptr->Counter("NEIGHBOR_ALLREDUCE_MESSAGES",
+                        (nsend + nrecv) * num_chunks);
+  timeline_ptr->ActivityEnd(entry.tensor_name);
+
+  if (error_message != "") {
+    entry.callback(Status::UnknownError(error_message));
+  } else {
+    entry.callback(Status::OK());
+  }
+}
+
 void MPIController::Allreduce(std::vector<TensorTableEntry>& entries) {
   auto& first_entry = entries[0];
   with_device device_guard(first_entry.device);
@@ -614,6 +829,8 @@ void MPIController::NeighborAllreduce(std::vector<TensorTableEntry>& entries) {
   // is no need to transfer the local info again. However, for computation view,
   // including itself is more intuitive.
   std::string error_message = "";
+  // Number of point-to-point messages, recorded in the timeline.
+  int num_messages = 0;
 
   if (!first_entry.is_hierarchical) {
     if (!first_entry.dynamic_neighbors_enabled) {
@@ -621,6 +838,7 @@ void MPIController::NeighborAllreduce(std::vector<TensorTableEntry>& entries) {
           fused_input_data, num_elements, mpi_ctx_.GetMPIDataType(first_entry.tensor),
           buffer_data, num_elements, mpi_ctx_.GetMPIDataType(first_entry.output),
           mpi_ctx_.GetMPICommunicator(Communicator::GRAPH));
+      num_messages = mpi_ctx_.neighbor_indgree_ + mpi_ctx_.neighbor_outdgree_;
       if (ret_code != MPI_SUCCESS) {
         throw std::runtime_error(
             "MPI_Neighbor_allreduce (through neighbor_allgather) failed, see MPI "
@@ -659,6 +877,7 @@ void MPIController::NeighborAllreduce(std::vector<TensorTableEntry>& entries) {
         }
       }
       MPI_Waitall(nsend + nrecv, requests.data(), statuses.data());
+      num_messages = nsend + nrecv;
       error_message =
           GenerateNeighborAllreduceErrorMessage(statuses, nsend, nrecv);
     }
@@ -711,6 +930,7 @@ void MPIController::NeighborAllreduce(std::vector<TensorTableEntry>& entries) {
         }
       }
       MPI_Waitall(nsend + nrecv, requests.data(), statuses.data());
+      num_messages = nsend + nrecv;
       error_message =
           GenerateNeighborAllreduceErrorMessage(statuses, nsend, nrecv);
     } else {
@@ -724,6 +944,9 @@ void MPIController::NeighborAllreduce(std::vector<TensorTableEntry>& entries) {
               mpi_ctx_.GetMPIDataType(first_entry.output), 0,
               mpi_ctx_.GetMPICommunicator(Communicator::LOCAL));
   }
+  if (num_messages > 0) {
+    timeline_ptr->Counter("NEIGHBOR_ALLREDUCE_MESSAGES", num_messages);
+  }
   timeline_ptr->ActivityEndAll(entries);
 
   // Remember buffer_data is already pointed at offset location (after self tensor).
@@ -745,6 +968,212 @@ void MPIController::NeighborAllreduce(std::vector<TensorTableEntry>& entries) {
   }
 }
 
+namespace {
+
+// All headers use tag 0. The data use the tags from 1 to 32767, which is the
+// largest tag guaranteed by MPI, in turn.
+const int NEGOTIATION_HEADER_TAG = 0;
+const int NEGOTIATION_MAX_DATA_TAG = 32767;
+
+// FNV-1a hash of the tensor name. It is the same on all ranks, unlike
+// std::hash.
+int64_t HashTensorName(const std::string& name) {
+  uint64_t hash = 14695981039346656037ULL;
+  for (char c : name) {
+    hash ^= static_cast<unsigned char>(c);
+    hash *= 1099511628211ULL;
+  }
+  // Keep it positive since it is sent as a signed integer.
+  return static_cast<int64_t>(hash >> 1);
+}
+
+}  // namespace
+
+void MPIController::StartNeighborNegotiatedAllreduce(NeighborNegotiatedOp& op) {
+  TensorTableEntry& entry = op.entry;
+  if (entry.dynamic_neighbors_enabled) {
+    op.send_ranks = *entry.send_neighbors;
+    op.recv_ranks = *entry.recv_neighbors;
+  } else {
+    op.send_ranks = mpi_ctx_.neighbor_out_ranks_;
+    op.recv_ranks = mpi_ctx_.neighbor_in_ranks_;
+  }
+  int nsend = op.send_ranks.size();
+  int nrecv = op.recv_ranks.size();
+  int num_elements = entry.tensor->shape().num_elements();
+  // The data tag only has to differ from the other data in flight to the
+  // same neighbor, whose header tells the receiver the tag.
+  int data_tag = next_negotiation_data_tag_;
+  next_negotiation_data_tag_ = data_tag % NEGOTIATION_MAX_DATA_TAG + 1;
+  op.send_header[0] = HashTensorName(entry.tensor_name);
+  op.send_header[1] = num_elements;
+  op.send_header[2] = static_cast<int64_t>(entry.tensor->dtype());
+  op.send_header[3] = data_tag;
+  op.header_requests.assign(nsend, MPI_REQUEST_NULL);
+  op.data_requests.assign(nsend + nrecv, MPI_REQUEST_NULL);
+  op.data_recv_posted.assign(nrecv, false);
+  op.num_data_recv_posted = 0;
+  op.drain_buffers.resize(nrecv);
+  op.error_message = "";
+  op.start_time = std::chrono::steady_clock::now();
+
+  Timeline* timeline_ptr;
+  Status timeline_status = GetBluefogTimeline(timeline_ptr);
+  timeline_ptr->ActivityStart(entry.tensor_name, "NEIGHBOR_NEGOTIATED_COMMUNICATE");
+
+  with_device device_guard(entry.device);
+  MPI_Comm comm = mpi_ctx_.graph_negotiation_comm;
+  for (int i = 0; i < nsend; ++i) {
+    int ret_code = MPI_Isend(op.send_header, 4, MPI_INT64_T, op.send_ranks[i],
+                             NEGOTIATION_HEADER_TAG, comm,
+                             &op.header_requests[i]);
+    if (ret_code != MPI_SUCCESS) {
+      throw std::runtime_error(
+          "MPI_Isend (for neighbor negotiated allreduce) failed, see MPI "
+          "output for details.");
+    }
+    ret_code = MPI_Isend(entry.tensor->data(), num_elements,
+                         mpi_ctx_.GetMPIDataType(entry.tensor),
+                         op.send_ranks[i], data_tag, comm,
+                         &op.data_requests[i]);
+    if (ret_code != MPI_SUCCESS) {
+      throw std::runtime_error(
+          "MPI_Isend (for neighbor negotiated allreduce) failed, see MPI "
+          "output for details.");
+    }
+  }
+}
+
+void MPIController::ReceiveNegotiationHeaders() {
+  MPI_Comm comm = mpi_ctx_.graph_negotiation_comm;
+  int flag = 0;
+  MPI_Status status;
+  while (true) {
+    MPI_Iprobe(MPI_ANY_SOURCE, NEGOTIATION_HEADER_TAG, comm, &flag, &status);
+    if (!flag) {
+      return;
+    }
+    std::array<int64_t, 4> header;
+    int ret_code = MPI_Recv(header.data(), 4, MPI_INT64_T, status.MPI_SOURCE,
+                            NEGOTIATION_HEADER_TAG, comm, MPI_STATUS_IGNORE);
+    if (ret_code != MPI_SUCCESS) {
+      throw std::runtime_error(
+          "MPI_Recv (for neighbor negotiated allreduce) failed, see MPI "
+          "output for details.");
+    }
+    negotiation_headers_[std::make_pair(status.MPI_SOURCE, header[0])]
+        .push_back(header);
+  }
+}
+
+bool MPIController::TestNeighborNegotiatedAllreduce(NeighborNegotiatedOp& op) {
+  TensorTableEntry& entry = op.entry;
+  int nsend = op.send_ranks.size();
+  int nrecv = op.recv_ranks.size();
+  int flag = 0;
+  with_device device_guard(entry.device);
+
+  if (op.num_data_recv_posted < nrecv) {
+    // Receive the data of an in-neighbor into the output once its header of
+    // the same name arrives, or drain it if the size or type is different.
+    // The headers of other tensors are kept for their own ops.
+    ReceiveNegotiationHeaders();
+    int element_size = mpi_ctx_.GetMPITypeSize(entry.output->dtype());
+    MPI_Comm comm = mpi_ctx_.graph_negotiation_comm;
+    for (int i = 0; i < nrecv; ++i) {
+      if (op.data_recv_posted[i]) {
+        continue;
+      }
+      auto it = negotiation_headers_.find(
+          std::make_pair(op.recv_ranks[i], op.send_header[0]));
+      if (it == negotiation_headers_.end()) {
+        continue;
+      }
+      std::array<int64_t, 4> header = it->second.front();
+      it->second.pop_front();
+      if (it->second.empty()) {
+        negotiation_headers_.erase(it);
+      }
+      void* recvbuf;
+      int count;
+      MPI_Datatype datatype;
+      if (header[1] == op.send_header[1] && header[2] == op.send_header[2]) {
+        recvbuf = (void*)(static_cast<const char*>(entry.output->data()) +
+                          op.send_header[1] * i * element_size);
+        count = op.send_header[1];
+        datatype = mpi_ctx_.GetMPIDataType(entry.output);
+      } else {
+        op.error_message += "Rank " + std::to_string(op.recv_ranks[i]) +
+                            " sent " + std::to_string(header[1]) +
+                            " elements of dtype " +
+                            std::to_string(header[2]) + ".\n";
+        op.drain_buffers[i].resize(
+            header[1] *
+            mpi_ctx_.GetMPITypeSize(static_cast<DataType>(header[2])));
+        recvbuf = op.drain_buffers[i].data();
+        count = op.drain_buffers[i].size();
+        datatype = MPI_BYTE;
+      }
+      int ret_code =
+          MPI_Irecv(recvbuf, count, datatype, op.recv_ranks[i],
+                    static_cast<int>(header[3]), comm,
+                    &op.data_requests[nsend + i]);
+      if (ret_code != MPI_SUCCESS) {
+        throw std::runtime_error(
+            "MPI_Irecv (for neighbor negotiated allreduce) failed, see MPI "
+            "output for details.");
+      }
+      op.data_recv_posted[i] = true;
+      op.num_data_recv_posted++;
+    }
+    if (op.num_data_recv_posted < nrecv) {
+      return false;
+    }
+  }
+
+  MPI_Testall(nsend, op.header_requests.data(), &flag, MPI_STATUSES_IGNORE);
+  if (!flag) {
+    return false;
+  }
+  std::vector<MPI_Status> statuses(nsend + nrecv);
+  MPI_Testall(nsend + nrecv, op.data_requests.data(), &flag, statuses.data());
+  if (!flag) {
+    return false;
+  }
+
+  Timeline* timeline_ptr;
+  Status timeline_status = GetBluefogTimeline(timeline_ptr);
+  timeline_ptr->ActivityEnd(entry.tensor_name);
+  std::string error_message =
+      GenerateNeighborAllreduceErrorMessage(statuses, nsend, nrecv);
+  if (!op.error_message.empty()) {
+    entry.callback(Status::InvalidArgument(
+        "Mismatched neighbor negotiated allreduce of " + entry.tensor_name +
+        ":\n" + op.error_message));
+  } else if (error_message != "") {
+    entry.callback(Status::UnknownError(error_message));
+  } else {
+    entry.callback(Status::OK());
+  }
+  return true;
+}
+
+void MPIController::CancelNeighborNegotiatedAllreduce(NeighborNegotiatedOp& op,
+                                                      const Status& status) {
+  for (auto* requests : {&op.header_requests, &op.data_requests}) {
+    for (auto& request : *requests) {
+      if (request != MPI_REQUEST_NULL) {
+        MPI_Cancel(&request);
+        MPI_Request_free(&request);
+      }
+    }
+  }
+  Timeline* timeline_ptr;
+  Status timeline_status = GetBluefogTimeline(timeline_ptr);
+  timeline_ptr->ActivityEnd(op.entry.tensor_name);
+  op.entry.callback(status);
+}
+
 void MPIController::PairGossip(TensorTableEntry& entry) {
   const void* sendbuf = entry.tensor->data();
   void* recvbuf = (void*)entry.output->data();
@@ -824,44 +1253,66 @@ void MPIController::WinCreate(TensorTableEntry& entry) {
                  global_mpi_win_ptr.get());
   win_manager->SetGlobalWin(global_mpi_win_ptr);
 
-  // Build extra buffers for win_put.
+  // Build the buffers for win_put and win_accumulate.
   // For example: size=4 exponential two ring topology
   // r\s   0    1    2    3
   //  0    g    x         x
   //  1    x    g    x
   //  2         x    g    x
   //  3    x         x    g
-  //  The following for-loop scans along columns
-  //  and the self-rank determines the rows.
-  //  If there is connection, the window is associated with the
-  //  neighbor_tensors. Otherwise, window is associated with null pointer.
-  std::shared_ptr<MPI_Win> mpi_win_ptr;
-  int neighbor_tensor_index = 0;
-  for (int rank = 0; rank < mpi_ctx_.size_; rank++) {
-    auto mpi_win_ptr = std::make_shared<MPI_Win>();
-    std::shared_ptr<Tensor> t = nullptr;
-    if (rank == mpi_ctx_.rank_) {
-      // Sender (no need to allocate the memory with it.)
-      data_buf = nullptr;
-      element_size = 1;
-      win_size = 0;
-    } else if (std::find(mpi_ctx_.neighbor_in_ranks_.begin(), mpi_ctx_.neighbor_in_ranks_.end(),
-                         rank) != mpi_ctx_.neighbor_in_ranks_.end()) {
-      // Receiver
-      t = neighbor_tensors[neighbor_tensor_index++];
-      data_buf = (void*)t->data();
-      element_size = mpi_ctx_.GetMPITypeSize(t->dtype());
-      win_size = (t->shape().num_elements()) * element_size;
-    } else {
-      // Just participate in a collective call.
-      data_buf = nullptr;
-      element_size = 1;
-      win_size = 0;
+  //  Each row (receiver) exposes the tensors of its in-neighbors (x) through
+  //  one window over one allocation, in which the k-th in-neighbor owns the
+  //  k-th slot. So the window count and the memory do not grow with the world
+  //  size. A sender writes to its slot at the receiver, whose displacement is
+  //  sent by the receiver when the window is created.
+  const std::vector<int>& in_ranks = mpi_ctx_.neighbor_in_ranks_;
+  const std::vector<int>& out_ranks = mpi_ctx_.neighbor_out_ranks_;
+  int64_t slot_elements = tensor->shape().num_elements();
+  data_buf = nullptr;
+  element_size = mpi_ctx_.GetMPITypeSize(tensor->dtype());
+  MPI_Aint neighbor_win_size = 0;
+  if (!in_ranks.empty()) {
+    data_buf = (void*)neighbor_tensors[0]->data();
+    int64_t slot_bytes = slot_elements * element_size;
+    for (size_t i = 0; i < in_ranks.size(); ++i) {
+      if (neighbor_tensors[i]->data() !=
+          static_cast<const char*>(data_buf) + i * slot_bytes) {
+        throw std::runtime_error(
+            "The neighbor tensors of window " + name +
+            " have to be the consecutive slots of one allocation.");
+      }
+      win_manager->SetAssociateTensorByRank(in_ranks[i], neighbor_tensors[i]);
     }
-    MPI_Win_create(data_buf, win_size, element_size, MPI_INFO_NULL,
-                   mpi_ctx_.GetMPICommunicator(Communicator::GLOBAL),
-                   mpi_win_ptr.get());
-    win_manager->PushBackWinAndTensor(mpi_win_ptr, t);
+    neighbor_win_size = static_cast<MPI_Aint>(slot_bytes * in_ranks.size());
+  }
+  auto neighbor_mpi_win_ptr = std::make_shared<MPI_Win>();
+  MPI_Win_create(data_buf, neighbor_win_size, element_size, MPI_INFO_NULL,
+                 mpi_ctx_.GetMPICommunicator(Communicator::GLOBAL),
+                 neighbor_mpi_win_ptr.get());
+  win_manager->SetNeighborWin(neighbor_mpi_win_ptr);
+
+  // Tell every in-neighbor where its slot is.
+  std::vector<int64_t> send_disps(in_ranks.size());
+  std::vector<int64_t> recv_disps(out_ranks.size());
+  std::vector<MPI_Request> requests(in_ranks.size() + out_ranks.size());
+  MPI_Comm comm = mpi_ctx_.GetMPICommunicator(Communicator::GLOBAL);
+  for (size_t i = 0; i < out_ranks.size(); ++i) {
+    MPI_Irecv(&recv_disps[i], 1, MPI_INT64_T, out_ranks[i], 0, comm,
+              &requests[i]);
+  }
+  for (size_t i = 0; i < in_ranks.size(); ++i) {
+    send_disps[i] = static_cast<int64_t>(i) * slot_elements;
+    MPI_Isend(&send_disps[i], 1, MPI_INT64_T, in_ranks[i], 0, comm,
+              &requests[out_ranks.size() + i]);
+  }
+  int ret_code =
+      MPI_Waitall(requests.size(), requests.data(), MPI_STATUSES_IGNORE);
+  if (ret_code != MPI_SUCCESS) {
+    throw std::runtime_error(
+        "Exchanging the slots of window failed, see MPI output for details.");
+  }
+  for (size_t i = 0; i < out_ranks.size(); ++i) {
+    win_manager->SetTargetDisp(out_ranks[i], recv_disps[i]);
   }
   timeline_ptr->ActivityEnd(name);
 
@@ -895,12 +1346,10 @@ Status MPIController::WinSync(const std::string& name, int device, bool with_ass
 
   with_device device_guard(device);
   auto win_mananger = it->second;
-  for (auto rank : mpi_ctx_.neighbor_in_ranks_) {
-    auto mpi_win_ptr = win_mananger->GetWinByRank(rank);
-    MPI_Win_lock(MPI_LOCK_EXCLUSIVE, mpi_ctx_.rank_, MPI_MODE_NOCHECK, *mpi_win_ptr);
-    MPI_Win_sync(*mpi_win_ptr);
-    MPI_Win_unlock(mpi_ctx_.rank_, *mpi_win_ptr);
-  }
+  auto mpi_win_ptr = win_mananger->GetNeighborWin();
+  MPI_Win_lock(MPI_LOCK_EXCLUSIVE, mpi_ctx_.rank_, MPI_MODE_NOCHECK, *mpi_win_ptr);
+  MPI_Win_sync(*mpi_win_ptr);
+  MPI_Win_unlock(mpi_ctx_.rank_, *mpi_win_ptr);
   if (with_associated_p) {
     auto p_win_ptr = win_mananger->GetPWin();
     MPI_Win_lock(MPI_LOCK_EXCLUSIVE, mpi_ctx_.rank_, MPI_MODE_NOCHECK,
@@ -921,9 +1370,7 @@ Status MPIController::WinFence(const std::string& name) {
   }
 
   std::shared_ptr<WindowManager> win_mananger = it->second;
-  for (int rank = 0; rank < mpi_ctx_.size_; rank++) {
-    MPI_Win_fence(0, *(win_mananger->GetWinByRank(rank)));
-  }
+  MPI_Win_fence(0, *(win_mananger->GetNeighborWin()));
 
   return Status::OK();
 }
@@ -962,7 +1409,7 @@ void MPIController::WinPut(TensorTableEntry& entry) {
                              " in (MPI) registered win name.");
   }
   std::shared_ptr<WindowManager> win_mananger = it->second;
-  MPI_Win mpi_win = *(win_mananger->GetWinByRank(mpi_ctx_.rank_));
+  MPI_Win mpi_win = *(win_mananger->GetNeighborWin());
 
   Timeline* timeline_ptr;
   Status timeline_status = GetBluefogTimeline(timeline_ptr);
@@ -975,6 +1422,12 @@ void MPIController::WinPut(TensorTableEntry& entry) {
     double weight = kv.second;
 
     BFLOG(TRACE, mpi_ctx_.rank_) << "Start MPI_Put for " << entry.tensor_name << " to " << target_rank;
+    int64_t slot_disp = win_mananger->GetTargetDisp(target_rank);
+    if (target_rank != mpi_ctx_.rank_ && slot_disp < 0) {
+      throw std::runtime_error("Cannot put " + entry.tensor_name + " to " +
+                               std::to_string(target_rank) +
+                               ", which is not an out-neighbor.");
+    }
 
     if (entry.require_mutex) {
       timeline_ptr->ActivityStart(entry.tensor_name, "Aquire_Mutex");
@@ -994,7 +1447,7 @@ void MPIController::WinPut(TensorTableEntry& entry) {
           (void*)(static_cast<char*>(sendbuf) +
                   target_disp * mpi_ctx_.GetMPITypeSize(tensor->dtype()));
       int ret_code = MPI_Put(sendbuf_start, sent_size, data_type, target_rank,
-                             target_disp, sent_size, data_type, mpi_win);
+                             slot_disp + target_disp, sent_size, data_type, mpi_win);
       if (ret_code != MPI_SUCCESS) {
         throw std::runtime_error("MPI_Put failed, see MPI output for details.");
       }
@@ -1045,7 +1498,7 @@ void MPIController::WinAccumulate(TensorTableEntry& entry) {
                              " in (MPI) registered win name.");
   }
   std::shared_ptr<WindowManager> win_mananger = it->second;
-  MPI_Win mpi_win = *(win_mananger->GetWinByRank(mpi_ctx_.rank_));
+  MPI_Win mpi_win = *(win_mananger->GetNeighborWin());
 
   Timeline* timeline_ptr;
   Status timeline_status = GetBluefogTimeline(timeline_ptr);
@@ -1064,6 +1517,14 @@ void MPIController::WinAccumulate(TensorTableEntry& entry) {
       WinMutexAcquire(entry.tensor_name, {target_rank}, /*is_sync=*/false);
       timeline_ptr->ActivityEnd(entry.tensor_name);
     }
+    int64_t slot_disp = win_mananger->GetTargetDisp(target_rank);
+    if (slot_disp < 0) {
+      if (entry.require_mutex)
+        WinMutexRelease(entry.tensor_name, {target_rank}, /*is_sync=*/false);
+      throw std::runtime_error("Cannot accumulate " + entry.tensor_name + " to " +
+                               std::to_string(target_rank) +
+                               ", which is not an out-neighbor.");
+    }
     auto tensor = entry.tensor->data_weight(weight);
     void* sendbuf = (void*)tensor->data();
 
@@ -1078,7 +1539,8 @@ void MPIController::WinAccumulate(TensorTableEntry& entry) {
                   target_disp * mpi_ctx_.GetMPITypeSize(tensor->dtype()));
       int ret_code =
           MPI_Accumulate(sendbuf_start, sent_size, data_type, target_rank,
-                         target_disp, sent_size, data_type, MPI_SUM, mpi_win);
+                         slot_disp + target_disp, sent_size, data_type, MPI_SUM,
+                         mpi_win);
       if (ret_code != MPI_SUCCESS) {
         if (entry.require_mutex)
           WinMutexRelease(entry.tensor_name, {target_rank}, /*is_sync=*/false);
@@ -1091,6 +1553,9 @@ void MPIController::WinAccumulate(TensorTableEntry& entry) {
     MPI_Win_unlock(target_rank, mpi_win);
     timeline_ptr->ActivityEnd(entry.tensor_name);
 
+    // Like win_put, so that the incremental win_update reads the accumulated slot.
+    WinVersionPutUpdate(entry.tensor_name, {target_rank});
+
     if (entry.win_ops_with_associated_p) {
       std::shared_ptr<MPI_Win> weight_win = win_mananger->GetPWin();
       MPI_Win_lock(MPI_LOCK_SHARED, target_rank, MPI_MODE_NOCHECK, *weight_win);
@@ -1146,6 +1611,13 @@ void MPIController::WinGet(TensorTableEntry& entry) {
     }
 
     auto tensor = win_mananger->GetAssociateTensorByRank(target_rank);
+    if (tensor == nullptr) {
+      if (entry.require_mutex)
+        WinMutexRelease(entry.tensor_name, {target_rank}, /*is_sync=*/false);
+      throw std::runtime_error("Cannot get " + entry.tensor_name + " from " +
+                               std::to_string(target_rank) +
+                               ", which is not an in-neighbor.");
+    }
     void* recvbuf = (void*)tensor->data();
     int num_elements = tensor->shape().num_elements();
     MPI_Datatype data_type = mpi_ctx_.GetMPIDataType(tensor);
@@ -1204,12 +1676,8 @@ Status MPIController::WinLock(const std::string& name) {
   // It only locks the memory in local.
   int target_rank = mpi_ctx_.rank_;
   MPI_Win_lock(MPI_LOCK_EXCLUSIVE, target_rank, MPI_MODE_NOCHECK, mpi_win);
-
-  for (const int& rank : mpi_ctx_.neighbor_in_ranks_) {
-    auto mpi_win_ptr = win_mananger->GetWinByRank(rank);
-    MPI_Win_lock(MPI_LOCK_EXCLUSIVE, target_rank, MPI_MODE_NOCHECK,
-                 *mpi_win_ptr);
-  }
+  MPI_Win_lock(MPI_LOCK_EXCLUSIVE, target_rank, MPI_MODE_NOCHECK,
+               *(win_mananger->GetNeighborWin()));
 
   return Status::OK();
 }
@@ -1227,11 +1695,7 @@ Status MPIController::WinUnlock(const std::string& name) {
   // It only locks the memory in local.
   int target_rank = mpi_ctx_.rank_;
   MPI_Win_unlock(target_rank, mpi_win);
-
-  for (const int& rank : mpi_ctx_.neighbor_in_ranks_) {
-    auto mpi_win_ptr = win_mananger->GetWinByRank(rank);
-    MPI_Win_unlock(target_rank, *mpi_win_ptr);
-  }
+  MPI_Win_unlock(target_rank, *(win_mananger->GetNeighborWin()));
 
   return Status::OK();
 }
@@ -1253,7 +1717,8 @@ Status MPIController::WinMutexAcquire(const std::string& name,
                                      ". The data window for that name is found"
                                      "but the mutex window is not.");
   }
-  return MPIWinMutexAcquireImpl(mutex_win, acquire_ranks, mpi_ctx_.rank_, is_sync);
+  return MPIWinMutexAcquireImpl(mutex_win, acquire_ranks, mpi_ctx_.rank_,
+                                mpi_ctx_.size_, is_sync);
 }
 
 Status MPIController::WinMutexRelease(const std::string& name,
@@ -1274,7 +1739,8 @@ Status MPIController::WinMutexRelease(const std::string& name,
                                      ". The data window for that name is found"
                                      "but mutex window is not.");
   }
-  return MPIWinMutexReleaseImpl(mutex_win, release_ranks, mpi_ctx_.rank_, is_sync);
+  return MPIWinMutexReleaseImpl(mutex_win, release_ranks, mpi_ctx_.rank_,
+                                mpi_ctx_.size_, is_sync);
 }
 
 
@@ -1313,7 +1779,7 @@ Status MPIController::WinVersionGetUpdate(const std::string& name,
 
 /**
  * This function increaments the remote version for the corresponding rank
- * when there is a win put operation.
+ * when there is a win put or accumulate operation.
  **/
 Status MPIController::WinVersionPutUpdate(const std::string& name,
                                           const std::vector<int>& ranks) {
@@ -1529,74 +1995,163 @@ void MPIController::MemcpyEntryOutFusionBufferForNeighbors(
   }
 }
 
-// Extracted from book "Using Advanced MPI" Section 4.5
+namespace {
+
+// The win mutex is a MCS queue lock, following the one in book "Using Advanced
+// MPI" Chapter 4. Mutex (owner, slot) protects the buffer of the slot rank in
+// the window of the owner rank. Only two parties use it: the owner for win_sync
+// (is_sync) and the slot rank for win_put and win_accumulate. A waiter joins
+// the queue at the owner once and then polls a flag in its own memory, which
+// is cleared by its predecessor on release, instead of spinning on the owner.
+// For world size N, the mutex memory of each rank is laid out as
+//   [0, N)   : the queue tail of mutex (self, slot) for each slot.
+//   [N, 3N)  : the node {next, blocked} of self in mutex (self, slot).
+//   [3N, 5N) : the node {next, blocked} of self in mutex (owner, self).
+// Ranks are stored as rank + 1 so that 0 means none.
+enum MutexNodeField { MUTEX_NEXT = 0, MUTEX_BLOCKED = 1 };
+
+int MutexNodeDisp(int size, int owner, int slot, bool is_owner,
+                  MutexNodeField field) {
+  int base = is_owner ? size + 2 * slot : 3 * size + 2 * owner;
+  return base + field;
+}
+
+// All accesses to the mutex memory are atomic, including the local ones.
+int MutexFetchAndOp(MPI_Win win, int value, int target, int disp, MPI_Op op) {
+  int result = 0;
+  MPI_Win_lock(MPI_LOCK_SHARED, target, 0, win);
+  MPI_Fetch_and_op(&value, &result, MPI_INT, target, disp, op, win);
+  MPI_Win_unlock(target, win);
+  return result;
+}
+
+int MutexCompareAndSwap(MPI_Win win, int value, int compare, int target,
+                        int disp) {
+  int result = 0;
+  MPI_Win_lock(MPI_LOCK_SHARED, target, 0, win);
+  MPI_Compare_and_swap(&value, &compare, &result, MPI_INT, target, disp, win);
+  MPI_Win_unlock(target, win);
+  return result;
+}
+
+// Polls the local field until it becomes zero (or non-zero if wait_for_set),
+// with exponential backoff. Returns the last value read.
+int PollMutexField(MPI_Win win, int self_rank, int disp, bool wait_for_set) {
+  int backoff = 1;
+  do {
+    int value = MutexFetchAndOp(win, 0, self_rank, disp, MPI_NO_OP);
+    if ((value != 0) == wait_for_set) return value;
+    std::this_thread::sleep_for(std::chrono::microseconds(backoff));
+    backoff = std::min(2 * backoff, std::max(WIN_MUTEX_MAX_BACKOFF, 1));
+  } while (1);
+}
+
+// Threads of one process share its queue node of a mutex, so they take turns
+// locally before joining the queue.
+std::mutex local_nodes_mutex;
+std::condition_variable local_nodes_cv;
+std::set<std::pair<MPI_Win, int>> local_nodes_in_use;
+
+void AcquireLocalNode(MPI_Win win, int disp) {
+  std::unique_lock<std::mutex> lock(local_nodes_mutex);
+  local_nodes_cv.wait(lock, [&] {
+    return local_nodes_in_use.count(std::make_pair(win, disp)) == 0;
+  });
+  local_nodes_in_use.insert(std::make_pair(win, disp));
+}
+
+bool IsLocalNodeInUse(MPI_Win win, int disp) {
+  std::lock_guard<std::mutex> lock(local_nodes_mutex);
+  return local_nodes_in_use.count(std::make_pair(win, disp)) > 0;
+}
+
+void ReleaseLocalNode(MPI_Win win, int disp) {
+  {
+    std::lock_guard<std::mutex> lock(local_nodes_mutex);
+    local_nodes_in_use.erase(std::make_pair(win, disp));
+  }
+  local_nodes_cv.notify_all();
+}
+
+}  // namespace
+
 Status MPIWinMutexAcquireImpl(std::shared_ptr<MPI_Win> mutex_win,
                               const std::vector<int>& acquire_ranks,
-                              int self_rank, bool is_sync) {
-  // TODO(ybc) Try better implementation than Spin Lock.
-  // Recall that we build N windows across all N processes.
-  // The spin value is stored in the rank i for i-th window.
-  // Other process will got to acquire it.
-  int one = 1;
-  int minus_one = -1;
-  int oldval = 0;
-
-  if (is_sync) {  // Lock for self mutex
-    MPI_Win_lock(MPI_LOCK_SHARED, self_rank, 0, *mutex_win);
-    for (int rank : acquire_ranks) {
-      do {
-        MPI_Fetch_and_op(&one, &oldval, MPI_INT, self_rank,
-                         /*target_disp=*/rank, MPI_SUM, *mutex_win);
-        MPI_Win_flush(self_rank, *mutex_win);
-        if (oldval == 0) break;
-        MPI_Accumulate(&minus_one, 1, MPI_INT, self_rank, /*target_disp=*/rank,
-                       1, MPI_INT, MPI_SUM, *mutex_win);
-        MPI_Win_flush(self_rank, *mutex_win);
-        std::this_thread::sleep_for(std::chrono::microseconds(1));
-      } while (1);
-    }
-    MPI_Win_unlock(self_rank, *mutex_win);
-  } else {  // Lock for remote mutex
-    for (int rank : acquire_ranks) {
-      MPI_Win_lock(MPI_LOCK_SHARED, rank, 0, *mutex_win);
-      do {
-        MPI_Fetch_and_op(&one, &oldval, MPI_INT, rank,
-                         /*target_disp=*/self_rank, MPI_SUM, *mutex_win);
-        MPI_Win_flush(rank, *mutex_win);
-        if (oldval == 0) break;
-        MPI_Accumulate(&minus_one, 1, MPI_INT, rank,
-                       /*target_disp=*/self_rank, 1, MPI_INT, MPI_SUM,
-                       *mutex_win);
-        MPI_Win_flush(rank, *mutex_win);
-        std::this_thread::sleep_for(std::chrono::microseconds(1));
-      } while (1);
-      MPI_Win_unlock(rank, *mutex_win);
-    }
+                              int self_rank, int size, bool is_sync) {
+  MPI_Win win = *mutex_win;
+  long num_contended = 0;
+  auto start_time = std::chrono::steady_clock::now();
+
+  for (int rank : acquire_ranks) {
+    // Self mutex is the one of the neighbor slot at self rank. Remote mutex is
+    // the one of self slot at the neighbor rank.
+    int owner = is_sync ? self_rank : rank;
+    int slot = is_sync ? rank : self_rank;
+    int next_disp = MutexNodeDisp(size, owner, slot, is_sync, MUTEX_NEXT);
+    int blocked_disp = MutexNodeDisp(size, owner, slot, is_sync, MUTEX_BLOCKED);
+
+    AcquireLocalNode(win, next_disp);
+    MutexFetchAndOp(win, 0, self_rank, next_disp, MPI_REPLACE);
+    MutexFetchAndOp(win, 1, self_rank, blocked_disp, MPI_REPLACE);
+    int predecessor = MutexFetchAndOp(win, self_rank + 1, owner,
+                                      /*target_disp=*/slot, MPI_REPLACE);
+    if (predecessor == 0) continue;
+
+    // The mutex is held by the other party. Link self behind it and wait
+    // until it hands the mutex over.
+    num_contended++;
+    predecessor -= 1;
+    MutexFetchAndOp(
+        win, self_rank + 1, predecessor,
+        MutexNodeDisp(size, owner, slot, !is_sync, MUTEX_NEXT), MPI_REPLACE);
+    PollMutexField(win, self_rank, blocked_disp, /*wait_for_set=*/false);
+  }
+
+  if (num_contended > 0) {
+    Timeline* timeline_ptr;
+    GetBluefogTimeline(timeline_ptr);
+    auto wait_micros = std::chrono::duration_cast<std::chrono::microseconds>(
+                           std::chrono::steady_clock::now() - start_time)
+                           .count();
+    timeline_ptr->Counter("WIN_MUTEX_CONTENDED", num_contended);
+    timeline_ptr->Counter("WIN_MUTEX_WAIT_US", long(wait_micros));
   }
-
   return Status::OK();
 }
 
 Status MPIWinMutexReleaseImpl(std::shared_ptr<MPI_Win> mutex_win,
                               const std::vector<int>& release_ranks,
-                              int self_rank, bool is_sync) {
-  int minus_one = -1;
-  // TODO(ybc) Notice the following accumulate may cause the value to be
-  // negative, i.e. more release ops is called than acquire.
-  if (is_sync) {
-    MPI_Win_lock(MPI_LOCK_SHARED, self_rank, 0, *mutex_win);
-    for (int rank : release_ranks) {
-      MPI_Accumulate(&minus_one, 1, MPI_INT, self_rank, /*target_disp=*/rank, 1,
-                     MPI_INT, MPI_SUM, *mutex_win);
+                              int self_rank, int size, bool is_sync) {
+  MPI_Win win = *mutex_win;
+
+  for (int rank : release_ranks) {
+    int owner = is_sync ? self_rank : rank;
+    int slot = is_sync ? rank : self_rank;
+    int next_disp = MutexNodeDisp(size, owner, slot, is_sync, MUTEX_NEXT);
+    if (!IsLocalNodeInUse(win, next_disp)) {
+      BFLOG(WARNING, self_rank) << "Win mutex of rank " << rank
+                                << " is released without being acquired.";
+      continue;
     }
-    MPI_Win_unlock(self_rank, *mutex_win);
-  } else {
-    for (int rank : release_ranks) {
-      MPI_Win_lock(MPI_LOCK_SHARED, rank, 0, *mutex_win);
-      MPI_Accumulate(&minus_one, 1, MPI_INT, rank, /*target_disp=*/self_rank, 1,
-                     MPI_INT, MPI_SUM, *mutex_win);
-      MPI_Win_unlock(rank, *mutex_win);
+
+    int successor = MutexFetchAndOp(win, 0, self_rank, next_disp, MPI_NO_OP);
+    if (successor == 0) {
+      // Leave the queue if no one joins it. Otherwise, the successor has
+      // swapped the tail but not linked itself yet.
+      int tail = MutexCompareAndSwap(win, 0, self_rank + 1, owner,
+                                     /*target_disp=*/slot);
+      if (tail == self_rank + 1) {
+        ReleaseLocalNode(win, next_disp);
+        continue;
+      }
+      successor = PollMutexField(win, self_rank, next_disp,
+                                 /*wait_for_set=*/true);
     }
+    successor -= 1;
+    MutexFetchAndOp(
+        win, 0, successor,
+        MutexNodeDisp(size, owner, slot, !is_sync, MUTEX_BLOCKED), MPI_REPLACE);
+    ReleaseLocalNode(win, next_disp);
   }
   return Status::OK();
 }
@@ -17,6 +17,14 @@
 #ifndef BLUEFOG_COMMON_MPI_CONTROLLER_H
 #define BLUEFOG_COMMON_MPI_CONTROLLER_H
 
+#include <array>
+#include <chrono>
+#include <deque>
+#include <map>
+#include <string>
+#include <utility>
+#include <vector>
+
 #include "logging.h"
 #include "mpi_context.h"
 #include "tensor_queue.h"
@@ -30,6 +38,33 @@ namespace common {
 bool CheckNeighborSendRecvPattern(int size, const TensorTableEntry& entry,
                                   Timeline* timeline_ptr, const MPI_Comm& comm);
 
+// A neighbor_allreduce negotiated among the neighbors only. Every rank sends a
+// header, i.e. the hash of the tensor name, the number of elements, the data
+// type and the tag of the data, along with the data. The headers of all tensors
+// share one tag and are dispatched to the op of the same name, in the order
+// they were sent, so the tensors can be submitted in any order. The data of an
+// in-neighbor is received only after its header arrives, so the negotiation
+// needs no coordinator.
+struct NeighborNegotiatedOp {
+  TensorTableEntry entry;
+  std::vector<int> send_ranks;
+  std::vector<int> recv_ranks;
+  int64_t send_header[4];
+  // Sends of headers.
+  std::vector<MPI_Request> header_requests;
+  // Sends of data followed by receives of data.
+  std::vector<MPI_Request> data_requests;
+  // Whether the data of each in-neighbor is being received.
+  std::vector<bool> data_recv_posted;
+  int num_data_recv_posted = 0;
+  // Scratch buffers draining the data of the in-neighbors with a mismatched
+  // header, so that their sends still complete.
+  std::vector<std::vector<char>> drain_buffers;
+  std::string error_message;
+  std::chrono::steady_clock::time_point start_time;
+  bool stall_warned = false;
+};
+
 class MPIController {
  public:
   MPIController(MPIContext& mpi_ctx) : mpi_ctx_(mpi_ctx) {
@@ -69,6 +104,15 @@ class MPIController {
   void Allreduce(std::vector<TensorTableEntry>& entries);
   void NeighborAllreduce(std::vector<TensorTableEntry>& entries);
 
+  // Neighbor allreduce negotiated among the neighbors over the duplicated
+  // graph communicator. None of them blocks: Start posts the messages, Test
+  // returns true and calls the callback once the op is completed, and Cancel
+  // aborts an op that is not completed yet.
+  void StartNeighborNegotiatedAllreduce(NeighborNegotiatedOp& op);
+  bool TestNeighborNegotiatedAllreduce(NeighborNegotiatedOp& op);
+  void CancelNeighborNegotiatedAllreduce(NeighborNegotiatedOp& op,
+                                         const Status& status);
+
   void WinCreate(TensorTableEntry& entry);
   void WinFree(TensorTableEntry& entry);
   void WinFreeAll(TensorTableEntry& entry);
@@ -109,6 +153,11 @@ class MPIController {
                                         double weight);
 
  protected:
+  // Neighbor allreduce of a CPU tensor split into chunks of
+  // entry.pipeline_chunk_size bytes. Each chunk of a neighbor is reduced into
+  // the output as soon as it arrives, while the later chunks are in flight.
+  void PipelinedNeighborAllreduce(TensorTableEntry& entry);
+
   void MemcpyInFusionBuffer(const std::vector<TensorTableEntry>& entries,
                             void*& buffer_data, size_t& buffer_len);
 
@@ -139,6 +188,21 @@ class MPIController {
 
   // flag indicating whether MPI multi-threading is supported.
   bool mpi_threads_supported_ = false;
+
+  // Receive buffers of the pipelined neighbor_allreduce. It grows to the
+  // largest size needed and is reused afterwards.
+  std::vector<char> recv_pool_;
+
+  // Receive the headers of the neighbor negotiated allreduce that arrived.
+  void ReceiveNegotiationHeaders();
+
+  // The headers received but not taken by an op yet, by the source rank and
+  // the hash of the tensor name, in the order they were sent.
+  std::map<std::pair<int, int64_t>, std::deque<std::array<int64_t, 4>>>
+      negotiation_headers_;
+
+  // The tag of the data of the next neighbor negotiated allreduce.
+  int next_negotiation_data_tag_ = 1;
 };
 
 // Our distributed mutex definition is different from the parallel computation
@@ -148,13 +212,14 @@ class MPIController {
 // the writing process from the neighbors (like win_put and win_accumulate).
 // However, Win_sync (i.e update setup) will read it, which conflicted with
 // other writting process. When WinMutexAcquire is called, we typically lock
-// for all out-neighbors.
+// for all out-neighbors. Each mutex is a queue lock, so a waiter polls its own
+// memory with exponential backoff instead of spinning on the remote process.
 Status MPIWinMutexAcquireImpl(std::shared_ptr<MPI_Win> mutex_win,
                               const std::vector<int>& acquire_ranks,
-                              int self_rank, bool is_sync);
+                              int self_rank, int size, bool is_sync);
 Status MPIWinMutexReleaseImpl(std::shared_ptr<MPI_Win> mutex_win,
                               const std::vector<int>& release_ranks,
-                              int self_rank, bool is_sync);
+                              int self_rank, int size, bool is_sync);
 
 }  // namespace common
 }  // namespace bluefog
@@ -162,13 +162,13 @@ bool NCCLWindowManager::InitializeMutexWin() {
   if (!mutex_win_) {
      mutex_win_  = std::make_shared<MPI_Win>();
   }
-  // We only need one value for self mutex.
-  mutex_mem_.resize(global_size);
-  std::fill_n(mutex_mem_.data(), global_size, 0);
+  // The queue of each mutex is empty at the beginning.
+  mutex_mem_.resize(WIN_MUTEX_FIELDS * global_size);
+  std::fill_n(mutex_mem_.data(), mutex_mem_.size(), 0);
 
   int element_size = 0;
   MPI_Type_size(MPI_INT, &element_size);
-  int win_size = global_size * element_size;
+  int win_size = WIN_MUTEX_FIELDS * global_size * element_size;
   MPI_Win_create((void *)mutex_mem_.data(), win_size, element_size, MPI_INFO_NULL, MPI_COMM_WORLD,
                  mutex_win_.get());
   return true;
@@ -16,6 +16,7 @@
 
 #include "operations.h"
 
+#include <algorithm>
 #include <atomic>
 #include <cassert>
 #include <chrono>
@@ -41,7 +42,14 @@
 #define COORDINATE_RANK 0
 #define BLUEFOG_TIMELINE "BLUEFOG_TIMELINE"
 #define BLUEFOG_CYCLE_TIME "BLUEFOG_CYCLE_TIME"
+#define BLUEFOG_ADAPTIVE_CYCLE_TIME "BLUEFOG_ADAPTIVE_CYCLE_TIME"
+#define BLUEFOG_MAX_CYCLE_TIME "BLUEFOG_MAX_CYCLE_TIME"
 #define BLUEFOG_FUSION_THRESHOLD "BLUEFOG_FUSION_THRESHOLD"
+#define BLUEFOG_AUTOTUNE "BLUEFOG_AUTOTUNE"
+#define BLUEFOG_AUTOTUNE_LOG "BLUEFOG_AUTOTUNE_LOG"
+#define BLUEFOG_RESPONSE_CACHE_CAPACITY "BLUEFOG_RESPONSE_CACHE_CAPACITY"
+#define BLUEFOG_NEIGHBOR_NEGOTIATION "BLUEFOG_NEIGHBOR_NEGOTIATION"
+#define BLUEFOG_NEIGHBOR_ALLREDUCE_CHUNK_SIZE "BLUEFOG_NEIGHBOR_ALLREDUCE_CHUNK_SIZE"
 
 // Stall-check warning time
 #define STALL_WARNING_TIME std::chrono::seconds(60)
@@ -73,6 +81,22 @@ using MessageTable = std::unordered_map<
     std::string,
     std::tuple<std::vector<Request>, std::chrono::steady_clock::time_point>>;
 
+// Combine the values in order into a hash. The separator keeps the patterns
+// like [1, 2 | 3] and [1 | 2, 3] apart.
+int64_t HashCombine(uint64_t seed, int64_t value) {
+  return seed ^ ((uint64_t)value + 0x9e3779b97f4a7c15ULL + (seed << 6) +
+                 (seed >> 2));
+}
+
+int64_t HashNeighborPattern(const std::vector<int>& send_neighbors,
+                            const std::vector<int>& recv_neighbors) {
+  int64_t hash = 1;
+  for (int rank : send_neighbors) hash = HashCombine(hash, rank);
+  hash = HashCombine(hash, -1);
+  for (int rank : recv_neighbors) hash = HashCombine(hash, rank);
+  return hash;
+}
+
 // Store the Request for a name, and return whether the total count of
 // Requests for that tensor is now equal to the MPI size (and thus we are
 // ready to reduce the tensor).
@@ -375,6 +399,18 @@ Response ConstructResponse(MessageTable* message_table, std::string name) {
   }
   response.set_devices(devices);
 
+  if (!error && message_type == Request::NEIGHBOR_ALLREDUCE) {
+    std::vector<int64_t> patterns(requests.size());
+    for (auto& request : requests) {
+      patterns[request.request_rank()] = request.neighbor_pattern();
+    }
+    int64_t neighbor_pattern = 0;
+    for (int64_t pattern : patterns) {
+      neighbor_pattern = HashCombine(neighbor_pattern, pattern);
+    }
+    response.set_neighbor_pattern(neighbor_pattern);
+  }
+
   // Clear all queued up requests for this name. They are now taken care of
   // by the constructed MPI response.
   message_table->erase(it);
@@ -461,6 +497,18 @@ void BackgroundThreadLoop(BluefogGlobalState& state) {
   if (bluefog_cycle_time != nullptr) {
     state.cycle_time_ms = std::strtof(bluefog_cycle_time, nullptr);
   }
+  state.current_cycle_time_ms = state.cycle_time_ms;
+  char* bluefog_adaptive_cycle_time = std::getenv(BLUEFOG_ADAPTIVE_CYCLE_TIME);
+  if (bluefog_adaptive_cycle_time != nullptr) {
+    state.adaptive_cycle_time =
+        std::strtol(bluefog_adaptive_cycle_time, nullptr, 10) > 0;
+  }
+  char* bluefog_max_cycle_time = std::getenv(BLUEFOG_MAX_CYCLE_TIME);
+  if (bluefog_max_cycle_time != nullptr) {
+    state.max_cycle_time_ms = std::strtof(bluefog_max_cycle_time, nullptr);
+  }
+  state.max_cycle_time_ms =
+      std::max(state.max_cycle_time_ms, state.cycle_time_ms);
 
   // Override Tensor Fusion threshold, if it's set.
   auto bluefog_fusion_threshold = std::getenv(BLUEFOG_FUSION_THRESHOLD);
@@ -469,9 +517,47 @@ void BackgroundThreadLoop(BluefogGlobalState& state) {
         std::strtol(bluefog_fusion_threshold, nullptr, 10);
   }
 
+  // Enable the response cache, if it's set. The capacity must be the same on
+  // all ranks.
+  auto bluefog_response_cache_capacity =
+      std::getenv(BLUEFOG_RESPONSE_CACHE_CAPACITY);
+  if (bluefog_response_cache_capacity != nullptr) {
+    state.response_cache.SetCapacity(
+        (uint32_t)std::strtol(bluefog_response_cache_capacity, nullptr, 10));
+  }
+
+  // Negotiate neighbor_allreduce among the neighbors, if it's set. It must be
+  // the same on all ranks.
+  auto bluefog_neighbor_negotiation = std::getenv(BLUEFOG_NEIGHBOR_NEGOTIATION);
+  if (bluefog_neighbor_negotiation != nullptr) {
+    state.neighbor_negotiation =
+        std::strtol(bluefog_neighbor_negotiation, nullptr, 10) > 0;
+  }
+
+  // Pipeline large neighbor_allreduce in chunks of this size, if it's set. It
+  // must be the same on all ranks.
+  auto bluefog_neighbor_allreduce_chunk_size =
+      std::getenv(BLUEFOG_NEIGHBOR_ALLREDUCE_CHUNK_SIZE);
+  if (bluefog_neighbor_allreduce_chunk_size != nullptr) {
+    state.neighbor_allreduce_chunk_size = std::max(
+        (int64_t)0,
+        (int64_t)std::strtoll(bluefog_neighbor_allreduce_chunk_size, nullptr, 10));
+  }
+
   // Initialize the tensor count table. No tensors are available yet.
   if (bluefog_global.controller->GetRank() == COORDINATE_RANK) {
     state.message_table = std::unique_ptr<MessageTable>(new MessageTable());
+
+    // Only the coordinator tunes the parameters.
+    char* bluefog_autotune_log = std::getenv(BLUEFOG_AUTOTUNE_LOG);
+    state.parameter_manager.Initialize(
+        state.tensor_fusion_threshold, state.cycle_time_ms,
+        bluefog_autotune_log != nullptr ? bluefog_autotune_log : "");
+    char* bluefog_autotune = std::getenv(BLUEFOG_AUTOTUNE);
+    if (bluefog_autotune != nullptr &&
+        std::strtol(bluefog_autotune, nullptr, 10) > 0) {
+      state.parameter_manager.SetAutoTuning(true);
+    }
   }
 
   // Signal that initialization is completed.
@@ -489,6 +575,10 @@ void BackgroundThreadLoop(BluefogGlobalState& state) {
   state.shut_down = true;
   // Notify all outstanding operations that Bluefog has been shut down
   // and finalize tensor queue.
+  for (auto& op : state.neighbor_negotiated_ops) {
+    state.controller->CancelNeighborNegotiatedAllreduce(op, SHUT_DOWN_ERROR);
+  }
+  state.neighbor_negotiated_ops.clear();
   std::vector<StatusCallback> callbacks;
   bluefog_global.tensor_queue.FinalizeTensorQueue(callbacks);
   for (auto& cb : callbacks) {
@@ -821,6 +911,183 @@ void PerformOperationWithFusion(std::vector<TensorTableEntry>& entries) {
   }
 }
 
+void SetTunableParameters(BluefogGlobalState& state,
+                          int64_t tensor_fusion_threshold,
+                          double cycle_time_ms) {
+  if (tensor_fusion_threshold >= 0) {
+    state.tensor_fusion_threshold = tensor_fusion_threshold;
+  }
+  if (cycle_time_ms >= 0) {
+    state.cycle_time_ms = cycle_time_ms;
+    state.current_cycle_time_ms = cycle_time_ms;
+  }
+}
+
+// Fuse the responses which can be processed together and add them into the
+// response list. If from_cache is true, every rank fuses the cached responses
+// independently, so only the properties that are the same on all ranks are
+// used.
+void FuseResponses(BluefogGlobalState& state, std::deque<Response>& responses,
+                   ResponseList& response_list, bool from_cache) {
+  while (!responses.empty()) {
+    Response response = responses.front();
+    assert(response.tensor_names().size() == 1);
+    responses.pop_front();
+
+    if (response.response_type() == Response::ResponseType::ALLREDUCE) {
+      // Attempt to add more responses to this fused response.
+      const TensorTableEntry& entry =
+          state.tensor_queue.GetTensorEntry(response.tensor_names()[0]);
+      int64_t tensor_size = entry.tensor->size();
+      while (!responses.empty()) {
+        Response new_response = responses.front();
+        assert(new_response.tensor_names().size() == 1);
+        const TensorTableEntry& new_entry =
+            state.tensor_queue.GetTensorEntry(new_response.tensor_names()[0]);
+        int64_t new_tensor_size = new_entry.tensor->size();
+        if (response.response_type() == new_response.response_type() &&
+            response.devices() == new_response.devices() &&
+            entry.tensor->dtype() == new_entry.tensor->dtype() &&
+            entry.is_hierarchical == new_entry.is_hierarchical &&
+            tensor_size + new_tensor_size <= state.tensor_fusion_threshold) {
+          // These tensors will fuse together well.
+          tensor_size += new_tensor_size;
+          response.add_tensor_name(new_response.tensor_names()[0]);
+          responses.pop_front();
+        } else {
+          // Don't try to fuse additional tensors since they are usually
+          // computed in order of requests and skipping tensors may mean
+          // that the batch will have to wait longer while skipped tensors
+          // could be reduced at that time.
+          break;
+        }
+      }
+    } else if (response.response_type() ==
+               Response::ResponseType::NEIGHBOR_ALLREDUCE) {
+      // Attempt to add more responses to this fused response.
+      const TensorTableEntry& entry =
+          state.tensor_queue.GetTensorEntry(response.tensor_names()[0]);
+      auto IsSameNeighborList =
+          [](std::shared_ptr<std::vector<int>> n1,
+             std::shared_ptr<std::vector<int>> n2) -> bool {
+        if (n1 == nullptr && n2 == nullptr) return true;
+        if (n1 == nullptr || n2 == nullptr) return false;
+        if (n1->size() != n2->size()) return false;
+        // The order matters as well.
+        for (int i = 0; i < n1->size(); i++) {
+          if (n1->at(i) != n2->at(i)) {
+            return false;
+          }
+        }
+        return true;
+      };
+      // Recall that send_neighbors is empty or not determines we use partial
+      // neighbor allreduce or not.
+      // The largest in-degree is used for static topology so that all ranks
+      // make the same decision and no fusion buffer overflows.
+      int num_recv_neighbors = !entry.dynamic_neighbors_enabled
+                                   ? mpi_context.max_neighbor_indgree_
+                                   : entry.recv_neighbors->size();
+      // Unlike allreduce, the storage for neighbor_allreduce in fusion buffer
+      // is like [t_1, t_2 | t_1_n1, t_2_n1, t_1_n2, t_2_n2].
+      // Here t_1 and t_2  means self tensor 1 and 2 and _n1 and _n2 means the
+      // recieving tensors for neighbor 1 and 2;
+      int64_t tensor_size = entry.tensor->size() * (1 + num_recv_neighbors);
+
+      // The neighbors of dynamic neighbor_allreduce differ across ranks, which
+      // cannot be fused without the coordinator. Pipelined neighbor_allreduce
+      // reduces into its own output, which cannot be fused either.
+      if ((from_cache && entry.dynamic_neighbors_enabled) ||
+          entry.pipeline_chunk_size > 0) {
+        response_list.add_response(response);
+        continue;
+      }
+      auto CanFuse = [&](const Response& new_response,
+                         const TensorTableEntry& new_entry) -> bool {
+        return response.response_type() == new_response.response_type() &&
+               response.devices() == new_response.devices() &&
+               entry.tensor->dtype() == new_entry.tensor->dtype() &&
+               entry.dynamic_neighbors_enabled ==
+                   new_entry.dynamic_neighbors_enabled &&
+               entry.is_hierarchical == new_entry.is_hierarchical &&
+               new_entry.pipeline_chunk_size == 0 &&
+               // The send and recv neighbors are the same on every rank.
+               response.neighbor_pattern() == new_response.neighbor_pattern() &&
+               IsSameNeighborList(entry.send_neighbors,
+                                  new_entry.send_neighbors) &&
+               IsSameNeighborList(entry.recv_neighbors,
+                                  new_entry.recv_neighbors);
+      };
+      for (auto it = responses.begin(); it != responses.end();) {
+        assert(it->tensor_names().size() == 1);
+        const TensorTableEntry& new_entry =
+            state.tensor_queue.GetTensorEntry(it->tensor_names()[0]);
+        if (!CanFuse(*it, new_entry)) {
+          if (entry.dynamic_neighbors_enabled) {
+            // Dynamic neighbor_allreduce of one step share the pattern, so
+            // collect the rest of the step even if other tensors interleave.
+            ++it;
+            continue;
+          }
+          break;
+        }
+        int64_t new_tensor_size =
+            new_entry.tensor->size() * (1 + num_recv_neighbors);
+        if (tensor_size + new_tensor_size > state.tensor_fusion_threshold) {
+          break;
+        }
+        // These tensors will fuse together well.
+        tensor_size += new_tensor_size;
+        response.add_tensor_name(it->tensor_names()[0]);
+        it = responses.erase(it);
+      }
+    }
+
+    response_list.add_response(response);
+  }
+}
+
+// Perform the responses in the response list, which is the same on all ranks.
+// The allreduce and neighbor_allreduce responses are cached if cache_responses
+// is true.
+void PerformResponses(BluefogGlobalState& state,
+                      const ResponseList& response_list,
+                      bool cache_responses) {
+  for (auto& response : response_list.responses()) {
+    std::vector<TensorTableEntry> nego_entries;
+    state.tensor_queue.GetTensorEntriesFromResponse(response, nego_entries);
+    if (response.response_type() == Response::ResponseType::ALLREDUCE ||
+        response.response_type() == Response::ResponseType::NEIGHBOR_ALLREDUCE) {
+      for (auto& e : nego_entries) {
+        if (cache_responses) {
+          Response single_response = response;
+          single_response.set_tensor_names({e.tensor_name});
+          state.response_cache.Put(single_response, e);
+        }
+        if (state.parameter_manager.IsAutoTuning()) {
+          state.parameter_manager.RecordBytes(e.tensor->size());
+        }
+      }
+    }
+    if (nego_entries.size() > 1) {
+      PerformOperationWithFusion(nego_entries);
+    } else {
+      PerformOperation(nego_entries);
+    }
+  }
+}
+
+// Whether the autotuner on the coordinator has chosen new parameters that are
+// not sent to other ranks yet.
+bool TunableParametersChanged(BluefogGlobalState& state) {
+  if (bluefog_rank() != COORDINATE_RANK) {
+    return false;
+  }
+  return state.parameter_manager.TensorFusionThreshold() !=
+             state.tensor_fusion_threshold ||
+         state.parameter_manager.CycleTimeMs() != state.cycle_time_ms;
+}
+
 void NegotiateOfRequestOfMaster(BluefogGlobalState& state,
                                 std::deque<Request>& message_queue_buffer,
                                 bool& should_change_topo,
@@ -909,99 +1176,19 @@ void NegotiateOfRequestOfMaster(BluefogGlobalState& state,
   response_list.set_shutdown(should_shut_down);
   response_list.set_change_topo(should_change_topo);
 
-  while (!responses.empty()) {
-    Response response = responses.front();
-    assert(response.tensor_names().size() == 1);
-    responses.pop_front();
-
-    if (response.response_type() == Response::ResponseType::ALLREDUCE) {
-      // Attempt to add more responses to this fused response.
-      const TensorTableEntry& entry =
-          state.tensor_queue.GetTensorEntry(response.tensor_names()[0]);
-      int64_t tensor_size = entry.tensor->size();
-      while (!responses.empty()) {
-        Response new_response = responses.front();
-        assert(new_response.tensor_names().size() == 1);
-        const TensorTableEntry& new_entry =
-            state.tensor_queue.GetTensorEntry(new_response.tensor_names()[0]);
-        int64_t new_tensor_size = new_entry.tensor->size();
-        if (response.response_type() == new_response.response_type() &&
-            response.devices() == new_response.devices() &&
-            entry.tensor->dtype() == new_entry.tensor->dtype() &&
-            entry.is_hierarchical == new_entry.is_hierarchical &&
-            tensor_size + new_tensor_size <= state.tensor_fusion_threshold) {
-          // These tensors will fuse together well.
-          tensor_size += new_tensor_size;
-          response.add_tensor_name(new_response.tensor_names()[0]);
-          responses.pop_front();
-        } else {
-          // Don't try to fuse additional tensors since they are usually
-          // computed in order of requests and skipping tensors may mean
-          // that the batch will have to wait longer while skipped tensors
-          // could be reduced at that time.
-          break;
-        }
-      }
-    } else if (response.response_type() ==
-               Response::ResponseType::NEIGHBOR_ALLREDUCE) {
-      // Attempt to add more responses to this fused response.
-      const TensorTableEntry& entry =
-          state.tensor_queue.GetTensorEntry(response.tensor_names()[0]);
-      auto IsSameNeighborList =
-          [](std::shared_ptr<std::vector<int>> n1,
-             std::shared_ptr<std::vector<int>> n2) -> bool {
-        if (n1 == nullptr && n2 == nullptr) return true;
-        if (n1 == nullptr || n2 == nullptr) return false;
-        if (n1->size() != n2->size()) return false;
-        // The order matters as well.
-        for (int i = 0; i < n1->size(); i++) {
-          if (n1->at(i) != n2->at(i)) {
-            return false;
-          }
-        }
-        return true;
-      };
-      // Recall that send_neighbors is empty or not determines we use partial
-      // neighbor allreduce or not.
-      int num_recv_neighbors = !entry.dynamic_neighbors_enabled
-                                   ? mpi_context.neighbor_indgree_
-                                   : entry.recv_neighbors->size();
-      // Unlike allreduce, the storage for neighbor_allreduce in fusion buffer
-      // is like [t_1, t_2 | t_1_n1, t_2_n1, t_1_n2, t_2_n2].
-      // Here t_1 and t_2  means self tensor 1 and 2 and _n1 and _n2 means the
-      // recieving tensors for neighbor 1 and 2;
-      int64_t tensor_size = entry.tensor->size() * (1 + num_recv_neighbors);
-
-      while (!responses.empty()) {
-        Response new_response = responses.front();
-        assert(new_response.tensor_names().size() == 1);
-        const TensorTableEntry& new_entry =
-            state.tensor_queue.GetTensorEntry(new_response.tensor_names()[0]);
-        int64_t new_tensor_size =
-            new_entry.tensor->size() * (1 + num_recv_neighbors);
-        if (response.response_type() == new_response.response_type() &&
-            response.devices() == new_response.devices() &&
-            entry.tensor->dtype() == new_entry.tensor->dtype() &&
-            entry.dynamic_neighbors_enabled == new_entry.dynamic_neighbors_enabled &&
-            entry.is_hierarchical == new_entry.is_hierarchical &&
-            IsSameNeighborList(entry.send_neighbors,
-                               new_entry.send_neighbors) &&
-            IsSameNeighborList(entry.recv_neighbors,
-                               new_entry.recv_neighbors) &&
-            tensor_size + new_tensor_size <= state.tensor_fusion_threshold) {
-          // These tensors will fuse together well.
-          tensor_size += new_tensor_size;
-          response.add_tensor_name(new_response.tensor_names()[0]);
-          responses.pop_front();
-        } else {
-          break;
-        }
-      }
-    }
-
-    response_list.add_response(response);
+  // Apply the parameters changed by the autotuner on all ranks before any
+  // fused response is constructed with them.
+  auto& parameter_manager = state.parameter_manager;
+  if (TunableParametersChanged(state)) {
+    response_list.set_tensor_fusion_threshold(
+        parameter_manager.TensorFusionThreshold());
+    response_list.set_cycle_time_ms(parameter_manager.CycleTimeMs());
+    SetTunableParameters(state, parameter_manager.TensorFusionThreshold(),
+                         parameter_manager.CycleTimeMs());
   }
 
+  FuseResponses(state, responses, response_list, /*from_cache=*/false);
+
   // Notify all nodes which tensors we'd like to reduce at this step.
   std::string encoded_response;
   ResponseList::SerializeToString(response_list, encoded_response);
@@ -1012,15 +1199,8 @@ void NegotiateOfRequestOfMaster(BluefogGlobalState& state,
             COORDINATE_RANK, mpi_context.mpi_comm);
   // Perform the collective operation. All nodes should end up performing
   // the same operation.
-  for (auto& response : response_list.responses()) {
-    std::vector<TensorTableEntry> nego_entries;
-    state.tensor_queue.GetTensorEntriesFromResponse(response, nego_entries);
-    if (nego_entries.size() > 1) {
-      PerformOperationWithFusion(nego_entries);
-    } else {
-      PerformOperation(nego_entries);
-    }
-  }
+  PerformResponses(state, response_list,
+                   /*cache_responses=*/state.response_cache.capacity() > 0);
 
   // Check for stalled tensors.
   if (std::chrono::steady_clock::now() - state.last_stall_check >
@@ -1058,18 +1238,13 @@ void NegotiateOfRequestOfSlave(BluefogGlobalState& state,
   ResponseList response_list;
   ResponseList::ParseFromBytes(response_list, buffer);
   delete[] buffer;
+  SetTunableParameters(state, response_list.tensor_fusion_threshold(),
+                       response_list.cycle_time_ms());
 
   // Perform the collective operation. All nodes should end up performing
   // the same operation.
-  for (auto& response : response_list.responses()) {
-    std::vector<TensorTableEntry> nego_entries;
-    state.tensor_queue.GetTensorEntriesFromResponse(response, nego_entries);
-    if (nego_entries.size() > 1) {
-      PerformOperationWithFusion(nego_entries);
-    } else {
-      PerformOperation(nego_entries);
-    }
-  }
+  PerformResponses(state, response_list,
+                   /*cache_responses=*/state.response_cache.capacity() > 0);
 
   if (response_list.shutdown()) {
     should_shut_down = true;
@@ -1091,23 +1266,221 @@ void NegotiationOfRequest(BluefogGlobalState& state,
   }
 }
 
-bool RunLoopOnce(BluefogGlobalState& state) {
-  // The coordinator sends a SHUTDOWN message to trigger shutdown.
-  bool should_shut_down = state.shut_down;
-  bool should_change_topo = state.setting_topology;
+// Negotiate with the response cache. Ranks agree on the ready cached tensors
+// with one bitwise AND allreduce, and only fall back to the coordinator when
+// some rank has uncached requests, or requests to shut down or change topology.
+void NegotiationWithResponseCache(BluefogGlobalState& state,
+                                  std::deque<Request>& message_queue_buffer,
+                                  bool& should_change_topo,
+                                  bool& should_shut_down) {
+  auto& cache = state.response_cache;
+  auto& cache_hit_requests = state.cache_hit_requests;
+  for (auto& request : message_queue_buffer) {
+    cache_hit_requests.emplace(request.tensor_name(), request);
+  }
+  message_queue_buffer.clear();
+
+  // The bit vector is [flags | hit bits | invalid bits]. The flags and the
+  // invalid bits are inverted so that the bitwise AND works as OR for them.
+  const uint64_t SHUT_DOWN_FLAG = 1;
+  const uint64_t CHANGE_TOPO_FLAG = 1 << 1;
+  const uint64_t NEGOTIATION_FLAG = 1 << 2;
+  const int num_words = (cache.capacity() + 63) / 64;
+  std::vector<uint64_t> bit_vector(1 + 2 * num_words, 0);
+  std::fill(bit_vector.begin() + 1 + num_words, bit_vector.end(), ~0ULL);
+  uint64_t* hit_bits = bit_vector.data() + 1;
+  uint64_t* invalid_bits = bit_vector.data() + 1 + num_words;
+
+  std::deque<Request> uncached_requests;
+  for (auto it = cache_hit_requests.begin(); it != cache_hit_requests.end();) {
+    auto cache_state = cache.Cached(it->second);
+    if (cache_state == ResponseCache::CacheState::MISS) {
+      uncached_requests.push_back(std::move(it->second));
+      it = cache_hit_requests.erase(it);
+      continue;
+    }
+    uint32_t bit = cache.GetBit(it->first);
+    if (cache_state == ResponseCache::CacheState::HIT) {
+      hit_bits[bit / 64] |= 1ULL << (bit % 64);
+    } else {
+      invalid_bits[bit / 64] &= ~(1ULL << (bit % 64));
+    }
+    ++it;
+  }
+
+  uint64_t flags = 0;
+  if (should_shut_down) flags |= SHUT_DOWN_FLAG;
+  if (should_change_topo) flags |= CHANGE_TOPO_FLAG;
+  if (!uncached_requests.empty() || TunableParametersChanged(state)) {
+    flags |= NEGOTIATION_FLAG;
+  }
+  bit_vector[0] = ~flags;
+  MPI_Allreduce(MPI_IN_PLACE, bit_vector.data(), (int)bit_vector.size(),
+                MPI_UINT64_T, MPI_BAND, mpi_context.mpi_comm);
+  flags = ~bit_vector[0];
+  should_shut_down = flags & SHUT_DOWN_FLAG;
+  should_change_topo = flags & CHANGE_TOPO_FLAG;
+  bool should_negotiate = flags & NEGOTIATION_FLAG;
+
+  // A tensor is invalid if its parameters are changed on any rank. Evict it
+  // on all ranks and negotiate it again.
+  for (uint32_t bit = 0; bit < cache.capacity(); bit++) {
+    if (invalid_bits[bit / 64] & (1ULL << (bit % 64))) {
+      continue;
+    }
+    should_negotiate = true;
+    hit_bits[bit / 64] &= ~(1ULL << (bit % 64));
+    auto it =
+        cache_hit_requests.find(cache.GetResponse(bit).tensor_names()[0]);
+    if (it != cache_hit_requests.end()) {
+      uncached_requests.push_back(std::move(it->second));
+      cache_hit_requests.erase(it);
+    }
+    cache.Erase(bit);
+  }
 
+  // Perform the tensors cached on all ranks in the order of bits.
+  std::deque<Response> responses;
+  for (uint32_t bit = 0; bit < cache.capacity(); bit++) {
+    if (hit_bits[bit / 64] & (1ULL << (bit % 64))) {
+      const Response& response = cache.GetResponse(bit);
+      cache_hit_requests.erase(response.tensor_names()[0]);
+      responses.push_back(response);
+    }
+  }
+  ResponseList response_list;
+  FuseResponses(state, responses, response_list, /*from_cache=*/true);
+  PerformResponses(state, response_list, /*cache_responses=*/false);
+
+  if (should_negotiate || should_shut_down || should_change_topo) {
+    NegotiationOfRequest(state, uncached_requests, should_change_topo,
+                         should_shut_down);
+  }
+}
+
+// Wait until the next cycle should start.
+void WaitForNextCycle(BluefogGlobalState& state) {
   // This delay determines thread frequency and MPI message latency
-  auto sleep_duration =
+  auto next_cycle_start =
       state.last_cycle_start +
-      std::chrono::microseconds(long(state.cycle_time_ms * 1000.)) -
-      std::chrono::steady_clock::now();
+      std::chrono::microseconds(long(state.current_cycle_time_ms * 1000.));
+  if (state.adaptive_cycle_time &&
+      state.current_cycle_time_ms > state.cycle_time_ms) {
+    // Idle: return as soon as a tensor is enqueued. The wait is still bounded
+    // since every rank has to join the negotiation regularly.
+    state.tensor_queue.WaitForMessages(next_cycle_start);
+    return;
+  }
+  // Busy: sleep for the full cycle so that the tensors enqueued meanwhile are
+  // processed (and fused) in one batch.
+  auto sleep_duration = next_cycle_start - std::chrono::steady_clock::now();
   if (sleep_duration > std::chrono::steady_clock::duration::zero()) {
     std::this_thread::sleep_for(sleep_duration);
   }
+}
+
+// Reset the cycle time when the queue is busy and back off exponentially when
+// it is idle.
+void UpdateCycleTime(BluefogGlobalState& state, bool is_busy) {
+  if (!state.adaptive_cycle_time) {
+    return;
+  }
+  double cycle_time_ms =
+      is_busy ? state.cycle_time_ms
+              : std::min(state.current_cycle_time_ms * 2, state.max_cycle_time_ms);
+  if (cycle_time_ms != state.current_cycle_time_ms) {
+    state.current_cycle_time_ms = cycle_time_ms;
+    state.timeline.Counter("CYCLE_TIME_US", long(cycle_time_ms * 1000.));
+  }
+}
+
+// Whether the request is a neighbor_allreduce negotiated among the neighbors.
+// Hierarchical ones need the local communicator, NCCL ones need the NCCL
+// communicator and topology-checked ones need a global allgather, so they
+// still go through the coordinator.
+bool IsNeighborNegotiated(BluefogGlobalState& state, const Request& request) {
+  if (!state.neighbor_negotiation || global_skip_negotiate_stage ||
+      request.request_type() != Request::NEIGHBOR_ALLREDUCE ||
+      request.is_hierarchical()) {
+    return false;
+  }
+  const TensorTableEntry& entry =
+      state.tensor_queue.GetTensorEntry(request.tensor_name());
+  return !entry.enable_topo_check && entry.pipeline_chunk_size == 0 &&
+         DetermineController(entry.mpi_ops_type, entry.device) == Vendor::MPI;
+}
+
+// Post the messages of the neighbor negotiated requests and remove them from
+// the buffer.
+void StartNeighborNegotiatedOps(BluefogGlobalState& state,
+                                std::deque<Request>& message_queue_buffer) {
+  auto IsNegotiated = [&state](const Request& request) -> bool {
+    return IsNeighborNegotiated(state, request);
+  };
+  for (auto& request : message_queue_buffer) {
+    if (!IsNegotiated(request)) {
+      continue;
+    }
+    state.neighbor_negotiated_ops.emplace_back();
+    NeighborNegotiatedOp& op = state.neighbor_negotiated_ops.back();
+    op.entry = state.tensor_queue.GetTensorEntriesFromRequestDirectly(request);
+    // Wait for the data is ready (in GPU case).
+    if (op.entry.ready_event != nullptr) {
+      while (!op.entry.ready_event->Ready()) {
+        std::this_thread::sleep_for(std::chrono::nanoseconds(100));
+      }
+    }
+    state.controller->StartNeighborNegotiatedAllreduce(op);
+  }
+  message_queue_buffer.erase(
+      std::remove_if(message_queue_buffer.begin(), message_queue_buffer.end(),
+                     IsNegotiated),
+      message_queue_buffer.end());
+}
+
+// Test the neighbor negotiated ops in flight without blocking.
+void ProgressNeighborNegotiatedOps(BluefogGlobalState& state) {
+  auto now = std::chrono::steady_clock::now();
+  for (auto it = state.neighbor_negotiated_ops.begin();
+       it != state.neighbor_negotiated_ops.end();) {
+    if (state.controller->TestNeighborNegotiatedAllreduce(*it)) {
+      if (state.parameter_manager.IsAutoTuning()) {
+        state.parameter_manager.RecordBytes(it->entry.tensor->size());
+      }
+      it = state.neighbor_negotiated_ops.erase(it);
+      continue;
+    }
+    if (!it->stall_warned && now - it->start_time > STALL_WARNING_TIME) {
+      BFLOG(WARNING, mpi_context.rank_)
+          << it->entry.tensor_name << " has been waiting for its neighbors "
+          << "for more than "
+          << std::chrono::duration_cast<std::chrono::seconds>(
+                 STALL_WARNING_TIME).count()
+          << " seconds. This may indicate that some neighbors are not "
+          << "submitting it, which will cause deadlock.";
+      it->stall_warned = true;
+    }
+    ++it;
+  }
+}
+
+bool RunLoopOnce(BluefogGlobalState& state) {
+  WaitForNextCycle(state);
   state.last_cycle_start = std::chrono::steady_clock::now();
 
+  // The coordinator sends a SHUTDOWN message to trigger shutdown.
+  bool should_shut_down = state.shut_down;
+  bool should_change_topo = state.setting_topology;
+
   std::deque<Request> message_queue_buffer;
-  state.tensor_queue.PopMessagesFromQueue(message_queue_buffer);
+  long queue_wait_micros = 0;
+  state.tensor_queue.PopMessagesFromQueue(message_queue_buffer,
+                                          &queue_wait_micros);
+  if (!message_queue_buffer.empty()) {
+    state.timeline.Counter("QUEUE_WAIT_US", queue_wait_micros);
+    state.timeline.Counter("QUEUE_LENGTH", long(message_queue_buffer.size()));
+  }
+  bool is_busy = !message_queue_buffer.empty();
 
   std::vector<TensorTableEntry> entries;
   auto IsRequestConvertToEntryDirectly = [](const Request& request) -> bool {
@@ -1134,18 +1507,32 @@ bool RunLoopOnce(BluefogGlobalState& state) {
 
   PerformOperation(entries);
 
+  StartNeighborNegotiatedOps(state, message_queue_buffer);
+  ProgressNeighborNegotiatedOps(state);
+
   // For the rest requests, they needs to coordinate and neogiate.
   // Collect all tensors that are ready to be reduced. Record them in the
   // tensor count table (rank zero) or send them to rank zero to be
   // recorded (everyone else).
   if (global_skip_negotiate_stage) {
     // Pass don't do anything.
+  } else if (state.response_cache.capacity() > 0) {
+    NegotiationWithResponseCache(state, message_queue_buffer,
+                                 should_change_topo, should_shut_down);
   } else {
     NegotiationOfRequest(state, message_queue_buffer, should_change_topo,
                          should_shut_down);
   }
+  if (state.parameter_manager.IsAutoTuning()) {
+    state.parameter_manager.Update();
+  }
   // Seperate the setting topology and negotiate communnication.
   if (should_change_topo) {
+    // The static neighbor negotiated ops depend on the current topology.
+    while (!state.neighbor_negotiated_ops.empty()) {
+      ProgressNeighborNegotiatedOps(state);
+      std::this_thread::sleep_for(SUSPEND_BACKGROUND_WAITTING_DURATION);
+    }
     bluefog_global.ready_to_setting_topology = true;
     while (!bluefog_global.setting_topology_done) {
       std::this_thread::sleep_for(SUSPEND_BACKGROUND_WAITTING_DURATION);
@@ -1157,6 +1544,10 @@ bool RunLoopOnce(BluefogGlobalState& state) {
     }
   }
 
+  // Tensors waiting for the negotiation result or their neighbors keep the
+  // loop busy as well.
+  UpdateCycleTime(state, is_busy || state.tensor_queue.HasPendingEntries() ||
+                             !state.neighbor_negotiated_ops.empty());
   return !should_shut_down;
 }
 
@@ -1195,6 +1586,7 @@ void bluefog_init() { InitializeBluefogOnce(); }
 void bluefog_shutdown() {
   if (bluefog_global.background_thread.joinable()) {
     bluefog_global.shut_down = true;
+    bluefog_global.tensor_queue.WakeUp();
     bluefog_global.background_thread.join();
     // Reset the initialization flag to allow restarting with bluefog_init(...)
     //bluefog_global.initialize_flag.clear();
@@ -1237,6 +1629,13 @@ int bluefog_neighbor_size() {
   return bluefog_global.controller->GetNeighborSize();
 }
 
+int64_t bluefog_neighbor_allreduce_chunk_size() {
+  if (!bluefog_global.initialization_done) {
+    return -1;
+  }
+  return bluefog_global.neighbor_allreduce_chunk_size;
+}
+
 int bluefog_mpi_threads_supported() {
   if (!bluefog_global.initialization_done) {
     return -1;
@@ -1271,6 +1670,7 @@ int bluefog_set_topology(int indegree, const int* sources, int outdegree,
   }
 #endif
   bluefog_global.setting_topology = true;
+  bluefog_global.tensor_queue.WakeUp();
   while (!bluefog_global.ready_to_setting_topology.load()) {
     std::this_thread::sleep_for(SUSPEND_BACKGROUND_WAITTING_DURATION);
   }
@@ -1520,6 +1920,8 @@ Status EnqueueTensorNeighborAllreduce(std::shared_ptr<Tensor> tensor,
                                       bool dynamic_neighbors_enabled,
                                       bool is_hierarchical,
                                       bool enable_topo_check,
+                                      bool pipelined, double self_weight,
+                                      const std::unordered_map<int, double>& neighbor_weights,
                                       const std::string& name, const int device,
                                       StatusCallback callback) {
   Request message;
@@ -1529,6 +1931,10 @@ Status EnqueueTensorNeighborAllreduce(std::shared_ptr<Tensor> tensor,
   message.set_device(device);
   message.set_request_type(Request::NEIGHBOR_ALLREDUCE);
   message.set_is_hierarchical(is_hierarchical);
+  if (send_neighbors != nullptr && recv_neighbors != nullptr) {
+    message.set_neighbor_pattern(
+        HashNeighborPattern(*send_neighbors, *recv_neighbors));
+  }
   for (int i = 0; i < tensor->shape().dims(); i++) {
     message.add_tensor_shape((int64_t)tensor->shape().dim_size(i));
   }
@@ -1544,6 +1950,11 @@ Status EnqueueTensorNeighborAllreduce(std::shared_ptr<Tensor> tensor,
   e.dynamic_neighbors_enabled = dynamic_neighbors_enabled;
   e.is_hierarchical = is_hierarchical;
   e.enable_topo_check = enable_topo_check;
+  if (pipelined) {
+    e.pipeline_chunk_size = bluefog_global.neighbor_allreduce_chunk_size;
+    e.self_weight = self_weight;
+    e.src_weights = neighbor_weights;
+  }
   e.device = device;
   e.callback = callback;
   e.mpi_ops_type = MPIOpsType::NEIGHBOR_ALLREDUCE;
@@ -1932,6 +2343,7 @@ void SetSkipNegotiateStageState(bool value) {
     // off negotiate stage. Otherwise, it may hang the processes. Use setting
     // topology flag to suspend the negotiate stage then skip it.
     bluefog_global.setting_topology = true;
+    bluefog_global.tensor_queue.WakeUp();
     while (!bluefog_global.ready_to_setting_topology.load()) {
       std::this_thread::sleep_for(SUSPEND_BACKGROUND_WAITTING_DURATION);
     }
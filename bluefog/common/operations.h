@@ -65,6 +65,11 @@ int bluefog_unified_mpi_window_model_supported();
 // Returns -1 if bluefog is not initialized or topology is not set.
 int bluefog_neighbor_size();
 
+// C interface to return the chunk size in bytes of the pipelined
+// neighbor_allreduce. Returns 0 if the pipeline is disabled.
+// Returns -1 if bluefog is not initialized.
+int64_t bluefog_neighbor_allreduce_chunk_size();
+
 // C interface to set the virtual topology for MPI graph communicator.
 // Also, the corresponding graph communicator is created.
 // Returns -1 if Bluefog is not initialized or failed.
@@ -143,6 +148,8 @@ Status EnqueueTensorNeighborAllreduce(std::shared_ptr<Tensor> tensor,
                                       bool dynamic_neighbors_enabled,
                                       bool is_hierarchical,
                                       bool enable_topo_check,
+                                      bool pipelined, double self_weight,
+                                      const std::unordered_map<int, double>& neighbor_weights,
                                       const std::string& name, const int device,
                                       StatusCallback callback);
 
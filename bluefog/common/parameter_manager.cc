@@ -0,0 +1,164 @@
+// Copyright (C) 2020 Bluefog Team. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// ==============================================================================
+
+#include "parameter_manager.h"
+
+#include <algorithm>
+
+#include "logging.h"
+
+namespace bluefog {
+namespace common {
+
+namespace {
+
+// Number of busy cycles, i.e. cycles processing allreduce or neighbor_allreduce,
+// in one sample.
+const int CYCLES_PER_SAMPLE = 10;
+
+// Number of samples for each candidate. The first one is the warmup.
+const size_t SAMPLES_PER_CANDIDATE = 5;
+
+double Median(std::vector<double> values) {
+  std::sort(values.begin(), values.end());
+  size_t n = values.size();
+  return n % 2 == 1 ? values[n / 2] : (values[n / 2 - 1] + values[n / 2]) / 2;
+}
+
+}  // namespace
+
+void ParameterManager::Initialize(int64_t tensor_fusion_threshold,
+                                  double cycle_time_ms,
+                                  const std::string& log_file) {
+  tensor_fusion_threshold_ = tensor_fusion_threshold;
+  cycle_time_ms_ = cycle_time_ms;
+  best_tensor_fusion_threshold_ = tensor_fusion_threshold;
+  best_cycle_time_ms_ = cycle_time_ms;
+
+  // Threshold 0 disables the fusion.
+  fusion_threshold_candidates_ = {0};
+  for (int64_t mb = 1; mb <= 64; mb *= 2) {
+    fusion_threshold_candidates_.push_back(mb * 1024 * 1024);
+  }
+  cycle_time_candidates_ = {0.1, 0.5, 1.0, 2.5, 5.0};
+
+  if (!log_file.empty()) {
+    log_.open(log_file, std::ios::out | std::ios::trunc);
+    if (log_.good()) {
+      log_ << "tensor_fusion_threshold,cycle_time_ms,bytes_per_sec"
+           << std::endl;
+    } else {
+      BFLOG(ERROR) << "Error opening the autotune log file " << log_file;
+    }
+  }
+}
+
+void ParameterManager::SetAutoTuning(bool active) {
+  if (active == active_) {
+    return;
+  }
+  active_ = active;
+  if (active) {
+    stage_ = 0;
+    candidate_index_ = 0;
+    best_score_ = 0;
+    sample_scores_.clear();
+    cycle_bytes_ = 0;
+    sample_bytes_ = 0;
+    sample_cycles_ = 0;
+    sample_start_ = std::chrono::steady_clock::now();
+    tensor_fusion_threshold_ = fusion_threshold_candidates_[0];
+  }
+}
+
+bool ParameterManager::Update() {
+  int64_t bytes = cycle_bytes_;
+  cycle_bytes_ = 0;
+  if (!active_ || bytes == 0) {
+    return false;
+  }
+  sample_bytes_ += bytes;
+  if (++sample_cycles_ < CYCLES_PER_SAMPLE) {
+    return false;
+  }
+
+  auto now = std::chrono::steady_clock::now();
+  double seconds = std::chrono::duration<double>(now - sample_start_).count();
+  sample_scores_.push_back(sample_bytes_ / std::max(seconds, 1e-9));
+  sample_bytes_ = 0;
+  sample_cycles_ = 0;
+  sample_start_ = now;
+  if (sample_scores_.size() < SAMPLES_PER_CANDIDATE) {
+    return false;
+  }
+
+  double score = Median(
+      std::vector<double>(sample_scores_.begin() + 1, sample_scores_.end()));
+  sample_scores_.clear();
+  LogScore(score);
+  if (score > best_score_) {
+    best_score_ = score;
+    best_tensor_fusion_threshold_ = tensor_fusion_threshold_;
+    best_cycle_time_ms_ = cycle_time_ms_;
+  }
+  NextCandidate();
+  return true;
+}
+
+void ParameterManager::NextCandidate() {
+  ++candidate_index_;
+  if (stage_ == 0) {
+    if (candidate_index_ < fusion_threshold_candidates_.size()) {
+      tensor_fusion_threshold_ = fusion_threshold_candidates_[candidate_index_];
+      return;
+    }
+    stage_ = 1;
+    candidate_index_ = 0;
+    tensor_fusion_threshold_ = best_tensor_fusion_threshold_;
+  }
+  // Skip the cycle time already scored in the first stage.
+  while (candidate_index_ < cycle_time_candidates_.size() &&
+         cycle_time_candidates_[candidate_index_] == best_cycle_time_ms_) {
+    ++candidate_index_;
+  }
+  if (candidate_index_ < cycle_time_candidates_.size()) {
+    cycle_time_ms_ = cycle_time_candidates_[candidate_index_];
+    return;
+  }
+
+  active_ = false;
+  tensor_fusion_threshold_ = best_tensor_fusion_threshold_;
+  cycle_time_ms_ = best_cycle_time_ms_;
+  BFLOG(INFO) << "Autotune finished. Chosen tensor fusion threshold: "
+              << tensor_fusion_threshold_
+              << " bytes, cycle time: " << cycle_time_ms_ << " ms.";
+  if (log_.is_open()) {
+    log_ << "# chosen," << tensor_fusion_threshold_ << "," << cycle_time_ms_
+         << "," << best_score_ << std::endl;
+  }
+}
+
+void ParameterManager::LogScore(double score) {
+  BFLOG(DEBUG) << "Autotune sample: tensor fusion threshold "
+               << tensor_fusion_threshold_ << " bytes, cycle time "
+               << cycle_time_ms_ << " ms, " << score << " bytes/sec.";
+  if (log_.is_open()) {
+    log_ << tensor_fusion_threshold_ << "," << cycle_time_ms_ << "," << score
+         << std::endl;
+  }
+}
+
+}  // namespace common
+}  // namespace bluefog
@@ -0,0 +1,88 @@
+// Copyright (C) 2020 Bluefog Team. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// ==============================================================================
+
+#ifndef BLUEFOG_COMMON_PARAMETER_MANAGER_H
+#define BLUEFOG_COMMON_PARAMETER_MANAGER_H
+
+#include <chrono>
+#include <cstdint>
+#include <fstream>
+#include <string>
+#include <vector>
+
+namespace bluefog {
+namespace common {
+
+// Tunes the tensor fusion threshold and the cycle time of the background
+// thread online. It only lives on the coordinator, which broadcasts the
+// chosen values to the other ranks within the ResponseList.
+//
+// The search is a coordinate-wise grid search: the fusion threshold is tuned
+// first with the initial cycle time, then the cycle time is tuned with the best
+// fusion threshold. Each candidate is scored by the median bytes/sec of
+// allreduce and neighbor_allreduce over several samples, where the first
+// sample is discarded as warmup (e.g. fusion buffer re-allocation).
+class ParameterManager {
+ public:
+  void Initialize(int64_t tensor_fusion_threshold, double cycle_time_ms,
+                  const std::string& log_file = "");
+
+  void SetAutoTuning(bool active);
+  inline bool IsAutoTuning() const { return active_; }
+
+  inline int64_t TensorFusionThreshold() const {
+    return tensor_fusion_threshold_;
+  }
+  inline double CycleTimeMs() const { return cycle_time_ms_; }
+
+  // Record the bytes of allreduce and neighbor_allreduce processed in the
+  // current cycle.
+  inline void RecordBytes(int64_t bytes) { cycle_bytes_ += bytes; }
+
+  // Called at the end of every cycle. Return true if the parameters are
+  // changed.
+  bool Update();
+
+ private:
+  void NextCandidate();
+  void LogScore(double score);
+
+  bool active_ = false;
+  int64_t tensor_fusion_threshold_ = 0;
+  double cycle_time_ms_ = 0;
+
+  std::vector<int64_t> fusion_threshold_candidates_;
+  std::vector<double> cycle_time_candidates_;
+  // 0 for tuning the fusion threshold, 1 for tuning the cycle time.
+  int stage_ = 0;
+  size_t candidate_index_ = 0;
+
+  double best_score_ = 0;
+  int64_t best_tensor_fusion_threshold_ = 0;
+  double best_cycle_time_ms_ = 0;
+
+  int64_t cycle_bytes_ = 0;
+  std::vector<double> sample_scores_;
+  int64_t sample_bytes_ = 0;
+  int sample_cycles_ = 0;
+  std::chrono::steady_clock::time_point sample_start_;
+
+  std::ofstream log_;
+};
+
+}  // namespace common
+}  // namespace bluefog
+
+#endif  // BLUEFOG_COMMON_PARAMETER_MANAGER_H
@@ -0,0 +1,115 @@
+// Copyright (C) 2020 Bluefog Team. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// ==============================================================================
+
+#include "response_cache.h"
+
+#include <cassert>
+#include <stdexcept>
+
+namespace bluefog {
+namespace common {
+
+void ResponseCache::SetCapacity(uint32_t capacity) {
+  capacity_ = capacity;
+  bit_to_item_.resize(capacity);
+  Clear();
+}
+
+ResponseCache::CacheState ResponseCache::Cached(const Request& request) const {
+  auto it = name_to_item_.find(request.tensor_name());
+  if (it == name_to_item_.end()) {
+    return CacheState::MISS;
+  }
+  const CacheItem& item = *it->second;
+  if (item.request_type == request.request_type() &&
+      item.tensor_type == request.tensor_type() &&
+      item.tensor_shape == request.tensor_shape() &&
+      item.device == request.device() &&
+      item.is_hierarchical == request.is_hierarchical()) {
+    return CacheState::HIT;
+  }
+  return CacheState::INVALID;
+}
+
+uint32_t ResponseCache::GetBit(const std::string& tensor_name) const {
+  return name_to_item_.at(tensor_name)->bit;
+}
+
+const Response& ResponseCache::GetResponse(uint32_t bit) {
+  auto it = bit_to_item_[bit];
+  cache_.splice(cache_.begin(), cache_, it);
+  return it->response;
+}
+
+void ResponseCache::Put(const Response& response,
+                        const TensorTableEntry& entry) {
+  if (capacity_ == 0) {
+    return;
+  }
+  assert(response.tensor_names().size() == 1);
+  Request::RequestType request_type;
+  switch (response.response_type()) {
+    case Response::ALLREDUCE:
+      request_type = Request::ALLREDUCE;
+      break;
+    case Response::NEIGHBOR_ALLREDUCE:
+      request_type = Request::NEIGHBOR_ALLREDUCE;
+      break;
+    default:
+      throw std::logic_error(
+          "Only allreduce and neighbor_allreduce responses can be cached.");
+  }
+
+  const std::string& name = response.tensor_names()[0];
+  auto it = name_to_item_.find(name);
+  if (it != name_to_item_.end()) {
+    Erase(it->second->bit);
+  } else if (free_bits_.empty()) {
+    Erase(cache_.back().bit);
+  }
+
+  CacheItem item;
+  item.response = response;
+  item.request_type = request_type;
+  item.tensor_type = entry.tensor->dtype();
+  item.tensor_shape = entry.tensor->shape().to_vector();
+  item.device = entry.device;
+  item.is_hierarchical = entry.is_hierarchical;
+  item.bit = *free_bits_.begin();
+  free_bits_.erase(free_bits_.begin());
+
+  cache_.push_front(std::move(item));
+  name_to_item_[name] = cache_.begin();
+  bit_to_item_[cache_.front().bit] = cache_.begin();
+}
+
+void ResponseCache::Erase(uint32_t bit) {
+  auto it = bit_to_item_[bit];
+  name_to_item_.erase(it->response.tensor_names()[0]);
+  cache_.erase(it);
+  free_bits_.insert(bit);
+}
+
+void ResponseCache::Clear() {
+  cache_.clear();
+  name_to_item_.clear();
+  free_bits_.clear();
+  for (uint32_t bit = 0; bit < capacity_; bit++) {
+    free_bits_.insert(bit);
+  }
+}
+
+}  // namespace common
+}  // namespace bluefog
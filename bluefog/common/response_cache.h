@@ -0,0 +1,88 @@
+// Copyright (C) 2020 Bluefog Team. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// ==============================================================================
+
+#ifndef BLUEFOG_COMMON_RESPONSE_CACHE_H
+#define BLUEFOG_COMMON_RESPONSE_CACHE_H
+
+#include <cstdint>
+#include <list>
+#include <set>
+#include <string>
+#include <unordered_map>
+#include <vector>
+
+#include "common.h"
+#include "message.h"
+
+namespace bluefog {
+namespace common {
+
+// Caches the responses of allreduce and neighbor_allreduce, so that a tensor
+// that was negotiated before can skip the coordinator next time.
+//
+// Every cached response is identified by a bit. Since the cache is only
+// modified with the responses broadcasted by the coordinator, or with the bits
+// agreed by all ranks, the content and the bits are the same on all ranks.
+// Ranks then agree on the ready tensors with a bitwise AND allreduce only.
+class ResponseCache {
+ public:
+  enum class CacheState { MISS, HIT, INVALID };
+
+  void SetCapacity(uint32_t capacity);
+  inline uint32_t capacity() const { return capacity_; }
+
+  // HIT if the request is cached with the same parameters. INVALID if the
+  // tensor name is cached but its parameters, such as the shape, are changed.
+  CacheState Cached(const Request& request) const;
+
+  // Bit of a cached tensor name.
+  uint32_t GetBit(const std::string& tensor_name) const;
+
+  // Get the response of a bit and mark it as the most recently used.
+  const Response& GetResponse(uint32_t bit);
+
+  // Cache the (single tensor) response of the entry. The least recently used
+  // response is evicted if the cache is full.
+  void Put(const Response& response, const TensorTableEntry& entry);
+
+  void Erase(uint32_t bit);
+
+  void Clear();
+
+ private:
+  struct CacheItem {
+    Response response;
+    Request::RequestType request_type;
+    DataType tensor_type;
+    std::vector<int64_t> tensor_shape;
+    int32_t device;
+    bool is_hierarchical;
+    uint32_t bit;
+  };
+
+  uint32_t capacity_ = 0;
+
+  // Ordered from the most recently used to the least recently used.
+  std::list<CacheItem> cache_;
+  std::unordered_map<std::string, std::list<CacheItem>::iterator> name_to_item_;
+  std::vector<std::list<CacheItem>::iterator> bit_to_item_;
+  // Use the smallest free bit first so that all ranks pick the same one.
+  std::set<uint32_t> free_bits_;
+};
+
+}  // namespace common
+}  // namespace bluefog
+
+#endif  // BLUEFOG_COMMON_RESPONSE_CACHE_H
@@ -0,0 +1,421 @@
+# Copyright 2020 Bluefog Team. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Single-process simulation of the Bluefog communication ops without MPI.
+
+All ranks live in one stacked NumPy array whose first dimension is the rank, i.e.
+``tensor[r]`` is the tensor held by rank ``r``. Every op is evaluated for all ranks at once
+as a sparse matrix multiplication, so thousands of ranks can be simulated on one CPU.
+Arguments that differ from rank to rank, such as ``self_weight`` or ``neighbor_weights``,
+are given as one value per rank, while a scalar is shared by all ranks.
+"""
+
+from typing import Any, List, Dict, Optional, Sequence, Union
+
+import numpy as np
+import scipy.sparse
+
+from bluefog.common import topology_util
+
+RankWeights = Optional[Sequence[Optional[Dict[int, float]]]]
+
+
+def _PerRank(value: Any, size: int, name: str) -> np.ndarray:
+    """Broadcast a scalar or check the per-rank sequence of values."""
+    value = np.asarray(value, dtype=np.float64)
+    if value.ndim == 0:
+        return np.full(size, float(value))
+    if value.shape != (size,):
+        raise ValueError("Argument {} should be a scalar or have one value per rank.".format(name))
+    return value
+
+
+def _FlattenRankWeights(rank_weights: Sequence[Optional[Dict[int, float]]], size: int,
+                        name: str):
+    """Flatten one {peer: weight} dictionary per rank into (owners, peers, weights) arrays."""
+    if len(rank_weights) != size:
+        raise ValueError("Argument {} should have one dictionary per rank.".format(name))
+    owners, peers, weights = [], [], []
+    for rank, weight_dict in enumerate(rank_weights):
+        if not weight_dict:
+            continue
+        owners.extend([rank] * len(weight_dict))
+        peers.extend(weight_dict.keys())
+        weights.extend(weight_dict.values())
+    return (np.array(owners, dtype=np.int64), np.array(peers, dtype=np.int64),
+            np.array(weights, dtype=np.float64))
+
+
+class _SimulatedWindow(object):
+    """The window tensor of all ranks and the buffers that each rank keeps for its in-neighbors.
+    The buffer of edge e = recv_indptr[dst] + k stores what dst received from its k-th
+    in-neighbor, in the same order as the CSR arrays of the simulator."""
+
+    def __init__(self, tensor: np.ndarray, flat_tensor: np.ndarray, recv_indptr: np.ndarray,
+                 recv_sources: np.ndarray, zero_init: bool):
+        self.tensor = tensor
+        self.flat_tensor = flat_tensor
+        destinations = np.repeat(np.arange(recv_indptr.shape[0] - 1), np.diff(recv_indptr))
+        if zero_init:
+            self.buffers = np.zeros((recv_sources.shape[0], flat_tensor.shape[1]),
+                                    dtype=flat_tensor.dtype)
+        else:
+            self.buffers = flat_tensor[destinations]
+        self.versions = np.zeros(recv_sources.shape[0], dtype=np.int64)
+
+
+class Simulator(object):
+    """Simulate ``size`` Bluefog ranks in a single process.
+
+    The methods follow the ``bluefog.torch`` ops of the same name. The tensor argument and
+    the returned value are stacked NumPy arrays of shape (size, ...). The only differences
+    are that the arguments specific to one rank become one value per rank, and that there is
+    neither the nonblocking version nor the mutex, since everything happens immediately.
+
+    Args:
+        size (int): The number of simulated ranks.
+        topology: networkx.DiGraph or SparseTopology. Default is the exponential-2 graph.
+        is_weighted (bool): Use the weights of topology in neighbor_allreduce and win_update
+            instead of the uniform average, same as ``bf.set_topology``.
+        local_size (int): The number of ranks in each simulated machine. Default is size.
+
+    Example:
+
+        >>> from bluefog.common import topology_util
+        >>> from bluefog.common.simulator import Simulator
+        >>> sim = Simulator(1024, topology_util.SparseExponentialGraph(1024))
+        >>> x = np.random.randn(1024, 10)
+        >>> for _ in range(20):
+        >>>     x = sim.neighbor_allreduce(x)
+        >>> np.abs(x - x.mean(axis=0)).max()
+    """
+
+    def __init__(self, size: int, topology: Optional[topology_util.TopologyType] = None,
+                 is_weighted: bool = False, local_size: Optional[int] = None):
+        assert size > 0
+        self._size = size
+        self._local_size = size if local_size is None else local_size
+        self._windows = {}
+        self._topology = None
+        self._is_topo_weighted = False
+        self.set_topology(topology, is_weighted)
+
+    def size(self) -> int:
+        return self._size
+
+    def local_size(self) -> int:
+        return self._local_size
+
+    def load_topology(self) -> topology_util.TopologyType:
+        return self._topology
+
+    def is_topo_weighted(self) -> bool:
+        return self._is_topo_weighted
+
+    def set_topology(self, topology: Optional[topology_util.TopologyType] = None,
+                     is_weighted: bool = False) -> bool:
+        """Set the virtual topology of all ranks. Same as ``bf.set_topology``, the topology
+        cannot be changed while there are windows."""
+        if topology is None:
+            topology = topology_util.SparseExponentialGraph(self._size)
+        if topology.number_of_nodes() != self._size:
+            raise ValueError("The topology should have {} nodes.".format(self._size))
+        if self._windows:
+            return False
+
+        sparse_topo = topology_util._AsSparseTopology(topology)  # pylint: disable=protected-access
+        indptr, indices, weights = sparse_topo.csr_arrays()
+        sources = np.repeat(np.arange(self._size, dtype=np.int64), np.diff(indptr))
+        is_self = sources == indices
+        self_weights = np.bincount(sources[is_self], weights[is_self], minlength=self._size)
+        sources, destinations = sources[~is_self], indices[~is_self]
+        weights = weights[~is_self]
+
+        # The out-neighbors are already sorted by the source, and the in-neighbors are sorted
+        # by the destination here. Zero weighted edges are still edges of the topology.
+        self._out_indptr = np.zeros(self._size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=self._size), out=self._out_indptr[1:])
+        self._out_destinations = destinations
+        order = np.lexsort((sources, destinations))
+        self._recv_indptr = np.zeros(self._size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(destinations, minlength=self._size), out=self._recv_indptr[1:])
+        self._recv_sources = sources[order]
+
+        if is_weighted:
+            self._self_weights = self_weights
+            self._recv_weights = weights[order]
+        else:
+            in_degrees = np.diff(self._recv_indptr)
+            self._self_weights = 1.0 / (in_degrees + 1)
+            self._recv_weights = np.repeat(1.0 / (in_degrees + 1), in_degrees)
+        self._recv_matrix = self._RecvMatrix(self._self_weights, self._recv_weights)
+        self._topology = topology
+        self._is_topo_weighted = is_weighted
+        return True
+
+    def in_neighbor_ranks(self, rank: int) -> List[int]:
+        begin, end = self._recv_indptr[rank], self._recv_indptr[rank + 1]
+        return self._recv_sources[begin:end].tolist()
+
+    def out_neighbor_ranks(self, rank: int) -> List[int]:
+        begin, end = self._out_indptr[rank], self._out_indptr[rank + 1]
+        return self._out_destinations[begin:end].tolist()
+
+    def _Flatten(self, tensor: np.ndarray) -> np.ndarray:
+        tensor = np.asarray(tensor)
+        if tensor.ndim == 0 or tensor.shape[0] != self._size:
+            raise ValueError("The first dimension of tensor should be the size {}.".format(
+                self._size))
+        return tensor.reshape(self._size, -1)
+
+    def _RecvMatrix(self, self_weights: np.ndarray, edge_weights: np.ndarray) -> Any:
+        """The (size, size) matrix whose row j are the weights that rank j applies."""
+        ranks = np.arange(self._size, dtype=np.int64)
+        destinations = np.repeat(ranks, np.diff(self._recv_indptr))
+        return scipy.sparse.csr_matrix(
+            (np.concatenate([self_weights, edge_weights]),
+             (np.concatenate([ranks, destinations]),
+              np.concatenate([ranks, self._recv_sources]))),
+            shape=(self._size, self._size))
+
+    def _EdgeIds(self, destinations: np.ndarray, sources: np.ndarray, name: str) -> np.ndarray:
+        """Positions of the edges sources -> destinations in the CSR arrays of in-neighbors."""
+        edge_keys = np.repeat(np.arange(self._size, dtype=np.int64),
+                              np.diff(self._recv_indptr)) * self._size + self._recv_sources
+        keys = destinations * self._size + sources
+        edge_ids = np.searchsorted(edge_keys, keys)
+        edge_ids = np.minimum(edge_ids, max(edge_keys.shape[0] - 1, 0))
+        if keys.size and (not edge_keys.size or (edge_keys[edge_ids] != keys).any()):
+            raise ValueError("The key of {} should only contain the ranks that belong to the "
+                             "neighbors (self-rank is not allowed).".format(name))
+        return edge_ids
+
+    def allreduce(self, tensor: np.ndarray, average: bool = True) -> np.ndarray:
+        """Average (or sum) the tensor over all ranks."""
+        flat_tensor = self._Flatten(tensor)
+        reduced = flat_tensor.mean(axis=0) if average else flat_tensor.sum(axis=0)
+        return np.broadcast_to(reduced, flat_tensor.shape).reshape(np.shape(tensor)).copy()
+
+    def broadcast(self, tensor: np.ndarray, root_rank: int) -> np.ndarray:
+        """Copy the tensor of root_rank to all ranks."""
+        flat_tensor = self._Flatten(tensor)
+        return np.broadcast_to(flat_tensor[root_rank],
+                               flat_tensor.shape).reshape(np.shape(tensor)).copy()
+
+    def neighbor_allreduce(self, tensor: np.ndarray,
+                           self_weight: Optional[Union[float, Sequence[float]]] = None,
+                           neighbor_weights: RankWeights = None,
+                           send_neighbors: Optional[Sequence[Sequence[int]]] = None,
+                           enable_topo_check: bool = True) -> np.ndarray:
+        """Weighted average of each rank's tensor over its in-neighbors and itself.
+
+        Args:
+            tensor: The stacked tensor of shape (size, ...). It is not modified.
+            self_weight: The self weight of each rank, or one weight for all ranks.
+            neighbor_weights: One {in-neighbor rank: weight} dictionary per rank.
+            send_neighbors: One list of destination ranks per rank for the dynamic topology.
+                In this mode, the keys of neighbor_weights of each rank have to be exactly the
+                ranks sending to it, since a mismatch hangs the real neighbor_allreduce.
+            enable_topo_check: Kept for the compatibility with bf.neighbor_allreduce. The
+                sending and receiving ranks are always checked.
+
+        Returns:
+            np.ndarray: The averaged tensor of the same shape as the input.
+        """
+        # pylint: disable=unused-argument
+        flat_tensor = self._Flatten(tensor)
+        if (self_weight is None) != (neighbor_weights is None):
+            raise ValueError("Arguments self_weight and neighbor_weights have to be presented "
+                             "at the same time")
+        if send_neighbors is not None and self_weight is None:
+            raise ValueError("Arguments self_weight and neighbor_weights should be presented if "
+                             "enabling dynamic topology.")
+
+        if self_weight is None:
+            recv_matrix = self._recv_matrix
+        else:
+            self_weights = _PerRank(self_weight, self._size, "self_weight")
+            destinations, sources, weights = _FlattenRankWeights(
+                neighbor_weights, self._size, "neighbor_weights")
+            if send_neighbors is None:
+                self._EdgeIds(destinations, sources, "neighbor_weights")
+            else:
+                self._CheckSendNeighbors(send_neighbors, destinations, sources)
+            ranks = np.arange(self._size, dtype=np.int64)
+            recv_matrix = scipy.sparse.csr_matrix(
+                (np.concatenate([self_weights, weights]),
+                 (np.concatenate([ranks, destinations]), np.concatenate([ranks, sources]))),
+                shape=(self._size, self._size))
+        return np.asarray(recv_matrix.dot(flat_tensor)).reshape(np.shape(tensor))
+
+    def _CheckSendNeighbors(self, send_neighbors: Sequence[Sequence[int]],
+                            destinations: np.ndarray, sources: np.ndarray) -> None:
+        if len(send_neighbors) != self._size:
+            raise ValueError("Argument send_neighbors should have one list per rank.")
+        send_sources, send_destinations = [], []
+        for rank, ranks in enumerate(send_neighbors):
+            if len(set(ranks)) != len(ranks):
+                raise ValueError("Argument send_neighbors should only contain the unique ranks.")
+            if not ranks:
+                raise ValueError("Argument send_neighbors cannot be empty list.")
+            send_sources.extend([rank] * len(ranks))
+            send_destinations.extend(ranks)
+        sent = set(zip(send_sources, send_destinations))
+        expected = set(zip(sources.tolist(), destinations.tolist()))
+        if sent != expected:
+            raise ValueError("The send_neighbors and the keys of neighbor_weights do not match "
+                             "with each other, e.g. {}.".format(
+                                 sorted(sent.symmetric_difference(expected))[0]))
+
+    def pair_gossip(self, tensor: np.ndarray, target_ranks: Sequence[Optional[int]],
+                    self_weight: Optional[Union[float, Sequence[float]]] = None,
+                    pair_weight: Optional[Union[float, Sequence[float]]] = None) -> np.ndarray:
+        """Average the tensor of each pair of ranks. Rank r pairs with target_ranks[r], which
+        has to pair with r in return. A rank with the target None keeps its tensor."""
+        flat_tensor = self._Flatten(tensor)
+        if (self_weight is None) != (pair_weight is None):
+            raise ValueError("self_weight and pair_weight have to be set at same time.")
+        if len(target_ranks) != self._size:
+            raise ValueError("Argument target_ranks should have one rank per rank.")
+        if self_weight is None:
+            self_weight, pair_weight = 0.5, 0.5
+        active = np.array([t is not None for t in target_ranks])
+        targets = np.array([r if t is None else t for r, t in enumerate(target_ranks)],
+                           dtype=np.int64)
+        if (targets[targets] != np.arange(self._size)).any() or \
+                (targets[active] == np.nonzero(active)[0]).any():
+            raise ValueError("The target ranks of pair_gossip should be paired with each other, "
+                             "otherwise the processes deadlock.")
+        self_weights = np.where(active, _PerRank(self_weight, self._size, "self_weight"), 1.0)
+        pair_weights = np.where(active, _PerRank(pair_weight, self._size, "pair_weight"), 0.0)
+        result = self_weights[:, None] * flat_tensor + pair_weights[:, None] * flat_tensor[targets]
+        return result.reshape(np.shape(tensor))
+
+    def win_create(self, tensor: np.ndarray, name: str, zero_init: bool = False) -> bool:
+        """Create the window for tensor. Same as bf.win_create, the tensor is shared with the
+        window and win_update modifies it in-place, so it has to be a contiguous array."""
+        if name in self._windows:
+            return False
+        if not isinstance(tensor, np.ndarray) or not tensor.flags.c_contiguous:
+            raise ValueError("The window tensor should be a C-contiguous numpy array.")
+        self._windows[name] = _SimulatedWindow(
+            tensor, self._Flatten(tensor), self._recv_indptr, self._recv_sources, zero_init)
+        return True
+
+    def win_free(self, name: Optional[str] = None) -> bool:
+        if name is None:
+            self._windows.clear()
+        else:
+            self._windows.pop(name)
+        return True
+
+    def _DefaultOutWeights(self) -> List[Dict[int, float]]:
+        return [{r: 1.0 for r in self.out_neighbor_ranks(rank)} for rank in range(self._size)]
+
+    def _SendToWindow(self, tensor: np.ndarray, name: str,
+                      self_weight: Optional[Union[float, Sequence[float]]],
+                      dst_weights: RankWeights, accumulate: bool) -> bool:
+        window = self._windows[name]
+        flat_tensor = self._Flatten(tensor)
+        if dst_weights is None:
+            dst_weights = self._DefaultOutWeights()
+        sources, destinations, weights = _FlattenRankWeights(
+            dst_weights, self._size, "dst_weights")
+        edge_ids = self._EdgeIds(destinations, sources, "dst_weights")
+        if accumulate:
+            window.buffers[edge_ids] += weights[:, None] * flat_tensor[sources]
+        else:
+            window.buffers[edge_ids] = weights[:, None] * flat_tensor[sources]
+        window.versions[edge_ids] += 1
+        if self_weight is not None:
+            self_weights = _PerRank(self_weight, self._size, "self_weight")
+            tensor *= self_weights.reshape((self._size,) + (1,) * (tensor.ndim - 1))
+        return True
+
+    def win_put(self, tensor: np.ndarray, name: str,
+                self_weight: Optional[Union[float, Sequence[float]]] = None,
+                dst_weights: RankWeights = None) -> bool:
+        """Each rank puts tensor * weight into the window buffers of its destinations, and then
+        multiplies its tensor by self_weight in-place."""
+        return self._SendToWindow(tensor, name, self_weight, dst_weights, accumulate=False)
+
+    def win_accumulate(self, tensor: np.ndarray, name: str,
+                       self_weight: Optional[Union[float, Sequence[float]]] = None,
+                       dst_weights: RankWeights = None) -> bool:
+        """Same as :meth:`win_put` except that tensor * weight is added to the buffers."""
+        return self._SendToWindow(tensor, name, self_weight, dst_weights, accumulate=True)
+
+    def win_get(self, name: str, src_weights: RankWeights = None) -> bool:
+        """Each rank gets the window tensor * weight of its sources into its buffers."""
+        window = self._windows[name]
+        if src_weights is None:
+            src_weights = [{r: 1.0 for r in self.in_neighbor_ranks(rank)}
+                           for rank in range(self._size)]
+        destinations, sources, weights = _FlattenRankWeights(
+            src_weights, self._size, "src_weights")
+        edge_ids = self._EdgeIds(destinations, sources, "src_weights")
+        window.buffers[edge_ids] = weights[:, None] * window.flat_tensor[sources]
+        window.versions[edge_ids] += 1
+        return True
+
+    def win_update(self, name: str,
+                   self_weight: Optional[Union[float, Sequence[float]]] = None,
+                   neighbor_weights: RankWeights = None,
+                   reset: bool = False, clone: bool = False) -> np.ndarray:
+        """Each rank averages its window tensor with the buffers of its in-neighbors. The
+        window tensor is updated in-place unless clone is True. With reset, the buffers used
+        in the average are reset to zero afterwards."""
+        window = self._windows[name]
+        if (self_weight is None) != (neighbor_weights is None):
+            raise ValueError("Arguments self_weight and neighbor_weights have to be presented "
+                             "at the same time")
+        if self_weight is None:
+            self_weights, edge_weights = self._self_weights, self._recv_weights
+            used = np.ones(edge_weights.shape[0], dtype=bool)
+        else:
+            self_weights = _PerRank(self_weight, self._size, "self_weight")
+            destinations, sources, weights = _FlattenRankWeights(
+                neighbor_weights, self._size, "neighbor_weights")
+            edge_ids = self._EdgeIds(destinations, sources, "neighbor_weights")
+            edge_weights = np.zeros(self._recv_sources.shape[0])
+            edge_weights[edge_ids] = weights
+            used = np.zeros(edge_weights.shape[0], dtype=bool)
+            used[edge_ids] = True
+
+        edge_matrix = scipy.sparse.csr_matrix(
+            (edge_weights, np.arange(edge_weights.shape[0]), self._recv_indptr),
+            shape=(self._size, edge_weights.shape[0]))
+        result = self_weights[:, None] * window.flat_tensor + edge_matrix.dot(window.buffers)
+        if reset:
+            window.buffers[used] = 0
+        window.versions[used] = 0
+        if clone:
+            return result.reshape(window.tensor.shape)
+        window.flat_tensor[...] = result
+        return window.tensor
+
+    def win_update_then_collect(self, name: str) -> np.ndarray:
+        """Sum the buffers of all in-neighbors into the window tensor and reset them."""
+        neighbor_weights = [{r: 1.0 for r in self.in_neighbor_ranks(rank)}
+                            for rank in range(self._size)]
+        return self.win_update(name, 1.0, neighbor_weights, reset=True)
+
+    def get_win_version(self, name: str) -> List[Dict[int, int]]:
+        """The number of put/get/accumulate of each buffer since it was last used by
+        win_update, as one {in-neighbor rank: version} dictionary per rank."""
+        versions = self._windows[name].versions
+        return [dict(zip(self.in_neighbor_ranks(rank),
+                         versions[self._recv_indptr[rank]:self._recv_indptr[rank + 1]].tolist()))
+                for rank in range(self._size)]
@@ -23,13 +23,19 @@ namespace common {
 
 // Add a TensorTableEntry as well as its message to the queue.
 Status TensorQueue::AddToTensorQueue(TensorTableEntry& e, Request& message) {
-  std::lock_guard<std::mutex> guard(mutex_);
-  if (tensor_table_.find(e.tensor_name) != tensor_table_.end()) {
-    return DUPLICATE_NAME_ERROR;
+  {
+    std::lock_guard<std::mutex> guard(mutex_);
+    if (tensor_table_.find(e.tensor_name) != tensor_table_.end()) {
+      return DUPLICATE_NAME_ERROR;
+    }
+    const std::string& name = message.tensor_name();
+    tensor_table_.emplace(name, std::move(e));
+    if (message_queue_.empty()) {
+      oldest_enqueue_time_ = std::chrono::steady_clock::now();
+    }
+    message_queue_.push(message);
   }
-  const std::string& name = message.tensor_name();
-  tensor_table_.emplace(name, std::move(e));
-  message_queue_.push(message);
+  message_cond_.notify_one();
   return Status::OK();
 }
 
@@ -109,8 +115,16 @@ const TensorTableEntry& TensorQueue::GetTensorEntry(
 
 // Pop out all the messages from the queue
 void TensorQueue::PopMessagesFromQueue(
-    std::deque<Request>& message_queue_buffer) {
+    std::deque<Request>& message_queue_buffer, long* queue_wait_micros) {
   std::lock_guard<std::mutex> guard(mutex_);
+  if (queue_wait_micros != nullptr) {
+    *queue_wait_micros =
+        message_queue_.empty()
+            ? 0
+            : std::chrono::duration_cast<std::chrono::microseconds>(
+                  std::chrono::steady_clock::now() - oldest_enqueue_time_)
+                  .count();
+  }
   while (!message_queue_.empty()) {
     Request message = message_queue_.front();
     message_queue_.pop();
@@ -120,8 +134,37 @@ void TensorQueue::PopMessagesFromQueue(
 
 // Push a message to massage queue
 void TensorQueue::PushMessageToQueue(Request& message) {
+  {
+    std::lock_guard<std::mutex> guard(mutex_);
+    if (message_queue_.empty()) {
+      oldest_enqueue_time_ = std::chrono::steady_clock::now();
+    }
+    message_queue_.push(std::move(message));
+  }
+  message_cond_.notify_one();
+}
+
+bool TensorQueue::WaitForMessages(
+    std::chrono::steady_clock::time_point deadline) {
+  std::unique_lock<std::mutex> lock(mutex_);
+  message_cond_.wait_until(lock, deadline, [this] {
+    return !message_queue_.empty() || wake_up_;
+  });
+  wake_up_ = false;
+  return !message_queue_.empty();
+}
+
+void TensorQueue::WakeUp() {
+  {
+    std::lock_guard<std::mutex> guard(mutex_);
+    wake_up_ = true;
+  }
+  message_cond_.notify_one();
+}
+
+bool TensorQueue::HasPendingEntries() const {
   std::lock_guard<std::mutex> guard(mutex_);
-  message_queue_.push(std::move(message));
+  return !tensor_table_.empty();
 }
 
 Status FusionBufferManager::InitializeBuffer(
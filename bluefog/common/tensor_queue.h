@@ -17,6 +17,8 @@
 #ifndef BLUEFOG_COMMON_TENSOR_QUEUE_H
 #define BLUEFOG_COMMON_TENSOR_QUEUE_H
 
+#include <chrono>
+#include <condition_variable>
 #include <iostream>
 #include <mutex>
 #include <queue>
@@ -42,10 +44,23 @@ class TensorQueue {
 
   const TensorTableEntry& GetTensorEntry(const std::string& tensor_name) const;
 
-  void PopMessagesFromQueue(std::deque<Request>& message_queue_buffer);
+  // If queue_wait_micros is given, it is set to how long the oldest popped
+  // message has been waiting in the queue.
+  void PopMessagesFromQueue(std::deque<Request>& message_queue_buffer,
+                            long* queue_wait_micros = nullptr);
 
   void PushMessageToQueue(Request& message);
 
+  // Block until a message is enqueued, WakeUp() is called, or the deadline is
+  // reached. Return true if there are messages in the queue.
+  bool WaitForMessages(std::chrono::steady_clock::time_point deadline);
+
+  // Wake up the thread blocked in WaitForMessages, e.g. on shutdown.
+  void WakeUp();
+
+  // Whether there are tensors enqueued but not finished yet.
+  bool HasPendingEntries() const;
+
   // Used when setting Topology, which require the tensor queue should be empty always.
   inline void LockTensorQueue() { mutex_.lock(); }
   inline void UnlockTensorQueue() { mutex_.unlock(); }
@@ -60,9 +75,16 @@ class TensorQueue {
   // Queue of MPI requests waiting to be sent to the coordinator node.
   std::queue<Request> message_queue_;
 
+  // Time point when the oldest message in message_queue_ was enqueued.
+  std::chrono::steady_clock::time_point oldest_enqueue_time_;
+
   // A mutex that needs to be used whenever operations on message queue are
   // done.
   mutable std::mutex mutex_;
+
+  // Signaled whenever a message is enqueued or WakeUp() is called.
+  std::condition_variable message_cond_;
+  bool wake_up_ = false;
 };
 
 // Encapsulates the process of creating and destroying fusion buffers as the requested
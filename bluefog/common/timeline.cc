@@ -56,6 +56,19 @@ void TimelineWriter::EnqueueWriteEvent(const std::string& tensor_name,
     ;
 }
 
+void TimelineWriter::EnqueueWriteCounter(const std::string& counter_name,
+                                         long value, long ts_micros) {
+  TimelineRecord r{};
+  r.type = TimelineRecordType::COUNTER;
+  r.tensor_name = counter_name;
+  r.phase = 'C';
+  r.ts_micros = ts_micros;
+  r.counter_value = value;
+
+  while (healthy_ && !record_queue_.push(r))
+    ;
+}
+
 void TimelineWriter::DoWriteEvent(const TimelineRecord& r) {
   assert(r.type == TimelineRecordType::EVENT);
 
@@ -96,6 +109,29 @@ void TimelineWriter::DoWriteEvent(const TimelineRecord& r) {
   file_ << "}," << std::endl;
 }
 
+void TimelineWriter::DoWriteCounter(const TimelineRecord& r) {
+  assert(r.type == TimelineRecordType::COUNTER);
+
+  // Tensors use pid starting from 1. All counters are put under pid 0.
+  if (!counter_process_registered_) {
+    counter_process_registered_ = true;
+    file_ << "{";
+    file_ << "\"name\": \"process_name\"";
+    file_ << ", \"ph\": \"M\"";
+    file_ << ", \"pid\": 0";
+    file_ << ", \"args\": {\"name\": \"BACKGROUND_LOOP\"}";
+    file_ << "}," << std::endl;
+  }
+
+  file_ << "{";
+  file_ << "\"ph\": \"C\"";
+  file_ << ", \"name\": \"" << r.tensor_name << "\"";
+  file_ << ", \"ts\": " << r.ts_micros << "";
+  file_ << ", \"pid\": 0";
+  file_ << ", \"args\": {\"value\": " << r.counter_value << "}";
+  file_ << "}," << std::endl;
+}
+
 void TimelineWriter::WriterLoop() {
   while (healthy_) {
     while (healthy_ && !record_queue_.empty()) {
@@ -104,6 +140,9 @@ void TimelineWriter::WriterLoop() {
         case TimelineRecordType::EVENT:
           DoWriteEvent(r);
           break;
+        case TimelineRecordType::COUNTER:
+          DoWriteCounter(r);
+          break;
         default:
           throw std::logic_error("Unknown event type provided.");
       }
@@ -204,5 +243,14 @@ void Timeline::ActivityEndAll(const std::vector<TensorTableEntry>& entries,
   }
 }
 
+void Timeline::Counter(const std::string& counter_name, long value) {
+  if (!initialized_) {
+    return;
+  }
+
+  std::lock_guard<std::recursive_mutex> guard(mutex_);
+  writer_.EnqueueWriteCounter(counter_name, value, TimeSinceStartMicros());
+}
+
 }  // namespace common
 }  // namespace bluefog
\ No newline at end of file
@@ -32,7 +32,7 @@
 namespace bluefog {
 namespace common {
 
-enum TimelineRecordType { EVENT };
+enum TimelineRecordType { EVENT, COUNTER };
 
 struct TimelineRecord {
   TimelineRecordType type;
@@ -41,6 +41,8 @@ struct TimelineRecord {
   std::string op_name;
   std::thread::id tid;
   long ts_micros;
+  // Only used by COUNTER records.
+  long counter_value;
 };
 
 class TimelineWriter {
@@ -50,9 +52,12 @@ class TimelineWriter {
   void EnqueueWriteEvent(const std::string& tensor_name, char phase,
                          const std::string& op_name, 
                          const std::thread::id tid, long ts_micros);
+  void EnqueueWriteCounter(const std::string& counter_name, long value,
+                           long ts_micros);
 
  private:
   void DoWriteEvent(const TimelineRecord& r);
+  void DoWriteCounter(const TimelineRecord& r);
   void WriterLoop();
 
   // Are we healthy?
@@ -73,6 +78,9 @@ class TimelineWriter {
   // Mapping of thread ID to indexes. It is used to transform thread::id
   // to int and reduce size of the timeline file.
   std::unordered_map<std::thread::id, int> tid_table_;
+
+  // Whether the metadata of the process holding all counters is written.
+  bool counter_process_registered_ = false;
 };
 
 enum TimelineState { ACTIVITY, TOP_LEVEL };
@@ -95,6 +103,10 @@ class Timeline {
   void ActivityEndAll(const std::vector<TensorTableEntry>& entries,
                       const std::thread::id* tid_ptr = nullptr);
 
+  // Record the current value of a counter, such as the queue wait time of the
+  // background thread. Counters are shown as line charts in chrome://tracing.
+  void Counter(const std::string& counter_name, long value);
+
  private:
   long TimeSinceStartMicros() const;
   void WriteEvent(const std::string& tensor_name, char phase,
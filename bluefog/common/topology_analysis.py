@@ -0,0 +1,391 @@
+# Copyright 2020 Bluefog Team. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Offline analysis of how fast a topology or a dynamic schedule averages and what it costs.
+
+Throughout this module, the weight matrix ``W`` follows the convention of topology_util:
+entry ``(i, j)`` is the weight that rank ``j`` applies to the tensor received from rank ``i``,
+so one step of ``neighbor_allreduce`` is ``x <- W^T x``. For a doubly stochastic ``W``, the
+consensus error ``x - mean(x)`` shrinks at least by the contraction rate ``||W - J||_2`` per
+step, where ``J = 11^T / size``.
+
+The sparse matrices and eigen/singular value solvers come from scipy, which is only imported
+for the topologies with more than ``DENSE_SIZE_LIMIT`` ranks. The rates of the smaller static
+topologies are computed with the dense numpy routines.
+"""
+
+from typing import List, Tuple, Dict, Optional, Sequence, Union
+
+import math
+import numpy as np
+
+from bluefog.common.topology_util import (
+    TopologyType, CirculantTopology, _AsSparseTopology)
+
+# Topologies up to this size are analyzed with the dense numpy routines, which are exact and
+# faster than the iterative sparse solvers for small matrices.
+DENSE_SIZE_LIMIT = 512
+
+
+def _ScipySparse():
+    try:
+        import scipy.sparse  # pylint: disable=import-outside-toplevel
+        import scipy.sparse.linalg  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        raise ImportError(
+            "scipy is required to analyze the topologies with more than {} ranks. "
+            "Please install it by `pip install scipy`.".format(DENSE_SIZE_LIMIT))
+    return scipy.sparse
+
+
+def WeightMatrix(topo: TopologyType):
+    """Return the weight matrix of topology as a ``scipy.sparse.csr_matrix``.
+
+    Args:
+        topo: networkx.DiGraph or SparseTopology.
+
+    Returns:
+        scipy.sparse.csr_matrix: The (size, size) weight matrix.
+    """
+    sparse = _ScipySparse()
+    topo = _AsSparseTopology(topo)
+    size = topo.number_of_nodes()
+    indptr, indices, weights = topo.csr_arrays()
+    return sparse.csr_matrix((weights, indices, indptr), shape=(size, size))
+
+
+def _DenseWeightMatrix(topo: TopologyType) -> np.ndarray:
+    topo = _AsSparseTopology(topo)
+    size = topo.number_of_nodes()
+    indptr, indices, weights = topo.csr_arrays()
+    W = np.zeros((size, size))
+    W[np.repeat(np.arange(size), np.diff(indptr)), indices] = weights
+    return W
+
+
+def _CirculantEigenvalues(topo: CirculantTopology) -> np.ndarray:
+    """Eigenvalues of a circulant matrix are the DFT of its first row, O(size log size)."""
+    first_row = np.zeros(topo.number_of_nodes())
+    first_row[topo.offsets] = topo.offset_weights
+    return np.fft.fft(first_row)
+
+
+def _DeviationNorm(matvec, rmatvec, size: int) -> float:
+    """||A - J||_2 where A is given by its (transposed) matrix-vector products."""
+    sparse = _ScipySparse()
+    operator = sparse.linalg.LinearOperator(
+        (size, size), dtype=np.float64,
+        matvec=lambda x: matvec(x) - x.mean(),
+        rmatvec=lambda x: rmatvec(x) - x.mean())
+    return float(sparse.linalg.svds(operator, k=1, return_singular_vectors=False)[0])
+
+
+def SecondLargestEigenvalueModulus(topo: TopologyType) -> float:
+    """Return the second largest modulus of the eigenvalues of the weight matrix.
+
+    For a connected doubly stochastic topology, the largest eigenvalue is 1 and the consensus
+    error asymptotically decays as ``SLEM ** steps``. The value is 1 if the topology is not
+    connected. Circulant topologies are evaluated in closed form, small topologies densely,
+    and the others with the sparse eigensolver of scipy.
+
+    Args:
+        topo: networkx.DiGraph or SparseTopology.
+
+    Returns:
+        float: The second largest eigenvalue modulus (SLEM).
+
+    Example:
+
+        >>> from bluefog.common import topology_util, topology_analysis
+        >>> topology_analysis.SecondLargestEigenvalueModulus(
+        >>>     topology_util.SparseExponentialGraph(16))
+        0.6...
+    """
+    size = topo.number_of_nodes()
+    if size == 1:
+        return 0.0
+    if isinstance(topo, CirculantTopology):
+        moduli = np.abs(_CirculantEigenvalues(topo))
+    elif size <= DENSE_SIZE_LIMIT:
+        moduli = np.abs(np.linalg.eigvals(_DenseWeightMatrix(topo)))
+    else:
+        sparse = _ScipySparse()
+        moduli = np.abs(sparse.linalg.eigs(WeightMatrix(topo), k=2, which='LM',
+                                           return_eigenvectors=False))
+    moduli.sort()
+    return float(min(moduli[-2], 1.0))
+
+
+def SpectralGap(topo: TopologyType) -> float:
+    """Return ``1 - SLEM`` of the weight matrix. The larger, the faster the topology averages.
+    See :func:`SecondLargestEigenvalueModulus`."""
+    return 1.0 - SecondLargestEigenvalueModulus(topo)
+
+
+def ContractionRate(topo: TopologyType) -> float:
+    """Return ``||W - J||_2``, the worst-case factor that one step of averaging shrinks the
+    consensus error by. It is never smaller than the SLEM and equals it for symmetric and
+    circulant weight matrices. It is only meaningful when the weight matrix is doubly
+    stochastic.
+
+    Args:
+        topo: networkx.DiGraph or SparseTopology.
+
+    Returns:
+        float: The contraction rate per step.
+    """
+    size = topo.number_of_nodes()
+    if size == 1:
+        return 0.0
+    if isinstance(topo, CirculantTopology):
+        eigenvalues = _CirculantEigenvalues(topo)
+        # W is normal and J projects onto the eigenvector of eigenvalues[0].
+        return float(max(abs(eigenvalues[0] - 1.0), np.abs(eigenvalues[1:]).max()))
+    if size <= DENSE_SIZE_LIMIT:
+        return float(np.linalg.norm(_DenseWeightMatrix(topo) - 1.0 / size, 2))
+    W = WeightMatrix(topo)
+    W_T = W.T.tocsr()
+    return _DeviationNorm(W.dot, W_T.dot, size)
+
+
+def DynamicWeightMatrices(send_matrix: np.ndarray) -> List:
+    """Build the weight matrices of a one-peer dynamic schedule.
+
+    At step ``t``, rank ``r`` sends to ``send_matrix[t, r]`` and every rank averages itself
+    with whatever it receives uniformly, i.e. ``self_weight = 1 / (len(recv_ranks) + 1)`` as
+    in the dynamic topology examples.
+
+    Args:
+        send_matrix (np.ndarray): Integer matrix of shape (num_steps, size), e.g. from
+            :func:`~bluefog.common.topology_util.GetDynamicSendMatrix` or the send ranks of
+            :func:`~bluefog.common.topology_util.GetInnerOuterRingDynamicSendRecvMatrix`.
+
+    Returns:
+        List[scipy.sparse.csr_matrix]: The (size, size) weight matrix of each step.
+    """
+    sparse = _ScipySparse()
+    send_matrix = np.asarray(send_matrix, dtype=np.int64)
+    num_steps, size = send_matrix.shape
+    ranks = np.arange(size, dtype=np.int64)
+    weight_matrices = []
+    for step in range(num_steps):
+        destinations = send_matrix[step]
+        recv_weights = 1.0 / (np.bincount(destinations, minlength=size) + 1)
+        sources = np.concatenate([ranks, ranks])
+        destinations = np.concatenate([ranks, destinations])
+        weight_matrices.append(sparse.csr_matrix(
+            (recv_weights[destinations], (sources, destinations)), shape=(size, size)))
+    return weight_matrices
+
+
+def ScheduleContractionRate(weight_matrices: Sequence) -> float:
+    """Return the per-step contraction rate of a periodic schedule.
+
+    It is ``||W_0 W_1 ... W_{T-1} - J||_2 ** (1 / T)``, i.e. the geometric mean over one period
+    of how much the consensus error shrinks. The product is applied as a chain of sparse
+    matrix-vector products and never formed explicitly.
+
+    Args:
+        weight_matrices: The weight matrices of one period, e.g. from
+            :func:`DynamicWeightMatrices`.
+
+    Returns:
+        float: The contraction rate per step.
+
+    Example:
+
+        >>> from bluefog.common import topology_util, topology_analysis
+        >>> send, _ = topology_util.GetInnerOuterRingDynamicSendRecvMatrix(32, 4, 4)
+        >>> topology_analysis.ScheduleContractionRate(
+        >>>     topology_analysis.DynamicWeightMatrices(send))
+    """
+    if not weight_matrices:
+        raise ValueError("weight_matrices should not be empty.")
+    num_steps = len(weight_matrices)
+    size = weight_matrices[0].shape[0]
+    if size == 1:
+        return 0.0
+    if size <= DENSE_SIZE_LIMIT:
+        product = np.eye(size)
+        for W in weight_matrices:
+            product = np.asarray(product @ W)
+        norm = float(np.linalg.norm(product - 1.0 / size, 2))
+    else:
+        transposed = [W.T.tocsr() for W in weight_matrices]
+
+        def matvec(x):
+            for W in reversed(weight_matrices):
+                x = W.dot(x)
+            return x
+
+        def rmatvec(x):
+            for W_T in transposed:
+                x = W_T.dot(x)
+            return x
+        norm = _DeviationNorm(matvec, rmatvec, size)
+    return norm ** (1.0 / num_steps)
+
+
+def StepsToConsensus(rate: float, tolerance: float = 1e-4) -> Optional[int]:
+    """Return the number of steps that shrinks the consensus error below tolerance times its
+    initial value with the given contraction rate per step, or None if it never does."""
+    assert 0 < tolerance < 1
+    if rate <= 0:
+        return 1
+    if rate >= 1:
+        return None
+    return int(math.ceil(math.log(tolerance) / math.log(rate)))
+
+
+def CommunicationCost(topo: TopologyType, tensor_bytes: int,
+                      local_size: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the bytes each rank sends in one step of ``neighbor_allreduce``.
+
+    Args:
+        topo: networkx.DiGraph or SparseTopology.
+        tensor_bytes (int): The size of the tensor in bytes.
+        local_size (int): The number of ranks in each machine. Ranks ``r`` and ``s`` are in
+            the same machine if ``r // local_size == s // local_size``. If it is None, all
+            ranks are regarded to be in different machines.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: intra_machine_bytes and inter_machine_bytes, each of
+        shape (size,).
+    """
+    topo = _AsSparseTopology(topo)
+    size = topo.number_of_nodes()
+    indptr, indices, _ = topo.csr_arrays()
+    sources = np.repeat(np.arange(size), np.diff(indptr))
+    return _SplitBytes(sources, indices, size, tensor_bytes, local_size)
+
+
+def ScheduleCommunicationCost(send_matrix: np.ndarray, tensor_bytes: int,
+                              local_size: Optional[int] = None
+                              ) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the bytes each rank sends per step, averaged over the steps of a one-peer
+    dynamic schedule. See :func:`CommunicationCost` for the arguments."""
+    send_matrix = np.asarray(send_matrix, dtype=np.int64)
+    num_steps, size = send_matrix.shape
+    sources = np.tile(np.arange(size), num_steps)
+    intra_bytes, inter_bytes = _SplitBytes(
+        sources, send_matrix.ravel(), size, tensor_bytes, local_size)
+    return intra_bytes / num_steps, inter_bytes / num_steps
+
+
+def _SplitBytes(sources: np.ndarray, destinations: np.ndarray, size: int,
+                tensor_bytes: int, local_size: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    is_sent = sources != destinations
+    sources, destinations = sources[is_sent], destinations[is_sent]
+    if local_size is None:
+        is_intra = np.zeros(sources.shape, dtype=bool)
+    else:
+        is_intra = (sources // local_size) == (destinations // local_size)
+    intra_bytes = np.bincount(sources[is_intra], minlength=size) * float(tensor_bytes)
+    inter_bytes = np.bincount(sources[~is_intra], minlength=size) * float(tensor_bytes)
+    return intra_bytes, inter_bytes
+
+
+class TopologyReport(object):
+    """How fast a topology or dynamic schedule averages and what one step costs.
+
+    Attributes:
+        rate (float): The contraction rate of the consensus error per step.
+        steps_to_consensus (int): Steps to shrink the consensus error below tolerance, or
+            None if it never does.
+        intra_machine_bytes (np.ndarray): Bytes sent by each rank per step within machine.
+        inter_machine_bytes (np.ndarray): Bytes sent by each rank per step across machines.
+        step_cost (float): The cost of one step, which is the largest per-rank cost
+            ``intra_machine_bytes + inter_node_cost * inter_machine_bytes``, since every
+            step waits for the slowest rank.
+    """
+
+    def __init__(self, rate: float, tolerance: float, intra_machine_bytes: np.ndarray,
+                 inter_machine_bytes: np.ndarray, inter_node_cost: float):
+        self.rate = rate
+        self.steps_to_consensus = StepsToConsensus(rate, tolerance)
+        self.intra_machine_bytes = intra_machine_bytes
+        self.inter_machine_bytes = inter_machine_bytes
+        self.step_cost = float(
+            (intra_machine_bytes + inter_node_cost * inter_machine_bytes).max())
+
+    @property
+    def cost_to_consensus(self) -> float:
+        if self.steps_to_consensus is None:
+            return math.inf
+        return self.steps_to_consensus * self.step_cost
+
+    def __repr__(self) -> str:
+        return "TopologyReport(rate={:.4f}, steps_to_consensus={}, step_cost={:.1f})".format(
+            self.rate, self.steps_to_consensus, self.step_cost)
+
+
+def AnalyzeTopology(topo: Union[TopologyType, np.ndarray], tensor_bytes: int,
+                    local_size: Optional[int] = None, inter_node_cost: float = 10.0,
+                    tolerance: float = 1e-4) -> TopologyReport:
+    """Analyze a static topology or a one-peer dynamic schedule.
+
+    Args:
+        topo: networkx.DiGraph or SparseTopology for the static topology, or the integer send
+            matrix of shape (period, size) for the dynamic schedule.
+        tensor_bytes (int): The size of the tensor in bytes.
+        local_size (int): The number of ranks in each machine. None means that all ranks are
+            in different machines.
+        inter_node_cost (float): The cost of sending one byte across machines relative to
+            sending it within one machine.
+        tolerance (float): The relative consensus error to reach.
+
+    Returns:
+        TopologyReport: The rate, steps to consensus and communication cost.
+    """
+    if isinstance(topo, np.ndarray):
+        rate = ScheduleContractionRate(DynamicWeightMatrices(topo))
+        intra_bytes, inter_bytes = ScheduleCommunicationCost(topo, tensor_bytes, local_size)
+    else:
+        rate = ContractionRate(topo)
+        intra_bytes, inter_bytes = CommunicationCost(topo, tensor_bytes, local_size)
+    return TopologyReport(rate, tolerance, intra_bytes, inter_bytes, inter_node_cost)
+
+
+def CheapestTopology(candidates: Dict[str, Union[TopologyType, np.ndarray]],
+                     tensor_bytes: int, num_steps: int, local_size: Optional[int] = None,
+                     inter_node_cost: float = 10.0, tolerance: float = 1e-4
+                     ) -> Tuple[Optional[str], Dict[str, TopologyReport]]:
+    """Pick the candidate with the cheapest step among those reaching consensus within
+    num_steps. See :func:`AnalyzeTopology` for the arguments.
+
+    Returns:
+        Tuple[Optional[str], Dict[str, TopologyReport]]: The name of the cheapest candidate,
+        or None if no candidate reaches consensus in time, and the reports of all candidates.
+
+    Example:
+
+        >>> from bluefog.common import topology_util, topology_analysis
+        >>> size, local_size = 32, 4
+        >>> send, _ = topology_util.GetInnerOuterRingDynamicSendRecvMatrix(
+        >>>     size, local_size, local_size)
+        >>> name, reports = topology_analysis.CheapestTopology(
+        >>>     {"expo2": topology_util.SparseExponentialGraph(size),
+        >>>      "mesh": topology_util.SparseMeshGrid2DGraph(size),
+        >>>      "inner_outer_ring": send},
+        >>>     tensor_bytes=4 << 20, num_steps=100, local_size=local_size)
+    """
+    reports = {name: AnalyzeTopology(topo, tensor_bytes, local_size, inter_node_cost, tolerance)
+               for name, topo in candidates.items()}
+    feasible = [name for name, report in reports.items()
+                if report.steps_to_consensus is not None and
+                report.steps_to_consensus <= num_steps]
+    if not feasible:
+        return None, reports
+    return min(feasible, key=lambda name: reports[name].step_cost), reports
@@ -13,56 +13,415 @@
 # limitations under the License.
 # ==============================================================================
 
-from typing import List, Tuple, Dict, Iterator, Optional
+from typing import List, Tuple, Dict, Iterator, Optional, Sequence, Union
 
+import hashlib
 import math
 import numpy as np
 import networkx as nx
 
 
-def IsTopologyEquivalent(topo1: nx.DiGraph, topo2: nx.DiGraph) -> bool:
+
+class SparseTopology(object):
+    """A compact weighted directed graph stored in the CSR (compressed sparse row) format.
+
+    Row ``i`` holds the out-going edges of rank ``i``, so entry ``(i, j)`` is the weight
+    that rank ``j`` applies to the tensor it receives from rank ``i``. This is the same
+    convention as the adjacency matrix of the ``networkx.DiGraph`` topologies. Self-loops
+    are stored as regular edges.
+
+    Unlike ``networkx.DiGraph``, the memory footprint is O(edges) and the neighbors of one
+    rank can be read without touching the rest of the graph, which keeps ``set_topology``
+    cheap at thousands of ranks. It can be passed to ``bf.set_topology`` directly, and
+    :meth:`to_networkx` converts it whenever a ``networkx.DiGraph`` is needed.
+
+    Args:
+        size (int): The number of ranks (nodes).
+        sources (Sequence[int]): The source rank of each edge.
+        destinations (Sequence[int]): The destination rank of each edge.
+        weights (Sequence[float]): The weight of each edge. Default is 1.0 for all edges.
+
+    Example:
+
+        >>> from bluefog.common import topology_util
+        >>> topo = topology_util.SparseTopology(3, [0, 1, 2], [1, 2, 0], [1.0, 1.0, 1.0])
+        >>> topo.predecessors(0)
+        [2]
+        >>> G = topo.to_networkx()
+    """
+
+    def __init__(self, size: int, sources: Sequence[int], destinations: Sequence[int],
+                 weights: Optional[Sequence[float]] = None):
+        assert size > 0
+        sources = np.asarray(sources, dtype=np.int64).ravel()
+        destinations = np.asarray(destinations, dtype=np.int64).ravel()
+        if weights is None:
+            weights = np.ones(sources.shape[0])
+        weights = np.asarray(weights, dtype=np.float64).ravel()
+        if not sources.shape == destinations.shape == weights.shape:
+            raise ValueError("sources, destinations and weights should have the same length.")
+        if sources.size and (min(sources.min(), destinations.min()) < 0 or
+                             max(sources.max(), destinations.max()) >= size):
+            raise ValueError("The rank of edges should be in the range [0, size).")
+
+        order = np.lexsort((destinations, sources))
+        sources, destinations = sources[order], destinations[order]
+        duplicated = (sources[1:] == sources[:-1]) & (destinations[1:] == destinations[:-1])
+        if duplicated.any():
+            raise ValueError("Each edge should be presented only once.")
+
+        self._size = size
+        self._indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=size), out=self._indptr[1:])
+        self._indices = destinations
+        self._weights = weights[order]
+        # Transposed (CSC) copy used by the predecessor queries. Built on first use.
+        self._t_indptr = None
+        self._t_indices = None
+        self._t_weights = None
+        self._fingerprint = None
+
+    @classmethod
+    def from_networkx(cls, topo: nx.DiGraph) -> 'SparseTopology':
+        """Build the sparse topology from a networkx.DiGraph whose nodes are 0 to size-1.
+        Other node labels are replaced by their order in the graph, as in the adjacency matrix
+        of networkx. Edges without the weight attribute are treated as weight 1.0."""
+        if set(topo.nodes) != set(range(topo.number_of_nodes())):
+            topo = nx.convert_node_labels_to_integers(topo)
+        edges = list(topo.edges(data='weight', default=1.0))
+        if not edges:
+            return cls(topo.number_of_nodes(), [], [], [])
+        sources, destinations, weights = zip(*edges)
+        return cls(topo.number_of_nodes(), sources, destinations, weights)
+
+    def to_networkx(self) -> nx.DiGraph:
+        """Convert to the networkx.DiGraph with the edge weights stored as `weight`."""
+        self._materialize()
+        G = nx.DiGraph()
+        G.add_nodes_from(range(self._size))
+        sources = np.repeat(np.arange(self._size), np.diff(self._indptr))
+        G.add_weighted_edges_from(
+            zip(sources.tolist(), self._indices.tolist(), self._weights.tolist()))
+        return G
+
+    def csr_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the (indptr, indices, weights) CSR arrays of the weight matrix. They are
+        shared with the topology and should not be modified."""
+        self._materialize()
+        return self._indptr, self._indices, self._weights
+
+    def number_of_nodes(self) -> int:
+        return self._size
+
+    def number_of_edges(self) -> int:
+        return int(self._indices.shape[0])
+
+    def out_edges(self, rank: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the (destinations, weights) arrays of out-going edges of rank, self-loop
+        included. Destinations are in ascending order."""
+        begin, end = self._indptr[rank], self._indptr[rank + 1]
+        return self._indices[begin:end], self._weights[begin:end]
+
+    def in_edges(self, rank: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the (sources, weights) arrays of in-coming edges of rank, self-loop
+        included. Sources are in ascending order."""
+        if self._t_indptr is None:
+            self._build_transposed()
+        begin, end = self._t_indptr[rank], self._t_indptr[rank + 1]
+        return self._t_indices[begin:end], self._t_weights[begin:end]
+
+    def successors(self, rank: int) -> List[int]:
+        return self.out_edges(rank)[0].tolist()
+
+    def predecessors(self, rank: int) -> List[int]:
+        return self.in_edges(rank)[0].tolist()
+
+    def out_degree(self, rank: int) -> int:
+        return int(self._indptr[rank + 1] - self._indptr[rank])
+
+    def in_degree(self, rank: int) -> int:
+        return len(self.in_edges(rank)[0])
+
+    def _build_transposed(self):
+        sources = np.repeat(np.arange(self._size), np.diff(self._indptr))
+        order = np.lexsort((sources, self._indices))
+        self._t_indptr = np.zeros(self._size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self._indices, minlength=self._size), out=self._t_indptr[1:])
+        self._t_indices = sources[order]
+        self._t_weights = self._weights[order]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, SparseTopology):
+            return NotImplemented
+        self._materialize()
+        other._materialize()
+        return (self._size == other._size and
+                np.array_equal(self._indptr, other._indptr) and
+                np.array_equal(self._indices, other._indices) and
+                np.array_equal(self._weights, other._weights))
+
+    def __ne__(self, other) -> bool:
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def fingerprint(self) -> str:
+        """Return a digest of the size, edges and weights. Two topologies have the same
+        fingerprint if and only if their weight matrices are the same (up to hash collision).
+        SparseTopology is immutable so the fingerprint is computed once and cached."""
+        if self._fingerprint is None:
+            self._materialize()
+            digest = hashlib.blake2b(digest_size=20)
+            digest.update(np.int64(self._size).tobytes())
+            digest.update(self._indptr.tobytes())
+            digest.update(self._indices.tobytes())
+            digest.update(self._weights.tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def _materialize(self):
+        """Hook for the subclasses which build the CSR arrays lazily."""
+
+    def __repr__(self) -> str:
+        return "SparseTopology(size={}, edges={})".format(self._size, self.number_of_edges())
+
+
+class CirculantTopology(SparseTopology):
+    """A SparseTopology where rank i sends to rank (i + offsets[k]) % size with weights[k].
+
+    ExponentialGraph, SymmetricExponentialGraph, RingGraph and FullyConnectedGraph are all
+    circulant. The neighbors and weights of any rank are computed in closed form from the
+    offsets, so creating it and querying one rank costs O(degree) instead of O(size * degree).
+    The CSR arrays are only built when the whole graph is needed, e.g. :meth:`to_networkx`.
+
+    Args:
+        size (int): The number of ranks (nodes).
+        offsets (Sequence[int]): The (clock-wise) distance from a rank to its out-neighbors.
+        weights (Sequence[float]): The weight associated with each offset.
+    """
+
+    def __init__(self, size: int, offsets: Sequence[int], weights: Sequence[float]):
+        # pylint: disable=super-init-not-called
+        assert size > 0
+        offsets = np.asarray(offsets, dtype=np.int64).ravel() % size
+        weights = np.asarray(weights, dtype=np.float64).ravel()
+        if offsets.shape != weights.shape:
+            raise ValueError("offsets and weights should have the same length.")
+        order = np.argsort(offsets, kind='stable')
+        offsets, weights = offsets[order], weights[order]
+        if (offsets[1:] == offsets[:-1]).any():
+            raise ValueError("Each offset should be presented only once.")
+        self._size = size
+        self._offsets = offsets
+        self._offset_weights = weights
+        self._indptr = None
+        self._t_indptr = None
+        self._fingerprint = None
+
+    @property
+    def offsets(self) -> np.ndarray:
+        return self._offsets
+
+    @property
+    def offset_weights(self) -> np.ndarray:
+        return self._offset_weights
+
+    def number_of_edges(self) -> int:
+        return self._size * int(self._offsets.shape[0])
+
+    def out_edges(self, rank: int) -> Tuple[np.ndarray, np.ndarray]:
+        destinations = (rank + self._offsets) % self._size
+        order = np.argsort(destinations)
+        return destinations[order], self._offset_weights[order]
+
+    def in_edges(self, rank: int) -> Tuple[np.ndarray, np.ndarray]:
+        sources = (rank - self._offsets) % self._size
+        order = np.argsort(sources)
+        return sources[order], self._offset_weights[order]
+
+    def out_degree(self, rank: int) -> int:
+        return int(self._offsets.shape[0])
+
+    def in_degree(self, rank: int) -> int:
+        return int(self._offsets.shape[0])
+
+    def _materialize(self):
+        if self._indptr is not None:
+            return
+        num_offsets = self._offsets.shape[0]
+        sources = np.repeat(np.arange(self._size, dtype=np.int64), num_offsets)
+        destinations = (sources + np.tile(self._offsets, self._size)) % self._size
+        fingerprint = self._fingerprint
+        SparseTopology.__init__(self, self._size, sources, destinations,
+                                np.tile(self._offset_weights, self._size))
+        self._fingerprint = fingerprint
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, CirculantTopology):
+            return (self._size == other._size and
+                    np.array_equal(self._offsets, other._offsets) and
+                    np.array_equal(self._offset_weights, other._offset_weights))
+        return SparseTopology.__eq__(self, other)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return "CirculantTopology(size={}, offsets={})".format(
+            self._size, self._offsets.tolist())
+
+
+TopologyType = Union[nx.DiGraph, SparseTopology]
+
+
+class LocalView(object):
+    """The neighbors and weights of a single rank in a topology.
+
+    It is everything one rank needs to know about the topology to run the neighbor ops,
+    see :func:`GetLocalView`. Neighbor ranks do not include the self rank and are sorted
+    in ascending order.
+    """
+
+    def __init__(self, rank: int, size: int,
+                 recv_self_weight: float, recv_neighbor_weights: Dict[int, float],
+                 send_self_weight: float, send_neighbor_weights: Dict[int, float]):
+        self.rank = rank
+        self.size = size
+        self.recv_self_weight = recv_self_weight
+        self.recv_neighbor_weights = recv_neighbor_weights
+        self.send_self_weight = send_self_weight
+        self.send_neighbor_weights = send_neighbor_weights
+        self.in_neighbor_ranks = sorted(recv_neighbor_weights.keys())
+        self.out_neighbor_ranks = sorted(send_neighbor_weights.keys())
+
+    def __repr__(self) -> str:
+        return "LocalView(rank={}, in_neighbor_ranks={}, out_neighbor_ranks={})".format(
+            self.rank, self.in_neighbor_ranks, self.out_neighbor_ranks)
+
+
+def GetLocalView(topo: TopologyType, rank: int) -> LocalView:
+    """Evaluate the topology for the given rank only.
+
+    The cost is proportional to the degree of rank for all topology types. For the
+    circulant topologies, like SparseExponentialGraph and SparseRingGraph, the neighbors
+    are computed in closed form without building the graph of other ranks at all.
+
+    Example:
+
+        >>> from bluefog.common import topology_util
+        >>> view = topology_util.GetLocalView(topology_util.SparseRingGraph(4096), 0)
+        >>> view.in_neighbor_ranks
+        [1, 4095]
+    """
+    recv_self_weight, recv_neighbor_weights = GetRecvWeights(topo, rank)
+    send_self_weight, send_neighbor_weights = GetSendWeights(topo, rank)
+    return LocalView(rank, topo.number_of_nodes(),
+                     recv_self_weight, recv_neighbor_weights,
+                     send_self_weight, send_neighbor_weights)
+
+
+def _AsSparseTopology(topo: TopologyType) -> SparseTopology:
+    if isinstance(topo, SparseTopology):
+        return topo
+    return SparseTopology.from_networkx(topo)
+
+
+def _Lcm(*values: int) -> int:
+    result = 1
+    for value in values:
+        result = result * value // math.gcd(result, value)
+    return result
+
+
+def _PowersOf(base: int, upper: int) -> List[int]:
+    """All the powers of base (starting with 1) which are smaller than upper."""
+    powers = []
+    p = 1
+    while p < upper:
+        powers.append(p)
+        p *= base
+    return powers
+
+
+def TopologyFingerprint(topo: TopologyType) -> str:
+    """Return the canonical fingerprint of the weight matrix of topology.
+
+    The cost is O(edges). It is cached for SparseTopology, which makes the repeated
+    comparison against the same SparseTopology free. networkx.DiGraph is mutable, so its
+    fingerprint is computed again at every call.
+    """
+    return _AsSparseTopology(topo).fingerprint()
+
+
+def IsTopologyEquivalent(topo1: TopologyType, topo2: TopologyType) -> bool:
     """ Determine two topologies are equivalent or not.
 
     Notice we do not check two topologies are isomorphism. Instead checking
-    the adjacenty matrix is the same only.
+    the adjacenty matrix is the same only. Both networkx.DiGraph and SparseTopology
+    are accepted and they can be compared with each other. The comparison is based on
+    TopologyFingerprint, which costs O(edges) and is cached for SparseTopology.
     """
     if topo1 is None or topo2 is None:
         return False
+    if topo1 is topo2:
+        return True
     if topo1.number_of_nodes() != topo2.number_of_nodes():
         return False
     if topo1.number_of_edges() != topo2.number_of_edges():
         return False
-    A1 = nx.to_numpy_matrix(topo1).ravel()
-    A2 = nx.to_numpy_matrix(topo2).ravel()
-    return (A1 == A2).all()
+    if isinstance(topo1, CirculantTopology) and isinstance(topo2, CirculantTopology):
+        return topo1 == topo2
+    return TopologyFingerprint(topo1) == TopologyFingerprint(topo2)
 
 
-def GetRecvWeights(topo: nx.DiGraph, rank: int) -> Tuple[float, Dict[int, float]]:
+def GetRecvWeights(topo: TopologyType, rank: int) -> Tuple[float, Dict[int, float]]:
     """Return a Tuple of self_weight and neighbor_weights for receiving dictionary."""
-    weight_matrix = nx.to_numpy_array(topo)
+    if isinstance(topo, SparseTopology):
+        sources, weights = topo.in_edges(rank)
+        return _SplitSelfWeight(rank, sources, weights)
     self_weight = 0.0
     neighbor_weights = {}
-    for src_rank in topo.predecessors(rank):
+    for src_rank, _, weight in topo.in_edges(rank, data='weight', default=1.0):
         if src_rank == rank:
-            self_weight = weight_matrix[src_rank, rank]
+            self_weight = weight
         else:
-            neighbor_weights[src_rank] = weight_matrix[src_rank, rank]
+            neighbor_weights[src_rank] = weight
     return self_weight, neighbor_weights
 
 
-def GetSendWeights(topo: nx.DiGraph, rank: int) -> Tuple[float, Dict[int, float]]:
+def GetSendWeights(topo: TopologyType, rank: int) -> Tuple[float, Dict[int, float]]:
     """Return a Tuple of self_weight and neighbor_weights for sending dictionary."""
-    weight_matrix = nx.to_numpy_array(topo)
+    if isinstance(topo, SparseTopology):
+        destinations, weights = topo.out_edges(rank)
+        return _SplitSelfWeight(rank, destinations, weights)
     self_weight = 0.0
     neighbor_weights = {}
-    for recv_rank in topo.successors(rank):
+    for _, recv_rank, weight in topo.out_edges(rank, data='weight', default=1.0):
         if recv_rank == rank:
-            self_weight = weight_matrix[rank, recv_rank]
+            self_weight = weight
         else:
-            neighbor_weights[recv_rank] = weight_matrix[rank, recv_rank]
+            neighbor_weights[recv_rank] = weight
     return self_weight, neighbor_weights
 
 
+def _SplitSelfWeight(rank: int, ranks: np.ndarray,
+                     weights: np.ndarray) -> Tuple[float, Dict[int, float]]:
+    self_weight = 0.0
+    neighbor_weights = {}
+    for r, w in zip(ranks.tolist(), weights.tolist()):
+        if r == rank:
+            self_weight = w
+        else:
+            neighbor_weights[r] = w
+    return self_weight, neighbor_weights
+
+
+def SparseExponentialTwoGraph(size: int) -> SparseTopology:
+    """The SparseTopology version of :func:`ExponentialTwoGraph`."""
+    assert size > 0
+    return SparseExponentialGraph(size, base=2)
+
+
 def ExponentialTwoGraph(size: int) -> nx.DiGraph:
     """Generate graph topology such that each points only
     connected to a point such that the index difference is the power of 2.
@@ -77,23 +436,27 @@ def ExponentialTwoGraph(size: int) -> nx.DiGraph:
         >>> G = topology_util.ExponentialTwoGraph(12)
         >>> nx.draw_circular(G)
     """
-    assert size > 0
-    x = np.array([1.0 if i & (i - 1) == 0 else 0 for i in range(size)])
-    x /= x.sum()
-    topo = np.empty((size, size))
-    for i in range(size):
-        topo[i] = np.roll(x, i)
-    G = nx.from_numpy_array(topo, create_using=nx.DiGraph)
-    return G
+    return SparseExponentialTwoGraph(size).to_networkx()
 
 
 def isPowerOf(x, base):
     assert isinstance(base, int), "Base has to be a integer."
     assert base > 1, "Base has to a interger larger than 1."
     assert x > 0
-    if (base ** int(math.log(x, base))) == x:
-        return True
-    return False
+    # Use integer arithmetic only. math.log(243, 3) is 4.999..., for example.
+    while x % base == 0:
+        x //= base
+    return x == 1
+
+
+def _ExponentialOffsets(size: int, base: int) -> List[int]:
+    return [0] + _PowersOf(base, size)
+
+
+def SparseExponentialGraph(size: int, base: int = 2) -> SparseTopology:
+    """The SparseTopology version of :func:`ExponentialGraph`."""
+    offsets = _ExponentialOffsets(size, base)
+    return CirculantTopology(size, offsets, [1.0 / len(offsets)] * len(offsets))
 
 
 def ExponentialGraph(size: int, base: int = 2) -> nx.DiGraph:
@@ -110,19 +473,22 @@ def ExponentialGraph(size: int, base: int = 2) -> nx.DiGraph:
         >>> G = topology_util.ExponentialGraph(12)
         >>> nx.draw_circular(G)
     """
-    x = [1.0]
-    for i in range(1, size):
-        if isPowerOf(i, base):
-            x.append(1.0)
-        else:
-            x.append(0.0)
-    x = np.array(x)
-    x /= x.sum()
-    topo = np.empty((size, size))
-    for i in range(size):
-        topo[i] = np.roll(x, i)
-    G = nx.from_numpy_array(topo, create_using=nx.DiGraph)
-    return G
+    return SparseExponentialGraph(size, base).to_networkx()
+
+
+def _SymmetricExponentialOffsets(size: int, base: int) -> List[int]:
+    # Offset i is connected if min(i, size - i) is a power of base, where the
+    # first half (i <= size // 2) is mirrored to the second half.
+    powers = _PowersOf(base, size)
+    offsets = [0] + [p for p in powers if p <= size // 2]
+    offsets += sorted(size - p for p in powers if size - p > size // 2)
+    return offsets
+
+
+def SparseSymmetricExponentialGraph(size: int, base: int = 4) -> SparseTopology:
+    """The SparseTopology version of :func:`SymmetricExponentialGraph`."""
+    offsets = _SymmetricExponentialOffsets(size, base)
+    return CirculantTopology(size, offsets, [1.0 / len(offsets)] * len(offsets))
 
 
 def SymmetricExponentialGraph(size: int, base: int = 4) -> nx.DiGraph:
@@ -141,20 +507,43 @@ def SymmetricExponentialGraph(size: int, base: int = 4) -> nx.DiGraph:
         >>> G = topology_util.SymmetricExponentialGraph(12)
         >>> nx.draw_circular(G)
     """
-    x = [1.0]
-    for i in range(1, size):
-        index = i if i <= size // 2 else size - i
-        if isPowerOf(index, base):
-            x.append(1.0)
-        else:
-            x.append(0.0)
-    x = np.array(x)
-    x /= x.sum()
-    topo = np.empty((size, size))
-    for i in range(size):
-        topo[i] = np.roll(x, i)
-    G = nx.from_numpy_array(topo, create_using=nx.DiGraph)
-    return G
+    return SparseSymmetricExponentialGraph(size, base).to_networkx()
+
+
+def SparseMeshGrid2DGraph(size: int, shape: Optional[Tuple[int, int]] = None) -> SparseTopology:
+    """The SparseTopology version of :func:`MeshGrid2DGraph`."""
+    assert size > 0
+    if shape is None:
+        i = int(np.sqrt(size))
+        while size % i != 0:
+            i -= 1
+        shape = (i, size//i)
+    nrow, ncol = shape
+    assert size == nrow*ncol, "The shape doesn't match the size provided."
+
+    ranks = np.arange(size, dtype=np.int64)
+    right = ranks[(ranks + 1) % ncol != 0]
+    down = ranks[ranks + ncol < size]
+    sources = np.concatenate([right, right + 1, down, down + ncol])
+    destinations = np.concatenate([right + 1, right, down + ncol, down])
+    return _HastingsTopology(size, sources, destinations)
+
+
+def _HastingsTopology(size: int, sources: np.ndarray, destinations: np.ndarray) -> SparseTopology:
+    """Weight the undirected graph, given as the edges in both directions without self-loops,
+    by the Hastings rule so that the weight matrix is symmetric and doubly stochastic."""
+    ranks = np.arange(size, dtype=np.int64)
+    # According to Hasting rule (Policy 1) in https://arxiv.org/pdf/1702.05122.pdf
+    # The neighbor definition in the paper is different from our implementation,
+    # which includes the self node.
+    num_neighbors_with_self = np.bincount(sources, minlength=size) + 1
+    weights = 1.0 / np.maximum(num_neighbors_with_self[sources],
+                               num_neighbors_with_self[destinations])
+    self_weights = 1.0 - np.bincount(sources, weights=weights, minlength=size)
+    return SparseTopology(size,
+                          np.concatenate([ranks, sources]),
+                          np.concatenate([ranks, destinations]),
+                          np.concatenate([self_weights, weights]))
 
 
 def MeshGrid2DGraph(size: int, shape: Optional[Tuple[int, int]] = None) -> nx.DiGraph:
@@ -178,37 +567,21 @@ def MeshGrid2DGraph(size: int, shape: Optional[Tuple[int, int]] = None) -> nx.Di
         >>> G = topology_util.MeshGrid2DGraph(16)
         >>> nx.draw_spring(G)
     """
+    return SparseMeshGrid2DGraph(size, shape).to_networkx()
 
-    assert size > 0
-    if shape is None:
-        i = int(np.sqrt(size))
-        while size % i != 0:
-            i -= 1
-        shape = (i, size//i)
-    nrow, ncol = shape
-    assert size == nrow*ncol, "The shape doesn't match the size provided."
-    topo = np.zeros((size, size))
-    for i in range(size):
-        topo[i][i] = 1.0
-        if (i+1) % ncol != 0:
-            topo[i][i+1] = 1.0
-            topo[i+1][i] = 1.0
-        if i+ncol < size:
-            topo[i][i+ncol] = 1.0
-            topo[i+ncol][i] = 1.0
 
-    # According to Hasting rule (Policy 1) in https://arxiv.org/pdf/1702.05122.pdf
-    # The neighbor definition in the paper is different from our implementation,
-    # which includes the self node.
-    topo_neighbor_with_self = [np.nonzero(topo[i])[0] for i in range(size)]
-    for i in range(size):
-        for j in topo_neighbor_with_self[i]:
-            if i != j:
-                topo[i][j] = 1.0/max(len(topo_neighbor_with_self[i]),
-                                     len(topo_neighbor_with_self[j]))
-        topo[i][i] = 2.0-topo[i].sum()
-    G = nx.from_numpy_array(topo, create_using=nx.DiGraph)
-    return G
+def SparseStarGraph(size: int, center_rank: int = 0) -> SparseTopology:
+    """The SparseTopology version of :func:`StarGraph`."""
+    assert size > 0
+    ranks = np.arange(size, dtype=np.int64)
+    self_weights = np.full(size, 1 - 1 / size)
+    self_weights[center_rank] = 1 / size
+    others = ranks[ranks != center_rank]
+    centers = np.full(size - 1, center_rank, dtype=np.int64)
+    return SparseTopology(size,
+                          np.concatenate([ranks, centers, others]),
+                          np.concatenate([ranks, others, centers]),
+                          np.concatenate([self_weights, np.full(2 * (size - 1), 1 / size)]))
 
 
 def StarGraph(size: int, center_rank: int = 0) -> nx.DiGraph:
@@ -227,14 +600,33 @@ def StarGraph(size: int, center_rank: int = 0) -> nx.DiGraph:
         >>> G = topology_util.StarGraph(16)
         >>> nx.draw_spring(G)
     """
+    return SparseStarGraph(size, center_rank).to_networkx()
+
+
+def _RingOffsetsAndWeights(size: int, connect_style: int) -> Tuple[List[int], List[float]]:
     assert size > 0
-    topo = np.zeros((size, size))
-    for i in range(size):
-        topo[i, i] = 1 - 1 / size
-        topo[center_rank, i] = 1 / size
-        topo[i, center_rank] = 1 / size
-    G = nx.from_numpy_array(topo, create_using=nx.DiGraph)
-    return G
+    assert connect_style >= 0 and connect_style <= 2, \
+        "connect_style has to be int between 0 and 2, where 1 " \
+        "for bi-connection, 1 for left connection, 2 for right connection."
+    if size == 1:
+        return [0], [1.0]
+    if size == 2:
+        return [0, 1], [0.5, 0.5]
+
+    if connect_style == 0:  # bi-connection
+        return [0, 1, size - 1], [1/3.0, 1/3.0, 1/3.0]
+    elif connect_style == 1:  # left-connection
+        return [0, size - 1], [0.5, 0.5]
+    elif connect_style == 2:  # right-connection
+        return [0, 1], [0.5, 0.5]
+    else:
+        raise ValueError("Connect_style has to be int between 0 and 2")
+
+
+def SparseRingGraph(size: int, connect_style: int = 0) -> SparseTopology:
+    """The SparseTopology version of :func:`RingGraph`."""
+    offsets, weights = _RingOffsetsAndWeights(size, connect_style)
+    return CirculantTopology(size, offsets, weights)
 
 
 def RingGraph(size: int, connect_style: int = 0) -> nx.DiGraph:
@@ -252,33 +644,13 @@ def RingGraph(size: int, connect_style: int = 0) -> nx.DiGraph:
         >>> G = topology_util.RingGraph(16)
         >>> nx.draw_circular(G)
     """
-    assert size > 0
-    assert connect_style >= 0 and connect_style <= 2, \
-        "connect_style has to be int between 0 and 2, where 1 " \
-        "for bi-connection, 1 for left connection, 2 for right connection."
-    if size == 1:
-        return nx.from_numpy_array(np.array([[1.0]]), create_using=nx.DiGraph)
-    if size == 2:
-        return nx.from_numpy_array(np.array([[0.5, 0.5], [0.5, 0.5]]), create_using=nx.DiGraph)
+    return SparseRingGraph(size, connect_style).to_networkx()
 
-    x = np.zeros(size)
-    x[0] = 0.5
-    if connect_style == 0:  # bi-connection
-        x[0] = 1/3.0
-        x[-1] = 1/3.0
-        x[1] = 1/3.0
-    elif connect_style == 1:  # left-connection
-        x[-1] = 0.5
-    elif connect_style == 2:  # right-connection
-        x[1] = 0.5
-    else:
-        raise ValueError("Connect_style has to be int between 0 and 2")
 
-    topo = np.empty((size, size))
-    for i in range(size):
-        topo[i] = np.roll(x, i)
-    G = nx.from_numpy_array(topo, create_using=nx.DiGraph)
-    return G
+def SparseFullyConnectedGraph(size: int) -> SparseTopology:
+    """The SparseTopology version of :func:`FullyConnectedGraph`."""
+    assert size > 0
+    return CirculantTopology(size, range(size), [1/size] * size)
 
 
 def FullyConnectedGraph(size: int) -> nx.DiGraph:
@@ -294,13 +666,99 @@ def FullyConnectedGraph(size: int) -> nx.DiGraph:
         >>> G = topology_util.FullyConnectedGraph(16)
         >>> nx.draw_spring(G)
     """
-    assert size > 0
-    x = np.array([1/size] * size)
-    topo = np.empty((size, size))
-    for i in range(size):
-        topo[i] = np.roll(x, i)
-    G = nx.from_numpy_array(topo, create_using=nx.DiGraph)
-    return G
+    return SparseFullyConnectedGraph(size).to_networkx()
+
+
+def _MachineSizes(world_size: int, local_size: Union[int, Sequence[int]]) -> np.ndarray:
+    if isinstance(local_size, (int, np.integer)):
+        if local_size <= 0:
+            raise ValueError("local_size should be positive.")
+        machine_sizes = [local_size] * (world_size // local_size)
+        if world_size % local_size:
+            machine_sizes.append(world_size % local_size)
+    else:
+        machine_sizes = list(local_size)
+        if sum(machine_sizes) != world_size or min(machine_sizes, default=0) <= 0:
+            raise ValueError("The sizes of machines should be positive and sum to world_size.")
+    return np.array(machine_sizes, dtype=np.int64)
+
+
+def SparseHierarchicalGraph(world_size: int, local_size: Union[int, Sequence[int]],
+                            num_gateways: int = 1, base: int = 2) -> SparseTopology:
+    """The SparseTopology version of :func:`HierarchicalGraph`."""
+    assert world_size > 0 and num_gateways > 0 and base > 1
+    machine_sizes = _MachineSizes(world_size, local_size)
+    num_machines = machine_sizes.shape[0]
+    machine_starts = np.concatenate([[0], np.cumsum(machine_sizes)[:-1]])
+    ranks = np.arange(world_size, dtype=np.int64)
+    machine_ids = np.repeat(np.arange(num_machines), machine_sizes)
+
+    # Fully connected inside each machine.
+    num_local_neighbors = machine_sizes[machine_ids]
+    sources = np.repeat(ranks, num_local_neighbors)
+    local_offsets = (np.arange(sources.shape[0]) -
+                     np.repeat(np.cumsum(num_local_neighbors) - num_local_neighbors,
+                               num_local_neighbors))
+    destinations = machine_starts[machine_ids][sources] + local_offsets
+    is_neighbor = sources != destinations
+    sources, destinations = [sources[is_neighbor]], [destinations[is_neighbor]]
+
+    # Machine a talks to machines a +/- base^j. The j-th link of machine a goes through its
+    # (j % num_gateways)-th local rank, which talks to the gateway of the same index.
+    num_machine_gateways = np.minimum(machine_sizes, num_gateways)
+    machines = np.arange(num_machines, dtype=np.int64)
+    for j, offset in enumerate(_PowersOf(base, num_machines)):
+        peer_machines = (machines + offset) % num_machines
+        gateway = j % num_machine_gateways
+        src = machine_starts + gateway
+        dst = machine_starts[peer_machines] + j % num_machine_gateways[peer_machines]
+        sources += [src, dst]
+        destinations += [dst, src]
+    sources, destinations = np.concatenate(sources), np.concatenate(destinations)
+    pairs = np.unique(np.stack([sources, destinations], axis=1), axis=0)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    return _HastingsTopology(world_size, pairs[:, 0], pairs[:, 1])
+
+
+def HierarchicalGraph(world_size: int, local_size: Union[int, Sequence[int]],
+                      num_gateways: int = 1, base: int = 2) -> nx.DiGraph:
+    """
+    Generate the two-level topology that is aware of machines.
+
+    Ranks inside one machine are fully connected, since the communication through the shared
+    memory is cheap. Across machines, the machines are connected as a symmetric exponential
+    graph (machine a talks to machines a +/- base^j), but only through up to ``num_gateways``
+    local ranks per machine. The links of a machine are distributed over its gateways. Hence
+    each machine sends about ``2 * log_base(num_machines)`` tensors over the network per
+    step, instead of ``local_size`` times more in the exponential graph of all ranks.
+    The weights follow the Hastings rule, so the weight matrix is symmetric and doubly
+    stochastic, and the graph should be used with ``is_weighted=True``.
+
+    Args:
+        world_size (int): The number of ranks.
+        local_size (int or Sequence[int]): The number of ranks in each machine, usually
+            ``bf.local_size()``. If the last machine has fewer ranks, world_size does not need
+            to be divisible. For the heterogeneous environment, pass the number of ranks of
+            every machine instead. Ranks are assigned to machines consecutively.
+        num_gateways (int): The maximum number of ranks of each machine talking to other
+            machines.
+        base (int): The base of the exponential graph among machines.
+
+    Example: A HierarchicalGraph with 4 machines of 4 ranks.
+
+    .. plot::
+        :context: close-figs
+
+        >>> import networkx as nx
+        >>> from bluefog.common import topology_util
+        >>> G = topology_util.HierarchicalGraph(16, 4)
+        >>> nx.draw_spring(G)
+        >>> bf.set_topology(topology_util.HierarchicalGraph(bf.size(), bf.local_size()),
+        >>>                 is_weighted=True)
+        >>> # Heterogeneous machines with 4, 2 and 3 ranks.
+        >>> G = topology_util.HierarchicalGraph(9, [4, 2, 3], num_gateways=2)
+    """
+    return SparseHierarchicalGraph(world_size, local_size, num_gateways, base).to_networkx()
 
 
 def IsRegularGraph(topo: nx.DiGraph) -> bool:
@@ -312,12 +770,348 @@ def IsRegularGraph(topo: nx.DiGraph) -> bool:
     return True
 
 
+def _UndirectedEdges(topo: TopologyType) -> np.ndarray:
+    """The (num_edges, 2) array of unique pairs i < j that are connected in either direction."""
+    indptr, indices, _ = _AsSparseTopology(topo).csr_arrays()
+    sources = np.repeat(np.arange(topo.number_of_nodes()), np.diff(indptr))
+    pairs = np.stack([np.minimum(sources, indices), np.maximum(sources, indices)], axis=1)
+    return np.unique(pairs[pairs[:, 0] != pairs[:, 1]], axis=0)
+
+
+def _SymmetricWeightMatrix(size: int, edges: np.ndarray, edge_weights: np.ndarray) -> np.ndarray:
+    W = np.zeros((size, size))
+    W[edges[:, 0], edges[:, 1]] = edge_weights
+    W[edges[:, 1], edges[:, 0]] = edge_weights
+    W[np.diag_indices(size)] = np.maximum(1.0 - W.sum(axis=1), 0.0)
+    return W
+
+
+def _ProjectEdgeWeights(edges: np.ndarray, edge_weights: np.ndarray,
+                        incident_edges: List[np.ndarray]) -> np.ndarray:
+    """Project onto {w >= 0, sum of w over the edges of each rank <= 1}, i.e. the symmetric
+    weight matrix is (doubly) stochastic with non-negative self weights."""
+    edge_weights = np.maximum(edge_weights, 0.0)
+    size = len(incident_edges)
+    for _ in range(5):
+        rank_sums = (np.bincount(edges[:, 0], edge_weights, minlength=size) +
+                     np.bincount(edges[:, 1], edge_weights, minlength=size))
+        violated = np.nonzero(rank_sums > 1.0)[0]
+        if not violated.size:
+            return edge_weights
+        for rank in violated:
+            # Euclidean projection of the edges of rank onto the simplex {w >= 0, sum(w) <= 1}.
+            idx = incident_edges[rank]
+            values = np.sort(edge_weights[idx])[::-1]
+            cumsum = np.cumsum(values) - 1.0
+            num_positive = np.nonzero(values * np.arange(1, values.size + 1) > cumsum)[0][-1]
+            threshold = max(cumsum[num_positive] / (num_positive + 1), 0.0)
+            edge_weights[idx] = np.maximum(edge_weights[idx] - threshold, 0.0)
+    # The projections of adjacent ranks interfere with each other. Scale the remaining
+    # violations down, which always results in a feasible point.
+    rank_sums = np.maximum(np.bincount(edges[:, 0], edge_weights, minlength=size) +
+                           np.bincount(edges[:, 1], edge_weights, minlength=size), 1.0)
+    return edge_weights / np.maximum(rank_sums[edges[:, 0]], rank_sums[edges[:, 1]])
+
+
+def _FastestMixingEdgeWeights(size: int, edges: np.ndarray,
+                              num_iters: int) -> Tuple[np.ndarray, float]:
+    """Projected subgradient method for the fastest mixing symmetric weights of Boyd, Diaconis
+    and Xiao, "Fastest Mixing Markov Chain on a Graph". Return the best edge weights and
+    their second largest eigenvalue modulus."""
+    if not edges.size:
+        return np.zeros(0), (1.0 if size > 1 else 0.0)
+    incident_edges = [[] for _ in range(size)]
+    for i, (src, dst) in enumerate(edges.tolist()):
+        incident_edges[src].append(i)
+        incident_edges[dst].append(i)
+    incident_edges = [np.array(idx, dtype=np.int64) for idx in incident_edges]
+    degrees = np.array([idx.size for idx in incident_edges])
+
+    # Start from the Metropolis-Hastings weights, which are always feasible.
+    edge_weights = 1.0 / (1.0 + np.maximum(degrees[edges[:, 0]], degrees[edges[:, 1]]))
+    step_size = edge_weights.mean()
+    best_weights, best_slem = edge_weights, math.inf
+    for k in range(1, num_iters + 1):
+        eigenvalues, eigenvectors = np.linalg.eigh(
+            _SymmetricWeightMatrix(size, edges, edge_weights))
+        # eigenvalues[-1] == 1 is the consensus mode.
+        slem = max(eigenvalues[-2], -eigenvalues[0])
+        if slem < best_slem:
+            best_weights, best_slem = edge_weights, slem
+        if eigenvalues[-2] >= -eigenvalues[0]:
+            u = eigenvectors[:, -2]
+            subgradient = -(u[edges[:, 0]] - u[edges[:, 1]])**2
+        else:
+            u = eigenvectors[:, 0]
+            subgradient = (u[edges[:, 0]] - u[edges[:, 1]])**2
+        norm = np.linalg.norm(subgradient)
+        if norm == 0:
+            break
+        edge_weights = _ProjectEdgeWeights(
+            edges, edge_weights - step_size / math.sqrt(k) * subgradient / norm, incident_edges)
+    return best_weights, float(max(best_slem, 0.0))
+
+
+def _WeightedGraphFromEdges(size: int, edges: np.ndarray, edge_weights: np.ndarray,
+                            threshold: float = 1e-8) -> nx.DiGraph:
+    W = _SymmetricWeightMatrix(size, edges, np.where(edge_weights > threshold, edge_weights, 0))
+    G = nx.DiGraph()
+    G.add_nodes_from(range(size))
+    sources, destinations = np.nonzero(W)
+    G.add_weighted_edges_from(zip(sources.tolist(), destinations.tolist(),
+                                  W[sources, destinations].tolist()))
+    for rank in range(size):
+        if not G.has_edge(rank, rank):
+            G.add_edge(rank, rank, weight=0.0)
+    return G
+
+
+def FastestMixingGraph(topo: TopologyType, num_iters: int = 200) -> nx.DiGraph:
+    """
+    Optimize the weights on the edges of topology such that averaging over it converges as
+    fast as possible, i.e. the second largest eigenvalue modulus of the weight matrix is
+    minimized. The edges are treated as undirected, and the resulting weight matrix is
+    symmetric and doubly stochastic. Edges whose optimal weight is zero are dropped, which
+    saves their communication as well.
+
+    The optimization evaluates a dense eigen-decomposition every iteration, so it is meant
+    for the offline design of topologies up to several hundred ranks.
+
+    Args:
+        topo: The base topology, networkx.DiGraph or SparseTopology.
+        num_iters (int): The number of subgradient iterations.
+
+    Returns:
+        nx.DiGraph: The topology to be used by ``bf.set_topology(topo, is_weighted=True)``.
+
+    Example:
+
+        >>> from bluefog.common import topology_util
+        >>> G = topology_util.FastestMixingGraph(topology_util.MeshGrid2DGraph(16))
+        >>> bf.set_topology(G, is_weighted=True)
+    """
+    size = topo.number_of_nodes()
+    edges = _UndirectedEdges(topo)
+    edge_weights, _ = _FastestMixingEdgeWeights(size, edges, num_iters)
+    return _WeightedGraphFromEdges(size, edges, edge_weights)
+
+
+def _HierarchicalCandidateEdges(size: int, local_size: int,
+                                max_degree: Optional[int]) -> Iterator[np.ndarray]:
+    """Yield the candidate structures with an increasing number of cross-machine links.
+
+    Ranks in the same machine are fully connected, or connected by the exponential-2 offsets
+    within the machine, which always include the ring, if the degree is bounded. The local
+    rank l in machine a connects to the same local rank in machine a + 2^j for num_links
+    offsets j rotated by l, so that the cross-machine links of one machine are spread over its
+    local ranks. The offsets wrap around within the last machine if it has fewer ranks.
+    """
+    ranks = np.arange(size, dtype=np.int64)
+    machine_ids, local_ranks = ranks // local_size, ranks % local_size
+    num_machines = (size + local_size - 1) // local_size
+    machine_sizes = np.minimum(local_size, size - np.arange(num_machines) * local_size)
+
+    intra_offsets = list(range(1, local_size))
+    # Keep two links for the other machines. Offsets 2^j and -2^j add 2 neighbors.
+    intra_degree = None if max_degree is None else \
+        max_degree - (2 if num_machines > 1 else 0)
+    if intra_degree is not None and local_size - 1 > intra_degree:
+        intra_offsets = _PowersOf(2, local_size)[:max(intra_degree // 2, 1)]
+    intra_pairs = [
+        (ranks, machine_ids * local_size +
+         (local_ranks + offset) % machine_sizes[machine_ids])
+        for offset in intra_offsets]
+
+    machine_offsets = _PowersOf(2, num_machines)
+    for num_links in range(1 if num_machines > 1 else 0, len(machine_offsets) + 1):
+        pairs = list(intra_pairs)
+        for i in range(num_links):
+            offsets = np.array(machine_offsets)[(local_ranks * num_links + i) %
+                                                len(machine_offsets)]
+            target_machines = (machine_ids + offsets) % num_machines
+            pairs.append((ranks, target_machines * local_size +
+                          local_ranks % machine_sizes[target_machines]))
+        sources = np.concatenate([p[0] for p in pairs] + [np.zeros(0, dtype=np.int64)])
+        destinations = np.concatenate([p[1] for p in pairs] + [np.zeros(0, dtype=np.int64)])
+        valid = destinations != sources
+        pairs = np.stack([np.minimum(sources, destinations)[valid],
+                          np.maximum(sources, destinations)[valid]], axis=1)
+        edges = np.unique(pairs, axis=0)
+        degrees = np.bincount(edges.ravel(), minlength=size)
+        if max_degree is not None and degrees.max(initial=0) > max_degree:
+            break
+        yield edges
+        if num_machines == 1:
+            break
+
+
+def OptimizeTopology(size: int, local_size: Optional[int] = None,
+                     max_degree: Optional[int] = None, intra_node_cost: float = 1.0,
+                     inter_node_cost: float = 10.0, num_iters: int = 200) -> nx.DiGraph:
+    """
+    Search for the weighted topology that averages the fastest per unit of communication cost.
+
+    Sending one tensor to a rank in the same machine costs ``intra_node_cost`` and to a rank
+    in another machine costs ``inter_node_cost``. The cost of one step is the largest total
+    cost among all ranks. The candidates have full (or exponential, if the degree is bounded)
+    connections inside each machine and an increasing number of exponential-2 links across
+    machines. For each candidate, the fastest mixing weights are optimized by
+    :func:`FastestMixingGraph`, and the candidate maximizing ``-log(SLEM) / step_cost``,
+    i.e. the decay of the consensus error per unit cost, is returned. The disconnected
+    candidates are skipped. If none is left within max_degree, the ring over all ranks is
+    returned.
+
+    Args:
+        size (int): The number of ranks.
+        local_size (int): The number of ranks in each machine. Rank r belongs to the machine
+            ``r // local_size``. The last machine may have fewer ranks. None means that each
+            rank is on its own machine.
+        max_degree (int): The maximum number of neighbors of each rank. None means unbounded.
+        intra_node_cost (float): The cost of one message within a machine.
+        inter_node_cost (float): The cost of one message across machines.
+        num_iters (int): The number of iterations to optimize the weights of each candidate.
+
+    Returns:
+        nx.DiGraph: The topology to be used by ``bf.set_topology(topo, is_weighted=True)``.
+
+    Example:
+
+        >>> from bluefog.common import topology_util
+        >>> G = topology_util.OptimizeTopology(bf.size(), bf.local_size(), max_degree=6)
+        >>> bf.set_topology(G, is_weighted=True)
+    """
+    assert size > 0
+    if local_size is None:
+        local_size = 1
+    if not 0 < local_size <= size:
+        raise ValueError("local_size should be in the range [1, size].")
+
+    best_score, best_result = -math.inf, None
+    for edges in _HierarchicalCandidateEdges(size, local_size, max_degree):
+        edge_weights, slem = _FastestMixingEdgeWeights(size, edges, num_iters)
+        if slem >= 1.0 - 1e-12:
+            # The graph is disconnected (or periodic), so it never reaches the consensus.
+            continue
+        used = edges[edge_weights > 1e-8]
+        is_intra = (used[:, 0] // local_size) == (used[:, 1] // local_size)
+        link_costs = np.where(is_intra, intra_node_cost, inter_node_cost)
+        rank_costs = (np.bincount(used[:, 0], link_costs, minlength=size) +
+                      np.bincount(used[:, 1], link_costs, minlength=size))
+        step_cost = rank_costs.max(initial=0.0)
+        if slem <= 0.0 or step_cost == 0.0:
+            score = math.inf
+        else:
+            score = -math.log(slem) / step_cost
+        if best_result is None or score > best_score:
+            best_score, best_result = score, (edges, edge_weights)
+    if best_result is None:
+        # The hierarchical candidates need more links than max_degree, e.g. a ring inside
+        # each machine and the links across machines. Fall back to the ring over all ranks.
+        if size > 2 and max_degree is not None and max_degree < 2:
+            raise ValueError(
+                "No connected topology satisfies max_degree={}.".format(max_degree))
+        edges = np.unique(np.sort(np.stack(
+            [np.arange(size), (np.arange(size) + 1) % size], axis=1), axis=1), axis=0)
+        edges = edges[edges[:, 0] != edges[:, 1]]
+        best_result = (edges, _FastestMixingEdgeWeights(size, edges, num_iters)[0])
+    return _WeightedGraphFromEdges(size, *best_result)
+
+
+def _ClockwiseSendRanks(topo: TopologyType, rank: int) -> List[int]:
+    """All out-neighbors (self excluded) sorted by clock-wise distance from rank.
+    (Imagine all ranks put on a clock.)"""
+    size = topo.number_of_nodes()
+    return sorted((r for r in topo.successors(rank) if r != rank),
+                  key=lambda r: (r - rank) % size)
+
+
+class DynamicSendRecvSchedule(object):
+    """The compiled send/recv schedule of one rank used by :func:`GetDynamicSendRecvRanks`.
+
+    At step ``t``, every rank ``r`` sends to the ``(t % degree(r))``-th of its out-neighbors
+    sorted clock-wise. Hence self rank receives from in-neighbor ``r`` exactly at the steps
+    ``t % degree(r) == position of self rank in the list of r``, and the whole schedule is
+    periodic with the period equal to the lcm of the degrees of self rank and its in-neighbors.
+    Only the neighbors of self rank are evaluated to compile it, and the send/recv ranks of one
+    period are stored as compact integer arrays so that each step is a table lookup. If the
+    period is longer than ``max_period`` (irregular graphs), the receiving ranks are evaluated
+    at each step from the in-neighbors instead, which costs O(in-degree).
+
+    Args:
+        topo: The base topology to generate dynamic send and receive ranks.
+        self_rank (int): The self rank.
+        max_period (int): The maximum number of steps stored in the table.
+
+    Example:
+
+        >>> from bluefog.common import topology_util
+        >>> schedule = topology_util.DynamicSendRecvSchedule(
+        >>>     topology_util.SparseExponentialGraph(16), 0)
+        >>> schedule.period
+        4
+        >>> schedule[5]
+        ([2], [14])
+    """
+
+    def __init__(self, topo: TopologyType, self_rank: int, max_period: int = 4096):
+        send_ranks = _ClockwiseSendRanks(topo, self_rank)
+        if not send_ranks:
+            raise ValueError("Rank {} does not have any out-neighbor.".format(self_rank))
+        self._send_ranks = np.array(send_ranks, dtype=np.int64)
+
+        in_ranks = sorted(r for r in topo.predecessors(self_rank) if r != self_rank)
+        in_degrees, in_positions = [], []
+        for r in in_ranks:
+            sorted_ranks = _ClockwiseSendRanks(topo, r)
+            in_degrees.append(len(sorted_ranks))
+            in_positions.append(sorted_ranks.index(self_rank))
+        self._in_ranks = np.array(in_ranks, dtype=np.int64)
+        self._in_degrees = np.array(in_degrees, dtype=np.int64)
+        self._in_positions = np.array(in_positions, dtype=np.int64)
+
+        period = _Lcm(len(send_ranks), *in_degrees)
+        self.period = period
+
+        self._recv_indptr = None
+        self._recv_indices = None
+        if period <= max_period:
+            steps = np.arange(period, dtype=np.int64)[:, None]
+            is_recv = (steps % self._in_degrees) == self._in_positions
+            self._recv_indptr = np.zeros(period + 1, dtype=np.int64)
+            np.cumsum(is_recv.sum(axis=1), out=self._recv_indptr[1:])
+            self._recv_indices = np.broadcast_to(self._in_ranks, is_recv.shape)[is_recv]
+
+    def send_ranks(self, index: int) -> List[int]:
+        return [int(self._send_ranks[index % len(self._send_ranks)])]
+
+    def recv_ranks(self, index: int) -> List[int]:
+        if self._recv_indptr is not None:
+            step = index % self.period
+            return self._recv_indices[
+                self._recv_indptr[step]:self._recv_indptr[step + 1]].tolist()
+        is_recv = (index % self._in_degrees) == self._in_positions
+        return self._in_ranks[is_recv].tolist()
+
+    def __getitem__(self, index: int) -> Tuple[List[int], List[int]]:
+        return self.send_ranks(index), self.recv_ranks(index)
+
+    def __iter__(self) -> Iterator[Tuple[List[int], List[int]]]:
+        index = 0
+        while True:
+            yield self[index]
+            index += 1
+
+
 def GetDynamicSendRecvRanks(
-        topo: nx.DiGraph, self_rank: int) -> Iterator[Tuple[List[int], List[int]]]:
+        topo: TopologyType, self_rank: int) -> Iterator[Tuple[List[int], List[int]]]:
     """A utility function to generate 1-outoging send rank and corresponding recieving rank(s).
 
+    The schedule is compiled once into a :class:`DynamicSendRecvSchedule`, so each step is
+    O(1) no matter how large the world size is.
+
     Args:
         topo (nx.DiGraph): The base topology to generate dynamic send and receive ranks.
+            SparseTopology is also accepted.
         self_rank (int): The self rank.
 
     Yields:
@@ -326,37 +1120,98 @@ def GetDynamicSendRecvRanks(
     Example:
 
         >>> from bluefog.common import topology_util
-        >>> topo = topology_util.PowerTwoRingGraph(10)
+        >>> topo = topology_util.ExponentialTwoGraph(10)
         >>> gen = topology_util.GetDynamicSendRecvRanks(topo, 0)
         >>> for _ in range(10):
         >>>     print(next(gen))
     """
-    # Generate all outgoing ranks sorted by clock-wise. (Imagine all ranks put on a clock.)
-    size = topo.number_of_nodes()
-    sorted_send_ranks = []
-    for rank in range(size):
-        sorted_ranks = sorted(topo.successors(rank),
-                              key=lambda r, rk=rank: r-rk if r >= rk else r-rk+size)
-        if sorted_ranks[0] == rank:
-            sorted_ranks = sorted_ranks[1:]  # remove the self-loop
-        sorted_send_ranks.append(sorted_ranks)
+    return iter(DynamicSendRecvSchedule(topo, self_rank))
+
+
+def GetDynamicSendMatrix(topo: TopologyType, num_steps: int, start_index: int = 0,
+                         ranks: Optional[Sequence[int]] = None) -> np.ndarray:
+    """
+    The vectorized send ranks of :func:`GetDynamicSendRecvRanks` for many ranks and steps
+    at once. The receiving ranks are not returned since one rank can receive from several
+    ranks in one step. The whole schedule is periodic with the lcm of all out-degrees.
 
-    self_degree = topo.out_degree(self_rank) - 1
+    Args:
+        topo (nx.DiGraph): The base topology to generate dynamic send ranks.
+            SparseTopology is also accepted.
+        num_steps (int): The number of steps (iterations) to generate.
+        start_index (int): The index of the first step. Default is 0.
+        ranks (Sequence[int]): The ranks to generate. Default is all ranks.
+
+    Returns:
+        np.ndarray: Integer matrix of shape (num_steps, num_ranks), where entry (t, i) is the
+        rank that the i-th rank sends to at step start_index + t.
+    """
+    steps, ranks = _StepsAndRanks(topo.number_of_nodes(), num_steps, start_index, ranks)
+    send_matrix = np.empty((num_steps, ranks.shape[1]), dtype=np.int64)
+    for i, rank in enumerate(ranks[0].tolist()):
+        send_ranks = np.array(_ClockwiseSendRanks(topo, rank), dtype=np.int64)
+        if not send_ranks.size:
+            raise ValueError("Rank {} does not have any out-neighbor.".format(rank))
+        send_matrix[:, i] = send_ranks[steps[:, 0] % send_ranks.size]
+    return send_matrix
+
+
+def _StepsAndRanks(world_size: int, num_steps: int, start_index: int,
+                   ranks: Optional[Sequence[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the broadcastable (num_steps, 1) step indices and (1, num_ranks) ranks."""
+    steps = np.arange(start_index, start_index + num_steps, dtype=np.int64)[:, None]
+    if ranks is None:
+        ranks = np.arange(world_size, dtype=np.int64)
+    ranks = np.asarray(ranks, dtype=np.int64)[None, :]
+    return steps, ranks
+
+
+def _CycleSchedule(send_matrix: np.ndarray,
+                   recv_matrix: np.ndarray) -> Iterator[Tuple[List[int], List[int]]]:
+    """Yield the single column of periodic (period, 1) send/recv matrices forever."""
+    send_ranks = send_matrix[:, 0].tolist()
+    recv_ranks = recv_matrix[:, 0].tolist()
+    period = len(send_ranks)
     index = 0
     while True:
-        send_rank = sorted_send_ranks[self_rank][index % self_degree]
-        recv_ranks = []
-        for other_rank in range(size):
-            if other_rank == self_rank:
-                continue
-            degree = topo.out_degree(other_rank) - 1
-            if sorted_send_ranks[other_rank][index % degree] == self_rank:
-                recv_ranks.append(other_rank)
-
-        yield [send_rank], recv_ranks
+        yield [send_ranks[index % period]], [recv_ranks[index % period]]
         index += 1
 
 
+def GetExp2DynamicSendRecvMachineMatrix(
+        world_size: int, local_size: int, num_steps: int, start_index: int = 0,
+        ranks: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The vectorized version of :func:`GetExp2DynamicSendRecvMachineRanks` for many ranks
+    and steps at once.
+
+    Args:
+        world_size (int): the size of all nodes; world_size = num_machines * nodes_per_machine
+        local_size (int): number of nodes in each machine
+        num_steps (int): The number of steps (iterations) to generate.
+        start_index (int): The index of the first step. Default is 0.
+        ranks (Sequence[int]): The ranks to generate. Default is all ranks.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: send_machine_ids and recv_machine_ids. Both are integer
+        matrices of shape (num_steps, num_ranks), where entry (t, i) is the machine id that
+        the i-th rank sends to or receives from at step start_index + t.
+    """
+    assert (world_size % local_size) == 0, \
+        "It should be used under homogeneous environment only."
+    assert world_size > local_size, \
+        "It should be used under at least two machines case."
+    steps, ranks = _StepsAndRanks(world_size, num_steps, start_index, ranks)
+
+    machine_id = ranks // local_size
+    machine_size = world_size // local_size
+    exp_2_size = int(np.log2(machine_size-1)) if machine_size > 1 else 0
+    machine_dist = 2**(steps % (exp_2_size + 1))
+    send_machine_ranks = (machine_id + machine_dist) % machine_size
+    recv_machine_ranks = (machine_id - machine_dist) % machine_size
+    return send_machine_ranks, recv_machine_ranks
+
+
 def GetExp2DynamicSendRecvMachineRanks(
         world_size: int, local_size: int, self_rank: int, local_rank: int
     ) -> Iterator[Tuple[List[int], List[int]]]:
@@ -384,16 +1239,68 @@ def GetExp2DynamicSendRecvMachineRanks(
     assert world_size > local_size, \
         "It should be used under at least two machines case."
 
-    machine_id = self_rank // local_size
     machine_size = world_size // local_size
     exp_2_size = int(np.log2(machine_size-1)) if machine_size > 1 else 0
-    index = 0
-    while True:
-        machine_dist = 2**(index % (exp_2_size + 1))
-        send_machine_rank = (machine_id + machine_dist) % machine_size
-        recv_machine_ranks = (machine_id - machine_dist) % machine_size
-        yield [send_machine_rank], [recv_machine_ranks]
-        index += 1
+    return _CycleSchedule(*GetExp2DynamicSendRecvMachineMatrix(
+        world_size, local_size, num_steps=exp_2_size + 1, ranks=[self_rank]))
+
+
+def GetInnerOuterRingDynamicSendRecvMatrix(
+        world_size: int, local_size: int, num_steps: int, start_index: int = 0,
+        ranks: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The vectorized version of :func:`GetInnerOuterRingDynamicSendRecvRanks` for many ranks
+    and steps at once.
+
+    Args:
+        world_size (int): the size of all nodes; world_size = num_machines * nodes_per_machine
+        local_size (int): number of nodes in each machine
+        num_steps (int): The number of steps (iterations) to generate.
+        start_index (int): The index of the first step. Default is 0.
+        ranks (Sequence[int]): The ranks to generate. Default is all ranks.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: send_ranks and recv_ranks. Both are integer matrices
+        of shape (num_steps, num_ranks), where entry (t, i) is the rank that the i-th rank
+        sends to or receives from at step start_index + t.
+
+    Example:
+
+        >>> from bluefog.common import topology_util
+        >>> send, recv = topology_util.GetInnerOuterRingDynamicSendRecvMatrix(16, 4, 10)
+        >>> send[3, 5]  # the rank that rank 5 sends to at step 3.
+    """
+    num_machines = world_size//local_size
+    nodes_per_machine = local_size
+    assert world_size % local_size == 0, "It should be used under homogeneous environment only."
+    assert local_size > 2, "Do no support the case where nodes_per_machine is equal or " \
+        "less than 2. Consider use hierarchical_neighbor_allreduce or GetDynamicSendRecvRanks."
+    steps, ranks = _StepsAndRanks(world_size, num_steps, start_index, ranks)
+
+    machine_id = ranks // nodes_per_machine
+    local_rank_id = ranks % nodes_per_machine
+    local_rank_to_go_outside_id = steps % nodes_per_machine
+    go_outside = local_rank_to_go_outside_id == local_rank_id
+
+    # The local rank going outside talks to the same local rank in the neighbor machines.
+    outer_send_rank = ((machine_id + 1) % num_machines) * nodes_per_machine + local_rank_id
+    outer_recv_rank = ((machine_id - 1) % num_machines) * nodes_per_machine + local_rank_id
+
+    # Other ranks form the inner ring, skipping the local rank going outside.
+    target_local_rank_id = (local_rank_id + 1) % nodes_per_machine
+    target_local_rank_id = np.where(target_local_rank_id == local_rank_to_go_outside_id,
+                                    (target_local_rank_id + 1) % nodes_per_machine,
+                                    target_local_rank_id)
+    source_local_rank_id = (local_rank_id - 1) % nodes_per_machine
+    source_local_rank_id = np.where(source_local_rank_id == local_rank_to_go_outside_id,
+                                    (source_local_rank_id - 1) % nodes_per_machine,
+                                    source_local_rank_id)
+    inner_send_rank = target_local_rank_id + machine_id * nodes_per_machine
+    inner_recv_rank = source_local_rank_id + machine_id * nodes_per_machine
+
+    send_ranks = np.where(go_outside, outer_send_rank, inner_send_rank)
+    recv_ranks = np.where(go_outside, outer_recv_rank, inner_recv_rank)
+    return send_ranks, recv_ranks
 
 
 def GetInnerOuterRingDynamicSendRecvRanks(
@@ -419,48 +1326,76 @@ def GetInnerOuterRingDynamicSendRecvRanks(
         >>> for _ in range(10):
         >>>     print(next(gen))
     """
+    # The schedule is periodic with the period local_size.
+    return _CycleSchedule(*GetInnerOuterRingDynamicSendRecvMatrix(
+        world_size, local_size, num_steps=local_size, ranks=[self_rank]))
+
+
+def _InnerOuterExpo2Sizes(num_machines: int, nodes_per_machine: int) -> Tuple[int, int]:
+    exp_2_out_size = int(np.log2(num_machines-1))
+    if nodes_per_machine == 2:
+        exp_2_in_size = 0
+    else:
+        # -2 because we need to remove outgoing node
+        exp_2_in_size = int(np.log2(nodes_per_machine-2))
+    return exp_2_out_size, exp_2_in_size
+
+
+def GetInnerOuterExpo2DynamicSendRecvMatrix(
+        world_size: int, local_size: int, num_steps: int, start_index: int = 0,
+        ranks: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The vectorized version of :func:`GetInnerOuterExpo2DynamicSendRecvRanks` for many ranks
+    and steps at once.
+
+    Args:
+        world_size (int): the size of all nodes; world_size = num_machines * nodes_per_machine
+        local_size (int): number of nodes in each machine
+        num_steps (int): The number of steps (iterations) to generate.
+        start_index (int): The index of the first step. Default is 0.
+        ranks (Sequence[int]): The ranks to generate. Default is all ranks.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: send_ranks and recv_ranks. Both are integer matrices
+        of shape (num_steps, num_ranks), where entry (t, i) is the rank that the i-th rank
+        sends to or receives from at step start_index + t.
+    """
     num_machines = world_size//local_size
     nodes_per_machine = local_size
     assert world_size % local_size == 0, "It should be used under homogeneous environment only."
     assert local_size > 2, "Do no support the case where nodes_per_machine is equal or " \
         "less than 2. Consider use hierarchical_neighbor_allreduce or GetDynamicSendRecvRanks."
-
-    index = 0
-    while True:
-        machine_id = self_rank // nodes_per_machine
-        local_rank_id = self_rank % nodes_per_machine
-        local_rank_to_go_outside_id = index % nodes_per_machine
-
-        if local_rank_to_go_outside_id == local_rank_id:
-            # find send_rank
-            target_machine_id = (machine_id + 1) % num_machines
-            target_rank_id = target_machine_id * nodes_per_machine + local_rank_id
-            send_rank = target_rank_id
-
-            # find recv_rank
-            source_machine_id = (machine_id - 1) % num_machines
-            source_rank_id = source_machine_id * nodes_per_machine + local_rank_id
-            recv_rank = source_rank_id
-
-        else:
-            # find send_rank
-            target_local_rank_id = (local_rank_id + 1) % nodes_per_machine
-            if target_local_rank_id == local_rank_to_go_outside_id:
-                target_local_rank_id = (
-                    target_local_rank_id + 1) % nodes_per_machine
-            target_rank_id = target_local_rank_id + machine_id * nodes_per_machine
-            send_rank = target_rank_id
-
-            # find recv_rank
-            source_local_rank_id = (local_rank_id - 1) % nodes_per_machine
-            if source_local_rank_id == local_rank_to_go_outside_id:
-                source_local_rank_id = (
-                    source_local_rank_id - 1) % nodes_per_machine
-            source_rank_id = source_local_rank_id + machine_id * nodes_per_machine
-            recv_rank = source_rank_id
-
-        yield [send_rank], [recv_rank]
-        index += 1
+    exp_2_out_size, exp_2_in_size = _InnerOuterExpo2Sizes(num_machines, nodes_per_machine)
+    steps, ranks = _StepsAndRanks(world_size, num_steps, start_index, ranks)
+
+    machine_id = ranks // nodes_per_machine
+    local_rank_id = ranks % nodes_per_machine
+    local_rank_to_go_outside_id = steps % nodes_per_machine
+    go_outside = local_rank_to_go_outside_id == local_rank_id
+
+    # Note: currently design is still not very good. Because some local rank i may NEVER
+    # directly talk to other machine's local rank i. See the comments in
+    # GetInnerOuterExpo2DynamicSendRecvRanks.
+    next_machine_dist = 2**(steps % (exp_2_out_size+1))
+    outer_send_rank = (((machine_id + next_machine_dist) % num_machines) * nodes_per_machine
+                       + local_rank_id)
+    outer_recv_rank = (((machine_id - next_machine_dist) % num_machines) * nodes_per_machine
+                       + local_rank_id)
+
+    # Distance from self to out-rank. The inner exponential ring skips the out-rank.
+    inner_dist = 2**(steps % (exp_2_in_size + 1))
+    dist_to_out = (local_rank_to_go_outside_id - local_rank_id) % nodes_per_machine
+    next_inner_dist = inner_dist + (inner_dist >= dist_to_out)
+    reverse_dist_to_out = (local_rank_id - local_rank_to_go_outside_id) % nodes_per_machine
+    reverse_inner_dist = inner_dist + (inner_dist >= reverse_dist_to_out)
+    inner_send_rank = ((local_rank_id + next_inner_dist) % nodes_per_machine
+                       + machine_id * nodes_per_machine)
+    inner_recv_rank = ((local_rank_id - reverse_inner_dist) % nodes_per_machine
+                       + machine_id * nodes_per_machine)
+
+    send_ranks = np.where(go_outside, outer_send_rank, inner_send_rank)
+    recv_ranks = np.where(go_outside, outer_recv_rank, inner_recv_rank)
+    return send_ranks, recv_ranks
 
 
 def GetInnerOuterExpo2DynamicSendRecvRanks(
@@ -485,70 +1420,19 @@ def GetInnerOuterExpo2DynamicSendRecvRanks(
         >>> gen = topology_util.GetInnerOuterExpo2DynamicSendRecvRanks(world_size, local_size, 0)
         >>> for _ in range(10):
         >>>     print(next(gen))
+
+    Note: currently design is still not very good. Because some local rank i may NEVER
+    directly talk to other machine's local rank i. Example:
+
+    Assume num_machines=16, nodes_per_machine=4, and self_rank=1, then we know that
+    exp_2_out_size=3, and local_rank_id=1. If the local rank goes outside,
+    local_rank_to_go_outside_id=1, and index % (exp_2_out_size+1)=1, resulting in
+    next_machine_dist always equal to 2.
     """
     num_machines = world_size//local_size
-    nodes_per_machine = local_size
     assert world_size % local_size == 0, "It should be used under homogeneous environment only."
-    assert local_size > 2, "Do no support the case where nodes_per_machine is equal or " \
-        "less than 2. Consider use hierarchical_neighbor_allreduce or GetDynamicSendRecvRanks."
-
-    exp_2_out_size = int(np.log2(num_machines-1))
-    if nodes_per_machine == 2:
-        exp_2_in_size = 0
-    else:
-        # -2 because we need to remove outgoing node
-        exp_2_in_size = int(np.log2(nodes_per_machine-2))  
-
-    index = 0
-    while True:
-        machine_id = self_rank // nodes_per_machine
-        local_rank_id = self_rank % nodes_per_machine
-        local_rank_to_go_outside_id = index % nodes_per_machine
-
-        if local_rank_to_go_outside_id == local_rank_id:
-            # Note: currently design is still not very good. Because some local rank i may NEVER
-            # directly talk to other machine's local rank i. Example:
-            #
-            # Assume num_machines=16, nodes_per_machine=4, and self_rank=1, then we know that
-            # exp_2_out_size=3, and local_rank_id=1. If this branch is reached,
-            # local_rank_to_go_outside_id=1, and index % (exp_2_out_size+1)=1, resulting in
-            # next_machine_dist always equal to 2.
-            next_machine_dist = 2**(index % (exp_2_out_size+1))
-            # find send_rank
-            target_machine_id = (machine_id + next_machine_dist) % num_machines
-            target_rank_id = target_machine_id * nodes_per_machine + local_rank_id
-            send_rank = target_rank_id
-
-            # find recv_rank
-            source_machine_id = (machine_id - next_machine_dist) % num_machines
-            source_rank_id = source_machine_id * nodes_per_machine + local_rank_id
-            recv_rank = source_rank_id
-
-        else:
-            # Distance from self to out-rank:
-            dist_to_out = (local_rank_to_go_outside_id -
-                            local_rank_id) % nodes_per_machine
-            next_inner_dist = 2**(index % (exp_2_in_size + 1))
-            if next_inner_dist >= dist_to_out:
-                next_inner_dist += 1
-
-            # find send_rank
-            target_local_rank_id = (local_rank_id +
-                                    next_inner_dist) % nodes_per_machine
-            target_rank_id = target_local_rank_id + machine_id * nodes_per_machine
-            send_rank = target_rank_id
-
-            reverse_inner_dist = 2**(index % (exp_2_in_size + 1))
-            reverse_dist_to_out = (
-                local_rank_id - local_rank_to_go_outside_id) % nodes_per_machine
-            if reverse_inner_dist >= reverse_dist_to_out:
-                reverse_inner_dist += 1
-
-            # find recv_rank
-            source_local_rank_id = (local_rank_id -
-                                    reverse_inner_dist) % nodes_per_machine
-            source_rank_id = source_local_rank_id + machine_id * nodes_per_machine
-            recv_rank = source_rank_id
-
-        yield [send_rank], [recv_rank]
-        index += 1
+    exp_2_out_size, exp_2_in_size = _InnerOuterExpo2Sizes(num_machines, local_size)
+    # The schedule is periodic with the lcm of all the cycles in it.
+    period = _Lcm(local_size, exp_2_out_size + 1, exp_2_in_size + 1)
+    return _CycleSchedule(*GetInnerOuterExpo2DynamicSendRecvMatrix(
+        world_size, local_size, num_steps=period, ranks=[self_rank]))
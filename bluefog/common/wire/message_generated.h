@@ -200,7 +200,8 @@ struct Request FLATBUFFERS_FINAL_CLASS : private flatbuffers::Table {
     VT_ROOT_RANK = 12,
     VT_DEVICE = 14,
     VT_TENSOR_SHAPE = 16,
-    VT_IS_HIERARCHICAL = 18
+    VT_IS_HIERARCHICAL = 18,
+    VT_NEIGHBOR_PATTERN = 20
   };
   int32_t request_rank() const {
     return GetField<int32_t>(VT_REQUEST_RANK, 0);
@@ -226,6 +227,9 @@ struct Request FLATBUFFERS_FINAL_CLASS : private flatbuffers::Table {
   bool is_hierarchical() const {
     return GetField<uint8_t>(VT_IS_HIERARCHICAL, 0) != 0;
   }
+  int64_t neighbor_pattern() const {
+    return GetField<int64_t>(VT_NEIGHBOR_PATTERN, 0);
+  }
   bool Verify(flatbuffers::Verifier &verifier) const {
     return VerifyTableStart(verifier) &&
            VerifyField<int32_t>(verifier, VT_REQUEST_RANK) &&
@@ -238,6 +242,7 @@ struct Request FLATBUFFERS_FINAL_CLASS : private flatbuffers::Table {
            VerifyOffset(verifier, VT_TENSOR_SHAPE) &&
            verifier.VerifyVector(tensor_shape()) &&
            VerifyField<uint8_t>(verifier, VT_IS_HIERARCHICAL) &&
+           VerifyField<int64_t>(verifier, VT_NEIGHBOR_PATTERN) &&
            verifier.EndTable();
   }
 };
@@ -270,6 +275,9 @@ struct RequestBuilder {
   void add_is_hierarchical(bool is_hierarchical) {
     fbb_.AddElement<uint8_t>(Request::VT_IS_HIERARCHICAL, static_cast<uint8_t>(is_hierarchical), 0);
   }
+  void add_neighbor_pattern(int64_t neighbor_pattern) {
+    fbb_.AddElement<int64_t>(Request::VT_NEIGHBOR_PATTERN, neighbor_pattern, 0);
+  }
   explicit RequestBuilder(flatbuffers::FlatBufferBuilder &_fbb)
         : fbb_(_fbb) {
     start_ = fbb_.StartTable();
@@ -291,8 +299,10 @@ inline flatbuffers::Offset<Request> CreateRequest(
     int32_t root_rank = 0,
     int32_t device = 0,
     flatbuffers::Offset<flatbuffers::Vector<int64_t>> tensor_shape = 0,
-    bool is_hierarchical = false) {
+    bool is_hierarchical = false,
+    int64_t neighbor_pattern = 0) {
   RequestBuilder builder_(_fbb);
+  builder_.add_neighbor_pattern(neighbor_pattern);
   builder_.add_tensor_shape(tensor_shape);
   builder_.add_device(device);
   builder_.add_root_rank(root_rank);
@@ -313,7 +323,8 @@ inline flatbuffers::Offset<Request> CreateRequestDirect(
     int32_t root_rank = 0,
     int32_t device = 0,
     const std::vector<int64_t> *tensor_shape = nullptr,
-    bool is_hierarchical = false) {
+    bool is_hierarchical = false,
+    int64_t neighbor_pattern = 0) {
   auto tensor_name__ = tensor_name ? _fbb.CreateString(tensor_name) : 0;
   auto tensor_shape__ = tensor_shape ? _fbb.CreateVector<int64_t>(*tensor_shape) : 0;
   return bluefog::common::wire::CreateRequest(
@@ -325,7 +336,8 @@ inline flatbuffers::Offset<Request> CreateRequestDirect(
       root_rank,
       device,
       tensor_shape__,
-      is_hierarchical);
+      is_hierarchical,
+      neighbor_pattern);
 }
 
 struct RequestList FLATBUFFERS_FINAL_CLASS : private flatbuffers::Table {
@@ -503,7 +515,9 @@ struct ResponseList FLATBUFFERS_FINAL_CLASS : private flatbuffers::Table {
   enum FlatBuffersVTableOffset FLATBUFFERS_VTABLE_UNDERLYING_TYPE {
     VT_RESPONSES = 4,
     VT_SHUTDOWN = 6,
-    VT_CHANGE_TOPO = 8
+    VT_CHANGE_TOPO = 8,
+    VT_TENSOR_FUSION_THRESHOLD = 10,
+    VT_CYCLE_TIME_MS = 12
   };
   const flatbuffers::Vector<flatbuffers::Offset<bluefog::common::wire::Response>> *responses() const {
     return GetPointer<const flatbuffers::Vector<flatbuffers::Offset<bluefog::common::wire::Response>> *>(VT_RESPONSES);
@@ -514,6 +528,12 @@ struct ResponseList FLATBUFFERS_FINAL_CLASS : private flatbuffers::Table {
   bool change_topo() const {
     return GetField<uint8_t>(VT_CHANGE_TOPO, 0) != 0;
   }
+  int64_t tensor_fusion_threshold() const {
+    return GetField<int64_t>(VT_TENSOR_FUSION_THRESHOLD, -1LL);
+  }
+  double cycle_time_ms() const {
+    return GetField<double>(VT_CYCLE_TIME_MS, -1.0);
+  }
   bool Verify(flatbuffers::Verifier &verifier) const {
     return VerifyTableStart(verifier) &&
            VerifyOffset(verifier, VT_RESPONSES) &&
@@ -521,6 +541,8 @@ struct ResponseList FLATBUFFERS_FINAL_CLASS : private flatbuffers::Table {
            verifier.VerifyVectorOfTables(responses()) &&
            VerifyField<uint8_t>(verifier, VT_SHUTDOWN) &&
            VerifyField<uint8_t>(verifier, VT_CHANGE_TOPO) &&
+           VerifyField<int64_t>(verifier, VT_TENSOR_FUSION_THRESHOLD) &&
+           VerifyField<double>(verifier, VT_CYCLE_TIME_MS) &&
            verifier.EndTable();
   }
 };
@@ -538,6 +560,12 @@ struct ResponseListBuilder {
   void add_change_topo(bool change_topo) {
     fbb_.AddElement<uint8_t>(ResponseList::VT_CHANGE_TOPO, static_cast<uint8_t>(change_topo), 0);
   }
+  void add_tensor_fusion_threshold(int64_t tensor_fusion_threshold) {
+    fbb_.AddElement<int64_t>(ResponseList::VT_TENSOR_FUSION_THRESHOLD, tensor_fusion_threshold, -1LL);
+  }
+  void add_cycle_time_ms(double cycle_time_ms) {
+    fbb_.AddElement<double>(ResponseList::VT_CYCLE_TIME_MS, cycle_time_ms, -1.0);
+  }
   explicit ResponseListBuilder(flatbuffers::FlatBufferBuilder &_fbb)
         : fbb_(_fbb) {
     start_ = fbb_.StartTable();
@@ -554,8 +582,12 @@ inline flatbuffers::Offset<ResponseList> CreateResponseList(
     flatbuffers::FlatBufferBuilder &_fbb,
     flatbuffers::Offset<flatbuffers::Vector<flatbuffers::Offset<bluefog::common::wire::Response>>> responses = 0,
     bool shutdown = false,
-    bool change_topo = false) {
+    bool change_topo = false,
+    int64_t tensor_fusion_threshold = -1LL,
+    double cycle_time_ms = -1.0) {
   ResponseListBuilder builder_(_fbb);
+  builder_.add_cycle_time_ms(cycle_time_ms);
+  builder_.add_tensor_fusion_threshold(tensor_fusion_threshold);
   builder_.add_responses(responses);
   builder_.add_change_topo(change_topo);
   builder_.add_shutdown(shutdown);
@@ -566,13 +598,17 @@ inline flatbuffers::Offset<ResponseList> CreateResponseListDirect(
     flatbuffers::FlatBufferBuilder &_fbb,
     const std::vector<flatbuffers::Offset<bluefog::common::wire::Response>> *responses = nullptr,
     bool shutdown = false,
-    bool change_topo = false) {
+    bool change_topo = false,
+    int64_t tensor_fusion_threshold = -1LL,
+    double cycle_time_ms = -1.0) {
   auto responses__ = responses ? _fbb.CreateVector<flatbuffers::Offset<bluefog::common::wire::Response>>(*responses) : 0;
   return bluefog::common::wire::CreateResponseList(
       _fbb,
       responses__,
       shutdown,
-      change_topo);
+      change_topo,
+      tensor_fusion_threshold,
+      cycle_time_ms);
 }
 
 }  // namespace wire
@@ -22,6 +22,7 @@ import collections
 import os
 import torch
 from bluefog.common.util import check_extension
+from bluefog.torch.compression import Compression
 from bluefog.torch.optimizers import (
     DistributedGradientAllreduceOptimizer,
     DistributedAllreduceOptimizer,
@@ -35,6 +36,7 @@ from bluefog.torch.mpi_ops import init, shutdown
 from bluefog.torch.mpi_ops import size, local_size, rank, local_rank
 from bluefog.torch.mpi_ops import load_topology, set_topology
 from bluefog.torch.mpi_ops import in_neighbor_ranks, out_neighbor_ranks
+from bluefog.torch.mpi_ops import in_neighbor_set, out_neighbor_set, load_recv_weights
 from bluefog.torch.mpi_ops import mpi_threads_supported
 from bluefog.torch.mpi_ops import unified_mpi_window_model_supported
 from bluefog.torch.mpi_ops import nccl_built, is_homogeneous
@@ -49,6 +51,7 @@ from bluefog.torch.mpi_ops import neighbor_allreduce, neighbor_allreduce_nonbloc
 from bluefog.torch.mpi_ops import hierarchical_neighbor_allreduce
 from bluefog.torch.mpi_ops import hierarchical_neighbor_allreduce_nonblocking
 from bluefog.torch.mpi_ops import poll, synchronize, wait, barrier
+from bluefog.torch.mpi_ops import set_output_buffer_pool_capacity
 
 from bluefog.torch.mpi_ops import win_create, win_free
 from bluefog.torch.mpi_ops import win_update, win_update_then_collect
@@ -0,0 +1,268 @@
+# Modifications copyright (C) 2020 Bluefog Team. All Rights Reserved.
+# Copyright 2019 Uber Technologies, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Gradient and parameter compression algorithms."""
+
+import numpy as np
+import torch
+
+
+class Compressor(object):
+    """Interface for compressing and decompressing a given tensor."""
+
+    # If set, the compressed tensor is reduced by the ops directly. Otherwise, the compressed
+    # tensors are gathered and decompressed one by one before the reduction.
+    reducible = False
+
+    @staticmethod
+    def compress(tensor):
+        """Compresses a tensor and returns a list of compressed tensors with the context needed
+        to decompress it."""
+
+    @staticmethod
+    def decompress(tensors, ctx):
+        """Decompress the list of compressed tensors with the given context."""
+
+
+class NoneCompressor(Compressor):
+    """Default no-op compression."""
+
+    reducible = True
+
+    @staticmethod
+    def compress(tensor):
+        """Returns the tensor unmodified."""
+        return [tensor], None
+
+    @staticmethod
+    def decompress(tensors, ctx):
+        """Returns the tensor unmodified."""
+        return tensors[0]
+
+
+class FP16Compressor(Compressor):
+    """Compress all floating point tensors to 16-bit."""
+
+    reducible = True
+
+    @staticmethod
+    def compress(tensor):
+        """Downcasts the tensor to 16-bit."""
+        tensor_compressed = tensor
+        if tensor.dtype.is_floating_point:
+            # Only allow compression from other floating point types
+            tensor_compressed = tensor.type(torch.float16)
+        return [tensor_compressed], tensor.dtype
+
+    @staticmethod
+    def decompress(tensors, ctx):
+        """Upcasts the tensor to the initialization dtype."""
+        tensor_decompressed = tensors[0]
+        dtype = ctx
+        if dtype.is_floating_point:
+            tensor_decompressed = tensor_decompressed.type(dtype)
+        return tensor_decompressed
+
+
+class BF16Compressor(Compressor):
+    """Compress all floating point tensors to bfloat16, which keeps the range of float32."""
+
+    @staticmethod
+    def compress(tensor):
+        """Downcasts the tensor to bfloat16."""
+        tensor_compressed = tensor
+        if tensor.dtype.is_floating_point:
+            tensor_compressed = tensor.to(torch.bfloat16)
+        return [tensor_compressed], tensor.dtype
+
+    @staticmethod
+    def decompress(tensors, ctx):
+        """Upcasts the tensor to the initialization dtype."""
+        return tensors[0].to(ctx)
+
+
+class INT8Compressor(Compressor):
+    """Quantize the tensor into 8-bit integers with stochastic rounding, which is unbiased.
+    The scale is the largest absolute value of the tensor divided by 127."""
+
+    @staticmethod
+    def compress(tensor):
+        """Quantizes the tensor and returns it with its scale."""
+        tensor_float = tensor.float()
+        scale = tensor_float.abs().max().div(127.0).view(1)
+        # Avoid dividing by zero for the tensor of zeros.
+        scale = torch.where(scale > 0, scale, torch.ones_like(scale))
+        noise = torch.rand_like(tensor_float)
+        tensor_compressed = tensor_float.div(scale).add_(noise).floor_().clamp_(-127, 127)
+        return [scale, tensor_compressed.to(torch.int8)], tensor.dtype
+
+    @staticmethod
+    def decompress(tensors, ctx):
+        """Dequantizes the tensor to the initialization dtype."""
+        scale, tensor_compressed = tensors
+        return tensor_compressed.float().mul_(scale).to(ctx)
+
+
+class TopKCompressor(Compressor):
+    """Keep the given ratio of the elements with the largest absolute values, which are sent
+    with their indices."""
+
+    def __init__(self, ratio=0.01):
+        if not 0 < ratio <= 1:
+            raise ValueError("Argument ratio has to be in (0, 1].")
+        self.ratio = ratio
+
+    def compress(self, tensor):
+        """Returns the largest elements of the tensor and their indices."""
+        tensor_flatten = tensor.reshape(-1)
+        k = max(1, int(tensor_flatten.numel() * self.ratio))
+        _, indices = tensor_flatten.abs().topk(k, sorted=False)
+        values = tensor_flatten[indices]
+        return [values, indices.int()], (tensor.shape, tensor.numel())
+
+    def decompress(self, tensors, ctx):
+        """Scatters the elements back into a tensor of zeros."""
+        values, indices = tensors
+        shape, numel = ctx
+        tensor_decompressed = values.new_zeros(numel)
+        tensor_decompressed.scatter_(0, indices.long(), values)
+        return tensor_decompressed.view(shape)
+
+
+class Compression(object):
+    """Optional compression algorithms used during the communication.
+
+    fp16 is reduced by the ops directly. The others are not supported by the ops, so the
+    compressed tensors are gathered from the neighbors (or all ranks for allreduce) and
+    decompressed before the weighted average. They only support the static topology.
+    The tensor of the rank itself is never compressed in its own result.
+    """
+
+    """Do not compress the tensors."""
+    none = NoneCompressor
+
+    """Compress all floating point tensors to 16-bit (2x less traffic for float32)."""
+    fp16 = FP16Compressor
+
+    """Compress all floating point tensors to bfloat16 (2x less traffic for float32)."""
+    bf16 = BF16Compressor
+
+    """Quantize the tensors into 8-bit integers stochastically (4x less traffic for float32)."""
+    int8 = INT8Compressor
+
+    @staticmethod
+    def topk(ratio=0.01):
+        """Sparsify the tensors with top-k, keeping the given ratio of the elements with their
+        indices, e.g. Compression.topk(0.01) (50x less traffic for float32)."""
+        return TopKCompressor(ratio)
+
+
+class _Precompressed(Compressor):
+    """The result of a compression that was already done, which is sent as it is instead of
+    compressing the tensor again."""
+
+    def __init__(self, compression, tensors, ctx):
+        self.compression = compression
+        self.reducible = compression.reducible
+        self.tensors = tensors
+        self.ctx = ctx
+
+    def compress(self, tensor):
+        """Returns the result of the compression done before."""
+        return self.tensors, self.ctx
+
+    def decompress(self, tensors, ctx):
+        """Decompresses with the original compression."""
+        return self.compression.decompress(tensors, ctx)
+
+
+def compress_once(compression, tensor):
+    """Compress the tensor and return it as the receivers will see it after the compression,
+    with the compression to pass to the ops, which sends exactly this result. Compressing
+    again in the ops could give another result, e.g. for the stochastic rounding of int8."""
+    tensors, ctx = compression.compress(tensor)
+    return compression.decompress(tensors, ctx), _Precompressed(compression, tensors, ctx)
+
+
+def _supports_view_as_dtype():
+    # Tensor.view(dtype) with a different element size is only supported by the recent torch.
+    try:
+        torch.zeros(1, dtype=torch.int32).view(torch.uint8)
+        return True
+    except (TypeError, RuntimeError):
+        return False
+
+
+_VIEW_AS_DTYPE = _supports_view_as_dtype()
+
+
+def _numpy_dtype(dtype):
+    return torch.tensor([], dtype=dtype).numpy().dtype
+
+
+def _as_bytes(tensor):
+    """Reinterpret the tensor as a flat uint8 tensor."""
+    tensor = tensor.contiguous().view(-1)
+    if _VIEW_AS_DTYPE:
+        return tensor.view(torch.uint8)
+    if tensor.dtype == torch.bfloat16:
+        # numpy has no bfloat16, which is exactly the upper half of a float32.
+        array = (tensor.float().cpu().numpy().view(np.uint32) >> 16).astype(np.uint16)
+    else:
+        array = tensor.cpu().numpy()
+    return torch.from_numpy(array.view(np.uint8)).to(tensor.device)
+
+
+def _from_bytes(data, dtype):
+    """Reinterpret the flat uint8 tensor as a tensor of the given dtype."""
+    if _VIEW_AS_DTYPE:
+        return data.view(dtype)
+    array = data.cpu().numpy()
+    if dtype == torch.bfloat16:
+        array = (array.view(np.uint16).astype(np.uint32) << 16).view(np.float32)
+        return torch.from_numpy(array).to(device=data.device, dtype=dtype)
+    return torch.from_numpy(array.view(_numpy_dtype(dtype))).to(data.device)
+
+
+# Each compressed tensor starts at a multiple of this many bytes so that it can be viewed with
+# its own dtype.
+_ALIGNMENT = 8
+
+
+def pack(tensors):
+    """Concatenate the bytes of the compressed tensors into one int32 tensor, which is supported
+    by the gather ops on both CPU and GPU."""
+    chunks = []
+    for tensor in tensors:
+        data = _as_bytes(tensor)
+        padding = (-data.numel()) % _ALIGNMENT
+        chunks.append(data)
+        if padding:
+            chunks.append(data.new_zeros(padding))
+    return _from_bytes(torch.cat(chunks), torch.int32)
+
+
+def unpack(packed, layout):
+    """Split a packed tensor back into the compressed tensors, given the list of their
+    (shape, dtype)."""
+    data = _as_bytes(packed)
+    tensors = []
+    offset = 0
+    for shape, dtype in layout:
+        numel = torch.Size(shape).numel()
+        nbytes = numel * torch.tensor([], dtype=dtype).element_size()
+        tensors.append(_from_bytes(data[offset:offset + nbytes], dtype).view(shape))
+        offset += nbytes + (-nbytes) % _ALIGNMENT
+    return tensors
@@ -33,6 +33,7 @@ namespace torch {
 
 using ::bluefog::common::bluefog_load_topology;
 using ::bluefog::common::bluefog_load_topology_weights;
+using ::bluefog::common::bluefog_neighbor_allreduce_chunk_size;
 using ::bluefog::common::bluefog_neighbor_size;
 using ::bluefog::common::bluefog_rank;
 using ::bluefog::common::bluefog_size;
@@ -311,6 +312,17 @@ int DoNeighborAllgather(::torch::Tensor tensor, ::torch::Tensor output,
   return handle;
 }
 
+// Whether the neighbor_allreduce of the tensor is pipelined, i.e. reduced in
+// chunks by the background thread. Then the output has the same shape as the
+// tensor instead of holding the tensors of all in-neighbors.
+bool IsNeighborAllreducePipelined(::torch::Tensor tensor) {
+  int64_t chunk_size = bluefog_neighbor_allreduce_chunk_size();
+  return chunk_size > 0 && tensor.device().is_cpu() &&
+         (tensor.scalar_type() == ::torch::kFloat32 ||
+          tensor.scalar_type() == ::torch::kFloat64) &&
+         tensor.numel() * tensor.element_size() >= chunk_size;
+}
+
 int DoNeighborAllreduce(::torch::Tensor tensor, ::torch::Tensor output,
                         double self_weight, const std::unordered_map<int, double>& neighbor_weights,
                         const std::vector<int>& send_neighbors, bool dynamic_neighbors_enabled,
@@ -350,7 +362,8 @@ int DoNeighborAllreduce(::torch::Tensor tensor, ::torch::Tensor output,
     auto enqueue_result = EnqueueTensorNeighborAllreduce(
         bf_tensor, bf_output, bf_context, ready_event, bf_recv_neighbors,
         bf_send_neighbors, dynamic_neighbors_enabled, is_hierarchical,
-        enable_topo_check, op_name, CPU_DEVICE_ID,
+        enable_topo_check, /*pipelined=*/false, self_weight, neighbor_weights,
+        op_name, CPU_DEVICE_ID,
         callback_wrapper([self_weight, neighbor_weights, avg_computation,
                           cpu_output, tensor, recv_neighbors, send_neighbors,
                           dynamic_neighbors_enabled, is_hierarchical, output,
@@ -448,13 +461,39 @@ int DoNeighborAllreduce(::torch::Tensor tensor, ::torch::Tensor output,
     auto bf_send_neighbors = std::make_shared<std::vector<int>>(send_neighbors);
     auto ready_event = RecordReadyEvent(device);
 
+    // The pipelined one is reduced by the background thread, which needs the
+    // weights of the uniform average explicitly.
+    bool pipelined = !is_hierarchical && IsNeighborAllreducePipelined(tensor);
+    double reduce_self_weight = self_weight;
+    std::unordered_map<int, double> reduce_neighbor_weights = neighbor_weights;
+    if (pipelined && !avg_computation) {
+      std::vector<int> recv_ranks = recv_neighbors;
+      if (!dynamic_neighbors_enabled) {
+        int indgree = 0;
+        int outdegree = 0;
+        int* sources_ptr = nullptr;
+        int* destinations_ptr = nullptr;
+        bluefog_load_topology(&indgree, sources_ptr, &outdegree,
+                              destinations_ptr);
+        recv_ranks.assign(sources_ptr, sources_ptr + indgree);
+      }
+      reduce_self_weight = 1.0 / (recv_ranks.size() + 1);
+      reduce_neighbor_weights.clear();
+      for (int recv_rank : recv_ranks) {
+        reduce_neighbor_weights[recv_rank] = reduce_self_weight;
+      }
+    }
+
     auto enqueue_result = EnqueueTensorNeighborAllreduce(
         bf_tensor, bf_output, bf_context, ready_event, bf_recv_neighbors,
         bf_send_neighbors, dynamic_neighbors_enabled, is_hierarchical,
-        enable_topo_check, op_name, device,
+        enable_topo_check, pipelined, reduce_self_weight,
+        reduce_neighbor_weights, op_name, device,
         callback_wrapper([self_weight, neighbor_weights, avg_computation,
                           recv_neighbors, send_neighbors, dynamic_neighbors_enabled,
-                          is_hierarchical, tensor, output]() mutable {
+                          is_hierarchical, tensor, output, pipelined]() mutable {
+          // The output is reduced already.
+          if (pipelined) return;
           int recv_size = bluefog_neighbor_size();
           if (dynamic_neighbors_enabled) recv_size = recv_neighbors.size();
           if (recv_size > 0) {
@@ -745,6 +784,8 @@ PYBIND11_MODULE(mpi_lib, m) {
   m.def("bluefog_torch_poll", &PollHandle);
   m.def("bluefog_torch_wait_and_clear", &WaitAndClear);
   m.def("bluefog_torch_barrier", &Barrier);
+  m.def("bluefog_torch_is_neighbor_allreduce_pipelined",
+        &IsNeighborAllreducePipelined);
 
   // one-sided communication
   AddWinOpsIntoPybind(m);
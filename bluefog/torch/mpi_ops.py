@@ -14,14 +14,15 @@
 # limitations under the License.
 # ==============================================================================
 
+from collections import OrderedDict
 from contextlib import contextmanager
 from typing import List, Dict, Optional
 
 import torch
 
 from bluefog.torch import mpi_lib  # C library
+from bluefog.torch.compression import Compression, pack, unpack
 from bluefog.common.basics import BlueFogBasics, logger
-from bluefog.common.topology_util import GetRecvWeights
 
 _basics = BlueFogBasics(__file__, 'mpi_lib')
 
@@ -37,6 +38,9 @@ is_topo_weighted = _basics.is_topo_weighted
 set_topology = _basics.set_topology
 in_neighbor_ranks = _basics.in_neighbor_ranks
 out_neighbor_ranks = _basics.out_neighbor_ranks
+in_neighbor_set = _basics.in_neighbor_set
+out_neighbor_set = _basics.out_neighbor_set
+load_recv_weights = _basics.load_recv_weights
 mpi_threads_supported = _basics.mpi_threads_supported
 unified_mpi_window_model_supported = _basics.unified_mpi_window_model_supported
 is_homogeneous = _basics.is_homogeneous
@@ -53,6 +57,89 @@ timeline_end_activity = _basics.timeline_end_activity
 # before the operation is finished.
 _handle_map = {}
 
+class _OutputBufferPool:
+    """Reusable output buffers of the nonblocking ops, keyed by the name of the op.
+
+    Every name alternates between two buffers. So the output of the previous call stays valid
+    while the next call with the same name is running, e.g. the parameters set to the output of
+    the last neighbor_allreduce. The buffers are allocated in size classes of powers of two, and
+    the least recently used ones are evicted once the pool exceeds its capacity in bytes.
+    """
+
+    def __init__(self):
+        self.capacity = 0
+        self._nbytes = 0
+        # Schema: (name, slot) -> flat buffer, from the least to the most recently used.
+        self._buffers = OrderedDict()
+        # Schema: name -> slot of the next call
+        self._next_slot = {}
+        # Schema: handle -> (name, slot), shape_known
+        self._handle_keys = {}
+        self._in_flight = set()
+
+    @staticmethod
+    def _size_class(numel):
+        return 1 << max(numel - 1, 0).bit_length()
+
+    def _evict(self):
+        while self._nbytes > self.capacity and self._buffers:
+            _, buffer = self._buffers.popitem(last=False)
+            self._nbytes -= buffer.numel() * buffer.element_size()
+
+    def set_capacity(self, capacity):
+        self.capacity = capacity
+        self._evict()
+
+    def acquire(self, tensor, shape, name):
+        """Return the output tensor for an op and its key in the pool, which is None if the
+        output is not pooled. If shape is None, the output is empty and allocated by the op."""
+        key = (name, self._next_slot.get(name, 0))
+        if self.capacity <= 0 or name is None or key in self._in_flight:
+            return (tensor.new() if shape is None else tensor.new(shape)), None
+        self._next_slot[name] = 1 - key[1]
+        numel = 0 if shape is None else torch.Size(shape).numel()
+        buffer = self._buffers.pop(key, None)
+        if buffer is not None:
+            self._nbytes -= buffer.numel() * buffer.element_size()
+            if buffer.dtype != tensor.dtype or buffer.device != tensor.device or \
+               (shape is not None and buffer.numel() != self._size_class(numel)) or \
+               buffer.data_ptr() == tensor.data_ptr():
+                buffer = None
+        if buffer is None:
+            buffer = tensor.new(self._size_class(numel))
+        self._buffers[key] = buffer
+        self._nbytes += buffer.numel() * buffer.element_size()
+        self._evict()
+        # Shrinking the size keeps the storage of the buffer.
+        output = tensor.new().set_(buffer)
+        output.resize_(shape if shape is not None else [0])
+        return output, key
+
+    def track(self, handle, key, shape_known=True):
+        if key is not None:
+            self._handle_keys[handle] = (key, shape_known)
+            self._in_flight.add(key)
+
+    def release(self, handle, output):
+        if handle not in self._handle_keys:
+            return
+        key, shape_known = self._handle_keys.pop(handle)
+        self._in_flight.discard(key)
+        buffer = self._buffers.get(key)
+        # The op reallocates the output if it is larger than the buffer, which is kept instead.
+        if not shape_known and buffer is not None and output.data_ptr() != buffer.data_ptr():
+            self._nbytes -= buffer.numel() * buffer.element_size()
+            self._buffers[key] = output.new().set_(output).view(-1)
+            self._nbytes += output.numel() * output.element_size()
+            self._evict()
+
+
+_output_buffer_pool = _OutputBufferPool()
+
+# Schema: handle -> function turning the output into the result, e.g. decompression.
+# Applied in synchronize.
+_handle_finalizers = {}
+
 # Schema: handle -> name
 _win_handle_map = {}
 
@@ -94,7 +181,8 @@ def _allreduce_nonblocking(tensor, output, average, is_hierarchical_local, name)
 
 
 def allreduce(tensor: torch.Tensor, average: bool = True,
-              is_hierarchical_local=False, name: Optional[str] = None) -> torch.Tensor:
+              is_hierarchical_local=False, name: Optional[str] = None,
+              compression=Compression.none) -> torch.Tensor:
     """
     A function that performs averaging or summation of the input tensor over all the
     Bluefog processes. The input tensor is not modified.
@@ -111,17 +199,20 @@ def allreduce(tensor: torch.Tensor, average: bool = True,
         is_hierarchical_local: If set, allreduce is executed within one machine instead of
                 global allreduce.
         name: A name of the reduction operation.
+        compression: Compression algorithm used to reduce the amount of data sent, e.g.
+            Compression.fp16. See `bluefog.torch.Compression`.
 
     Returns:
         A tensor of the same shape and type as `tensor`, averaged or summed across all
         processes.
     """
-    handle = allreduce_nonblocking(tensor, average, is_hierarchical_local, name)
+    handle = allreduce_nonblocking(tensor, average, is_hierarchical_local, name, compression)
     return synchronize(handle)
 
 
 def allreduce_nonblocking(tensor: torch.Tensor, average: bool = True,
-                          is_hierarchical_local=False, name: Optional[str] = None) -> int:
+                          is_hierarchical_local=False, name: Optional[str] = None,
+                          compression=Compression.none) -> int:
     """
     A function that performs nonblocking averaging or summation of the input tensor
     over all the Bluefog processes. The input tensor is not modified.
@@ -138,13 +229,60 @@ def allreduce_nonblocking(tensor: torch.Tensor, average: bool = True,
         is_hierarchical_local: If set, allreduce is executed within one machine instead of
                 global allreduce.
         name: A name of the reduction operation.
+        compression: Compression algorithm used to reduce the amount of data sent, e.g.
+            Compression.fp16. See `bluefog.torch.Compression`.
 
     Returns:
         A handle to the allreduce operation that can be used with `poll()` or
         `synchronize()`.
     """
-    output = tensor.new(tensor.shape)
-    return _allreduce_nonblocking(tensor, output, average, is_hierarchical_local, name)
+    if compression is not Compression.none:
+        return _compressed_allreduce_nonblocking(tensor, average, is_hierarchical_local, name,
+                                                 compression)
+    output, pool_key = _output_buffer_pool.acquire(tensor, tensor.shape, name)
+    handle = _allreduce_nonblocking(tensor, output, average, is_hierarchical_local, name)
+    _output_buffer_pool.track(handle, pool_key)
+    return handle
+
+
+def _decompress_on_synchronize(handle, compression, compressed, ctx, tensor, self_weight):
+    # The output includes the compressed tensor of the rank itself with self_weight, which is
+    # replaced by the uncompressed one.
+    def finalize(output):
+        result = compression.decompress([output], ctx)
+        decompressed = compression.decompress(compressed, ctx)
+        if decompressed is tensor:
+            # Not compressed, e.g. the integer tensor by fp16.
+            return result
+        return result.add_((tensor - decompressed).mul_(self_weight))
+    _handle_finalizers[handle] = finalize
+    return handle
+
+
+def _compressed_allreduce_nonblocking(tensor, average, is_hierarchical_local, name, compression):
+    compressed, ctx = compression.compress(tensor)
+    if compression.reducible:
+        handle = allreduce_nonblocking(compressed[0], average, is_hierarchical_local, name)
+        num_ranks = local_size() if is_hierarchical_local else size()
+        return _decompress_on_synchronize(handle, compression, compressed, ctx, tensor,
+                                          1.0 / num_ranks if average else 1.0)
+    if is_hierarchical_local:
+        raise ValueError("Local allreduce only supports the compression reduced by the ops "
+                         "directly, e.g. Compression.fp16.")
+    # The compressed tensors of all ranks are gathered and reduced after the decompression,
+    # except the one of the rank itself, which is taken uncompressed.
+    layout = [(t.shape, t.dtype) for t in compressed]
+    handle = allgather_nonblocking(pack(compressed), name)
+    self_rank = rank()
+
+    def finalize(output):
+        result = tensor.clone()
+        for i, packed in enumerate(output.chunk(size())):
+            if i != self_rank:
+                result.add_(compression.decompress(unpack(packed, layout), ctx))
+        return result.div_(size()) if average else result
+    _handle_finalizers[handle] = finalize
+    return handle
 
 
 def allreduce_(tensor: torch.Tensor, average: bool = True,
@@ -357,8 +495,11 @@ def allgather_nonblocking(tensor: torch.Tensor, name: Optional[str] = None) -> i
         A handle to the allgather operation that can be used with `poll()` or
         `synchronize()`.
     """
-    output = tensor.new()  # real size will be allocated later.
-    return _allgather_nonblocking(tensor, output, name)
+    # real size will be allocated later.
+    output, pool_key = _output_buffer_pool.acquire(tensor, None, name)
+    handle = _allgather_nonblocking(tensor, output, name)
+    _output_buffer_pool.track(handle, pool_key, shape_known=False)
+    return handle
 
 
 def _neighbor_allgather_function_factory(tensor):
@@ -412,8 +553,11 @@ def neighbor_allgather_nonblocking(tensor: torch.Tensor, name: Optional[str] = N
         A handle to the allgather operation that can be used with `poll()` or
         `synchronize()`.
     """
-    output = tensor.new()  # real size will be allocated later.
-    return _neighbor_allgather_nonblocking(tensor, output, name)
+    # real size will be allocated later.
+    output, pool_key = _output_buffer_pool.acquire(tensor, None, name)
+    handle = _neighbor_allgather_nonblocking(tensor, output, name)
+    _output_buffer_pool.track(handle, pool_key, shape_known=False)
+    return handle
 
 
 def _neighbor_allreduce_function_factory(tensor):
@@ -437,16 +581,8 @@ def _neighbor_allreduce_nonblocking(tensor, output, self_weight, neighbor_weight
     else:
         dynamic_neighbors_enabled = True
     if self_weight is None and neighbor_weights is None:
-        # Implying this is static graph.
-        if is_topo_weighted():
-            topology = load_topology()
-            self_weight, neighbor_weights = GetRecvWeights(topology, rank())
-            avg_computation = True
-        else:
-            weight = 1.0/(len(in_neighbor_ranks())+1)
-            self_weight = weight
-            neighbor_weights = {r: weight for r in in_neighbor_ranks()}
-            avg_computation = False
+        # Implying this is static graph. The weights are cached when the topology is set.
+        self_weight, neighbor_weights, avg_computation = load_recv_weights()
     elif self_weight is not None and neighbor_weights is not None:
         if not isinstance(neighbor_weights, dict):
             raise ValueError("Argument neighbor_weights has to be a dictionary map from the "
@@ -455,7 +591,7 @@ def _neighbor_allreduce_nonblocking(tensor, output, self_weight, neighbor_weight
             raise ValueError(
                 "Argument self_weight has to be a float for self rank.")
         if not dynamic_neighbors_enabled and \
-           not set(neighbor_weights.keys()).issubset(set(in_neighbor_ranks())):
+           not neighbor_weights.keys() <= in_neighbor_set():
             raise ValueError("The key of weights should only contain the ranks that belong to "
                              " in-neighbors and self rank.")
         uniform_weights = 1.0/(len(neighbor_weights)+1)
@@ -483,7 +619,8 @@ def neighbor_allreduce(tensor: torch.Tensor,
                        neighbor_weights: Optional[Dict[int, float]] = None,
                        send_neighbors: Optional[List[int]] = None,
                        enable_topo_check: bool = True,
-                       name: Optional[str] = None) -> torch.Tensor:
+                       name: Optional[str] = None,
+                       compression=Compression.none) -> torch.Tensor:
     """
     A function that performs weighted averaging of the input tensor over the negihbors and itself
     in the Bluefog processes. The default behavior is (uniformly) average.
@@ -513,6 +650,9 @@ def neighbor_allreduce(tensor: torch.Tensor,
             sending and recieving neighbors match with each other. Disabling this check can boost
             the performance.
         name: A name of the reduction operation.
+        compression: Compression algorithm used to reduce the amount of data sent, e.g.
+            Compression.fp16. The compressions not reduced by the ops directly, such as
+            Compression.int8, support the static topology only. See `bluefog.torch.Compression`.
 
     Returns:
         A tensor of the same shape and type as `tensor`,  across all processes.
@@ -524,7 +664,7 @@ def neighbor_allreduce(tensor: torch.Tensor,
         raise ValueError("Arguments self_weight and neighbor_weights have to be presented at "
                          "the same time")
     handle = neighbor_allreduce_nonblocking(tensor, self_weight, neighbor_weights,
-                                            send_neighbors, enable_topo_check, name)
+                                            send_neighbors, enable_topo_check, name, compression)
     return synchronize(handle)
 
 
@@ -533,7 +673,8 @@ def neighbor_allreduce_nonblocking(tensor: torch.Tensor,
                                    neighbor_weights: Optional[Dict[int, float]] = None,
                                    send_neighbors: Optional[List[int]] = None,
                                    enable_topo_check: bool = True,
-                                   name: Optional[str] = None) -> int:
+                                   name: Optional[str] = None,
+                                   compression=Compression.none) -> int:
     """
     A function that nonblockingly performs weighted averaging of the input tensor over the
     negihbors and itself in the Bluefog processes. The default behavior is (uniformly) average.
@@ -563,6 +704,9 @@ def neighbor_allreduce_nonblocking(tensor: torch.Tensor,
             sending and recieving neighbors match with each other. Disabling this check can boost
             the performance.
         name: A name of the neighbor_allreduce operation.
+        compression: Compression algorithm used to reduce the amount of data sent, e.g.
+            Compression.fp16. The compressions not reduced by the ops directly, such as
+            Compression.int8, support the static topology only. See `bluefog.torch.Compression`.
 
     Returns:
         A handle to the neighbor_allreduce operation that can be used with `poll()` or
@@ -574,14 +718,63 @@ def neighbor_allreduce_nonblocking(tensor: torch.Tensor,
        (self_weight is not None and neighbor_weights is None):
         raise ValueError("Arguments self_weight and neighbor_weights have to be presented at "
                          "the same time")
-    if send_neighbors is None:
-        first_dim = tensor.shape[0] * len(in_neighbor_ranks())
+    if compression is not Compression.none:
+        return _compressed_neighbor_allreduce_nonblocking(
+            tensor, self_weight, neighbor_weights, send_neighbors, enable_topo_check, name,
+            compression)
+    if mpi_lib.bluefog_torch_is_neighbor_allreduce_pipelined(tensor):
+        # Reduced in chunks as they arrive, so no room for the neighbors' tensors is needed.
+        new_shape = tensor.shape
+    elif send_neighbors is None:
+        first_dim = tensor.shape[0] * len(in_neighbor_set())
+        new_shape = torch.Size([first_dim] + list(tensor.shape[1:]))
     else:
         first_dim = tensor.shape[0] * len(neighbor_weights)
-    new_shape = torch.Size([first_dim] + list(tensor.shape[1:]))
-    output = tensor.new(new_shape)  # Pre-allocate the memory for the output.
-    return _neighbor_allreduce_nonblocking(tensor, output, self_weight, neighbor_weights,
-                                           send_neighbors, enable_topo_check, name=name)
+        new_shape = torch.Size([first_dim] + list(tensor.shape[1:]))
+    # Pre-allocate the memory for the output.
+    output, pool_key = _output_buffer_pool.acquire(tensor, new_shape, name)
+    handle = _neighbor_allreduce_nonblocking(tensor, output, self_weight, neighbor_weights,
+                                             send_neighbors, enable_topo_check, name=name)
+    _output_buffer_pool.track(handle, pool_key)
+    return handle
+
+
+def _compressed_neighbor_allreduce_nonblocking(tensor, self_weight, neighbor_weights,
+                                               send_neighbors, enable_topo_check, name,
+                                               compression):
+    compressed, ctx = compression.compress(tensor)
+    if compression.reducible:
+        handle = neighbor_allreduce_nonblocking(compressed[0], self_weight, neighbor_weights,
+                                                send_neighbors, enable_topo_check, name)
+        if self_weight is None:
+            self_weight = load_recv_weights()[0]
+        return _decompress_on_synchronize(handle, compression, compressed, ctx, tensor,
+                                          self_weight)
+    if send_neighbors is not None:
+        raise ValueError("The compression not reduced by the ops directly only supports the "
+                         "static topology, i.e. send_neighbors is None.")
+    if self_weight is None:
+        self_weight, neighbor_weights, _ = load_recv_weights()
+    elif not neighbor_weights.keys() <= in_neighbor_set():
+        raise ValueError("The key of weights should only contain the ranks that belong to "
+                         " in-neighbors and self rank.")
+    # The compressed tensors of the in-neighbors are gathered, in the order of
+    # in_neighbor_ranks(), and averaged with the uncompressed tensor after the decompression.
+    recv_ranks = in_neighbor_ranks()
+    layout = [(t.shape, t.dtype) for t in compressed]
+    handle = neighbor_allgather_nonblocking(pack(compressed), name)
+
+    def finalize(output):
+        if not recv_ranks:
+            return tensor.clone()
+        result = tensor.mul(self_weight)
+        for recv_rank, packed in zip(recv_ranks, output.chunk(len(recv_ranks))):
+            weight = neighbor_weights.get(recv_rank, 0.0)
+            if weight != 0:
+                result.add_(compression.decompress(unpack(packed, layout), ctx).mul_(weight))
+        return result
+    _handle_finalizers[handle] = finalize
+    return handle
 
 
 def hierarchical_neighbor_allreduce(tensor: torch.Tensor,
@@ -589,7 +782,8 @@ def hierarchical_neighbor_allreduce(tensor: torch.Tensor,
                                     neighbor_machine_weights: Dict[int, float],
                                     send_neighbor_machines: List[int],
                                     enable_topo_check: bool = False,
-                                    name: Optional[str] = None) -> torch.Tensor:
+                                    name: Optional[str] = None,
+                                    compression=Compression.none) -> torch.Tensor:
     """
     A function that performs weighted averaging of the input tensor over the negihbor machines and
     itself in the Bluefog processes. It is similar to neighbor_allreduce. But each machine runs
@@ -618,6 +812,8 @@ def hierarchical_neighbor_allreduce(tensor: torch.Tensor,
             sending and recieving neighbors match with each other. Disabling this check can boost
             the performance.
         name: A name of the reduction operation.
+        compression: Compression algorithm used to reduce the amount of data sent. Only the
+            ones reduced by the ops directly, e.g. Compression.fp16, are supported.
 
     Returns:
         A tensor of the same shape and type as `tensor`,  across all processes.
@@ -631,7 +827,7 @@ def hierarchical_neighbor_allreduce(tensor: torch.Tensor,
                          "be presented at the same time")
     handle = hierarchical_neighbor_allreduce_nonblocking(
         tensor, self_weight, neighbor_machine_weights, send_neighbor_machines,
-        enable_topo_check, name)
+        enable_topo_check, name, compression)
     return synchronize(handle)
 
 
@@ -640,7 +836,8 @@ def hierarchical_neighbor_allreduce_nonblocking(tensor: torch.Tensor,
                                                 neighbor_machine_weights: Dict[int, float],
                                                 send_neighbor_machines: List[int],
                                                 enable_topo_check: bool = False,
-                                                name: Optional[str] = None) -> int:
+                                                name: Optional[str] = None,
+                                                compression=Compression.none) -> int:
     """
     A function that nonblockingly performs weighted averaging of the input tensor over the negihbor
     machines and itself in the Bluefog processes. It is similar to neighbor_allreduce. But
@@ -669,6 +866,8 @@ def hierarchical_neighbor_allreduce_nonblocking(tensor: torch.Tensor,
             sending and recieving neighbors match with each other. Disabling this check can boost
             the performance.
         name: A name of the reduction operation.
+        compression: Compression algorithm used to reduce the amount of data sent. Only the
+            ones reduced by the ops directly, e.g. Compression.fp16, are supported.
 
     Returns:
         A handle to the hierarchical_neighbor_allreduce operation that can be used with `poll()` or
@@ -680,6 +879,18 @@ def hierarchical_neighbor_allreduce_nonblocking(tensor: torch.Tensor,
        (self_weight is not None and neighbor_machine_weights is None):
         raise ValueError("Arguments self_weight and neighbor_weights have to be presented at "
                          "the same time")
+    if compression is not Compression.none:
+        if not compression.reducible:
+            raise ValueError("Hierarchical neighbor allreduce only supports the compression "
+                             "reduced by the ops directly, e.g. Compression.fp16.")
+        compressed, ctx = compression.compress(tensor)
+        handle = hierarchical_neighbor_allreduce_nonblocking(
+            compressed[0], self_weight, neighbor_machine_weights, send_neighbor_machines,
+            enable_topo_check, name)
+        # The tensors of the machine are summed up before the weighted average, which is
+        # divided by the local size.
+        return _decompress_on_synchronize(handle, compression, compressed, ctx, tensor,
+                                          self_weight / local_size())
 
     first_dim = tensor.shape[0] * len(neighbor_machine_weights)
     new_shape = torch.Size([first_dim] + list(tensor.shape[1:]))
@@ -851,6 +1062,11 @@ def synchronize(handle: int) -> torch.Tensor:
         raise ValueError("Cannot find handle to synchronize")
     mpi_lib.bluefog_torch_wait_and_clear(handle)
     _, output = _handle_map.pop(handle)
+    _output_buffer_pool.release(handle, output)
+    finalize = _handle_finalizers.pop(handle, None)
+    if finalize is not None:
+        # Decompress the output of the compressed ops.
+        return finalize(output)
     return output
 
 
@@ -869,6 +1085,25 @@ def wait(handle: int) -> torch.Tensor:
     return synchronize(handle)
 
 
+def set_output_buffer_pool_capacity(capacity: int):
+    """
+    Reuse the outputs of allreduce, allgather, neighbor_allgather and neighbor_allreduce with
+    the same name across the calls, e.g. in every iteration of the training, instead of
+    allocating new ones. The outputs are rounded up to powers of two and the least recently used
+    ones are released once they take more than `capacity` bytes in total.
+
+    Arguments:
+        capacity: The maximum bytes of the pooled outputs. 0 disables the pool (Default).
+
+    Note: Each name alternates between two outputs. The output of an op with name is therefore
+    overwritten by the op after the next one with the same name. Copy it if it has to live
+    longer than that.
+    """
+    if capacity < 0:
+        raise ValueError("Argument capacity has to be non-negative.")
+    _output_buffer_pool.set_capacity(capacity)
+
+
 def barrier():
     """Barrier function to sychronize all MPI processes.
 
@@ -937,29 +1172,33 @@ def _win_update_function_factory(tensor):
     return 'bluefog_torch_win_sync_' + tensor.type().replace('.', '_')
 
 
-def win_update_then_collect(name: str, require_mutex: bool = True) -> torch.Tensor:
+def win_update_then_collect(name: str, require_mutex: bool = True,
+                            incremental: bool = False) -> torch.Tensor:
     """ A utility function to sync the neighbor buffers then accumulate all
     neighbor buffers' tensors into self tensor and clear the buffer.
     It is equivalent to
 
     >>> win_update(name, self_weight=1.0, neighbor_weights={neighbor: 1.0}, reset=True,
-                   require_mutex=require_mutex)
+                   require_mutex=require_mutex, incremental=incremental)
 
     Args:
         name: The unique name to associate the window object.
+        incremental: If set, the neighbor buffers that have not been written since the last
+            update are skipped. See `win_update`.
 
     Returns:
         torch.Tensor: The average tensor of all neighbors' cooresponding tensors.
     """
     neighbor_weights = {r: 1.0 for r in in_neighbor_ranks()}
-    return win_update(name, 1.0, neighbor_weights, reset=True, require_mutex=require_mutex)
+    return win_update(name, 1.0, neighbor_weights, reset=True, require_mutex=require_mutex,
+                      incremental=incremental)
 
 
 def win_update(name: str,
                self_weight: Optional[float] = None,
                neighbor_weights: Optional[Dict[int, float]] = None,
                reset: bool = False, clone: bool = False,
-               require_mutex: bool = False) -> torch.Tensor:
+               require_mutex: bool = False, incremental: bool = False) -> torch.Tensor:
     """Locally synchronized the window objects and returned the reduced neighbor tensor.
     Note the returned tensor is the same tensor used in win_create and in-place modification
     is happened. During the update, a mutex for local variable is acquired.
@@ -981,6 +1220,12 @@ def win_update(name: str,
             in-place change.
         require_mutex: If set to be true, the window mutex associated with local process will be
             acquired.
+        incremental: If set to be true, only the neighbor buffers whose version advanced since
+            the last update (see `get_win_version`) are read. Without reset, the weighted sum
+            of the other neighbors is reused from a cache, which keeps a copy of every neighbor
+            buffer. With reset, the other buffers are zero, so they are skipped. It helps when
+            the neighbors run at different speeds. Use it with require_mutex if the neighbors
+            may put concurrently, otherwise a concurrent put can be missed until the next one.
 
     Returns:
         torch.Tensor: The average tensor of all neighbors' cooresponding tensors.
@@ -1004,27 +1249,20 @@ def win_update(name: str,
         if not isinstance(self_weight, float):
             raise ValueError(
                 "Argument self_weight has to be a float for self rank.")
-        if not set(neighbor_weights.keys()).issubset(set(in_neighbor_ranks())):
+        if not neighbor_weights.keys() <= in_neighbor_set():
             raise ValueError("The key of weights should only contain the ranks that belong to "
                              " in-neighbors and self rank.")
         avg_computation = True
 
     elif neighbor_weights is None and self_weight is None:
-        if is_topo_weighted():
-            topology = load_topology()
-            self_weight, neighbor_weights = GetRecvWeights(topology, rank())
-            avg_computation = True
-        else:
-            weight = 1.0/(len(in_neighbor_ranks())+1)
-            self_weight = weight
-            neighbor_weights = {r: weight for r in in_neighbor_ranks()}
-            avg_computation = False
+        # The weights are cached when the topology is set.
+        self_weight, neighbor_weights, avg_computation = load_recv_weights()
     else:
         raise ValueError("Arguments self_weight and neighbor_weights have to be presented at "
                          "the same time")
 
     if not getattr(mpi_lib, function)(tensor, name, self_weight, neighbor_weights,
-                                      reset, avg_computation, require_mutex):
+                                      reset, avg_computation, require_mutex, incremental):
         raise RuntimeError("Cannot apply win_update on " + name)
     return tensor
 
@@ -1063,7 +1301,7 @@ def win_put_nonblocking(tensor: torch.Tensor, name: str,
                    if dst_weights is None else dst_weights)
     if self_weight is None:
         self_weight = 1.0
-    if not set(dst_weights.keys()).issubset(set(out_neighbor_ranks())):
+    if not dst_weights.keys() <= out_neighbor_set():
         raise ValueError(
             "The key of dst_weights should only contain ranks that "
             " belong to out-neighbors (self-rank is not allowed).")
@@ -1126,7 +1364,7 @@ def win_get_nonblocking(name: str, src_weights: Optional[Dict[int, float]] = Non
     function = "bluefog_torch_win_get"
     src_weights = ({rank: 1.0 for rank in in_neighbor_ranks()}
                    if src_weights is None else src_weights)
-    if not set(src_weights.keys()).issubset(set(in_neighbor_ranks())):
+    if not src_weights.keys() <= in_neighbor_set():
         raise ValueError(
             "The key of src_weights should only containranks that "
             " belong to in-neighbors.")
@@ -1198,7 +1436,7 @@ def win_accumulate_nonblocking(tensor: torch.Tensor, name: str,
                    if dst_weights is None else dst_weights)
     if self_weight is None:
         self_weight = 1.0
-    if not set(dst_weights.keys()).issubset(set(out_neighbor_ranks())):
+    if not dst_weights.keys() <= out_neighbor_set():
         raise ValueError(
             "The key of dst_weights should only containranks that "
             " belong to out-neighbors (self-rank is not allowed).")
@@ -1263,7 +1501,7 @@ def get_win_version(name: str) -> Dict[int, int]:
     Returns:
         A dictionary maps from neighbor ranks to version. 0 means the latest
         tensor stored in win buffer has been read/sync. Non-negative value
-        means the tensor has been updated through put or get before read/sync.
+        means the tensor has been updated through put, accumulate or get before read/sync.
     """
     versions = [0] * size()
     returned_versions = mpi_lib.bluefog_torch_get_win_version(name, versions)
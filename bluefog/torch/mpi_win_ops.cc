@@ -90,13 +90,24 @@ bool WinTorchStorageManager::RegisterWinName(
   int* destinations_ptr = nullptr;
   bluefog_load_topology(&in_neighbor_degree_, sources_ptr,
                         &out_neighbor_degree_, destinations_ptr);
-  // We need to allocate neighbor_indegree tensor space for it.
+  // We need to allocate neighbor_indegree tensor space for it. The neighbor
+  // tensors are the consecutive slots of one allocation so that they can be
+  // exposed through a single window.
+  ::torch::Tensor self_tensor = tensor->GetUnderlyingTensor();
+  std::vector<int64_t> buffer_shape = {in_neighbor_degree_};
+  buffer_shape.insert(buffer_shape.end(), self_tensor.sizes().begin(),
+                      self_tensor.sizes().end());
+  ::torch::Tensor buffer;
+  {
+    with_device device_context(device);
+    buffer = self_tensor.unsqueeze(0).expand(buffer_shape).clone(
+        ::torch::MemoryFormat::Contiguous);
+  }
+  if (zero_init) buffer.fill_(0.0);
   NeighborTable neighbor_tensors;
   for (int i = 0; i < in_neighbor_degree_; i++) {
-    std::shared_ptr<TorchTensor> t = tensor->MakeCopy(device);
-    if (zero_init) t->GetUnderlyingTensor().fill_(0.0);
     int source_rank = *(sources_ptr + i);
-    neighbor_tensors[source_rank] = t;
+    neighbor_tensors[source_rank] = std::make_shared<TorchTensor>(buffer[i]);
   }
   tensors_map_[name] = neighbor_tensors;
   self_tensor_map_[name] = tensor;
@@ -112,12 +123,14 @@ bool WinTorchStorageManager::UnregisterWinName(const std::string& name) {
   tensors_map_.erase(it);
   self_tensor_map_.erase(self_tensor_map_.find(name));
   device_map_.erase(device_map_.find(name));
+  cache_map_.erase(name);
   return true;
 }
 
 void WinTorchStorageManager::ClearAll() {
   tensors_map_.clear();
   self_tensor_map_.clear();
+  cache_map_.clear();
 }
 
 bool WinTorchStorageManager::GetStorageByname(
@@ -278,6 +291,67 @@ bool WinTorchStorageManager::AvgWithNeighbor(
   return true;
 }
 
+// The cached weighted sum is built again after this many incremental updates,
+// so that the rounding errors of the updates do not accumulate.
+static const int MAX_INCREMENTAL_UPDATES = 100;
+
+bool WinTorchStorageManager::NeedRebuildCache(
+    const std::string& name,
+    const std::unordered_map<int, double>& neighbor_weights) {
+  auto it = cache_map_.find(name);
+  return it == cache_map_.end() || it->second.weights != neighbor_weights ||
+         it->second.num_updates >= MAX_INCREMENTAL_UPDATES;
+}
+
+void WinTorchStorageManager::ClearCache(const std::string& name) {
+  cache_map_.erase(name);
+}
+
+bool WinTorchStorageManager::AvgWithCachedNeighbor(
+    const std::string& name, ::torch::Tensor local_tensor, double self_weight,
+    const std::unordered_map<int, double>& neighbor_weights,
+    const std::vector<int>& updated_ranks, bool rebuild,
+    bool associated_with_p) {
+  auto it = tensors_map_.find(name);
+  if (it == tensors_map_.end()) {
+    return false;
+  }
+  auto& neighbor_map = it->second;
+  WeightedSumCache& cache = cache_map_[name];
+  if (rebuild) {
+    cache.weights = neighbor_weights;
+    cache.snapshots.clear();
+    cache.weighted_sum = ::torch::zeros_like(local_tensor);
+    cache.num_updates = 0;
+    for (auto& kv : neighbor_weights) {
+      auto neighbor_tensor = neighbor_map.at(kv.first)->GetUnderlyingTensor();
+      cache.weighted_sum.add_(neighbor_tensor.mul(kv.second));
+      cache.snapshots[kv.first] = neighbor_tensor.clone();
+    }
+  } else {
+    // Replace the stale contribution of the updated neighbors only.
+    for (int rank : updated_ranks) {
+      auto neighbor_tensor = neighbor_map.at(rank)->GetUnderlyingTensor();
+      ::torch::Tensor& snapshot = cache.snapshots.at(rank);
+      cache.weighted_sum.add_((neighbor_tensor - snapshot).mul(cache.weights.at(rank)));
+      snapshot.copy_(neighbor_tensor);
+    }
+    cache.num_updates++;
+  }
+  local_tensor.mul_(self_weight).add_(cache.weighted_sum);
+
+  if (associated_with_p) {
+    double avg_p = GetWinAssociatedP(name) * self_weight;  // self value
+    for (auto& kv : neighbor_weights) {
+      double associated_p = 0.0;
+      common::GetWinAssociatedPByNameAndRank(name, kv.first, &associated_p);
+      avg_p += (associated_p * kv.second);
+    }
+    SetWinAssociatedP(name, avg_p);
+  }
+  return true;
+}
+
 void DoWinWait(int);
 
 int DoWinCreate(::torch::Tensor tensor, const std::string& name,
@@ -345,7 +419,8 @@ int ResetNeighborTensor(const std::string& name,
 int DoWinSync(::torch::Tensor tensor, const std::string& name,
               double self_weight,
               const std::unordered_map<int, double>& neighbor_weights,
-              bool reset, bool internal_avg, bool require_mutex) {
+              bool reset, bool internal_avg, bool require_mutex,
+              bool incremental) {
   ThrowIfError(common::CheckInitialized());
 
   Timeline* timeline_ptr;
@@ -359,7 +434,10 @@ int DoWinSync(::torch::Tensor tensor, const std::string& name,
   }
 
   // We need to lock self avoid updating and win_put/win_accumulate happen at
-  // simultaneous time.
+  // simultaneous time. With incremental, the mutexes are acquired before the
+  // versions are read, because WindowSync below clears the versions of all
+  // neighbors. Otherwise, a put landing in between would be neither read nor
+  // recorded in the versions.
   std::vector<int> neighbor_ranks;
   neighbor_ranks.reserve(neighbor_weights.size());
   for (auto& kv : neighbor_weights) {
@@ -368,6 +446,29 @@ int DoWinSync(::torch::Tensor tensor, const std::string& name,
   if (require_mutex)
     common::WindowMutexAcquire(name, neighbor_ranks, device, /*is_sync=*/true);
 
+  // With incremental, only the neighbors whose version advanced since the last
+  // update, i.e. that have put or been gotten since then, are read. Without
+  // reset, the others contribute the same as last time, which is cached. With
+  // reset, their tensors are zero, so they are skipped.
+  bool rebuild_cache = false;
+  std::vector<int> updated_ranks;
+  std::unordered_map<int, double> updated_weights;
+  if (incremental) {
+    std::vector<int> versions(common::bluefog_size(), 0);
+    bool version_known = common::GetWindowVersion(name, versions).ok();
+    rebuild_cache =
+        !reset && win_storage_manager.NeedRebuildCache(name, neighbor_weights);
+    for (auto& kv : neighbor_weights) {
+      if (!version_known || rebuild_cache || versions[kv.first] > 0) {
+        updated_ranks.push_back(kv.first);
+        updated_weights[kv.first] = kv.second;
+      }
+    }
+  } else {
+    // The neighbor tensors may be reset and the versions are cleared below.
+    win_storage_manager.ClearCache(name);
+  }
+
   bool associated_with_p = common::GetWinOpsWithAssociatedPState();
   Status status = common::WindowSync(name, device);
 
@@ -381,7 +482,23 @@ int DoWinSync(::torch::Tensor tensor, const std::string& name,
   // for the neighbors which may lead to efficiency and precision difference.
   // but when internal_avg is false, the results are only correct when all
   // weights are 1/(neighbor size+1).
-  if (internal_avg) {
+  if (incremental && !reset) {
+    if (!win_storage_manager.AvgWithCachedNeighbor(
+            name, tensor_buffer, self_weight, neighbor_weights, updated_ranks,
+            rebuild_cache, associated_with_p)) {
+      if (require_mutex)
+        common::WindowMutexRelease(name, neighbor_ranks, device, /*is_sync=*/true);
+      return 0;
+    }
+  } else if (incremental) {
+    // The reset tensors of the other neighbors contribute nothing.
+    if (!win_storage_manager.AvgWithNeighbor(name, tensor_buffer, self_weight,
+                                             updated_weights, associated_with_p)) {
+      if (require_mutex)
+        common::WindowMutexRelease(name, neighbor_ranks, device, /*is_sync=*/true);
+      return 0;
+    }
+  } else if (internal_avg) {
     // Weighted averaging with neighbors' tensors happens in-place.
     if (!win_storage_manager.AvgWithNeighbor(name, tensor_buffer, self_weight,
                                              neighbor_weights, associated_with_p)) {
@@ -405,7 +522,8 @@ int DoWinSync(::torch::Tensor tensor, const std::string& name,
     }
   }
 
-  if (reset && !ResetNeighborTensor(name, neighbor_weights, associated_with_p)) {
+  if (reset && !ResetNeighborTensor(name, incremental ? updated_weights : neighbor_weights,
+                                    associated_with_p)) {
     if (require_mutex)
       common::WindowMutexRelease(name, neighbor_ranks, device, /*is_sync=*/true);
     return 0;
@@ -673,15 +791,26 @@ void AddWinOpsIntoPybind(py::module& m) {
   m.def("bluefog_torch_win_create_torch_cuda_DoubleTensor", &DoWinCreate);
 #endif
 
-  m.def("bluefog_torch_win_sync_torch_IntTensor", &DoWinSync);
-  m.def("bluefog_torch_win_sync_torch_LongTensor", &DoWinSync);
-  m.def("bluefog_torch_win_sync_torch_FloatTensor", &DoWinSync);
-  m.def("bluefog_torch_win_sync_torch_DoubleTensor", &DoWinSync);
+  // The ops which may wait for the neighbors release the GIL, so other Python
+  // threads, e.g. the training thread of an asynchronous optimizer, keep
+  // running.
+  m.def("bluefog_torch_win_sync_torch_IntTensor", &DoWinSync,
+        py::call_guard<py::gil_scoped_release>());
+  m.def("bluefog_torch_win_sync_torch_LongTensor", &DoWinSync,
+        py::call_guard<py::gil_scoped_release>());
+  m.def("bluefog_torch_win_sync_torch_FloatTensor", &DoWinSync,
+        py::call_guard<py::gil_scoped_release>());
+  m.def("bluefog_torch_win_sync_torch_DoubleTensor", &DoWinSync,
+        py::call_guard<py::gil_scoped_release>());
 #if HAVE_CUDA
-  m.def("bluefog_torch_win_sync_torch_cuda_IntTensor", &DoWinSync);
-  m.def("bluefog_torch_win_sync_torch_cuda_LongTensor", &DoWinSync);
-  m.def("bluefog_torch_win_sync_torch_cuda_FloatTensor", &DoWinSync);
-  m.def("bluefog_torch_win_sync_torch_cuda_DoubleTensor", &DoWinSync);
+  m.def("bluefog_torch_win_sync_torch_cuda_IntTensor", &DoWinSync,
+        py::call_guard<py::gil_scoped_release>());
+  m.def("bluefog_torch_win_sync_torch_cuda_LongTensor", &DoWinSync,
+        py::call_guard<py::gil_scoped_release>());
+  m.def("bluefog_torch_win_sync_torch_cuda_FloatTensor", &DoWinSync,
+        py::call_guard<py::gil_scoped_release>());
+  m.def("bluefog_torch_win_sync_torch_cuda_DoubleTensor", &DoWinSync,
+        py::call_guard<py::gil_scoped_release>());
 #endif
 
   m.def("bluefog_torch_win_put_torch_IntTensor", &DoWinPut);
@@ -713,13 +842,16 @@ void AddWinOpsIntoPybind(py::module& m) {
   m.def("bluefog_torch_win_free", &DoWinFree);
   m.def("bluefog_torch_win_fence", &DoWinFence);
   m.def("bluefog_torch_win_poll", &DoWinPollHandle);
-  m.def("bluefog_torch_win_wait", &DoWinWait);
+  m.def("bluefog_torch_win_wait", &DoWinWait,
+        py::call_guard<py::gil_scoped_release>());
 
   m.def("bluefog_torch_win_lock", &DoWinLock);
   m.def("bluefog_torch_win_unlock", &DoWinUnlock);
 
-  m.def("bluefog_torch_win_mutex_acquire", &DoWinMutexAcquire);
-  m.def("bluefog_torch_win_mutex_release", &DoWinMutexRelease);
+  m.def("bluefog_torch_win_mutex_acquire", &DoWinMutexAcquire,
+        py::call_guard<py::gil_scoped_release>());
+  m.def("bluefog_torch_win_mutex_release", &DoWinMutexRelease,
+        py::call_guard<py::gil_scoped_release>());
 
   m.def("bluefog_torch_get_win_version", &GetWinVersion);
   
@@ -88,6 +88,26 @@ class WinTorchStorageManager {
                        const std::vector<int>& source_ranks,
                        bool associated_with_p);
 
+  // Weighted average the local tensor with neighbor tensors like
+  // AvgWithNeighbor, but only the neighbor tensors of updated_ranks are read.
+  // The weighted sum of the other neighbors is reused from the cache, which
+  // keeps a snapshot of every neighbor tensor. If rebuild is set, all neighbor
+  // tensors are read and the cache is built again.
+  bool AvgWithCachedNeighbor(
+      const std::string& name, ::torch::Tensor local_tensor, double self_weight,
+      const std::unordered_map<int, double>& neighbor_weights,
+      const std::vector<int>& updated_ranks, bool rebuild,
+      bool associated_with_p);
+
+  // Whether the cached weighted sum cannot be used with the neighbor_weights,
+  // i.e. it is not built, is built with other weights, or has been updated
+  // incrementally for too many times.
+  bool NeedRebuildCache(const std::string& name,
+                        const std::unordered_map<int, double>& neighbor_weights);
+
+  // Drop the cached weighted sum, e.g. after the neighbor tensors are reset.
+  void ClearCache(const std::string& name);
+
   // Clear all storage/reference to neighbor TorchTensor.
   void ClearAll();
 
@@ -104,6 +124,16 @@ class WinTorchStorageManager {
 
   std::unordered_map<std::string, int> device_map_;
 
+  // The cached weighted sum of the neighbor tensors used by the incremental
+  // win_update, with the snapshots of the neighbor tensors it is made of.
+  struct WeightedSumCache {
+    ::torch::Tensor weighted_sum;
+    std::unordered_map<int, double> weights;
+    std::unordered_map<int, ::torch::Tensor> snapshots;
+    int num_updates = 0;
+  };
+  std::unordered_map<std::string, WeightedSumCache> cache_map_;
+
   mutable std::mutex mutex_;
   int in_neighbor_degree_;
   int out_neighbor_degree_;
@@ -130,7 +160,8 @@ WIN_CREATE_H(torch_cuda_DoubleTensor, THCudaDoubleTensor)
       THTensor* tensor, char* name,                            \
       double self_weight,                                      \
       const std::unordered_map<int, double>& neighbor_weights, \
-      bool reset, bool internal_avg, bool require_mutex);
+      bool reset, bool internal_avg, bool require_mutex,      \
+      bool incremental);
 
 WIN_SYNC_H(torch_IntTensor, THIntTensor)
 WIN_SYNC_H(torch_LongTensor, THLongTensor)
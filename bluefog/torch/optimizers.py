@@ -15,8 +15,11 @@
 # ==============================================================================
 
 from contextlib import contextmanager
+import atexit
+import copy
 import itertools
 import os
+import threading
 import warnings
 
 import torch
@@ -136,8 +139,126 @@ def _register_timeline(optimizer, models, parameter_names, parent_name=None):
             *pre_forward_hook_handles, *forward_end_hook_handles]
 
 
+class _FlatBuffer:
+    """A contiguous buffer holding the parameters of the same dtype and device.
+
+    Every parameter (and its gradient if with_grad is set) is a view into the buffer. Hence the
+    buffer is communicated by a single op instead of one op per parameter, and nothing is copied
+    into or out of the fusion buffer.
+    """
+
+    def __init__(self, name, params, with_grad):
+        self.name = name
+        self.params = params
+        self.offsets = list(itertools.accumulate([0] + [p.numel() for p in params]))
+        with torch.no_grad():
+            self.data = torch.cat([p.data.reshape(-1) for p in params])
+        self.grad = torch.zeros_like(self.data) if with_grad else None
+        self.set_(self.data)
+        if with_grad:
+            self.attach_grads()
+
+    def _view(self, tensor, i):
+        return tensor[self.offsets[i]:self.offsets[i + 1]].view_as(self.params[i])
+
+    def set_(self, tensor):
+        """Rebind the parameters to the views into tensor, which has the layout of the buffer.
+        It is used in place of torch.Tensor.set_ for the result of the communication."""
+        self.data = tensor
+        for i, p in enumerate(self.params):
+            p.data = self._view(tensor, i)
+
+    def attach_grads(self):
+        """Make the gradients views into the buffer again, e.g. after they are set to None
+        by model.zero_grad()."""
+        for i, p in enumerate(self.params):
+            view = self._view(self.grad, i)
+            if p.grad is None:
+                view.zero_()
+                p.grad = view
+            elif p.grad.data_ptr() != view.data_ptr():
+                view.copy_(p.grad)
+                p.grad = view
+
+
+# Every call of _make_flat_buffers takes the next id, so the buffers of different optimizers
+# get different names. The optimizers are created in the same order on all ranks.
+_flat_buffer_ids = itertools.count()
+
+
+def _make_flat_buffers(params, with_grad=False):
+    """Group the parameters by dtype and device, keeping their order, into flat buffers."""
+    groups = {}
+    for p in params:
+        groups.setdefault((p.dtype, p.device), []).append(p)
+    prefix = "flat_buffer.{}".format(next(_flat_buffer_ids))
+    return [_FlatBuffer("{}.{}".format(prefix, i), ps, with_grad)
+            for i, ps in enumerate(groups.values())]
+
+
+def _compress_with_error_feedback(residuals, name, tensor, compression):
+    """Add the residual of the last compression to the tensor and compress it once. Return it
+    as the receivers will see it with the compression to pass to the ops, so that the error of
+    what is actually sent is kept and sent in the next communication instead of being lost."""
+    if compression is bf.Compression.none:
+        return tensor, compression
+    corrected = tensor + residuals[name] if name in residuals else tensor
+    compressed, compression = bf.compression.compress_once(compression, corrected)
+    residuals[name] = corrected - compressed
+    return compressed, compression
+
+
+class _AsyncWinWorker:
+    """A background thread running the rounds of communication of an asynchronous window
+    optimizer, so that the training thread never waits for the neighbors.
+
+    A round is requested by notify() and the requests made while a round is running are merged
+    into one. The lock guards the parameters, which are updated in place by both threads. It is
+    only held to copy the parameters from and to them, never during the communication.
+    """
+
+    def __init__(self, communicate):
+        self.lock = threading.Lock()
+        self._communicate = communicate
+        self._requested = threading.Event()
+        self._stopped = False
+        self._error = None
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        # Stop before bluefog shuts down, which is registered earlier.
+        atexit.register(self.stop)
+
+    def _loop(self):
+        while True:
+            self._requested.wait()
+            self._requested.clear()
+            if self._stopped:
+                return
+            try:
+                self._communicate()
+            except Exception as e:  # pylint: disable=broad-except
+                self._error = e
+                return
+
+    def raise_if_failed(self):
+        if self._error is not None:
+            raise RuntimeError("The background communication failed.") from self._error
+
+    def notify(self):
+        self.raise_if_failed()
+        self._requested.set()
+
+    def stop(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        self._requested.set()
+        self._thread.join()
+
+
 class _DistributedOptimizer(torch.optim.Optimizer):
-    def __init__(self, params, model, backward_passes_per_step=1):
+    def __init__(self, params, model, backward_passes_per_step=1, flat_buffer=False,
+                 compression=None):
         super(self.__class__, self).__init__(params)
 
         named_parameters, models = _check_named_parameters(self, model)
@@ -153,16 +274,31 @@ class _DistributedOptimizer(torch.optim.Optimizer):
         self._backward_passes_per_step = backward_passes_per_step
         self._allreduce_delay = {v: self._backward_passes_per_step
                                  for _, v in sorted(named_parameters)}
+        self._flat_buffer = flat_buffer
+        self._flat_buffers = []
+        self._flat_buffer_of = {}
+        self._flat_pending = {}
+        self._compression = compression if compression is not None else bf.Compression.none
+        self._residuals = {}
         if os.getenv('BLUEFOG_TIMELINE'):
             self.turn_on_timeline()
         if bf.size() > 1:
             self._register_hooks()
 
     def _register_hooks(self):
+        if self._flat_buffer:
+            self._flat_buffers = _make_flat_buffers(
+                [p for param_group in self.param_groups
+                 for p in param_group["params"] if p.requires_grad], with_grad=True)
+            for buf in self._flat_buffers:
+                self._flat_pending[buf] = len(buf.params)
+                for p in buf.params:
+                    self._flat_buffer_of[p] = buf
         for param_group in self.param_groups:
             for p in param_group["params"]:
                 if p.requires_grad:
-                    p.grad = p.data.new(p.size()).zero_()
+                    if not self._flat_buffer:
+                        p.grad = p.data.new(p.size()).zero_()
                     self._requires_update.add(p)
                     p_tmp = p.expand_as(p)
                     grad_acc = p_tmp.grad_fn.next_functions[0][0]
@@ -180,18 +316,52 @@ class _DistributedOptimizer(torch.optim.Optimizer):
                     "accumulate gradients locally.")
             self._allreduce_delay[p] -= 1
             if self._allreduce_delay[p] == 0:
-                handle = self._allreduce_grad_async(p)
-                self._handles[p] = handle
+                if self._flat_buffer:
+                    # Allreduce the whole buffer once all of its gradients are ready.
+                    buf = self._flat_buffer_of[p]
+                    self._flat_pending[buf] -= 1
+                    if self._flat_pending[buf] == 0:
+                        self._handles[buf] = self._allreduce_flat_grad_async(buf)
+                else:
+                    handle = self._allreduce_grad_async(p)
+                    self._handles[p] = handle
 
         return hook
 
     def _allreduce_grad_async(self, p):
         name = self._parameter_names.get(p)
+        grad, compression = _compress_with_error_feedback(self._residuals, name, p.grad,
+                                                          self._compression)
         handle = bf.allreduce_nonblocking(
-            p.grad, average=True, name=name
+            grad, average=True, name=name, compression=compression
         )
         return handle
 
+    def _allreduce_flat_grad_async(self, buf):
+        buf.attach_grads()
+        if self._compression is not bf.Compression.none:
+            # The compressed allreduce is not in-place. Its output is copied back to the
+            # gradient buffer in synchronize().
+            grad, compression = _compress_with_error_feedback(self._residuals, buf.name,
+                                                              buf.grad, self._compression)
+            return bf.allreduce_nonblocking(grad, average=True, name=buf.name,
+                                            compression=compression)
+        return bf.allreduce_nonblocking_(buf.grad, average=True, name=buf.name)
+
+    def _synchronize_flat_buffers(self):
+        for buf in self._flat_buffers:
+            if buf not in self._handles:
+                self._handles[buf] = self._allreduce_flat_grad_async(buf)
+
+        for buf, handle in self._handles.items():
+            output = bf.synchronize(handle)
+            if output is not buf.grad:
+                buf.grad.copy_(output)
+            self._flat_pending[buf] = len(buf.params)
+            for p in buf.params:
+                self._allreduce_delay[p] = self._backward_passes_per_step
+        self._handles.clear()
+
     def turn_on_timeline(self):
         handles = _register_timeline(
             self, self._models, self._parameter_names, 'allreduce')
@@ -205,6 +375,11 @@ class _DistributedOptimizer(torch.optim.Optimizer):
         self._use_timeline = False
 
     def synchronize(self):
+        if self._flat_buffer:
+            self._synchronize_flat_buffers()
+            self._synchronized = True
+            return
+
         missing_p = self._requires_update - set(self._handles.keys())
         for p in missing_p:
             handle = self._allreduce_grad_async(p)
@@ -265,6 +440,12 @@ class _DistributedOptimizer(torch.optim.Optimizer):
                 "but before optimizer.step() or optimizer.synchronize(). "
                 "This is prohibited as it can cause a race condition."
             )
+        if self._flat_buffers:
+            # Keep the gradients as views into the flat buffers instead of setting them to None.
+            for buf in self._flat_buffers:
+                buf.grad.zero_()
+                buf.attach_grads()
+            return None
         return super(self.__class__, self).zero_grad()
 
 class _DistributedReduceOptimizer(torch.optim.Optimizer):
@@ -291,7 +472,8 @@ class _DistributedReduceOptimizer(torch.optim.Optimizer):
         w_{i+1, k} = Neighbor_Average( w_{i, k} - lr * local_grad(w_{i, k}) )
     """
 
-    def __init__(self, params, model, reduce_type, num_steps_per_communication=1):
+    def __init__(self, params, model, reduce_type, num_steps_per_communication=1,
+                 flat_buffer=False, compression=None):
         super(self.__class__, self).__init__(params)
 
         named_parameters, models = _check_named_parameters(self, model)
@@ -302,6 +484,8 @@ class _DistributedReduceOptimizer(torch.optim.Optimizer):
         self.neighbor_machine_weights = None
         self.send_neighbor_machines = None
         self.enable_topo_check = False
+        # The sparse compression needs a step size as small as the ratio of the kept elements.
+        self.consensus_step_size = getattr(compression, "ratio", 1.0)
 
         self._models = models
         self._parameter_names = {v: k for k, v in sorted(named_parameters)}
@@ -325,12 +509,33 @@ class _DistributedReduceOptimizer(torch.optim.Optimizer):
 
         self._reduce_delay = {v: self._num_steps_per_communication
                               for _, v in sorted(named_parameters)}
+        self._flat_buffer = flat_buffer
+        self._flat_buffers = []
+        self._flat_buffer_of = {}
+        self._flat_pending = {}
+        self._compression = compression if compression is not None else bf.Compression.none
+        # Schema: name -> sum of the compressed differences sent, i.e. the parameter as the
+        # neighbors know it.
+        self._replicas = {}
+        # Schema: name -> the weighted average of the replicas of the rank and its neighbors.
+        self._replica_averages = {}
+        self._weights_signature = None
         if os.getenv('BLUEFOG_TIMELINE'):
             self.turn_on_timeline()
         if bf.size() > 1:
             self._register_hooks()
 
     def _register_hooks(self):
+        if self._flat_buffer:
+            self._flat_buffers = _make_flat_buffers(
+                [p for param_group in self.param_groups
+                 for p in param_group["params"] if p.requires_grad])
+            for buf in self._flat_buffers:
+                # The reduce functions look up the name of the buffer as a parameter.
+                self._parameter_names[buf] = buf.name
+                self._flat_pending[buf] = len(buf.params)
+                for p in buf.params:
+                    self._flat_buffer_of[p] = buf
         for model in self._models:
             for parent_name, layer in _named_leaf_module(model):
                 layer.register_forward_hook(self._make_hook(parent_name))
@@ -354,40 +559,95 @@ class _DistributedReduceOptimizer(torch.optim.Optimizer):
                             "accumulate gradients locally.")
                     self._reduce_delay[p] -= 1
                     if self._reduce_delay[p] == 0:
-                        if self._reduce_method == 0:
-                            handle = self._allreduce_data_async(p)
-                        elif self._reduce_method == 1:
-                            handle = self._neighbor_allreduce_data_async(p)
-                        elif self._reduce_method == 2:
-                            handle = self._hierarchical_neighbor_allreduce_data_async(p)
-                        elif self._reduce_method == -1:
-                            handle = None
+                        if self._flat_buffer:
+                            # Reduce the whole buffer once all of its parameters are ready.
+                            buf = self._flat_buffer_of[p]
+                            self._flat_pending[buf] -= 1
+                            if self._flat_pending[buf] == 0:
+                                self._handles[buf] = self._reduce_data_async(buf)
                         else:
-                            raise ValueError(
-                                "Unknown reduce method. Do not change _reduce_method manually.")
-                        self._handles[p] = handle
+                            self._handles[p] = self._reduce_data_async(p)
         return hook
 
+    def _reduce_data_async(self, p):
+        if self._reduce_method == 0:
+            handle = self._allreduce_data_async(p)
+        elif self._reduce_method == 1:
+            handle = self._neighbor_allreduce_data_async(p)
+        elif self._reduce_method == 2:
+            handle = self._hierarchical_neighbor_allreduce_data_async(p)
+        elif self._reduce_method == -1:
+            handle = None
+        else:
+            raise ValueError(
+                "Unknown reduce method. Do not change _reduce_method manually.")
+        return handle
+
+    def _check_fixed_weights(self):
+        signature = (self._reduce_method, self.self_weight, self.neighbor_weights,
+                     self.send_neighbors, self.neighbor_machine_weights,
+                     self.send_neighbor_machines)
+        if self._weights_signature is None:
+            self._weights_signature = copy.deepcopy(signature)
+        elif signature != self._weights_signature:
+            raise ValueError("The reduce method, weights and neighbors cannot be changed with "
+                             "the compression, which averages the replicas of the parameters "
+                             "with the same weights in every communication.")
+
+    def _compress_data(self, p, name):
+        """Return the data to communicate for the parameter and the compression to pass to the
+        ops. With the compression, the parameter is not sent, but the compressed difference
+        from its replica, which is added to the replica on all ranks (CHOCO-SGD). Hence the
+        compression error is corrected in the next communication and does not accumulate."""
+        if self._compression is bf.Compression.none:
+            return p.data, self._compression
+        self._check_fixed_weights()
+        if name not in self._replicas:
+            # The first communication is not compressed, which starts the replicas.
+            self._replicas[name] = p.data.clone()
+            return p.data, bf.Compression.none
+        difference, compression = bf.compression.compress_once(
+            self._compression, p.data - self._replicas[name])
+        self._replicas[name].add_(difference)
+        return difference, compression
+
+    def _consensus_step(self, p, output):
+        """Move the parameter towards the weighted average of the replicas, given the weighted
+        average of the data sent by _compress_data."""
+        name = self._parameter_names.get(p)
+        if name in self._replica_averages:
+            self._replica_averages[name].add_(output)
+        else:
+            self._replica_averages[name] = output.clone()
+        step = self._replica_averages[name] - self._replicas[name]
+        return p.data + step.mul_(self.consensus_step_size)
+
     def _neighbor_allreduce_data_async(self, p):
         name = self._parameter_names.get(p)
-        handle = bf.neighbor_allreduce_nonblocking(p.data, name=name, self_weight=self.self_weight,
+        data, compression = self._compress_data(p, name)
+        handle = bf.neighbor_allreduce_nonblocking(data, name=name, self_weight=self.self_weight,
                                                    neighbor_weights=self.neighbor_weights,
                                                    send_neighbors=self.send_neighbors,
-                                                   enable_topo_check=self.enable_topo_check)
+                                                   enable_topo_check=self.enable_topo_check,
+                                                   compression=compression)
         return handle
 
     def _hierarchical_neighbor_allreduce_data_async(self, p):
         name = self._parameter_names.get(p)
+        data, compression = self._compress_data(p, name)
         handle = bf.hierarchical_neighbor_allreduce_nonblocking(
-            p.data, name=name, self_weight=self.self_weight,
+            data, name=name, self_weight=self.self_weight,
             neighbor_machine_weights=self.neighbor_machine_weights,
             send_neighbor_machines=self.send_neighbor_machines,
-            enable_topo_check=self.enable_topo_check)
+            enable_topo_check=self.enable_topo_check,
+            compression=compression)
         return handle
 
     def _allreduce_data_async(self, p):
         name = self._parameter_names.get(p)
-        handle = bf.allreduce_nonblocking(p.data, average=True, name=name)
+        data, compression = self._compress_data(p, name)
+        handle = bf.allreduce_nonblocking(data, average=True, name=name,
+                                          compression=compression)
         return handle
 
     def turn_on_timeline(self):
@@ -419,8 +679,15 @@ class _DistributedReduceOptimizer(torch.optim.Optimizer):
             for p, handle in self._handles.items():
                 if handle is not None:
                     output = bf.synchronize(handle)
+                    if self._compression is not bf.Compression.none:
+                        output = self._consensus_step(p, output)
                     p.set_(output)
-                self._reduce_delay[p] = self._num_steps_per_communication
+                if isinstance(p, _FlatBuffer):
+                    self._flat_pending[p] = len(p.params)
+                    for param in p.params:
+                        self._reduce_delay[param] = self._num_steps_per_communication
+                else:
+                    self._reduce_delay[p] = self._num_steps_per_communication
         self._handles.clear()
 
         self._synchronized = True
@@ -464,14 +731,21 @@ class _DistributedReduceOptimizer(torch.optim.Optimizer):
 
 class _DistributedWinOptimizer(torch.optim.Optimizer):
 
-    def __init__(self, params, model, num_steps_per_communication, pull_style):
+    def __init__(self, params, model, num_steps_per_communication, pull_style,
+                 flat_buffer=False, asynchronous=False, max_staleness=None):
         super(self.__class__, self).__init__(params)
 
+        if max_staleness is not None and (not asynchronous or max_staleness < 0):
+            raise ValueError("Argument max_staleness has to be a non-negative integer used "
+                             "with asynchronous=True.")
+
         if pull_style:
             self.src_weights = None # use to control the behavior of win_get dynamically.
         else:
             self.dst_weights = None # use to control the behavior of win_put dynamically.
         self.force_barrier = False
+        # If set, win_update only reads the neighbors that have updated the window.
+        self.incremental_update = False
 
         named_parameters, models = _check_named_parameters(self, model)
         self._models = models
@@ -484,12 +758,24 @@ class _DistributedWinOptimizer(torch.optim.Optimizer):
         self._num_steps_per_communication = num_steps_per_communication
         self._bluefog_delay = {v: self._num_steps_per_communication
                                for _, v in sorted(named_parameters)}
+        self._flat_buffer = flat_buffer
+        self._flat_buffers = []
+        self._flat_buffer_of = {}
+        self._flat_pending = {}
+        self._windows = []  # store (name, tensor) of the windows
+        self._max_staleness = max_staleness
+        self._staleness = {}  # store name -> {rank: rounds since the buffer was written}
+        self._async_worker = None
+        self._async_steps = 0
         self._timeline_hook_handles = []
         if os.getenv('BLUEFOG_TIMELINE'):
             self.turn_on_timeline()
         if bf.size() > 1:
             self._register_window()
-            self._register_hooks()
+            if asynchronous:
+                self._async_worker = _AsyncWinWorker(self._communicate_async)
+            else:
+                self._register_hooks()
 
     def _register_hooks(self):
         for model in self._models:
@@ -517,6 +803,15 @@ class _DistributedWinOptimizer(torch.optim.Optimizer):
                             "accumulate gradients locally.")
                     self._bluefog_delay[p] -= 1
                     if self._bluefog_delay[p] == 0:
+                        if self._flat_buffer:
+                            # Put the whole buffer once all of its parameters are ready.
+                            buf = self._flat_buffer_of[p]
+                            self._flat_pending[buf] -= 1
+                            if self._flat_pending[buf] == 0:
+                                self._handles[buf] = bf.win_put_nonblocking(
+                                    tensor=buf.data, name=buf.name,
+                                    dst_weights=self.dst_weights, require_mutex=False)
+                            continue
                         handle = bf.win_put_nonblocking(
                             tensor=p.data, name=parent_name+'.'+name,
                             dst_weights=self.dst_weights, require_mutex=False)
@@ -540,6 +835,15 @@ class _DistributedWinOptimizer(torch.optim.Optimizer):
                             "accumulate gradients locally.")
                     self._bluefog_delay[p] -= 1
                     if self._bluefog_delay[p] == 0:
+                        if self._flat_buffer:
+                            # Get the whole buffer once all of its parameters are ready.
+                            buf = self._flat_buffer_of[p]
+                            self._flat_pending[buf] -= 1
+                            if self._flat_pending[buf] == 0:
+                                self._handles[buf] = bf.win_get_nonblocking(
+                                    name=buf.name, src_weights=self.src_weights,
+                                    require_mutex=True)
+                            continue
                         handle = bf.win_get_nonblocking(
                             name=parent_name+'.'+name, src_weights=self.src_weights,
                             require_mutex=True)
@@ -547,6 +851,20 @@ class _DistributedWinOptimizer(torch.optim.Optimizer):
         return hook
 
     def _register_window(self):
+        if self._flat_buffer:
+            # The parameters are views into the buffers, which are the memory of the windows.
+            self._flat_buffers = _make_flat_buffers(
+                [p for param_group in self.param_groups
+                 for p in param_group["params"] if p.requires_grad])
+            for buf in self._flat_buffers:
+                self._flat_pending[buf] = len(buf.params)
+                for p in buf.params:
+                    self._flat_buffer_of[p] = buf
+                if not bf.win_create(buf.data, buf.name):
+                    raise ValueError(
+                        "Cannot allocate MPI window for the flat buffer {}".format(buf.name))
+                self._windows.append((buf.name, buf.data))
+            return
         for param_group in self.param_groups:
             for p in param_group["params"]:
                 name = self._parameter_names.get(p)
@@ -556,6 +874,52 @@ class _DistributedWinOptimizer(torch.optim.Optimizer):
                 if not bf.win_create(p.data, name):
                     raise ValueError(
                         "Cannot allocate MPI window for the parameter {}".format(name))
+                self._windows.append((name, p.data))
+
+    def _recv_weights_within_staleness(self, name):
+        """Count the rounds since each neighbor buffer was last written, through the window
+        versions, and return the weights of win_update that leave out the neighbors staler
+        than max_staleness. Their weights go to self. It has to be called while holding the
+        self mutexes of the window until the update, which clears the versions.
+        """
+        self_weight, neighbor_weights, _ = bf.load_recv_weights()
+        self_weight, neighbor_weights = float(self_weight), dict(neighbor_weights)
+        if self._max_staleness is None:
+            return self_weight, neighbor_weights
+        staleness = self._staleness.setdefault(name, {})
+        for rank, version in bf.get_win_version(name).items():
+            staleness[rank] = 0 if version > 0 else staleness.get(rank, 0) + 1
+        for rank, rank_staleness in staleness.items():
+            if rank_staleness > self._max_staleness:
+                self_weight += neighbor_weights.pop(rank, 0.0)
+        return self_weight, neighbor_weights
+
+    @torch.no_grad()
+    def _communicate_async(self):
+        for name, tensor in self._windows:
+            if self._pull_style:
+                bf.win_get(name=name, src_weights=self.src_weights, require_mutex=True)
+            else:
+                with self._async_worker.lock:
+                    sent_tensor = tensor.clone()
+                bf.win_put(tensor=sent_tensor, name=name, dst_weights=self.dst_weights,
+                           require_mutex=True)
+            # The neighbor part of the average is computed into a new tensor without the lock,
+            # so step() doesn't wait for the neighbors.
+            with bf.win_mutex(name, for_self=True, ranks=bf.in_neighbor_ranks()):
+                self_weight, neighbor_weights = self._recv_weights_within_staleness(name)
+                neighbor_part = bf.win_update(name=name, self_weight=0.0,
+                                              neighbor_weights=neighbor_weights, clone=True,
+                                              incremental=self.incremental_update)
+            with self._async_worker.lock:
+                # The window tensor is the parameter (or the flat buffer) updated in place.
+                tensor.mul_(self_weight).add_(neighbor_part)
+
+    def stop_communication(self):
+        """Stop the background communication of the asynchronous mode. The parameters are not
+        averaged with the neighbors afterwards."""
+        if self._async_worker is not None:
+            self._async_worker.stop()
 
     def turn_on_timeline(self):
         handles = _register_timeline(self, self._models, self._parameter_names)
@@ -594,10 +958,19 @@ class _DistributedWinOptimizer(torch.optim.Optimizer):
         with torch.no_grad():
             for p, handle in self._handles.items():
                 _ = bf.win_wait(handle)
+                if isinstance(p, _FlatBuffer):
+                    self._flat_pending[p] = len(p.params)
+                    for param in p.params:
+                        self._bluefog_delay[param] = self._num_steps_per_communication
+                    # One update of the window averages all the parameters in the buffer.
+                    p.set_(bf.win_update(name=p.name, require_mutex=True,
+                                         incremental=self.incremental_update))
+                    continue
                 name = self._parameter_names.get(p)
                 self._bluefog_delay[p] = self._num_steps_per_communication
                 # Update p to the average of neighbors.
-                p.set_(bf.win_update(name=name, require_mutex=True))
+                p.set_(bf.win_update(name=name, require_mutex=True,
+                                     incremental=self.incremental_update))
 
         self._handles.clear()
         self._synchronized = True
@@ -605,6 +978,15 @@ class _DistributedWinOptimizer(torch.optim.Optimizer):
     def step(self, closure=None):
         if self.force_barrier:
             bf.barrier()
+        if self._async_worker is not None:
+            # Only the local update is done here. The communication runs in the background.
+            self._async_worker.raise_if_failed()
+            with self._async_worker.lock:
+                loss = super(self.__class__, self).step(closure)
+            self._async_steps += 1
+            if self._async_steps % self._num_steps_per_communication == 0:
+                self._async_worker.notify()
+            return loss
         # some validation here?
         if self._should_synchronize:
             if self._synchronized:
@@ -623,7 +1005,8 @@ class _DistributedWinOptimizer(torch.optim.Optimizer):
 
 class _DistributedPushSumOptimizer(torch.optim.Optimizer):
 
-    def __init__(self, params, model, num_steps_per_communication):
+    def __init__(self, params, model, num_steps_per_communication, flat_buffer=False,
+                 asynchronous=False):
         super(self.__class__, self).__init__(params)
 
         # use to control the behavior of win_accumulate dynamically.
@@ -631,7 +1014,9 @@ class _DistributedPushSumOptimizer(torch.optim.Optimizer):
         self.dst_weights = {rank: 1.0 / (outdegree + 1)
                             for rank in bf.out_neighbor_ranks()}
         self.self_weight = 1.0 / (outdegree + 1)
-        self.force_barrier = True
+        self.force_barrier = not asynchronous
+        # If set, the neighbors that have not accumulated since the last step are skipped.
+        self.incremental_update = False
 
         named_parameters, models = _check_named_parameters(self, model)
         self._models = models
@@ -645,13 +1030,44 @@ class _DistributedPushSumOptimizer(torch.optim.Optimizer):
         self._num_steps_per_communication = num_steps_per_communication
         self._pushsum_delay = {v: self._num_steps_per_communication
                                for _, v in sorted(named_parameters)}
+        self._flat_buffer = flat_buffer
+        self._flat_buffers = []
+        self._flat_buffer_of = {}
+        self._flat_pending = {}
+        self._flat_send_tensors = {}
+        self._async_worker = None
+        self._async_steps = 0
+        self._async_ps_weights = {}  # store name -> push_sum weight of the asynchronous mode
         self._timeline_hook_handles = []
         if bf.size() > 1:
             self._register_window()
-            self._register_hooks()
+            if asynchronous:
+                self._async_worker = _AsyncWinWorker(self._communicate_async)
+            else:
+                self._register_hooks()
 
     @torch.no_grad()
     def _register_window(self):
+        if self._flat_buffer:
+            self._flat_buffers = _make_flat_buffers(
+                [p for param_group in self.param_groups
+                 for p in param_group["params"] if p.requires_grad])
+            for buf in self._flat_buffers:
+                self._flat_pending[buf] = len(buf.params)
+                for p in buf.params:
+                    self._flat_buffer_of[p] = buf
+                ps_weights = torch.ones(1, dtype=buf.data.dtype, device=buf.data.device)
+                # The parameters are views into the sent tensor, whose last element is the
+                # push_sum weight, so nothing is concatenated in each step.
+                send_tensor = torch.cat((buf.data, ps_weights), 0)
+                buf.set_(send_tensor[:-1])
+                self._flat_send_tensors[buf] = send_tensor
+                extended_parameter = send_tensor.clone()
+                self._named_extension_parameters[buf.name] = extended_parameter
+                if not bf.win_create(extended_parameter, buf.name, zero_init=True):
+                    raise ValueError(
+                        "Cannot allocate MPI window for the flat buffer {}".format(buf.name))
+            return
         for param_group in self.param_groups:
             for p in param_group["params"]:
                 name = self._parameter_names.get(p)
@@ -669,6 +1085,38 @@ class _DistributedPushSumOptimizer(torch.optim.Optimizer):
                     raise ValueError(
                         "Cannot allocate MPI window for the parameter {}".format(name))
 
+    @torch.no_grad()
+    def _communicate_async(self):
+        # The mass of a late neighbor is collected once it arrives, so no neighbor is left out
+        # for the staleness as in the averaging window optimizers. The windows only receive the
+        # mass of the neighbors, while self keeps the parameters and the push_sum weight, since
+        # the parameters move locally between the rounds.
+        windows = ([(buf.name, buf) for buf in self._flat_buffers] if self._flat_buffer else
+                   [(self._parameter_names[p], p)
+                    for param_group in self.param_groups for p in param_group["params"]])
+        received_weights = {r: 1.0 for r in bf.in_neighbor_ranks()}
+        for name, p in windows:
+            ps_weight = self._async_ps_weights.get(name, 1.0)
+            with self._async_worker.lock:
+                sent_tensor = torch.cat((p.data.view(-1), p.data.new_ones(1))).mul_(ps_weight)
+            bf.win_accumulate(tensor=sent_tensor, name=name, dst_weights=self.dst_weights,
+                              require_mutex=True)
+            received = bf.win_update(name=name, self_weight=0.0,
+                                     neighbor_weights=received_weights, reset=True, clone=True,
+                                     require_mutex=True, incremental=self.incremental_update)
+            with self._async_worker.lock:
+                extended_parameter = torch.cat((p.data.view(-1), p.data.new_ones(1)))
+                extended_parameter.mul_(ps_weight * self.self_weight).add_(received)
+                # Update the parameters in place, which the training thread is using.
+                p.data.copy_((extended_parameter[:-1] / extended_parameter[-1]).view_as(p.data))
+            self._async_ps_weights[name] = extended_parameter[-1].item()
+
+    def stop_communication(self):
+        """Stop the background communication of the asynchronous mode. The parameters are not
+        averaged with the neighbors afterwards."""
+        if self._async_worker is not None:
+            self._async_worker.stop()
+
     def _register_hooks(self):
         for model in self._models:
             for parent_name, layer in _named_leaf_module(model):
@@ -692,6 +1140,16 @@ class _DistributedPushSumOptimizer(torch.optim.Optimizer):
                             "accumulate gradients locally.")
                     self._pushsum_delay[p] -= 1
                     if self._pushsum_delay[p] == 0:
+                        if self._flat_buffer:
+                            # Accumulate the whole buffer once all of its parameters are ready.
+                            buf = self._flat_buffer_of[p]
+                            self._flat_pending[buf] -= 1
+                            if self._flat_pending[buf] == 0:
+                                self._handles[buf] = bf.win_accumulate_nonblocking(
+                                    tensor=self._flat_send_tensors[buf], name=buf.name,
+                                    dst_weights=self.dst_weights,
+                                    require_mutex=True)
+                            continue
                         ps_weights = self._named_ps_weights[full_name]
                         extended_parameter = torch.cat((p.data.view(-1), ps_weights), 0)
                         self._named_extension_parameters[name] = extended_parameter
@@ -739,12 +1197,24 @@ class _DistributedPushSumOptimizer(torch.optim.Optimizer):
         with torch.no_grad():
             for p, handle in self._handles.items():
                 _ = bf.win_wait(handle)
+                if isinstance(p, _FlatBuffer):
+                    self._flat_pending[p] = len(p.params)
+                    for param in p.params:
+                        self._pushsum_delay[param] = self._num_steps_per_communication
+                    extended_parameter = self._named_extension_parameters[p.name]
+                    extended_parameter.mul_(self.self_weight)
+                    extended_parameter = bf.win_update_then_collect(
+                        name=p.name, incremental=self.incremental_update)
+                    # Update the parameters in the buffer to the average of neighbors in place.
+                    p.data.copy_(extended_parameter[:-1] / extended_parameter[-1])
+                    continue
                 name = self._parameter_names.get(p)
                 self._pushsum_delay[p] = self._num_steps_per_communication
                 extended_parameter = self._named_extension_parameters[name]
                 extended_parameter.mul_(self.self_weight)
                 # Last dimension is the push_sum weights and we want parameter / weight
-                extended_parameter = bf.win_update_then_collect(name=name)
+                extended_parameter = bf.win_update_then_collect(
+                    name=name, incremental=self.incremental_update)
                 corrected_parameter = (
                     extended_parameter[:-1] / extended_parameter[-1]).reshape(p.shape)
                 # Update p to the average of neighbors.
@@ -756,6 +1226,15 @@ class _DistributedPushSumOptimizer(torch.optim.Optimizer):
     def step(self, closure=None):
         if self.force_barrier:
             bf.barrier()
+        if self._async_worker is not None:
+            # Only the local update is done here. The communication runs in the background.
+            self._async_worker.raise_if_failed()
+            with self._async_worker.lock:
+                loss = super(self.__class__, self).step(closure)
+            self._async_steps += 1
+            if self._async_steps % self._num_steps_per_communication == 0:
+                self._async_worker.notify()
+            return loss
         # some validation here?
         if self._should_synchronize:
             if self._synchronized:
@@ -774,7 +1253,8 @@ class _DistributedPushSumOptimizer(torch.optim.Optimizer):
 
 
 def DistributedPushSumOptimizer(optimizer, model,
-                                num_steps_per_communication=1):
+                                num_steps_per_communication=1, flat_buffer=False,
+                                asynchronous=False):
     """
     An distributed optimizer that wraps another torch.optim.Optimizer through
     win_accumulate ops to implement the gradient push algorithm.
@@ -790,6 +1270,15 @@ def DistributedPushSumOptimizer(optimizer, model,
                                      communication. This allows local model parameter updates
                                      per num_steps_per_communication before reducing them over
                                      distributed computation resources.
+        flat_buffer: If set, the parameters of the same dtype and device are packed into one
+                     contiguous buffer as views, which is registered as a single window. Each
+                     step then communicates with one win_accumulate per neighbor and one window
+                     update instead of one per parameter.
+        asynchronous: If set, the parameters are accumulated to the neighbors and collected by
+                      a background thread, which is notified every num_steps_per_communication
+                      steps. step() only updates the parameters locally and never waits for the
+                      neighbors, and force_barrier is off by default. Call
+                      `stop_communication()` before freeing the windows.
 
     Example for two scenarios to use num_steps_per_communication:
         Scenario 1) Local accumulation of gradient without update model.
@@ -815,11 +1304,13 @@ def DistributedPushSumOptimizer(optimizer, model,
         (optimizer.__class__,),
         dict(_DistributedPushSumOptimizer.__dict__),
     )
-    return cls(optimizer.param_groups, model, num_steps_per_communication)
+    return cls(optimizer.param_groups, model, num_steps_per_communication, flat_buffer,
+               asynchronous)
 
 
 def DistributedPullGetOptimizer(optimizer, model,
-                                num_steps_per_communication=1):
+                                num_steps_per_communication=1, flat_buffer=False,
+                                asynchronous=False):
     """
     An distributed optimizer that wraps another torch.optim.Optimizer with
     pull model average through bf.win_get ops.
@@ -831,6 +1322,15 @@ def DistributedPullGetOptimizer(optimizer, model,
                                      communication. This allows local model parameter updates
                                      per num_steps_per_communication before reducing them over
                                      distributed computation resources.
+        flat_buffer: If set, the parameters of the same dtype and device are packed into one
+                     contiguous buffer as views, which is registered as a single window. Each
+                     step then communicates with one win_get per neighbor and one window update
+                     instead of one per parameter.
+        asynchronous: If set, the parameters are pushed to (or pulled from) the neighbors and
+                      averaged by a background thread, which is notified every
+                      num_steps_per_communication steps. step() only updates the parameters
+                      locally and never waits for the neighbors. Call `stop_communication()`
+                      before freeing the windows.
 
     Example for two scenarios to use num_steps_per_communication:
         Scenario 1) Local accumulation of gradient without update model.
@@ -851,21 +1351,25 @@ def DistributedPullGetOptimizer(optimizer, model,
         >>>     loss.backward()
         >>>     opt.step()  # PullGet communication happens at the last iteration
 
-    Returned optimizer has two extra parameters `src_weights` and `force_barrier`.
-    Set src_weights dictionary as {rank: scaling} differently per iteration to achieve
-    win_get over dynamic graph behavior. If force_barrier is True, a barrier function
-    will put at `step()` to synchronous processes.
+    Returned optimizer has three extra parameters `src_weights`, `force_barrier` and
+    `incremental_update`. Set src_weights dictionary as {rank: scaling} differently per
+    iteration to achieve win_get over dynamic graph behavior. If force_barrier is True, a
+    barrier function will put at `step()` to synchronous processes. If incremental_update
+    is True, the update only reads the neighbors whose window version advanced, see
+    `win_update`.
     """
     cls = type(
         optimizer.__class__.__name__,
         (optimizer.__class__,),
         dict(_DistributedWinOptimizer.__dict__),
     )
-    return cls(optimizer.param_groups, model, num_steps_per_communication, pull_style=True)
+    return cls(optimizer.param_groups, model, num_steps_per_communication, pull_style=True,
+               flat_buffer=flat_buffer, asynchronous=asynchronous)
 
 
 def DistributedWinPutOptimizer(optimizer, model,
-                               num_steps_per_communication=1):
+                               num_steps_per_communication=1, flat_buffer=False,
+                               asynchronous=False, max_staleness=None):
     """An distributed optimizer that wraps another torch.optim.Optimizer with
     pull model average through bf.win_put ops.
 
@@ -876,11 +1380,26 @@ def DistributedWinPutOptimizer(optimizer, model,
                                      communication. This allows local model parameter updates
                                      per num_steps_per_communication before reducing them over
                                      distributed computation resources.
-
-    Returned optimizer has two extra parameters `dst_weights` and `force_barrier`.
-    Set dst_weights dictionary as {rank: scaling} differently per iteration to achieve
-    win_put over dynamic graph behavior. If force_barrier is True, a barrier function
-    will put at `step()` to synchronous processes.
+        flat_buffer: If set, the parameters of the same dtype and device are packed into one
+                     contiguous buffer as views, which is registered as a single window. Each
+                     step then communicates with one win_put per neighbor and one window update
+                     instead of one per parameter.
+        asynchronous: If set, the parameters are pushed to (or pulled from) the neighbors and
+                      averaged by a background thread, which is notified every
+                      num_steps_per_communication steps. step() only updates the parameters
+                      locally and never waits for the neighbors. Call `stop_communication()`
+                      before freeing the windows.
+        max_staleness: Used with asynchronous. A neighbor whose buffer has not been written for
+                       more than max_staleness rounds, counted through the window versions, is
+                       left out of the average and its weight goes to self. None means the
+                       neighbors are never left out.
+
+    Returned optimizer has three extra parameters `dst_weights`, `force_barrier` and
+    `incremental_update`. Set dst_weights dictionary as {rank: scaling} differently per
+    iteration to achieve win_put over dynamic graph behavior. If force_barrier is True, a
+    barrier function will put at `step()` to synchronous processes. If incremental_update
+    is True, the update only reads the neighbors whose window version advanced, see
+    `win_update`.
     """
     # We dynamically create a new class that inherits from the optimizer that was passed in.
     # The goal is to override the `step()` method.
@@ -889,11 +1408,13 @@ def DistributedWinPutOptimizer(optimizer, model,
         (optimizer.__class__,),
         dict(_DistributedWinOptimizer.__dict__),
     )
-    return cls(optimizer.param_groups, model, num_steps_per_communication, pull_style=False)
+    return cls(optimizer.param_groups, model, num_steps_per_communication, pull_style=False,
+               flat_buffer=flat_buffer, asynchronous=asynchronous, max_staleness=max_staleness)
 
 
 def DistributedAllreduceOptimizer(optimizer, model,
-                                  num_steps_per_communication=1):
+                                  num_steps_per_communication=1, flat_buffer=False,
+                                  compression=None):
     """
     An distributed optimizer that wraps another torch.optim.Optimizer through allreduce ops.
     The communication for allreduce is applied on the parameters when forward propagation happens.
@@ -905,6 +1426,15 @@ def DistributedAllreduceOptimizer(optimizer, model,
                                      communication. This allows local model parameter updates
                                      per num_steps_per_communication before reducing them over
                                      distributed computation resources.
+        flat_buffer: If set, the parameters of the same dtype and device are packed into one
+                     contiguous buffer as views, which is communicated by a single op per step
+                     without any copy into the fusion buffer.
+        compression: Compression algorithm used to reduce the amount of data sent, e.g.
+                     bf.Compression.fp16. The compressed difference between the parameters
+                     and their replica, which sums up what was sent before, is communicated
+                     (CHOCO-SGD). The parameters move towards the average of the replicas by
+                     the `consensus_step_size` attribute, which is the ratio of
+                     bf.Compression.topk and 1 otherwise. The weights have to be fixed.
 
     Example for two scenarios to use num_steps_per_communication.
         Scenario 1) Local accumulation of gradient without update model.
@@ -937,11 +1467,13 @@ def DistributedAllreduceOptimizer(optimizer, model,
         (optimizer.__class__,),
         dict(_DistributedReduceOptimizer.__dict__),
     )
-    return cls(optimizer.param_groups, model, "allreduce", num_steps_per_communication)
+    return cls(optimizer.param_groups, model, "allreduce", num_steps_per_communication,
+               flat_buffer, compression)
 
 
 def DistributedNeighborAllreduceOptimizer(optimizer, model,
-                                          num_steps_per_communication=1):
+                                          num_steps_per_communication=1, flat_buffer=False,
+                                          compression=None):
     """
     An distributed optimizer that wraps another torch.optim.Optimizer through
     neighbor_allreduce ops over parameters.
@@ -957,6 +1489,15 @@ def DistributedNeighborAllreduceOptimizer(optimizer, model,
                                      communication. This allows local model parameter updates
                                      per num_steps_per_communication before reducing them over
                                      distributed computation resources.
+        flat_buffer: If set, the parameters of the same dtype and device are packed into one
+                     contiguous buffer as views, which is communicated by a single op per step
+                     without any copy into the fusion buffer.
+        compression: Compression algorithm used to reduce the amount of data sent, e.g.
+                     bf.Compression.fp16. The compressed difference between the parameters
+                     and their replica, which sums up what was sent before, is communicated
+                     (CHOCO-SGD). The parameters move towards the average of the replicas by
+                     the `consensus_step_size` attribute, which is the ratio of
+                     bf.Compression.topk and 1 otherwise. The weights have to be fixed.
     """
     # We dynamically create a new class that inherits from the optimizer that was passed in.
     # The goal is to override the `step()` method with neighbor_allreduce implementation.
@@ -965,11 +1506,14 @@ def DistributedNeighborAllreduceOptimizer(optimizer, model,
         (optimizer.__class__,),
         dict(_DistributedReduceOptimizer.__dict__),
     )
-    return cls(optimizer.param_groups, model, "neighbor.allreduce", num_steps_per_communication)
+    return cls(optimizer.param_groups, model, "neighbor.allreduce", num_steps_per_communication,
+               flat_buffer, compression)
 
 
 def DistributedHierarchicalNeighborAllreduceOptimizer(optimizer, model,
-                                                      num_steps_per_communication=1):
+                                                      num_steps_per_communication=1,
+                                                      flat_buffer=False,
+                                                      compression=None):
     """
     An distributed optimizer that wraps another torch.optim.Optimizer through
     hierarchical_neighbor_allreduce ops over parameters.
@@ -985,6 +1529,15 @@ def DistributedHierarchicalNeighborAllreduceOptimizer(optimizer, model,
                                      communication. This allows local model parameter updates
                                      per num_steps_per_communication before reducing them over
                                      distributed computation resources.
+        flat_buffer: If set, the parameters of the same dtype and device are packed into one
+                     contiguous buffer as views, which is communicated by a single op per step
+                     without any copy into the fusion buffer.
+        compression: Compression algorithm used to reduce the amount of data sent, e.g.
+                     bf.Compression.fp16. The compressed difference between the parameters
+                     and their replica, which sums up what was sent before, is communicated
+                     (CHOCO-SGD). The parameters move towards the average of the replicas by
+                     the `consensus_step_size` attribute, which is the ratio of
+                     bf.Compression.topk and 1 otherwise. The weights have to be fixed.
 
     Warning:
         The processes within the same machine should provide the same `neighbor_machine_weights` and
@@ -1020,11 +1573,12 @@ def DistributedHierarchicalNeighborAllreduceOptimizer(optimizer, model,
         dict(_DistributedReduceOptimizer.__dict__),
     )
     return cls(optimizer.param_groups, model, "hierarchical.neighbor.allreduce",
-               num_steps_per_communication)
+               num_steps_per_communication, flat_buffer, compression)
 
 
 def DistributedGradientAllreduceOptimizer(optimizer, model,
-                                          backward_passes_per_step=1):
+                                          backward_passes_per_step=1, flat_buffer=False,
+                                          compression=None):
     """
     An distributed optimizer that wraps another torch.optim.Optimizer through allreduce ops.
     The communication happens when backward propagation happens, which is the same as Horovod.
@@ -1037,6 +1591,13 @@ def DistributedGradientAllreduceOptimizer(optimizer, model,
                                      communication. This allows local model parameter updates
                                      per num_steps_per_communication before reducing them over
                                      distributed computation resources.
+        flat_buffer: If set, the parameters and gradients of the same dtype and device are
+                     packed into contiguous buffers as views. The gradient buffer is allreduced
+                     in-place by a single op per step without any copy into the fusion buffer.
+                     Use optimizer.zero_grad() instead of model.zero_grad() to keep the views.
+        compression: Compression algorithm used to reduce the amount of data sent, e.g.
+                     bf.Compression.fp16. The error of the compression is kept locally and
+                     added to the gradients of the next communication (error feedback).
 
     Example for two scenarios to use num_steps_per_communication:
 
@@ -1070,4 +1631,5 @@ def DistributedGradientAllreduceOptimizer(optimizer, model,
         (optimizer.__class__,),
         dict(_DistributedOptimizer.__dict__),
     )
-    return cls(optimizer.param_groups, model, backward_passes_per_step)
+    return cls(optimizer.param_groups, model, backward_passes_per_step, flat_buffer,
+               compression)
@@ -27,7 +27,7 @@ parser.add_argument('--max-iters', type=int, default=200,
                     help='maximum iterations')
 parser.add_argument('--virtual-topology', type=str, default="expo2",
                     help='The underlying virtual topology. Supporting options are ' +
-                    '[expo2(Default), ring, mesh, star, InnerOuterExpo2].')
+                    '[expo2(Default), ring, mesh, star, hierarchical, InnerOuterExpo2].')
 parser.add_argument('--asynchronous-mode', action='store_true', default=False,
                     help='Use one-sided ops to run asynchronous push sum algorithm')
 parser.add_argument('--no-cuda', action='store_true', default=False,
@@ -71,9 +71,12 @@ elif args.virtual_topology == "star":
     bf.set_topology(topology_util.StarGraph(bf.size()), is_weighted=True)
 elif args.virtual_topology == "full":
     bf.set_topology(topology_util.FullyConnectedGraph(bf.size()))
+elif args.virtual_topology == "hierarchical":
+    bf.set_topology(topology_util.HierarchicalGraph(
+        bf.size(), bf.local_size()), is_weighted=True)
 else:
     raise ValueError("Unknown args.virtual_topology, supporting options are " +
-                     "[expo2(Default), ring, mesh, star].")
+                     "[expo2(Default), ring, mesh, star, hierarchical].")
 
 x_bar = bf.allreduce(x, average=True)
 mse = [torch.norm(x-x_bar, p=2) / torch.norm(x_bar, p=2)]
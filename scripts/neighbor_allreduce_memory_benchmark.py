@@ -0,0 +1,70 @@
+"""Benchmark the peak memory of neighbor_allreduce against the in-degree.
+
+Without the pipeline, neighbor_allreduce receives the whole tensors of all in-neighbors, so the
+transient memory grows as O(in-degree x tensor). With BLUEFOG_NEIGHBOR_ALLREDUCE_CHUNK_SIZE, the
+tensors are received into a bounded pool of chunks and reduced into one output, which is
+O(tensor). Compare them, e.g.
+
+    bfrun -np 16 python scripts/neighbor_allreduce_memory_benchmark.py --chunk-size 0
+    bfrun -np 16 python scripts/neighbor_allreduce_memory_benchmark.py --chunk-size 1048576
+"""
+import argparse
+import os
+import resource
+
+import torch
+
+parser = argparse.ArgumentParser(description='Neighbor Allreduce Memory Benchmark',
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('--data-size', type=int, default=64 * 1024 * 1024,
+                    help='the number of float elements in the tensor.')
+parser.add_argument('--chunk-size', type=int, default=1024 * 1024,
+                    help='the chunk size in bytes of the pipeline. 0 disables the pipeline.')
+parser.add_argument('--recv-pool-size', type=int, default=0,
+                    help='the bytes of the receive pool. 0 means two chunks per in-neighbor.')
+parser.add_argument('--num-iters', type=int, default=5,
+                    help='number of benchmark iterations')
+parser.add_argument('--virtual-topology', type=str, default="expo2",
+                    help='The underlying virtual topology. Supporting options are ' +
+                    '[expo2(Default), ring].')
+
+args = parser.parse_args()
+
+# The knobs are read when bluefog is initialized.
+os.environ["BLUEFOG_NEIGHBOR_ALLREDUCE_CHUNK_SIZE"] = str(args.chunk_size)
+os.environ["BLUEFOG_NEIGHBOR_ALLREDUCE_RECV_POOL_SIZE"] = str(args.recv_pool_size)
+
+import bluefog.torch as bf  # pylint: disable=wrong-import-position
+from bluefog.common import topology_util  # pylint: disable=wrong-import-position
+
+bf.init()
+if args.virtual_topology == "ring":
+    bf.set_topology(topology_util.RingGraph(bf.size(), connect_style=0))
+elif args.virtual_topology != "expo2":
+    raise ValueError("Unknown args.virtual_topology, supporting options are " +
+                     "[expo2(Default), ring].")
+
+
+def peak_memory_mb():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+data = torch.randn(args.data_size)
+tensor_mb = data.numel() * data.element_size() / 1024 / 1024
+bf.barrier()
+baseline_mb = peak_memory_mb()
+for _ in range(args.num_iters):
+    output = bf.neighbor_allreduce(data, name="neighbor_allreduce_memory_benchmark")
+    del output
+transient_mb = peak_memory_mb() - baseline_mb
+
+# The rank with the largest in-degree bounds the memory.
+stats = bf.allgather(torch.tensor([[transient_mb, len(bf.in_neighbor_ranks())]]),
+                     name="neighbor_allreduce_memory_benchmark.stats")
+transient_mb, in_degree = stats[stats[:, 0].argmax()].tolist()
+if bf.rank() == 0:
+    print('%10s %12s %12s %16s %18s' % ('chunk', 'in-degree', 'tensor (MB)',
+                                        'transient (MB)', 'transient/tensor'))
+    print('%10d %12d %12.1f %16.1f %18.2f' % (args.chunk_size, in_degree, tensor_mb,
+                                              transient_mb, transient_mb / tensor_mb))
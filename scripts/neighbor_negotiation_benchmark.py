@@ -0,0 +1,75 @@
+"""Benchmark the control overhead of neighbor_allreduce against the world size.
+
+A tiny tensor makes the latency of neighbor_allreduce dominated by the negotiation. Compare
+the coordinator negotiation with the negotiation among neighbors (BLUEFOG_NEIGHBOR_NEGOTIATION)
+by running it for several world sizes, e.g.
+
+    for np in 4 8 16 32; do
+        bfrun -np $np python scripts/neighbor_negotiation_benchmark.py --negotiation coordinator
+        bfrun -np $np python scripts/neighbor_negotiation_benchmark.py --negotiation neighbor
+    done
+"""
+import argparse
+import os
+import timeit
+
+import numpy as np
+import torch
+
+parser = argparse.ArgumentParser(description='Neighbor Negotiation Benchmark',
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('--negotiation', type=str, default="neighbor",
+                    help='Supporting options are [neighbor(Default), coordinator].')
+parser.add_argument('--data-size', type=int, default=1,
+                    help='the size of data. Keep it small to measure the control overhead.')
+parser.add_argument('--num-warmup-batches', type=int, default=10,
+                    help='number of warm-up batches that don\'t count towards benchmark')
+parser.add_argument('--num-batches-per-iter', type=int, default=100,
+                    help='number of batches per benchmark iteration')
+parser.add_argument('--num-iters', type=int, default=10,
+                    help='number of benchmark iterations')
+parser.add_argument('--cycle-time', type=float, default=0.1,
+                    help='the cycle time of the background thread in milliseconds.')
+parser.add_argument('--virtual-topology', type=str, default="expo2",
+                    help='The underlying virtual topology. Supporting options are ' +
+                    '[expo2(Default), ring].')
+
+args = parser.parse_args()
+if args.negotiation not in ("neighbor", "coordinator"):
+    raise ValueError("Unknown args.negotiation, supporting options are " +
+                     "[neighbor(Default), coordinator].")
+
+# The knobs are read when the background thread starts.
+os.environ["BLUEFOG_NEIGHBOR_NEGOTIATION"] = "1" if args.negotiation == "neighbor" else "0"
+os.environ["BLUEFOG_CYCLE_TIME"] = str(args.cycle_time)
+
+import bluefog.torch as bf  # pylint: disable=wrong-import-position
+from bluefog.common import topology_util  # pylint: disable=wrong-import-position
+
+bf.init()
+if args.virtual_topology == "ring":
+    bf.set_topology(topology_util.RingGraph(bf.size(), connect_style=0))
+elif args.virtual_topology != "expo2":
+    raise ValueError("Unknown args.virtual_topology, supporting options are " +
+                     "[expo2(Default), ring].")
+
+data = torch.randn(args.data_size)
+
+
+def benchmark_step():
+    bf.neighbor_allreduce(data, name="neighbor_negotiation_benchmark")
+
+
+timeit.timeit(benchmark_step, number=args.num_warmup_batches)
+
+latencies = []
+for _ in range(args.num_iters):
+    elapsed = timeit.timeit(benchmark_step, number=args.num_batches_per_iter)
+    latencies.append(elapsed / args.num_batches_per_iter * 1e6)
+
+# The slowest rank bounds the training.
+latency = bf.allgather(torch.tensor([np.median(latencies)]),
+                       name="neighbor_negotiation_benchmark.latency").max().item()
+if bf.rank() == 0:
+    print('%8s %12s %24s' % ('size', 'negotiation', 'latency per op (us)'))
+    print('%8d %12s %24.1f' % (bf.size(), args.negotiation, latency))
@@ -0,0 +1,82 @@
+"""Simulate examples/pytorch_average_consensus.py with many ranks in a single process.
+
+No MPI is needed. All ranks are evaluated at once by bluefog.common.simulator, e.g.
+
+    python scripts/simulate_average_consensus.py --size 1024 --virtual-topology expo2 \
+        --enable-dynamic-topology
+"""
+import argparse
+import time
+
+import numpy as np
+
+from bluefog.common import topology_util
+from bluefog.common.simulator import Simulator
+
+parser = argparse.ArgumentParser(description='Simulated Average Consensus',
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('--size', type=int, default=1024,
+                    help='the number of simulated ranks.')
+parser.add_argument('--local-size', type=int, default=8,
+                    help='the number of simulated ranks in each machine.')
+parser.add_argument('--data-size', type=int, default=100000,
+                    help='the size of data.')
+parser.add_argument('--max-iters', type=int, default=200,
+                    help='maximum iterations')
+parser.add_argument('--virtual-topology', type=str, default="expo2",
+                    help='The underlying virtual topology. Supporting options are ' +
+                    '[expo2(Default), ring, mesh, star, hierarchical, InnerOuterExpo2].')
+parser.add_argument('--enable-dynamic-topology', action='store_true',
+                    default=False, help=('Enable each iteration to transmit one neighbor ' +
+                                         'per iteration dynamically.'))
+parser.add_argument('--seed', type=int, default=2020, help='random seed')
+
+args = parser.parse_args()
+size, local_size = args.size, args.local_size
+
+is_weighted = False
+if args.virtual_topology in ("expo2", "InnerOuterExpo2"):
+    topo = topology_util.SparseExponentialGraph(size)
+elif args.virtual_topology == "ring":
+    topo = topology_util.SparseRingGraph(size, connect_style=1)
+elif args.virtual_topology == "mesh":
+    topo, is_weighted = topology_util.SparseRingGraph(size, connect_style=0), True
+elif args.virtual_topology == "star":
+    topo, is_weighted = topology_util.SparseStarGraph(size), True
+elif args.virtual_topology == "hierarchical":
+    topo, is_weighted = topology_util.SparseHierarchicalGraph(size, local_size), True
+else:
+    raise ValueError("Unknown args.virtual_topology, supporting options are " +
+                     "[expo2(Default), ring, mesh, star, hierarchical, InnerOuterExpo2].")
+sim = Simulator(size, topo, is_weighted=is_weighted, local_size=local_size)
+
+x = np.random.RandomState(args.seed).randn(size, args.data_size)
+x_bar = sim.allreduce(x, average=True)
+mse = [np.linalg.norm(x - x_bar) / np.linalg.norm(x_bar)]
+
+if args.enable_dynamic_topology:
+    if args.virtual_topology == "InnerOuterExpo2":
+        send_matrix, _ = topology_util.GetInnerOuterExpo2DynamicSendRecvMatrix(
+            size, local_size, args.max_iters)
+    else:
+        send_matrix = topology_util.GetDynamicSendMatrix(topo, args.max_iters)
+
+start = time.time()
+for ite in range(args.max_iters):
+    if args.enable_dynamic_topology:
+        send_neighbors = [[r] for r in send_matrix[ite].tolist()]
+        recv_neighbors = [[] for _ in range(size)]
+        for src, dst in enumerate(send_matrix[ite].tolist()):
+            recv_neighbors[dst].append(src)
+        neighbor_weights = [{r: 1 / (len(recv) + 1) for r in recv} for recv in recv_neighbors]
+        self_weight = [1 / (len(recv) + 1) for recv in recv_neighbors]
+        x = sim.neighbor_allreduce(x, self_weight, neighbor_weights,
+                                   send_neighbors=send_neighbors)
+    else:
+        x = sim.neighbor_allreduce(x)
+    mse.append(np.linalg.norm(x - x_bar) / np.linalg.norm(x_bar))
+elapsed = time.time() - start
+
+print("MSE at the last iteration: {:.3e}".format(mse[-1]))
+print("Simulated {} iterations of {} ranks in {:.2f} seconds.".format(
+    args.max_iters, size, elapsed))
@@ -0,0 +1,46 @@
+"""Micro-benchmark of IsTopologyEquivalent, which is called by every bf.set_topology.
+
+  * dense:    the previous implementation, comparing the dense adjacency matrices.
+  * networkx: fingerprint comparison of two networkx.DiGraph (computed at every call).
+  * sparse:   fingerprint comparison of two SparseTopology (cached after the first call).
+"""
+import argparse
+import timeit
+
+import networkx as nx
+
+from bluefog.common import topology_util
+
+parser = argparse.ArgumentParser(description='IsTopologyEquivalent Micro-Benchmark',
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('--sizes', type=int, nargs='+',
+                    default=[64, 128, 256, 512, 1024, 2048, 4096],
+                    help='the number of nodes in the topology.')
+parser.add_argument('--num-iters', type=int, default=10,
+                    help='number of comparisons for each size')
+
+args = parser.parse_args()
+
+
+def dense_equivalent(topo1, topo2):
+    return (nx.to_numpy_array(topo1) == nx.to_numpy_array(topo2)).all()
+
+
+def bench(fn):
+    return min(timeit.repeat(fn, number=1, repeat=args.num_iters)) * 1000
+
+
+print('%8s %12s %14s %12s' % ('size', 'dense (ms)', 'networkx (ms)', 'sparse (ms)'))
+for size in args.sizes:
+    # Use two different objects so that the identity shortcut is not taken.
+    nx_topo1 = topology_util.MeshGrid2DGraph(size)
+    nx_topo2 = topology_util.MeshGrid2DGraph(size)
+    sparse_topo1 = topology_util.SparseMeshGrid2DGraph(size)
+    sparse_topo2 = topology_util.SparseMeshGrid2DGraph(size)
+    assert dense_equivalent(nx_topo1, nx_topo2)
+    assert topology_util.IsTopologyEquivalent(sparse_topo1, sparse_topo2)
+
+    dense_time = bench(lambda: dense_equivalent(nx_topo1, nx_topo2))
+    nx_time = bench(lambda: topology_util.IsTopologyEquivalent(nx_topo1, nx_topo2))
+    sparse_time = bench(lambda: topology_util.IsTopologyEquivalent(sparse_topo1, sparse_topo2))
+    print('%8d %12.3f %14.3f %12.4f' % (size, dense_time, nx_time, sparse_time))
@@ -0,0 +1,58 @@
+"""Benchmark the per-rank cost of building a topology and evaluating it for one rank.
+
+It simulates what every rank does inside bf.init()/bf.set_topology() without MPI:
+  * networkx: build the networkx.DiGraph and read the neighbors of self rank.
+  * sparse:   build the SparseTopology and read the neighbors of self rank.
+"""
+import argparse
+import timeit
+
+from bluefog.common import topology_util
+
+parser = argparse.ArgumentParser(description='Topology Setup Benchmark',
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('--sizes', type=int, nargs='+',
+                    default=[8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096],
+                    help='the simulated world sizes.')
+parser.add_argument('--virtual-topology', type=str, default="expo2",
+                    help='The underlying virtual topology. Supporting options are ' +
+                    '[expo2(Default), expo4, symexpo, ring, mesh, star].')
+parser.add_argument('--num-iters', type=int, default=5,
+                    help='number of benchmark iterations for each size')
+parser.add_argument('--skip-networkx', action='store_true', default=False,
+                    help='only benchmark the sparse topology.')
+
+args = parser.parse_args()
+
+generators = {
+    "expo2": (topology_util.ExponentialGraph, topology_util.SparseExponentialGraph),
+    "expo4": (lambda size: topology_util.ExponentialGraph(size, base=4),
+              lambda size: topology_util.SparseExponentialGraph(size, base=4)),
+    "symexpo": (topology_util.SymmetricExponentialGraph,
+                topology_util.SparseSymmetricExponentialGraph),
+    "ring": (topology_util.RingGraph, topology_util.SparseRingGraph),
+    "mesh": (topology_util.MeshGrid2DGraph, topology_util.SparseMeshGrid2DGraph),
+    "star": (topology_util.StarGraph, topology_util.SparseStarGraph),
+}
+if args.virtual_topology not in generators:
+    raise ValueError("Unknown args.virtual_topology, supporting options are " +
+                     "[expo2(Default), expo4, symexpo, ring, mesh, star].")
+nx_fn, sparse_fn = generators[args.virtual_topology]
+
+
+def setup(topology_fn, size):
+    # The last rank is the worst case for the lookup of neighbors.
+    topo = topology_fn(size)
+    return topology_util.GetLocalView(topo, size - 1)
+
+
+print('%8s %16s %16s %10s' % ('size', 'networkx (ms)', 'sparse (ms)', 'speedup'))
+for size in args.sizes:
+    sparse_time = min(timeit.repeat(lambda: setup(sparse_fn, size),
+                                    number=1, repeat=args.num_iters)) * 1000
+    if args.skip_networkx:
+        print('%8d %16s %16.3f %10s' % (size, '-', sparse_time, '-'))
+        continue
+    nx_time = min(timeit.repeat(lambda: setup(nx_fn, size),
+                                number=1, repeat=args.num_iters)) * 1000
+    print('%8d %16.3f %16.3f %9.1fx' % (size, nx_time, sparse_time, nx_time / sparse_time))
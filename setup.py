@@ -310,6 +310,8 @@ def get_common_options(build_ext):
                "bluefog/common/mpi_context.cc",
                "bluefog/common/mpi_controller.cc",
                "bluefog/common/operations.cc",
+               "bluefog/common/parameter_manager.cc",
+               "bluefog/common/response_cache.cc",
                "bluefog/common/tensor_queue.cc",
                "bluefog/common/thread_pool.cc",
                "bluefog/common/timeline.cc"]
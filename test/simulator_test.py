@@ -0,0 +1,159 @@
+# Copyright 2020 Bluefog Team. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import pytest
+
+from bluefog.common import topology_util
+
+pytest.importorskip("scipy")
+from bluefog.common.simulator import Simulator  # pylint: disable=wrong-import-position
+
+
+def _DenseWeightMatrix(topo):
+    size = topo.number_of_nodes()
+    W = np.zeros((size, size))
+    for src, dst, weight in topo.to_networkx().edges(data='weight', default=1.0) \
+            if isinstance(topo, topology_util.SparseTopology) \
+            else topo.edges(data='weight', default=1.0):
+        W[src, dst] = weight
+    return W
+
+
+class SimulatorTests(unittest.TestCase):
+    """
+    Tests for the simulator.py. No MPI is required.
+    """
+
+    def setUp(self):
+        self.size = 12
+        self.rng = np.random.RandomState(123)
+
+    def test_allreduce_and_broadcast(self):
+        sim = Simulator(self.size)
+        x = self.rng.randn(self.size, 3, 2)
+        np.testing.assert_allclose(sim.allreduce(x), np.broadcast_to(x.mean(axis=0), x.shape))
+        np.testing.assert_allclose(sim.allreduce(x, average=False),
+                                   np.broadcast_to(x.sum(axis=0), x.shape))
+        np.testing.assert_allclose(sim.broadcast(x, 3), np.broadcast_to(x[3], x.shape))
+
+    def test_neighbor_allreduce_static(self):
+        x = self.rng.randn(self.size, 5)
+        for topo in [topology_util.ExponentialGraph(self.size),
+                     topology_util.SparseStarGraph(self.size),
+                     topology_util.MeshGrid2DGraph(self.size)]:
+            W = _DenseWeightMatrix(topo)
+            sim = Simulator(self.size, topo)
+            A = (W.T != 0) / (W != 0).sum(axis=0)[:, None]
+            np.testing.assert_allclose(sim.neighbor_allreduce(x), A.dot(x))
+
+            sim = Simulator(self.size, topo, is_weighted=True)
+            np.testing.assert_allclose(sim.neighbor_allreduce(x), W.T.dot(x))
+
+    def test_neighbor_allreduce_with_weights(self):
+        sim = Simulator(self.size, topology_util.RingGraph(self.size))
+        x = self.rng.randn(self.size)
+        neighbor_weights = [{(r - 1) % self.size: 0.25} for r in range(self.size)]
+        result = sim.neighbor_allreduce(x, 0.5, neighbor_weights)
+        np.testing.assert_allclose(result, 0.5 * x + 0.25 * np.roll(x, 1))
+        with pytest.raises(ValueError):
+            sim.neighbor_allreduce(x, 0.5, [{(r + 3) % self.size: 0.5}
+                                            for r in range(self.size)])
+        with pytest.raises(ValueError):
+            sim.neighbor_allreduce(x, 0.5)
+
+    def test_dynamic_average_consensus(self):
+        size = 64
+        topo = topology_util.SparseExponentialGraph(size)
+        sim = Simulator(size, topo)
+        gens = [topology_util.GetDynamicSendRecvRanks(topo, r) for r in range(size)]
+        x = self.rng.randn(size, 4)
+        x_bar = x.mean(axis=0)
+        for _ in range(6):
+            send_neighbors, neighbor_weights, self_weights = [], [], []
+            for r in range(size):
+                send_ranks, recv_ranks = next(gens[r])
+                send_neighbors.append(send_ranks)
+                neighbor_weights.append({s: 1 / (len(recv_ranks) + 1) for s in recv_ranks})
+                self_weights.append(1 / (len(recv_ranks) + 1))
+            x = sim.neighbor_allreduce(x, self_weights, neighbor_weights,
+                                       send_neighbors=send_neighbors)
+        # One-peer exponential-2 graph reaches the exact average in log2(size) steps.
+        np.testing.assert_allclose(x, np.broadcast_to(x_bar, x.shape))
+
+        send_neighbors = [[(r + 1) % size] for r in range(size)]
+        with pytest.raises(ValueError):
+            sim.neighbor_allreduce(x, 0.5, [{(r + 2) % size: 0.5} for r in range(size)],
+                                   send_neighbors=send_neighbors)
+
+    def test_pair_gossip(self):
+        sim = Simulator(4)
+        x = np.arange(4, dtype=np.float64)
+        np.testing.assert_allclose(sim.pair_gossip(x, [1, 0, 3, 2]), [0.5, 0.5, 2.5, 2.5])
+        np.testing.assert_allclose(sim.pair_gossip(x, [1, 0, None, None], 0.75, 0.25),
+                                   [0.25, 0.75, 2, 3])
+        with pytest.raises(ValueError):
+            sim.pair_gossip(x, [1, 2, 3, 0])
+
+    def test_win_put_then_update_matches_neighbor_allreduce(self):
+        sim = Simulator(self.size, topology_util.ExponentialGraph(self.size))
+        x = self.rng.randn(self.size, 3)
+        expected = sim.neighbor_allreduce(x)
+        window = x.copy()
+        assert sim.win_create(window, "x")
+        assert not sim.win_create(window, "x")
+        sim.win_put(window, "x")
+        versions = sim.get_win_version("x")
+        assert all(set(v.values()) == {1} for v in versions)
+        result = sim.win_update("x")
+        assert result is window
+        np.testing.assert_allclose(window, expected)
+        assert all(set(v.values()) == {0} for v in sim.get_win_version("x"))
+        assert not sim.set_topology(topology_util.RingGraph(self.size))
+        sim.win_free("x")
+        assert sim.set_topology(topology_util.RingGraph(self.size))
+
+    def test_win_accumulate_and_get(self):
+        size = 4
+        sim = Simulator(size, topology_util.RingGraph(size, connect_style=2))
+        x = np.arange(size, dtype=np.float64).reshape(size, 1)
+        window = x.copy()
+        sim.win_create(window, "x", zero_init=True)
+        dst_weights = [{(r + 1) % size: 0.5} for r in range(size)]
+        sim.win_accumulate(window, "x", self_weight=0.5, dst_weights=dst_weights)
+        sim.win_accumulate(window, "x", dst_weights=dst_weights)
+        np.testing.assert_allclose(window, 0.5 * x)
+        # Rank r received 0.5 * x[r-1] and then 0.25 * x[r-1].
+        collected = sim.win_update_then_collect("x").copy()
+        np.testing.assert_allclose(collected, 0.5 * x + 0.75 * np.roll(x, 1, axis=0))
+        np.testing.assert_allclose(sim.win_update("x", clone=True),
+                                   collected / 2)
+
+        sim.win_get("x", src_weights=[{(r - 1) % size: 2.0} for r in range(size)])
+        result = sim.win_update("x", 0.0, [{(r - 1) % size: 1.0} for r in range(size)],
+                                reset=True)
+        np.testing.assert_allclose(result, 2.0 * np.roll(collected, 1, axis=0))
+        with pytest.raises(ValueError):
+            sim.win_put(window, "x", dst_weights=[{(r + 2) % size: 1.0} for r in range(size)])
+
+
+if __name__ == "__main__":
+    unittest.main()
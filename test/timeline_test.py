@@ -17,6 +17,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import inspect
+import json
 import os
 import time
 import threading
@@ -73,6 +75,45 @@ class TimelineTests(unittest.TestCase):
             assert 'MPI_NEIGHBOR_ALLGATHER' in timeline_text, timeline_text
             assert 'ENQUEUE_NEIGHBOR_ALLGATHER' in timeline_text, timeline_text
 
+    def test_timeline_dynamic_neighbor_allreduce_fusion(self):
+        size = bf.size()
+        rank = bf.rank()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        num_tensors = 20
+        file_name = f"{self.temp_file}{bf.rank()}.json"
+
+        def read_messages():
+            time.sleep(0.1)
+            messages = []
+            with open(file_name, 'r') as tf:
+                for line in tf:
+                    if '"NEIGHBOR_ALLREDUCE_MESSAGES"' in line:
+                        messages.append(json.loads(line.strip().rstrip(','))["args"]["value"])
+            return messages
+
+        num_previous_ops = len(read_messages())
+        # One step of dynamic topology, where all tensors share the send/recv pattern.
+        send_neighbors = [(rank + 1) % size]
+        neighbor_weights = {(rank - 1) % size: 0.5}
+        bf.barrier()
+        handles = [
+            bf.neighbor_allreduce_nonblocking(
+                torch.FloatTensor(10).fill_(rank), self_weight=0.5,
+                neighbor_weights=neighbor_weights, send_neighbors=send_neighbors,
+                enable_topo_check=False, name=f"test_dynamic_fusion_{i}")
+            for i in range(num_tensors)]
+        for handle in handles:
+            x = bf.synchronize(handle)
+            assert (x == (rank + (rank - 1) % size) * 0.5).all(), x
+
+        messages = read_messages()[num_previous_ops:]
+        # Every fused op sends to one neighbor and receives from one neighbor.
+        assert all(m == 2 for m in messages), messages
+        assert len(messages) < num_tensors, messages
+
     def test_timeline_with_python_interface(self):
         bf.timeline_start_activity("test_python_interface_x", "FAKE_ACTIVITY")
         time.sleep(0.1)
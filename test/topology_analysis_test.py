@@ -0,0 +1,158 @@
+# Copyright 2020 Bluefog Team. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import pytest
+
+from bluefog.common import topology_util
+
+pytest.importorskip("scipy")
+from bluefog.common import topology_analysis  # pylint: disable=wrong-import-position
+
+
+def _Simulate(weight_matrices, num_steps, size, seed=0):
+    """Run num_steps of x <- W^T x and return the relative consensus error."""
+    x = np.random.RandomState(seed).randn(size)
+    x_bar = x.mean()
+    init_error = np.linalg.norm(x - x_bar)
+    for step in range(num_steps):
+        x = weight_matrices[step % len(weight_matrices)].T.dot(x)
+    return np.linalg.norm(x - x_bar) / init_error
+
+
+class TopologyAnalysisTests(unittest.TestCase):
+    """
+    Tests for the topology_analysis.py. No MPI is required.
+    """
+
+    def test_circulant_matches_dense(self):
+        for size in [2, 5, 16, 33]:
+            for topo in [topology_util.SparseExponentialGraph(size),
+                         topology_util.SparseSymmetricExponentialGraph(size),
+                         topology_util.SparseRingGraph(size, 1)]:
+                W = topology_analysis.WeightMatrix(topo).toarray()
+                moduli = np.sort(np.abs(np.linalg.eigvals(W)))
+                assert topology_analysis.SecondLargestEigenvalueModulus(topo) == \
+                    pytest.approx(moduli[-2])
+                assert topology_analysis.ContractionRate(topo) == \
+                    pytest.approx(np.linalg.norm(W - 1.0 / size, 2))
+
+    def test_sparse_solver_matches_dense(self):
+        topo = topology_util.MeshGrid2DGraph(64)
+        dense_slem = topology_analysis.SecondLargestEigenvalueModulus(topo)
+        dense_rate = topology_analysis.ContractionRate(topo)
+        limit = topology_analysis.DENSE_SIZE_LIMIT
+        try:
+            topology_analysis.DENSE_SIZE_LIMIT = 8
+            assert topology_analysis.SecondLargestEigenvalueModulus(topo) == \
+                pytest.approx(dense_slem, rel=1e-6)
+            assert topology_analysis.ContractionRate(topo) == \
+                pytest.approx(dense_rate, rel=1e-6)
+        finally:
+            topology_analysis.DENSE_SIZE_LIMIT = limit
+
+    def test_spectral_gap_ordering(self):
+        size = 32
+        gap = lambda topo: topology_analysis.SpectralGap(topo)
+        assert gap(topology_util.SparseFullyConnectedGraph(size)) == pytest.approx(1.0)
+        assert gap(topology_util.SparseExponentialGraph(size)) > \
+            gap(topology_util.SparseMeshGrid2DGraph(size)) > \
+            gap(topology_util.SparseRingGraph(size))
+
+    def test_rate_bounds_simulated_error(self):
+        size, num_steps = 24, 20
+        topo = topology_util.SparseMeshGrid2DGraph(size)
+        rate = topology_analysis.ContractionRate(topo)
+        error = _Simulate([topology_analysis.WeightMatrix(topo)], num_steps, size)
+        assert error <= rate ** num_steps + 1e-12
+
+    def test_schedule_contraction_rate(self):
+        world_size, local_size = 32, 4
+        send_matrix, _ = topology_util.GetInnerOuterRingDynamicSendRecvMatrix(
+            world_size, local_size, local_size)
+        weight_matrices = topology_analysis.DynamicWeightMatrices(send_matrix)
+        for W in weight_matrices:
+            np.testing.assert_allclose(W.sum(axis=0), 1)
+            np.testing.assert_allclose(W.sum(axis=1), 1)
+        rate = topology_analysis.ScheduleContractionRate(weight_matrices)
+        assert 0 < rate < 1
+        num_steps = 10 * local_size
+        error = _Simulate(weight_matrices, num_steps, world_size)
+        assert error <= rate ** num_steps + 1e-12
+
+        limit = topology_analysis.DENSE_SIZE_LIMIT
+        try:
+            topology_analysis.DENSE_SIZE_LIMIT = 8
+            assert topology_analysis.ScheduleContractionRate(weight_matrices) == \
+                pytest.approx(rate, rel=1e-6)
+        finally:
+            topology_analysis.DENSE_SIZE_LIMIT = limit
+
+        # One-peer exponential-2 schedule reaches the exact average in log2(size) steps.
+        send_matrix = topology_util.GetDynamicSendMatrix(
+            topology_util.SparseExponentialGraph(16), 4)
+        assert topology_analysis.ScheduleContractionRate(
+            topology_analysis.DynamicWeightMatrices(send_matrix)) == pytest.approx(0, abs=1e-6)
+
+    def test_communication_cost(self):
+        size, local_size, tensor_bytes = 16, 4, 100
+        topo = topology_util.SparseExponentialGraph(size)
+        intra_bytes, inter_bytes = topology_analysis.CommunicationCost(
+            topo, tensor_bytes, local_size)
+        # Offsets 1, 2 stay inside the machine only for some ranks, 4 and 8 always leave.
+        np.testing.assert_array_equal(intra_bytes + inter_bytes, np.full(size, 4 * tensor_bytes))
+        assert intra_bytes[0] == 2 * tensor_bytes and intra_bytes[3] == 0
+        _, inter_bytes = topology_analysis.CommunicationCost(topo, tensor_bytes)
+        np.testing.assert_array_equal(inter_bytes, np.full(size, 4 * tensor_bytes))
+
+        send_matrix, _ = topology_util.GetInnerOuterRingDynamicSendRecvMatrix(
+            size, local_size, local_size)
+        intra_bytes, inter_bytes = topology_analysis.ScheduleCommunicationCost(
+            send_matrix, tensor_bytes, local_size)
+        np.testing.assert_allclose(inter_bytes, np.full(size, tensor_bytes / local_size))
+        np.testing.assert_allclose(intra_bytes + inter_bytes, np.full(size, tensor_bytes))
+
+    def test_cheapest_topology(self):
+        size, local_size = 32, 4
+        send_matrix, _ = topology_util.GetInnerOuterRingDynamicSendRecvMatrix(
+            size, local_size, local_size)
+        candidates = {"expo2": topology_util.SparseExponentialGraph(size),
+                      "full": topology_util.SparseFullyConnectedGraph(size),
+                      "inner_outer_ring": send_matrix}
+        name, reports = topology_analysis.CheapestTopology(
+            candidates, tensor_bytes=1 << 20, num_steps=1000, local_size=local_size)
+        assert name == "inner_outer_ring"
+        assert reports["full"].steps_to_consensus == 1
+        name, _ = topology_analysis.CheapestTopology(
+            candidates, tensor_bytes=1 << 20, num_steps=30, local_size=local_size)
+        assert name == "expo2"
+        name, _ = topology_analysis.CheapestTopology(
+            {"ring": topology_util.SparseRingGraph(size)}, tensor_bytes=1, num_steps=5)
+        assert name is None
+
+    def test_steps_to_consensus(self):
+        assert topology_analysis.StepsToConsensus(0.5, 1e-3) == 10
+        assert topology_analysis.StepsToConsensus(0.0) == 1
+        assert topology_analysis.StepsToConsensus(1.0) is None
+
+
+if __name__ == "__main__":
+    unittest.main()
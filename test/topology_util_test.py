@@ -0,0 +1,339 @@
+# Copyright 2020 Bluefog Team. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import unittest
+
+import numpy as np
+import networkx as nx
+import pytest
+
+from bluefog.common import topology_util
+
+
+def _DenseWeightMatrix(topo):
+    size = topo.number_of_nodes()
+    W = np.zeros((size, size))
+    for src, dst, weight in topo.edges(data='weight', default=1.0):
+        W[src, dst] = weight
+    return W
+
+
+class SparseTopologyTests(unittest.TestCase):
+    """
+    Tests for the SparseTopology in topology_util.py. No MPI is required.
+    """
+
+    generators = [
+        ("ExponentialTwoGraph", ()),
+        ("ExponentialGraph", ()),
+        ("ExponentialGraph", (3,)),
+        ("SymmetricExponentialGraph", ()),
+        ("SymmetricExponentialGraph", (2,)),
+        ("MeshGrid2DGraph", ()),
+        ("StarGraph", ()),
+        ("RingGraph", (0,)),
+        ("RingGraph", (1,)),
+        ("RingGraph", (2,)),
+        ("FullyConnectedGraph", ()),
+    ]
+
+    def test_sparse_generators_match_networkx_generators(self):
+        for size in [1, 2, 3, 4, 7, 12, 16, 33]:
+            for name, args in self.generators:
+                sparse_topo = getattr(topology_util, "Sparse" + name)(size, *args)
+                nx_topo = getattr(topology_util, name)(size, *args)
+                assert isinstance(sparse_topo, topology_util.SparseTopology)
+                assert isinstance(nx_topo, nx.DiGraph)
+                assert topology_util.IsTopologyEquivalent(sparse_topo, nx_topo), \
+                    "{}{} with size {}".format(name, args, size)
+                for rank in range(size):
+                    assert sparse_topo.predecessors(rank) == sorted(nx_topo.predecessors(rank))
+                    assert sparse_topo.successors(rank) == sorted(nx_topo.successors(rank))
+
+    def test_generators_match_baseline(self):
+        # The edges and weights were captured from the networkx generators before they were
+        # built on the sparse backend.
+        with open(os.path.join(os.path.dirname(__file__), "topology_baseline.json")) as f:
+            baseline = json.load(f)
+        for name, args in self.generators:
+            key = name + ("({})".format(",".join(map(str, args))) if args else "")
+            for size in [1, 2, 3, 4, 7, 12, 16]:
+                expected = np.zeros((size, size))
+                adjacency = np.zeros((size, size), dtype=bool)
+                for src, dst, weight in baseline["{}/{}".format(key, size)]:
+                    expected[src, dst] = weight
+                    adjacency[src, dst] = True
+                for topo in [getattr(topology_util, name)(size, *args),
+                             getattr(topology_util, "Sparse" + name)(size, *args).to_networkx()]:
+                    W = _DenseWeightMatrix(topo)
+                    np.testing.assert_array_equal(
+                        W != 0, adjacency, err_msg="{} with size {}".format(key, size))
+                    np.testing.assert_allclose(
+                        W, expected, atol=1e-10, err_msg="{} with size {}".format(key, size))
+
+    def test_generators_are_doubly_stochastic(self):
+        size = 24
+        for name, args in self.generators:
+            W = _DenseWeightMatrix(getattr(topology_util, name)(size, *args))
+            np.testing.assert_allclose(W.sum(axis=0), np.ones(size), err_msg=name)
+            np.testing.assert_allclose(W.sum(axis=1), np.ones(size), err_msg=name)
+
+    def test_networkx_round_trip(self):
+        topo = topology_util.MeshGrid2DGraph(20)
+        sparse_topo = topology_util.SparseTopology.from_networkx(topo)
+        assert sparse_topo.number_of_nodes() == 20
+        assert sparse_topo.number_of_edges() == topo.number_of_edges()
+        assert topology_util.IsTopologyEquivalent(sparse_topo.to_networkx(), topo)
+        np.testing.assert_array_equal(
+            _DenseWeightMatrix(sparse_topo.to_networkx()), _DenseWeightMatrix(topo))
+
+    def test_recv_and_send_weights(self):
+        topo = topology_util.StarGraph(6, center_rank=2)
+        sparse_topo = topology_util.SparseStarGraph(6, center_rank=2)
+        for rank in range(6):
+            self_weight, neighbor_weights = topology_util.GetRecvWeights(sparse_topo, rank)
+            exp_self_weight, exp_neighbor_weights = topology_util.GetRecvWeights(topo, rank)
+            assert self_weight == pytest.approx(exp_self_weight)
+            assert neighbor_weights == pytest.approx(exp_neighbor_weights)
+            self_weight, neighbor_weights = topology_util.GetSendWeights(sparse_topo, rank)
+            exp_self_weight, exp_neighbor_weights = topology_util.GetSendWeights(topo, rank)
+            assert self_weight == pytest.approx(exp_self_weight)
+            assert neighbor_weights == pytest.approx(exp_neighbor_weights)
+
+    def test_topology_equivalent(self):
+        assert topology_util.IsTopologyEquivalent(
+            topology_util.SparseRingGraph(8), topology_util.SparseRingGraph(8))
+        assert not topology_util.IsTopologyEquivalent(
+            topology_util.SparseRingGraph(8), topology_util.SparseRingGraph(8, 1))
+        assert not topology_util.IsTopologyEquivalent(
+            topology_util.SparseRingGraph(8), topology_util.SparseRingGraph(9))
+        assert not topology_util.IsTopologyEquivalent(topology_util.SparseRingGraph(8), None)
+
+    def test_topology_equivalent_with_node_labels(self):
+        # Nodes which are not labeled 0 to size-1 are compared in their order in the graph.
+        nx_topo = topology_util.RingGraph(6)
+        labeled = nx.relabel_nodes(nx_topo, {i: "rank{}".format(i) for i in range(6)})
+        shifted = nx.relabel_nodes(nx_topo, {i: i + 1 for i in range(6)})
+        for topo in [labeled, shifted]:
+            assert topology_util.IsTopologyEquivalent(topo, nx_topo)
+            assert topology_util.IsTopologyEquivalent(topology_util.SparseRingGraph(6), topo)
+            assert not topology_util.IsTopologyEquivalent(
+                topo, topology_util.SparseRingGraph(6, 1))
+
+    def test_topology_fingerprint(self):
+        sparse_topo = topology_util.SparseExponentialGraph(16)
+        nx_topo = topology_util.ExponentialGraph(16)
+        materialized = topology_util.SparseTopology.from_networkx(nx_topo)
+        fingerprint = topology_util.TopologyFingerprint(sparse_topo)
+        assert fingerprint == topology_util.TopologyFingerprint(nx_topo)
+        assert fingerprint == materialized.fingerprint()
+        assert fingerprint != topology_util.TopologyFingerprint(
+            topology_util.SparseExponentialGraph(16, base=4))
+        assert fingerprint != topology_util.TopologyFingerprint(
+            topology_util.SparseExponentialGraph(17))
+
+        # Same edges but different weights.
+        nx_topo[0][1]['weight'] = 0.5
+        assert not topology_util.IsTopologyEquivalent(nx_topo, sparse_topo)
+        assert not topology_util.IsTopologyEquivalent(materialized, nx_topo)
+
+    def test_exponential_graph_with_exact_powers(self):
+        # 3**5 = 243 has to be connected even though math.log(243, 3) < 5.
+        topo = topology_util.SparseExponentialGraph(256, base=3)
+        assert 243 in topo.successors(0)
+        assert topology_util.isPowerOf(243, 3)
+        assert not topology_util.isPowerOf(244, 3)
+
+    def test_local_view_matches_networkx(self):
+        size = 20
+        for name, args in self.generators:
+            sparse_topo = getattr(topology_util, "Sparse" + name)(size, *args)
+            nx_topo = getattr(topology_util, name)(size, *args)
+            for rank in range(size):
+                view = topology_util.GetLocalView(sparse_topo, rank)
+                exp_view = topology_util.GetLocalView(nx_topo, rank)
+                assert view.in_neighbor_ranks == exp_view.in_neighbor_ranks
+                assert view.out_neighbor_ranks == exp_view.out_neighbor_ranks
+                assert view.recv_self_weight == pytest.approx(exp_view.recv_self_weight)
+                assert view.recv_neighbor_weights == \
+                    pytest.approx(exp_view.recv_neighbor_weights)
+                assert view.send_neighbor_weights == \
+                    pytest.approx(exp_view.send_neighbor_weights)
+
+    def test_circulant_topology_is_lazy(self):
+        topo = topology_util.SparseExponentialGraph(1 << 20)
+        assert isinstance(topo, topology_util.CirculantTopology)
+        assert topo.predecessors(0) == [0] + [(1 << 20) - (1 << i) for i in range(19, -1, -1)]
+        assert topo.number_of_edges() == (1 << 20) * 21
+        # Comparing with the materialized copy builds the CSR arrays.
+        topo = topology_util.SparseRingGraph(10)
+        materialized = topology_util.SparseTopology.from_networkx(topo.to_networkx())
+        assert topo == materialized and materialized == topo
+        assert topo != topology_util.SparseRingGraph(10, 1)
+
+    def test_dynamic_send_recv_schedule(self):
+        size = 12
+        for topo in [topology_util.SparseExponentialGraph(size),
+                     topology_util.MeshGrid2DGraph(size),
+                     topology_util.StarGraph(size)]:
+            schedules = [topology_util.DynamicSendRecvSchedule(topo, r) for r in range(size)]
+            no_tables = [topology_util.DynamicSendRecvSchedule(topo, r, max_period=0)
+                         for r in range(size)]
+            gens = [topology_util.GetDynamicSendRecvRanks(topo, r) for r in range(size)]
+            for step in range(30):
+                expected_recv = {r: [] for r in range(size)}
+                for r in range(size):
+                    send_ranks, recv_ranks = next(gens[r])
+                    assert (send_ranks, recv_ranks) == schedules[r][step]
+                    assert (send_ranks, recv_ranks) == no_tables[r][step]
+                    assert send_ranks[0] in topo.successors(r)
+                    expected_recv[send_ranks[0]].append(r)
+                for r in range(size):
+                    assert schedules[r].recv_ranks(step) == expected_recv[r]
+
+    def test_dynamic_schedule_period(self):
+        schedule = topology_util.DynamicSendRecvSchedule(
+            topology_util.SparseExponentialGraph(16), 0)
+        assert schedule.period == 4
+        assert schedule[5] == ([2], [14])
+        assert schedule[5 + 4 * 1000] == schedule[5]
+
+    def test_inner_outer_schedule_matrices(self):
+        world_size, local_size, num_steps = 32, 4, 40
+        for matrix_fn, gen_fn in [
+                (topology_util.GetInnerOuterRingDynamicSendRecvMatrix,
+                 topology_util.GetInnerOuterRingDynamicSendRecvRanks),
+                (topology_util.GetInnerOuterExpo2DynamicSendRecvMatrix,
+                 topology_util.GetInnerOuterExpo2DynamicSendRecvRanks)]:
+            send_matrix, recv_matrix = matrix_fn(world_size, local_size, num_steps)
+            assert send_matrix.shape == recv_matrix.shape == (num_steps, world_size)
+            for rank in range(world_size):
+                gen = gen_fn(world_size, local_size, rank)
+                for step in range(num_steps):
+                    assert next(gen) == ([send_matrix[step, rank]], [recv_matrix[step, rank]])
+            # Every rank sends to exactly one rank and that rank expects it.
+            for step in range(num_steps):
+                np.testing.assert_array_equal(
+                    recv_matrix[step, send_matrix[step]], np.arange(world_size))
+
+            send_part, recv_part = matrix_fn(world_size, local_size, 5, start_index=7,
+                                             ranks=[3, 9])
+            np.testing.assert_array_equal(send_part, send_matrix[7:12, [3, 9]])
+            np.testing.assert_array_equal(recv_part, recv_matrix[7:12, [3, 9]])
+
+    def test_exp2_machine_schedule_matrix(self):
+        world_size, local_size, num_steps = 24, 3, 10
+        send_matrix, recv_matrix = topology_util.GetExp2DynamicSendRecvMachineMatrix(
+            world_size, local_size, num_steps)
+        for rank in range(world_size):
+            gen = topology_util.GetExp2DynamicSendRecvMachineRanks(
+                world_size, local_size, rank, rank % local_size)
+            for step in range(num_steps):
+                assert next(gen) == ([send_matrix[step, rank]], [recv_matrix[step, rank]])
+
+    def test_hierarchical_graph(self):
+        for world_size, local_size, num_gateways in [
+                (16, 4, 1), (32, 8, 2), (10, 4, 1), (9, [4, 2, 3], 2), (8, 8, 1), (8, 1, 1)]:
+            topo = topology_util.SparseHierarchicalGraph(world_size, local_size, num_gateways)
+            nx_topo = topology_util.HierarchicalGraph(world_size, local_size, num_gateways)
+            assert topology_util.IsTopologyEquivalent(topo, nx_topo)
+            W = _DenseWeightMatrix(nx_topo)
+            np.testing.assert_allclose(W, W.T)
+            np.testing.assert_allclose(W.sum(axis=1), np.ones(world_size))
+            assert (W >= 0).all()
+            assert np.sort(np.abs(np.linalg.eigvals(W)))[-2] < 1 - 1e-6
+
+            machine_sizes = [local_size] * (world_size // local_size) + \
+                [world_size % local_size] * (world_size % local_size > 0) \
+                if isinstance(local_size, int) else local_size
+            machine_ids = np.repeat(np.arange(len(machine_sizes)), machine_sizes)
+            machine_starts = np.cumsum([0] + list(machine_sizes))
+            for rank in range(world_size):
+                local_rank = rank - machine_starts[machine_ids[rank]]
+                remote = [r for r in topo.successors(rank)
+                          if machine_ids[r] != machine_ids[rank]]
+                local = [r for r in topo.successors(rank) if machine_ids[r] == machine_ids[rank]]
+                assert len(local) == machine_sizes[machine_ids[rank]]
+                if local_rank >= num_gateways:
+                    assert not remote
+
+        with pytest.raises(ValueError):
+            topology_util.SparseHierarchicalGraph(9, [4, 4])
+
+    def test_fastest_mixing_graph(self):
+        for base in [topology_util.MeshGrid2DGraph(16), topology_util.RingGraph(10),
+                     topology_util.StarGraph(8)]:
+            size = base.number_of_nodes()
+            G = topology_util.FastestMixingGraph(base)
+            W = _DenseWeightMatrix(G)
+            np.testing.assert_allclose(W, W.T)
+            np.testing.assert_allclose(W.sum(axis=1), np.ones(size))
+            assert (W >= 0).all()
+            assert set(G.edges()) <= set(base.to_undirected().edges()) | \
+                {(j, i) for i, j in base.to_undirected().edges()} | {(i, i) for i in range(size)}
+            slem = lambda W: np.sort(np.abs(np.linalg.eigvals(W)))[-2]
+            assert slem(W) < slem(_DenseWeightMatrix(base)) - 1e-3
+
+    def test_optimize_topology(self):
+        size, local_size, max_degree = 64, 8, 6
+        G = topology_util.OptimizeTopology(size, local_size, max_degree=max_degree)
+        W = _DenseWeightMatrix(G)
+        np.testing.assert_allclose(W.sum(axis=0), np.ones(size))
+        np.testing.assert_allclose(W.sum(axis=1), np.ones(size))
+        assert np.sort(np.abs(np.linalg.eigvals(W)))[-2] < 0.9
+        for rank in range(size):
+            neighbors = [r for r in G.successors(rank) if r != rank]
+            assert len(neighbors) <= max_degree
+            # Most of the traffic stays inside the machine.
+            assert sum(r // local_size != rank // local_size for r in neighbors) <= 2
+        # Single machine gets the exact average in one step.
+        W = _DenseWeightMatrix(topology_util.OptimizeTopology(8, 8))
+        np.testing.assert_allclose(W, np.full((8, 8), 1 / 8))
+        with pytest.raises(ValueError):
+            topology_util.OptimizeTopology(size, local_size, max_degree=1)
+
+    def test_optimize_topology_is_connected(self):
+        # Small degrees, a single machine and a partial last machine.
+        for size, local_size, max_degree in [(6, 3, 2), (16, 4, 3), (12, 12, 2), (12, 12, 3),
+                                             (32, 8, 3), (10, 4, 3), (10, 4, None), (11, 4, 6),
+                                             (5, 5, None), (2, 1, 1)]:
+            G = topology_util.OptimizeTopology(size, local_size, max_degree=max_degree)
+            W = _DenseWeightMatrix(G)
+            np.testing.assert_allclose(W.sum(axis=0), np.ones(size))
+            np.testing.assert_allclose(W.sum(axis=1), np.ones(size))
+            assert nx.is_strongly_connected(G), (size, local_size, max_degree)
+            assert np.sort(np.abs(np.linalg.eigvals(W)))[-2] < 1 - 1e-6, (
+                size, local_size, max_degree)
+            if max_degree is not None:
+                for rank in range(size):
+                    assert len([r for r in G.successors(rank) if r != rank]) <= max_degree
+
+    def test_invalid_edges(self):
+        with pytest.raises(ValueError):
+            topology_util.SparseTopology(3, [0, 0], [1, 1], [0.5, 0.5])
+        with pytest.raises(ValueError):
+            topology_util.SparseTopology(3, [0], [3], [1.0])
+        with pytest.raises(ValueError):
+            topology_util.SparseTopology(3, [0, 1], [1], [1.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -28,8 +28,8 @@ import torch
 
 from common import mpi_env_rank_and_size
 import bluefog.torch as bf
-from bluefog.common.topology_util import ExponentialGraph, RingGraph, RingGraph
-from bluefog.common.topology_util import IsTopologyEquivalent
+from bluefog.common.topology_util import ExponentialGraph, RingGraph, StarGraph
+from bluefog.common.topology_util import IsTopologyEquivalent, GetRecvWeights
 
 warnings.filterwarnings("ignore", message="numpy.dtype size changed")
 warnings.filterwarnings("ignore", message="numpy.ufunc size changed")
@@ -144,6 +144,26 @@ class BasicsTests(unittest.TestCase):
         assert sorted(in_neighobrs) == expected_in_neighbors
         assert sorted(out_neighbors) == expected_out_neighbors
 
+    def test_cached_recv_weights(self):
+        bf.init()
+        rank = bf.rank()
+        size = bf.size()
+        assert bf.set_topology(StarGraph(size), is_weighted=True)
+        self_weight, neighbor_weights, avg_computation = bf.load_recv_weights()
+        expected_self_weight, expected_neighbor_weights = GetRecvWeights(StarGraph(size), rank)
+        assert avg_computation
+        assert self_weight == pytest.approx(expected_self_weight)
+        assert neighbor_weights == pytest.approx(expected_neighbor_weights)
+        assert bf.in_neighbor_set() == set(bf.in_neighbor_ranks())
+
+        # Cache has to be invalidated after the topology is changed.
+        assert bf.set_topology(RingGraph(size))
+        self_weight, neighbor_weights, avg_computation = bf.load_recv_weights()
+        assert not avg_computation
+        assert self_weight == pytest.approx(1.0/(len(bf.in_neighbor_ranks())+1))
+        assert sorted(neighbor_weights.keys()) == bf.in_neighbor_ranks()
+        assert bf.out_neighbor_set() == set(bf.out_neighbor_ranks())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,151 @@
+# Copyright 2020 Bluefog Team. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import torch
+
+import bluefog.torch as bf
+from bluefog.torch import compression as compression_lib
+from bluefog.torch.optimizers import _compress_with_error_feedback
+
+
+class CompressionTests(unittest.TestCase):
+    """
+    Tests for bluefog/torch/compression.py
+    """
+
+    def setUp(self):
+        torch.manual_seed(0)
+
+    @staticmethod
+    def roundtrip(compression, tensor):
+        tensors, ctx = compression.compress(tensor)
+        return compression.decompress(tensors, ctx)
+
+    def test_fp16_and_bf16_relative_error(self):
+        """Test that the 16-bit compressions round to the nearest representable value."""
+        tensor = torch.randn(1000).mul_(torch.logspace(-3, 3, 1000))
+        # Half of the spacing, relative to the value, for 11 and 8 significant bits. The
+        # subnormal numbers of fp16 have the fixed spacing 2**-24.
+        for compression, relative_error, absolute_error in [(bf.Compression.fp16, 2**-11, 2**-25),
+                                                            (bf.Compression.bf16, 2**-8, 0)]:
+            output = self.roundtrip(compression, tensor)
+            assert output.dtype == tensor.dtype and output.shape == tensor.shape
+            error_bound = tensor.abs() * relative_error + absolute_error
+            assert ((output - tensor).abs() <= error_bound).all(), (
+                "{} exceeds the error bound of its rounding".format(compression.__name__))
+
+    def test_int8_error_within_scale(self):
+        """Test that the stochastic rounding of int8 errs by less than one step of its scale,
+        and is unbiased."""
+        tensor = torch.randn(100)
+        scale = tensor.abs().max() / 127
+        num_repeats = 2000
+        total = torch.zeros_like(tensor)
+        for _ in range(num_repeats):
+            output = self.roundtrip(bf.Compression.int8, tensor)
+            assert ((output - tensor).abs() <= scale * (1 + 1e-5)).all(), (
+                "int8 compression errs by more than its scale")
+            total.add_(output)
+        assert ((total / num_repeats - tensor).abs() < 0.1 * scale).all(), (
+            "int8 compression is biased")
+
+        zeros = torch.zeros(10)
+        assert torch.equal(self.roundtrip(bf.Compression.int8, zeros), zeros)
+
+    def test_topk_keeps_largest(self):
+        """Test that top-k keeps exactly the elements with the largest absolute values."""
+        # The absolute values are distinct and nonzero.
+        tensor = torch.randperm(60).float().add_(1).mul_(torch.tensor([1.0, -1.0]).repeat(30))
+        tensor = tensor.view(6, 10)
+        for ratio in [0.01, 0.1, 0.5, 1.0]:
+            k = max(1, int(tensor.numel() * ratio))
+            output = self.roundtrip(bf.Compression.topk(ratio), tensor)
+            assert output.shape == tensor.shape
+            kept = output != 0
+            assert kept.sum().item() == k
+            assert torch.equal(output[kept], tensor[kept])
+            if k < tensor.numel():
+                # The dropped elements are not larger than any kept one.
+                assert tensor[~kept].abs().max() <= tensor[kept].abs().min()
+
+    def test_topk_factory(self):
+        compression = bf.Compression.topk(0.5)
+        assert isinstance(compression, compression_lib.TopKCompressor)
+        assert compression.ratio == 0.5 and not compression.reducible
+        for ratio in [0, 1.5]:
+            with self.assertRaises(ValueError):
+                bf.Compression.topk(ratio)
+
+    def test_pack_and_unpack(self):
+        """Test that the compressed tensors are packed and unpacked exactly, with and without
+        Tensor.view(dtype), which the older torch does not support."""
+        compressions = [bf.Compression.fp16, bf.Compression.bf16, bf.Compression.int8,
+                        bf.Compression.topk(0.3)]
+        view_as_dtype = compression_lib._VIEW_AS_DTYPE
+        try:
+            for use_view_as_dtype in sorted({False, view_as_dtype}):
+                compression_lib._VIEW_AS_DTYPE = use_view_as_dtype
+                for compression in compressions:
+                    for numel in [1, 3, 7, 17, 100]:
+                        tensors, _ = compression.compress(torch.randn(numel, 2))
+                        layout = [(t.shape, t.dtype) for t in tensors]
+                        packed = compression_lib.pack(tensors)
+                        assert packed.dtype == torch.int32
+                        for tensor, unpacked in zip(tensors, compression_lib.unpack(packed,
+                                                                                    layout)):
+                            assert unpacked.dtype == tensor.dtype
+                            assert unpacked.shape == tensor.shape
+                            assert torch.equal(unpacked.float(), tensor.float())
+        finally:
+            compression_lib._VIEW_AS_DTYPE = view_as_dtype
+
+    def test_compress_once(self):
+        """Test that the ops send the result of the compression returned by compress_once
+        instead of compressing again, which differs for the stochastic rounding."""
+        tensor = torch.randn(100)
+        output, compression = compression_lib.compress_once(bf.Compression.int8, tensor)
+        assert compression.reducible == bf.Compression.int8.reducible
+        for _ in range(10):
+            tensors, ctx = compression.compress(tensor)
+            assert torch.equal(compression.decompress(tensors, ctx), output)
+
+    def test_error_feedback_across_steps(self):
+        """Test that the compression error is sent in the next steps, so the average of what is
+        sent converges to the tensor, unlike the compression without error feedback."""
+        tensor = torch.randn(64)
+        num_steps = 100
+        for compression in [bf.Compression.int8, bf.Compression.topk(0.1)]:
+            residuals = {}
+            total = torch.zeros_like(tensor)
+            for _ in range(num_steps):
+                sent, _ = _compress_with_error_feedback(residuals, "x", tensor, compression)
+                total.add_(sent)
+            # What is sent in total differs from the input in total only by the last residual.
+            assert torch.allclose(total + residuals["x"], tensor * num_steps, atol=1e-3)
+            error = (total / num_steps - tensor).abs().max()
+            error_without_feedback = (self.roundtrip(compression, tensor) - tensor).abs().max()
+            assert error < error_without_feedback / 10, (
+                "The error feedback does not reduce the error: {} >= {} / 10".format(
+                    error, error_without_feedback))
+
+
+if __name__ == "__main__":
+    unittest.main()
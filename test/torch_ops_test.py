@@ -282,6 +282,109 @@ class OpsTests(unittest.TestCase):
                 torch.allclose(tensor_2, exp_tenosr_2)
             ), "bf.allreduce(fusion) produces incorrect tensor 2"
 
+    def test_output_buffer_pool(self):
+        """Test that the ops with the same name alternate between two pooled outputs."""
+        size = bf.size()
+        rank = bf.rank()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        bf.set_output_buffer_pool_capacity(1024 * 1024)
+        try:
+            allreduce_ptrs, allgather_ptrs = [], []
+            for step in range(4):
+                tensor = torch.FloatTensor(23, 3).fill_(rank + step)
+                output = bf.allreduce(tensor, average=False, name="pool_allreduce")
+                assert torch.allclose(
+                    output, torch.FloatTensor(23, 3).fill_(size * (size - 1) / 2 + size * step)
+                ), "bf.allreduce with pooled output produces incorrect tensor"
+                allreduce_ptrs.append(output.data_ptr())
+
+                output = bf.allgather(tensor, name="pool_allgather")
+                assert list(output.shape) == [23 * size, 3]
+                for i in range(size):
+                    assert torch.allclose(output[i * 23:(i + 1) * 23], tensor.fill_(i + step)), \
+                        "bf.allgather with pooled output produces incorrect tensor"
+                allgather_ptrs.append(output.data_ptr())
+            for ptrs in [allreduce_ptrs, allgather_ptrs]:
+                assert ptrs[0] == ptrs[2] != ptrs[1] == ptrs[3], "Pooled outputs are not reused"
+        finally:
+            bf.set_output_buffer_pool_capacity(0)
+
+    def test_compressed_allreduce_and_neighbor_allreduce(self):
+        """Test that the compressed allreduce and neighbor_allreduce average the tensors, which
+        are represented exactly by all compressions."""
+        size = bf.size()
+        rank = bf.rank()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        compressions = [bf.Compression.fp16, bf.Compression.bf16, bf.Compression.int8,
+                        bf.Compression.topk(1.0)]
+
+        # By default, we use exponential two ring topology.
+        num_indegree = int(np.ceil(np.log2(size)))
+        neighbor_ranks = [(rank - 2**i) % size for i in range(num_indegree)]
+        sum_value = np.sum(neighbor_ranks) + rank
+
+        for i, compression in enumerate(compressions):
+            tensor = torch.FloatTensor(23, 3).fill_(rank)
+            output = bf.allreduce(tensor, average=True, name="compressed_allreduce_{}".format(i),
+                                  compression=compression)
+            assert output.dtype == tensor.dtype and list(output.shape) == [23, 3]
+            assert (
+                (output - (size - 1) / 2).abs().max() < EPSILON
+            ), "bf.allreduce with compression produces incorrect tensor"
+
+            output = bf.neighbor_allreduce(
+                tensor, name="compressed_neighbor_allreduce_{}".format(i),
+                compression=compression)
+            assert output.dtype == tensor.dtype and list(output.shape) == [23, 3]
+            assert (
+                (output.mul_(num_indegree + 1) - sum_value).abs().max() < EPSILON
+            ), "bf.neighbor_allreduce with compression produces incorrect tensor"
+
+    def test_compressed_allreduce_and_neighbor_allreduce_error_bound(self):
+        """Test that the compressed ops differ from the uncompressed ones by at most the
+        compression error of the other ranks, as the tensor of the rank itself is exact."""
+        size = bf.size()
+        rank = bf.rank()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        # The elements are in [-1, 1], so each compression errs by at most these bounds.
+        compressions = [(bf.Compression.fp16, 2**-11), (bf.Compression.bf16, 2**-8),
+                        (bf.Compression.int8, 1 / 127), (bf.Compression.topk(0.1), None)]
+        torch.manual_seed(rank)
+        tensor = torch.rand(100, 3).mul_(2).sub_(1)
+        expected_allreduce = bf.allreduce(tensor, name="uncompressed_allreduce")
+        expected_neighbor_allreduce = bf.neighbor_allreduce(
+            tensor, name="uncompressed_neighbor_allreduce")
+        zero_neighbor_weights = {r: 0.0 for r in bf.in_neighbor_ranks()}
+
+        for i, (compression, error_bound) in enumerate(compressions):
+            # Only the tensor of the rank itself is taken, which is not compressed.
+            output = bf.neighbor_allreduce(
+                tensor, self_weight=1.0, neighbor_weights=zero_neighbor_weights,
+                name="compressed_self_neighbor_allreduce_{}".format(i), compression=compression)
+            assert (output - tensor).abs().max() < EPSILON, (
+                "bf.neighbor_allreduce with compression changes the tensor of the rank itself")
+            if error_bound is None:
+                continue
+
+            output = bf.allreduce(tensor, name="compressed_allreduce_bound_{}".format(i),
+                                  compression=compression)
+            assert (output - expected_allreduce).abs().max() <= error_bound + EPSILON, (
+                "bf.allreduce with compression exceeds the error bound")
+            output = bf.neighbor_allreduce(
+                tensor, name="compressed_neighbor_allreduce_bound_{}".format(i),
+                compression=compression)
+            assert (output - expected_neighbor_allreduce).abs().max() <= error_bound + EPSILON, (
+                "bf.neighbor_allreduce with compression exceeds the error bound")
+
     def test_allgather(self):
         """Test that the allgather correctly gathers 1D, 2D, 3D tensors."""
         size = bf.size()
@@ -862,6 +965,133 @@ class OpsTests(unittest.TestCase):
                 (reduced_tensor.data - expect_result).abs().max() < eps
             ), "bf.neighbor_allreduce (weighted_avg) produces incorrect reduced tensor"
 
+    # The sizes are around and across the chunk boundaries of
+    # BLUEFOG_NEIGHBOR_ALLREDUCE_CHUNK_SIZE=1000 (250 floats, 125 doubles) used by
+    # make test_torch_neighbor_allreduce_pipelined, including the ones not divisible by it.
+    # Without it, the tests check the same results on the non-pipelined neighbor_allreduce.
+    PIPELINE_TEST_SIZES = [1, 124, 125, 126, 249, 250, 251, 1000, 2501, 10007]
+
+    def test_neighbor_allreduce_chunk_boundaries(self):
+        """Test that the neighbor allreduce with weights is correct for the sizes around the
+           chunks of the pipelined neighbor allreduce."""
+        size = bf.size()
+        rank = bf.rank()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        dtypes = [torch.FloatTensor, torch.DoubleTensor]
+
+        # By default, we use exponential two ring topology.
+        num_indegree = int(np.ceil(np.log2(size)))
+        neighbor_ranks = [(rank - 2**i) % size for i in range(num_indegree)]
+        self_weight = 0.25
+        neighbor_weights = {r: 0.5 / (i + 1) for i, r in enumerate(neighbor_ranks)}
+
+        for dtype, n in itertools.product(dtypes, self.PIPELINE_TEST_SIZES):
+            base = torch.arange(n).fmod(13).type(dtype)
+            tensor = base + rank
+            name = "neighbor_allreduce_chunk_{}_{}".format(n, dtype)
+            avg_tensor = bf.neighbor_allreduce(tensor, name=name + "_avg")
+            weighted_tensor = bf.neighbor_allreduce(
+                tensor, name=name + "_weighted", self_weight=self_weight,
+                neighbor_weights=neighbor_weights)
+
+            expected_avg = base + (np.sum(neighbor_ranks) + rank) / (num_indegree + 1)
+            expected_weighted = (base + rank) * self_weight + sum(
+                (base + r) * w for r, w in neighbor_weights.items())
+            assert (
+                list(avg_tensor.shape) == [n] and list(weighted_tensor.shape) == [n]
+            ), "bf.neighbor_allreduce (chunk) produces incorrect reduced shape"
+            assert (
+                (avg_tensor - expected_avg).abs().max() < EPSILON
+            ), "bf.neighbor_allreduce (chunk avg) produces incorrect reduced tensor"
+            assert (
+                (weighted_tensor - expected_weighted).abs().max() < EPSILON
+            ), "bf.neighbor_allreduce (chunk weighted) produces incorrect reduced tensor"
+            assert (
+                (tensor - base - rank).abs().max() == 0
+            ), "bf.neighbor_allreduce (chunk) modifies the input tensor"
+
+    def test_neighbor_allreduce_recv_pool_reuse(self):
+        """Test that the neighbor allreduce in flight together are correct when the receive pool
+           of the pipelined neighbor allreduce is reused by tensors of decreasing sizes."""
+        size = bf.size()
+        rank = bf.rank()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+
+        # By default, we use exponential two ring topology.
+        num_indegree = int(np.ceil(np.log2(size)))
+        neighbor_ranks = [(rank - 2**i) % size for i in range(num_indegree)]
+        sum_value = np.sum(neighbor_ranks) + rank
+
+        sizes = sorted(self.PIPELINE_TEST_SIZES, reverse=True)
+        tensors, handles = [], []
+        for i, n in enumerate(sizes):
+            tensors.append(torch.FloatTensor(n).fill_(i + rank))
+            handles.append(bf.neighbor_allreduce_nonblocking(
+                tensors[i], name="recv_pool_reuse_{}".format(n)))
+        for i, n in enumerate(sizes):
+            output = bf.synchronize(handles[i])
+            assert (
+                list(output.shape) == [n]
+            ), "bf.neighbor_allreduce (recv pool) produces incorrect reduced shape"
+            assert (
+                ((output - i).mul(num_indegree+1) - sum_value).abs().max() < EPSILON
+            ), "bf.neighbor_allreduce (recv pool) produces incorrect reduced tensor"
+
+    def test_neighbor_allreduce_dynamic_topo_chunk_boundaries(self):
+        """Test that the neighbor allreduce with dynamic neighbors, including the ranks without
+           in-neighbors, is correct for the sizes around the chunks of the pipelined neighbor
+           allreduce."""
+        size = bf.size()
+        rank = bf.rank()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        dtypes = [torch.FloatTensor, torch.DoubleTensor]
+
+        num_indegree = int(np.ceil(np.log2(size)))
+        for dtype, n in itertools.product(dtypes, self.PIPELINE_TEST_SIZES):
+            base = torch.arange(n).fmod(13).type(dtype)
+            tensor = base + rank
+            # One peer of the exponential two ring at a time.
+            for k in range(num_indegree):
+                recv_rank = (rank - 2**k) % size
+                reduced_tensor = bf.neighbor_allreduce(
+                    tensor, name="dynamic_chunk_{}_{}_{}".format(n, dtype, k),
+                    self_weight=0.75, neighbor_weights={recv_rank: 0.25},
+                    send_neighbors=[(rank + 2**k) % size])
+                expected = base + rank * 0.75 + recv_rank * 0.25
+                assert (
+                    (reduced_tensor - expected).abs().max() < EPSILON
+                ), "bf.neighbor_allreduce (dynamic chunk) produces incorrect reduced tensor"
+
+            # Every rank sends to rank 1, which sends to rank 0. So the ranks from 2 on have no
+            # in-neighbors, while rank 1 receives from all the others.
+            if rank == 0:
+                self_weight, neighbor_weights = 0.5, {1: 0.5}
+                expected = base + 0.5
+            elif rank == 1:
+                others = [r for r in range(size) if r != 1]
+                self_weight = 0.5
+                neighbor_weights = {r: 0.5 / len(others) for r in others}
+                expected = base + 0.5 + 0.5 * np.mean(others)
+            else:
+                self_weight, neighbor_weights = 1.0, {}
+                expected = base + rank
+            reduced_tensor = bf.neighbor_allreduce(
+                tensor, name="dynamic_chunk_star_{}_{}".format(n, dtype),
+                self_weight=self_weight, neighbor_weights=neighbor_weights,
+                send_neighbors=[0] if rank == 1 else [1])
+            assert (
+                (reduced_tensor - expected).abs().max() < EPSILON
+            ), "bf.neighbor_allreduce (dynamic chunk) produces incorrect reduced tensor"
+
     def test_neighbor_allreduce_fusion(self):
         """Test that the neighbor allreduce works under tensor fusion."""
         size = bf.size()
@@ -959,6 +1189,40 @@ class OpsTests(unittest.TestCase):
                     (output_normalized - sum_value).abs().max() < EPSILON
                 ), f"{names[i]} (fusion) produces incorrect reduced tensor"
 
+    def test_neighbor_allreduce_out_of_order(self):
+        """Test that the neighbor allreduce matches tensors submitted in different orders."""
+        size = bf.size()
+        rank = bf.rank()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        K = 200 # number of tensors in flight at the same time
+
+        # By default, we use exponential two ring topology.
+        num_indegree = int(np.ceil(np.log2(size)))
+        neighbor_ranks = [(rank - 2**i) % size for i in range(num_indegree)]
+        sum_value = np.sum(neighbor_ranks) + rank
+
+        # Every rank submits the tensors in its own order, and the sizes differ so that a
+        # tensor matched with the wrong neighbor tensor is reported as an error.
+        order = np.random.RandomState(rank).permutation(K)
+        tensors, handles = {}, {}
+        for i in order:
+            tensors[i] = torch.FloatTensor(i % 7 + 1).fill_(i + rank)
+            handles[i] = bf.neighbor_allreduce_nonblocking(
+                tensors[i], name="out_of_order_{}".format(i))
+
+        for i in range(K):
+            output = bf.synchronize(handles[i])
+            assert (
+                list(output.shape) == [i % 7 + 1]
+            ), "bf.neighbor_allreduce (out of order) produces incorrect reduced shape"
+            output_normalized = (output - i).mul(num_indegree+1)
+            assert (
+                (output_normalized - sum_value).abs().max() < EPSILON
+            ), "bf.neighbor_allreduce (out of order) produces incorrect reduced tensor"
+
     def test_neighbor_allreduce_dynamic_topo_fusion(self):
         """Test neighbor allreduce works with parital send (dynamic topo) under tensor fusion."""
         size = bf.size()
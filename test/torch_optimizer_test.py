@@ -0,0 +1,427 @@
+# Copyright 2020 Bluefog Team. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import inspect
+import time
+import warnings
+import unittest
+
+import numpy as np
+import torch
+
+import bluefog.torch as bf
+
+TOLERANCE = 0.2
+
+
+class _Vector(torch.nn.Module):
+    """A model whose only parameter x is the output, filled with value initially."""
+
+    def __init__(self, value, dim=4):
+        super(_Vector, self).__init__()
+        self.x = torch.nn.Parameter(torch.full((dim,), float(value)))
+
+    def forward(self):  # pylint: disable=arguments-differ
+        return self.x
+
+
+class _Vectors(torch.nn.Module):
+    """Two _Vector children of different sizes, whose concatenation is the output. The window
+    optimizers name the parameters after the children."""
+
+    def __init__(self, value):
+        super(_Vectors, self).__init__()
+        self.a = _Vector(value, dim=3)
+        self.b = _Vector(value, dim=5)
+
+    def forward(self):  # pylint: disable=arguments-differ
+        return torch.cat((self.a(), self.b()))
+
+
+class OptimizerTests(unittest.TestCase):
+    """
+    Tests for bluefog/torch/optimizers.py
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(OptimizerTests, self).__init__(*args, **kwargs)
+        warnings.simplefilter("module")
+
+    def setUp(self):
+        bf.init()
+        bf.set_skip_negotiate_stage(True)
+
+    def tearDown(self):
+        assert bf.win_free()
+
+    @staticmethod
+    def minimize_distance_to_rank(model, optimizer, num_steps, lr_decay=0.99):
+        """Run the steps of min_x sum_i ||x - i||^2 / 2 over the ranks i, whose solution is the
+        mean of the ranks, with a decaying learning rate. Then keep stepping without the
+        gradient so that the asynchronous averaging reaches the consensus."""
+        lr = optimizer.param_groups[0]["lr"]
+        for step in range(2 * num_steps):
+            for param_group in optimizer.param_groups:
+                param_group["lr"] = lr * lr_decay**step if step < num_steps else 0.0
+            optimizer.zero_grad()
+            loss = 0.5 * (model() - bf.rank()).pow(2).sum()
+            loss.backward()
+            optimizer.step()
+            time.sleep(0.002)
+
+    @staticmethod
+    def train_two_layer_model(make_optimizer, flat_buffer, num_steps=5, backward_passes=1):
+        """Train the same initial model on every rank with the data of the rank. Return the
+        model and the optimizer."""
+        torch.manual_seed(0)
+        model = torch.nn.Sequential(torch.nn.Linear(4, 3), torch.nn.ReLU(),
+                                    torch.nn.Linear(3, 2))
+        optimizer = make_optimizer(torch.optim.SGD(model.parameters(), lr=0.1), model,
+                                   flat_buffer)
+        torch.manual_seed(1 + bf.rank())
+        inputs = torch.randn(num_steps, backward_passes, 8, 4)
+        for step in range(num_steps):
+            optimizer.zero_grad()
+            for j in range(backward_passes):
+                model(inputs[step, j]).pow(2).mean().backward()
+            optimizer.step()
+        return model, optimizer
+
+    @staticmethod
+    def assert_views_of_flat_buffers(optimizer, check_grad=False):
+        assert optimizer._flat_buffers, "The optimizer has no flat buffer."
+        for buf in optimizer._flat_buffers:
+            for i, p in enumerate(buf.params):
+                begin, end = buf.offsets[i], buf.offsets[i + 1]
+                assert p.data_ptr() == buf.data[begin:end].data_ptr(), (
+                    "The parameter is not a view into the flat buffer.")
+                if check_grad:
+                    assert p.grad.data_ptr() == buf.grad[begin:end].data_ptr(), (
+                        "The gradient is not a view into the flat buffer.")
+
+    def _test_flat_buffer_matches(self, make_optimizer, backward_passes=1):
+        """Return the optimizer with flat_buffer=True after checking that it gives the same
+        parameters as the optimizer with flat_buffer=False."""
+        flat_model, flat_optimizer = self.train_two_layer_model(
+            make_optimizer, True, backward_passes=backward_passes)
+        model, _ = self.train_two_layer_model(
+            make_optimizer, False, backward_passes=backward_passes)
+        for (name, flat_p), (_, p) in zip(flat_model.named_parameters(),
+                                          model.named_parameters()):
+            assert torch.allclose(flat_p, p, atol=1e-6), (
+                "The parameter {} differs with flat_buffer: {} != {} at rank {}".format(
+                    name, flat_p, p, bf.rank()))
+        return flat_optimizer
+
+    def test_flat_buffer_allreduce(self):
+        if bf.size() <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        optimizer = self._test_flat_buffer_matches(
+            lambda opt, model, flat_buffer: bf.DistributedAllreduceOptimizer(
+                opt, model, flat_buffer=flat_buffer))
+        self.assert_views_of_flat_buffers(optimizer)
+
+    def test_flat_buffer_neighbor_allreduce(self):
+        if bf.size() <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        optimizer = self._test_flat_buffer_matches(
+            lambda opt, model, flat_buffer: bf.DistributedNeighborAllreduceOptimizer(
+                opt, model, flat_buffer=flat_buffer))
+        self.assert_views_of_flat_buffers(optimizer)
+
+    def test_flat_buffer_hierarchical_neighbor_allreduce(self):
+        num_machines = bf.size() // bf.local_size()
+        if bf.local_size() <= 1 or num_machines <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to a single machine or local size 1".format(fname))
+            return
+        machine_id = bf.rank() // bf.local_size()
+
+        def make_optimizer(opt, model, flat_buffer):
+            optimizer = bf.DistributedHierarchicalNeighborAllreduceOptimizer(
+                opt, model, flat_buffer=flat_buffer)
+            optimizer.self_weight = 0.5
+            optimizer.neighbor_machine_weights = {(machine_id - 1) % num_machines: 0.5}
+            optimizer.send_neighbor_machines = [(machine_id + 1) % num_machines]
+            return optimizer
+        optimizer = self._test_flat_buffer_matches(make_optimizer)
+        self.assert_views_of_flat_buffers(optimizer)
+
+    def test_flat_buffer_gradient_allreduce(self):
+        if bf.size() <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        for backward_passes in [1, 2]:
+            optimizer = self._test_flat_buffer_matches(
+                lambda opt, model, flat_buffer: bf.DistributedGradientAllreduceOptimizer(
+                    opt, model, backward_passes_per_step=backward_passes,
+                    flat_buffer=flat_buffer),
+                backward_passes=backward_passes)
+            self.assert_views_of_flat_buffers(optimizer, check_grad=True)
+            optimizer.zero_grad()
+            self.assert_views_of_flat_buffers(optimizer, check_grad=True)
+            for buf in optimizer._flat_buffers:
+                assert (buf.grad == 0).all(), "zero_grad does not clear the flat buffer."
+
+    def test_flat_buffer_names_are_unique(self):
+        """Test that two optimizers with flat buffers communicate at the same time."""
+        if bf.size() <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        models = [_Vector(bf.rank()), _Vector(2 * bf.rank())]
+        optimizers = [bf.DistributedGradientAllreduceOptimizer(
+            torch.optim.SGD(model.parameters(), lr=1.0), model, flat_buffer=True)
+                      for model in models]
+        names = [{buf.name for buf in optimizer._flat_buffers} for optimizer in optimizers]
+        assert names[0].isdisjoint(names[1]), "The flat buffers share names: {}".format(names)
+        for optimizer in optimizers:
+            optimizer.zero_grad()
+        # Both gradient allreduces are in flight before either optimizer steps.
+        for model in models:
+            model().sum().backward()
+        for optimizer in optimizers:
+            optimizer.step()
+        for i, model in enumerate(models):
+            # The gradient of every rank is one.
+            assert torch.allclose(model.x.data, torch.full_like(model.x, (i + 1) * bf.rank() - 1))
+
+    def _test_sync_win_converges(self, make_optimizer):
+        """Return the optimizer with flat_buffer=True after checking that it converges, as the
+        optimizer with flat_buffer=False does."""
+        size = bf.size()
+        if size <= 1:
+            fname = inspect.stack()[1][3]
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return None
+        expected_value = (size - 1) / 2
+        for flat_buffer in [False, True]:
+            model = _Vectors(0)
+            optimizer = make_optimizer(torch.optim.SGD(model.parameters(), lr=0.1), model,
+                                       flat_buffer)
+            self.minimize_distance_to_rank(model, optimizer, num_steps=200)
+            for name, p in model.named_parameters():
+                assert (p.data - expected_value).abs().max() < TOLERANCE, (
+                    "The parameter {} does not converge with flat_buffer={}: {} != {} at "
+                    "rank {}".format(name, flat_buffer, p.data, expected_value, bf.rank()))
+        return optimizer
+
+    def test_win_put_flat_buffer_converges(self):
+        optimizer = self._test_sync_win_converges(
+            lambda opt, model, flat_buffer: bf.DistributedWinPutOptimizer(
+                opt, model, flat_buffer=flat_buffer))
+        if optimizer is not None:
+            self.assert_views_of_flat_buffers(optimizer)
+
+    def test_pull_get_flat_buffer_converges(self):
+        optimizer = self._test_sync_win_converges(
+            lambda opt, model, flat_buffer: bf.DistributedPullGetOptimizer(
+                opt, model, flat_buffer=flat_buffer))
+        if optimizer is not None:
+            self.assert_views_of_flat_buffers(optimizer)
+
+    def test_push_sum_flat_buffer_converges(self):
+        optimizer = self._test_sync_win_converges(
+            lambda opt, model, flat_buffer: bf.DistributedPushSumOptimizer(
+                opt, model, flat_buffer=flat_buffer))
+        if optimizer is None:
+            return
+        self.assert_views_of_flat_buffers(optimizer)
+        # The buffers stay the sent tensors without their last element, the push_sum weight 1,
+        # which is windowed by a copy.
+        for buf in optimizer._flat_buffers:
+            send_tensor = optimizer._flat_send_tensors[buf]
+            assert buf.data.data_ptr() == send_tensor.data_ptr()
+            assert buf.data.numel() == send_tensor.numel() - 1
+            assert send_tensor[-1].item() == 1.0
+            assert (optimizer._named_extension_parameters[buf.name].data_ptr() !=
+                    send_tensor.data_ptr())
+
+    def _test_async_converges(self, make_optimizer):
+        size = bf.size()
+        if size <= 1:
+            fname = inspect.stack()[1][3]
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        model = _Vector(0)
+        optimizer = make_optimizer(torch.optim.SGD(model.parameters(), lr=0.1), model)
+        self.minimize_distance_to_rank(model, optimizer, num_steps=200)
+        optimizer.stop_communication()
+        bf.barrier()
+        expected_value = (size - 1) / 2
+        assert (model.x.data - expected_value).abs().max() < TOLERANCE, (
+            "The asynchronous optimizer does not converge: {} != {} at rank {}".format(
+                model.x.data, expected_value, bf.rank()))
+
+    def test_async_win_put_converges(self):
+        self._test_async_converges(
+            lambda opt, model: bf.DistributedWinPutOptimizer(opt, model, asynchronous=True))
+
+    def test_async_win_put_flat_buffer_converges(self):
+        self._test_async_converges(
+            lambda opt, model: bf.DistributedWinPutOptimizer(opt, model, flat_buffer=True,
+                                                             asynchronous=True))
+
+    def test_async_pull_get_converges(self):
+        self._test_async_converges(
+            lambda opt, model: bf.DistributedPullGetOptimizer(opt, model, asynchronous=True))
+
+    def test_async_push_sum_converges(self):
+        self._test_async_converges(
+            lambda opt, model: bf.DistributedPushSumOptimizer(opt, model, asynchronous=True))
+
+    def _test_compressed_converges(self, make_optimizer):
+        size = bf.size()
+        if size <= 1:
+            fname = inspect.stack()[1][3]
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        expected_value = (size - 1) / 2
+        for compression in [bf.Compression.fp16, bf.Compression.int8, bf.Compression.topk(0.5)]:
+            model = _Vector(0)
+            optimizer = make_optimizer(torch.optim.SGD(model.parameters(), lr=0.1), model,
+                                       compression)
+            self.minimize_distance_to_rank(model, optimizer, num_steps=200)
+            assert (model.x.data - expected_value).abs().max() < TOLERANCE, (
+                "The optimizer with {} does not converge: {} != {} at rank {}".format(
+                    type(compression).__name__, model.x.data, expected_value, bf.rank()))
+
+    def test_compressed_neighbor_allreduce_converges(self):
+        self._test_compressed_converges(
+            lambda opt, model, compression: bf.DistributedNeighborAllreduceOptimizer(
+                opt, model, compression=compression))
+
+    def test_compressed_allreduce_converges(self):
+        self._test_compressed_converges(
+            lambda opt, model, compression: bf.DistributedAllreduceOptimizer(
+                opt, model, compression=compression))
+
+    def test_compressed_gradient_allreduce_converges(self):
+        self._test_compressed_converges(
+            lambda opt, model, compression: bf.DistributedGradientAllreduceOptimizer(
+                opt, model, compression=compression))
+
+    def test_compressed_neighbor_allreduce_rejects_changed_weights(self):
+        size = bf.size()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        model = _Vector(0)
+        optimizer = bf.DistributedNeighborAllreduceOptimizer(
+            torch.optim.SGD(model.parameters(), lr=0.1), model, compression=bf.Compression.int8)
+        self.minimize_distance_to_rank(model, optimizer, num_steps=2)
+        optimizer.self_weight = 1.0
+        optimizer.neighbor_weights = {r: 0.0 for r in bf.in_neighbor_ranks()}
+        with self.assertRaises(ValueError):
+            model()
+
+    def test_async_max_staleness_excludes_stopped_neighbor(self):
+        """Test that the neighbors stop averaging with a rank once it stops writing."""
+        size = bf.size()
+        rank = bf.rank()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        max_staleness = 2
+        # Rank 0 writes 100 once and stops. The others start from 0 and only average.
+        model = _Vector(100 if rank == 0 else 0)
+        optimizer = bf.DistributedWinPutOptimizer(
+            torch.optim.SGD(model.parameters(), lr=0.0), model, asynchronous=True,
+            max_staleness=max_staleness)
+        if rank == 0:
+            optimizer.stop_communication()
+            bf.win_put(model.x.data, name="x", require_mutex=True)
+        bf.barrier()
+
+        for _ in range(200):
+            model.x.grad = torch.zeros_like(model.x)
+            optimizer.step()
+            time.sleep(0.002)
+        optimizer.stop_communication()
+        bf.barrier()
+
+        if rank != 0:
+            # Rank 0 is averaged in at most max_staleness + 1 rounds, with at most the weight
+            # 1 / (indegree + 1) each time. Without max_staleness, the values approach 100.
+            indegree = int(np.ceil(np.log2(size)))
+            bound = 100 * (1 - (1 - 1 / (indegree + 1)) ** (max_staleness + 1))
+            assert model.x.data.max() < bound + TOLERANCE, (
+                "The neighbor which stopped writing is not left out: {} >= {} at rank {}".format(
+                    model.x.data.max(), bound, rank))
+
+    def test_async_stop_communication(self):
+        """Test that a rank is not averaged with its neighbors after stop_communication."""
+        size = bf.size()
+        rank = bf.rank()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        model = _Vector(100 if rank == 0 else 0)
+        optimizer = bf.DistributedWinPutOptimizer(
+            torch.optim.SGD(model.parameters(), lr=0.0), model, asynchronous=True)
+        if rank == 0:
+            optimizer.stop_communication()
+            assert not optimizer._async_worker._thread.is_alive(), (
+                "The background communication is still running after stop_communication.")
+        bf.barrier()
+
+        # The other ranks keep putting to rank 0 and averaging.
+        for _ in range(50):
+            model.x.grad = torch.zeros_like(model.x)
+            optimizer.step()
+            time.sleep(0.002)
+        optimizer.stop_communication()
+        bf.barrier()
+
+        if rank == 0:
+            assert (model.x.data == 100).all(), (
+                "The parameters are averaged after stop_communication: {}".format(model.x.data))
+
+    def test_async_error_surfaces_on_step(self):
+        """Test that an error of the background communication is raised by step()."""
+        size = bf.size()
+        rank = bf.rank()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        model = _Vector(0)
+        optimizer = bf.DistributedWinPutOptimizer(
+            torch.optim.SGD(model.parameters(), lr=0.1), model, asynchronous=True)
+        # Self is not an out-neighbor, so win_put fails in the background thread.
+        optimizer.dst_weights = {rank: 1.0}
+        with self.assertRaises(RuntimeError):
+            for _ in range(100):
+                model.x.grad = torch.zeros_like(model.x)
+                optimizer.step()
+                time.sleep(0.01)
+        optimizer.stop_communication()
+        bf.barrier()
+
+
+if __name__ == "__main__":
+    unittest.main()
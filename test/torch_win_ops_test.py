@@ -364,6 +364,152 @@ class WinOpsTests(unittest.TestCase):
             is_freed = bf.win_free(window_name)
             assert is_freed, "bf.win_free do not free window object successfully."
 
+    def test_win_update_incremental(self):
+        """Test that the incremental win_update reuses the unchanged neighbor buffers."""
+        size = bf.size()
+        rank = bf.rank()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        dtypes = [torch.FloatTensor, torch.DoubleTensor]
+        if TEST_ON_GPU:
+            dtypes += [torch.cuda.FloatTensor, torch.cuda.DoubleTensor]
+
+        # By default, we use exponential two ring topology.
+        indegree = int(np.ceil(np.log2(size)))
+        neighbor_ranks = [(rank - 2**i) %
+                          size for i in range(indegree)]  # in-neighbor
+        avg_value = (rank + np.sum(neighbor_ranks)) / float(indegree+1)
+
+        dims = [1, 2, 3]
+        for dtype, dim in itertools.product(dtypes, dims):
+            tensor = torch.FloatTensor(*([DIM_SIZE] * dim)).fill_(1).mul_(rank)
+            tensor = self.cast_and_place(tensor, dtype)
+            window_name = "win_update_incremental_{}_{}".format(dim, dtype)
+            bf.win_create(tensor, window_name)
+
+            bf.win_put(tensor, window_name)
+            bf.barrier()
+            sync_result = bf.win_update(window_name, clone=True, incremental=True)
+            assert (sync_result.data - avg_value).abs().max() < EPSILON, (
+                "bf.win_update (incremental) produces wrong tensor value " +
+                "[{}-{}]!={} at rank {}.".format(sync_result.min(), sync_result.max(),
+                                                 avg_value, rank))
+
+            # Only the closest in-neighbor changes its buffer.
+            bf.win_put(tensor + 10, window_name, dst_weights={(rank + 1) % size: 1.0})
+            bf.barrier()
+            sync_result = bf.win_update(window_name, clone=True, incremental=True)
+            expected_value = avg_value + 10 / float(indegree+1)
+            assert (sync_result.data - expected_value).abs().max() < EPSILON, (
+                "bf.win_update (incremental) produces wrong tensor value " +
+                "[{}-{}]!={} at rank {}.".format(sync_result.min(), sync_result.max(),
+                                                 expected_value, rank))
+            full_result = bf.win_update(window_name, clone=True)
+            assert (full_result.data - sync_result.data).abs().max() < EPSILON, (
+                "bf.win_update (incremental) does not match bf.win_update.")
+
+        time.sleep(0.5)
+        for dtype, dim in itertools.product(dtypes, dims):
+            window_name = "win_update_incremental_{}_{}".format(dim, dtype)
+            is_freed = bf.win_free(window_name)
+            assert is_freed, "bf.win_free do not free window object successfully."
+
+    def test_win_update_incremental_with_concurrent_put(self):
+        """Test that the incremental win_update with require_mutex does not miss the win_put
+           happening at the same time."""
+        size = bf.size()
+        rank = bf.rank()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        K = 50 # number of concurrent win_put and win_update
+
+        # By default, we use exponential two ring topology.
+        indegree = int(np.ceil(np.log2(size)))
+        neighbor_ranks = [(rank - 2**i) %
+                          size for i in range(indegree)]  # in-neighbor
+        neighbor_weights = {r: 1.0 / indegree for r in neighbor_ranks}
+
+        dtypes = [torch.FloatTensor, torch.DoubleTensor]
+        for dtype in dtypes:
+            tensor = self.cast_and_place(torch.FloatTensor(DIM_SIZE).fill_(rank), dtype)
+            window_name = "win_update_incremental_concurrent_{}".format(dtype)
+            bf.win_create(tensor, window_name)
+            put_tensor = tensor.clone()
+            bf.barrier()
+
+            for k in range(K):
+                put_tensor.fill_(k + rank)
+                handle = bf.win_put_nonblocking(put_tensor, window_name, require_mutex=True)
+                bf.win_update(window_name, self_weight=0.0, neighbor_weights=neighbor_weights,
+                              require_mutex=True, incremental=True)
+                bf.win_wait(handle)
+            bf.barrier()
+
+            # A win_put whose version was cleared without being read would leave the cached
+            # value of its neighbor stale.
+            sync_result = bf.win_update(window_name, self_weight=0.0,
+                                        neighbor_weights=neighbor_weights,
+                                        require_mutex=True, incremental=True)
+            expected_value = K - 1 + np.mean(neighbor_ranks)
+            assert (sync_result.data - expected_value).abs().max() < EPSILON, (
+                "bf.win_update (incremental) misses a concurrent win_put " +
+                "[{}-{}]!={} at rank {}.".format(sync_result.min(), sync_result.max(),
+                                                 expected_value, rank))
+            bf.barrier()
+            assert bf.win_free(window_name), "bf.win_free do not free window object successfully."
+
+    def test_win_update_then_collect_incremental_with_accumulate(self):
+        """Test that the incremental win_update_then_collect collects what win_accumulate adds,
+           as push-sum does, and skips the buffers reset without a new accumulation."""
+        size = bf.size()
+        rank = bf.rank()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        K = 3 # number of accumulations before each collection
+
+        # By default, we use exponential two ring topology.
+        indegree = int(np.ceil(np.log2(size)))
+        neighbor_ranks = [(rank - 2**i) %
+                          size for i in range(indegree)]  # in-neighbor
+
+        dtypes = [torch.FloatTensor, torch.DoubleTensor]
+        if TEST_ON_GPU:
+            dtypes += [torch.cuda.FloatTensor, torch.cuda.DoubleTensor]
+        for dtype in dtypes:
+            tensor = self.cast_and_place(torch.FloatTensor(DIM_SIZE).fill_(rank), dtype)
+            window_name = "win_collect_incremental_accumulate_{}".format(dtype)
+            bf.win_create(tensor, window_name, zero_init=True)
+            bf.barrier()
+
+            expected_value = rank
+            for _ in range(2):
+                for _ in range(K):
+                    bf.win_accumulate(tensor.clone().fill_(rank), window_name,
+                                      require_mutex=True)
+                bf.barrier()
+                collected = bf.win_update_then_collect(window_name, incremental=True)
+                expected_value += K * np.sum(neighbor_ranks)
+                assert (collected.data - expected_value).abs().max() < EPSILON, (
+                    "bf.win_update_then_collect (incremental) misses win_accumulate " +
+                    "[{}-{}]!={} at rank {}.".format(collected.min(), collected.max(),
+                                                     expected_value, rank))
+                bf.barrier()
+
+            # No neighbor accumulates, so nothing more is collected.
+            collected = bf.win_update_then_collect(window_name, incremental=True)
+            assert (collected.data - expected_value).abs().max() < EPSILON, (
+                "bf.win_update_then_collect (incremental) collects the reset buffers again " +
+                "[{}-{}]!={} at rank {}.".format(collected.min(), collected.max(),
+                                                 expected_value, rank))
+            bf.barrier()
+            assert bf.win_free(window_name), "bf.win_free do not free window object successfully."
+
     def test_win_put_with_given_destination(self):
         """Test that the window put operation with given destination."""
         size = bf.size()
@@ -405,6 +551,74 @@ class WinOpsTests(unittest.TestCase):
             is_freed = bf.win_free(window_name)
             assert is_freed, "bf.win_free do not free window object successfully."
 
+    def test_win_put_and_accumulate_to_non_out_neighbor(self):
+        """Test that win_put and win_accumulate to a rank which is not an out-neighbor raise
+        an error without sending anything."""
+        size = bf.size()
+        rank = bf.rank()
+        out_neighbor_ranks = bf.out_neighbor_ranks()
+        # All ranks have the same out-degree in the exponential two ring topology.
+        non_neighbor_ranks = [r for r in range(size)
+                              if r != rank and r not in out_neighbor_ranks]
+        if not non_neighbor_ranks:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} since every rank is an out-neighbor".format(fname))
+            return
+
+        tensor = torch.FloatTensor(DIM_SIZE).fill_(1).mul_(rank + 1)
+        window_name = "win_non_out_neighbor"
+        bf.win_create(tensor, window_name, zero_init=True)
+        dst_weights = {out_neighbor_ranks[0]: 1.0, non_neighbor_ranks[0]: 1.0}
+        with self.assertRaises(ValueError):
+            bf.win_put(tensor, window_name, dst_weights=dst_weights)
+        with self.assertRaises(ValueError):
+            bf.win_accumulate(tensor, window_name, dst_weights=dst_weights)
+        bf.barrier()
+
+        # The valid destination is not written either.
+        neighbor_weights = {r: 1.0 for r in bf.in_neighbor_ranks()}
+        sync_result = bf.win_update(window_name, self_weight=0.0,
+                                    neighbor_weights=neighbor_weights)
+        assert sync_result.abs().max() < EPSILON, (
+            "bf.win_put or bf.win_accumulate to a non out-neighbor wrote to the window "
+            "at rank {}.".format(rank))
+        assert bf.win_free(window_name)
+
+    def test_win_put_and_accumulate_with_varied_window_sizes(self):
+        """Test that the data of each neighbor lands in its own slot, with several windows of
+        different sizes."""
+        size = bf.size()
+        rank = bf.rank()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        shapes = [[1], [7], [DIM_SIZE, DIM_SIZE], [3, 5, 2]]
+        tensors = []
+        for k, shape in enumerate(shapes):
+            # Each window has its own values, so that a mixed up window is detected as well.
+            tensor = torch.FloatTensor(*shape).fill_(1).mul_(rank * len(shapes) + k)
+            tensors.append(tensor)
+            bf.win_create(tensor, "win_put_size_{}".format(k))
+            bf.win_create(tensor.clone(), "win_accumulate_size_{}".format(k), zero_init=True)
+        for k, tensor in enumerate(tensors):
+            bf.win_put(tensor, "win_put_size_{}".format(k))
+            bf.win_accumulate(tensor, "win_accumulate_size_{}".format(k))
+        bf.barrier()
+
+        for k, shape in enumerate(shapes):
+            for window_name in ["win_put_size_{}".format(k), "win_accumulate_size_{}".format(k)]:
+                for r in bf.in_neighbor_ranks():
+                    sync_result = bf.win_update(window_name, self_weight=0.0,
+                                                neighbor_weights={r: 1.0}, clone=True)
+                    expected_value = r * len(shapes) + k
+                    assert list(sync_result.shape) == shape, (
+                        "bf.win_update of {} produces wrong shape tensor.".format(window_name))
+                    assert (sync_result - expected_value).abs().max() < EPSILON, (
+                        "The slot of neighbor {} in {} holds [{}-{}] instead of {} at "
+                        "rank {}.".format(r, window_name, sync_result.min(), sync_result.max(),
+                                          expected_value, rank))
+
     def test_win_accumulate(self):
         """Test that the window accumulate operation."""
         size = bf.size()
@@ -719,6 +933,55 @@ class WinOpsTests(unittest.TestCase):
                 assert (t_end - t_start) < 2, \
                     "The mutex acquire time should be shorter than 2 second"
 
+    def test_win_mutex_contention(self):
+        """Test that win_put and win_update with require_mutex never see a partially put
+           buffer when they run concurrently."""
+        size = bf.size()
+        rank = bf.rank()
+        if size <= 1:
+            fname = inspect.currentframe().f_code.co_name
+            warnings.warn("Skip {} due to size 1".format(fname))
+            return
+        K = 50 # number of concurrent win_put and win_update
+        n = 100003 # large enough that a put is not atomic without the mutex
+
+        # By default, we use exponential two ring topology.
+        indegree = int(np.ceil(np.log2(size)))
+        neighbor_ranks = [(rank - 2**i) % size for i in range(indegree)]  # in-neighbor
+
+        dtypes = [torch.FloatTensor, torch.DoubleTensor]
+        for dtype in dtypes:
+            window_name = "win_mutex_contention_{}".format(dtype)
+            tensor = self.cast_and_place(torch.FloatTensor(n).fill_(rank), dtype)
+            bf.win_create(tensor, window_name)
+            put_tensor = tensor.clone()
+            bf.barrier()
+
+            for k in range(K):
+                put_tensor.fill_(k + rank)
+                handle = bf.win_put_nonblocking(put_tensor, window_name, require_mutex=True)
+                sync_result = bf.win_update(window_name, require_mutex=True)
+                # Every buffer is filled with one value, so is the average of them unless
+                # a buffer is read while a neighbor is writing it.
+                assert (sync_result.max() - sync_result.min()) < EPSILON, (
+                    "bf.win_update with require_mutex reads a partially put buffer " +
+                    "[{}-{}] at rank {}.".format(sync_result.min(), sync_result.max(), rank))
+                bf.win_wait(handle)
+            bf.barrier()
+
+            # Only the last win_put of each neighbor is left in the buffers.
+            sync_result = bf.win_update(
+                window_name, self_weight=0.0,
+                neighbor_weights={r: 1.0 / indegree for r in neighbor_ranks},
+                require_mutex=True)
+            expected_value = K - 1 + np.mean(neighbor_ranks)
+            assert (sync_result - expected_value).abs().max() < EPSILON, (
+                "bf.win_update after concurrent win_put produces wrong tensor value " +
+                "[{}-{}]!={} at rank {}.".format(sync_result.min(), sync_result.max(),
+                                                 expected_value, rank))
+            bf.barrier()
+            assert bf.win_free(window_name), "bf.win_free do not free window object successfully."
+
     @unittest.skip("It is most likely because the win_mutex is called through the main thread")
     def test_win_mutex_given_ranks(self):
         size = bf.size()